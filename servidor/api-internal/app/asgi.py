@@ -10,7 +10,6 @@ from __future__ import annotations
 import pathlib
 import re
 
-from dotenv import dotenv_values
 from fastapi import Depends, HTTPException, Request
 from fastapi.responses import JSONResponse
 
@@ -21,6 +20,7 @@ from app.main import (
     get_project_row,
     resolve_authenticated_user,
 )
+from app.project_env import read_project_env
 from app.validation import validate_project_id
 
 PROJECTS_ROOT = pathlib.Path("/docker/projects").resolve()
@@ -37,7 +37,7 @@ def _read_project_s3_vector_keys(project_name: str) -> tuple[str, str]:
     if not env_path.is_file():
         raise HTTPException(409, "Project environment file is missing")
 
-    values = dotenv_values(env_path, interpolate=False)
+    values = read_project_env(env_path, interpolate=False)
     access_key = str(values.get("S3_PROTOCOL_ACCESS_KEY_ID") or "").strip()
     secret_key = str(values.get("S3_PROTOCOL_ACCESS_KEY_SECRET") or "").strip()
 
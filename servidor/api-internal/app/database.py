@@ -1,30 +1,222 @@
-"""Estado e ciclo de vida do pool do control plane."""
+"""Estado e ciclo de vida dos pools do control plane.
+
+Ha duas lanes: ``requests`` atende as rotas HTTP e ``background`` atende a
+fila de jobs, o scanner de rotacao e demais loops. ``get_pool()`` escolhe a
+lane pelo contexto (``use_background_lane``), entao um job longo nao consome
+as conexoes das requisicoes. Cada lane mede espera de acquire, conexoes em
+uso e latencia dos statements.
+"""
 
 from __future__ import annotations
 
+import contextvars
+import time
+from typing import Any
+
 import asyncpg
 
 
-_pool: asyncpg.Pool | None = None
+REQUEST_LANE = "requests"
+BACKGROUND_LANE = "background"
+
+_current_lane: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "control_plane_pool_lane", default=REQUEST_LANE
+)
+_pools: dict[str, "LanePool"] = {}
+
+
+class LaneMetrics:
+    __slots__ = (
+        "acquires",
+        "acquire_wait_seconds",
+        "acquire_wait_max_seconds",
+        "acquire_timeouts",
+        "in_use",
+        "in_use_peak",
+        "statements",
+        "statement_errors",
+        "statement_seconds",
+        "statement_max_seconds",
+    )
+
+    def __init__(self) -> None:
+        self.acquires = 0
+        self.acquire_wait_seconds = 0.0
+        self.acquire_wait_max_seconds = 0.0
+        self.acquire_timeouts = 0
+        self.in_use = 0
+        self.in_use_peak = 0
+        self.statements = 0
+        self.statement_errors = 0
+        self.statement_seconds = 0.0
+        self.statement_max_seconds = 0.0
+
+    def record_acquire(self, waited: float) -> None:
+        self.acquires += 1
+        self.acquire_wait_seconds += waited
+        self.acquire_wait_max_seconds = max(self.acquire_wait_max_seconds, waited)
+        self.in_use += 1
+        self.in_use_peak = max(self.in_use_peak, self.in_use)
+
+    def record_query(self, record: Any) -> None:
+        """Query logger do asyncpg (``Connection.add_query_logger``)."""
+        self.statements += 1
+        self.statement_seconds += record.elapsed
+        self.statement_max_seconds = max(self.statement_max_seconds, record.elapsed)
+        if record.exception is not None:
+            self.statement_errors += 1
+
+    def snapshot(self) -> dict[str, float | int]:
+        return {
+            "acquires": self.acquires,
+            "acquire_wait_avg_ms": round(
+                self.acquire_wait_seconds * 1000 / self.acquires, 3
+            ) if self.acquires else 0.0,
+            "acquire_wait_max_ms": round(self.acquire_wait_max_seconds * 1000, 3),
+            "acquire_timeouts": self.acquire_timeouts,
+            "in_use": self.in_use,
+            "in_use_peak": self.in_use_peak,
+            "statements": self.statements,
+            "statement_errors": self.statement_errors,
+            "statement_avg_ms": round(
+                self.statement_seconds * 1000 / self.statements, 3
+            ) if self.statements else 0.0,
+            "statement_max_ms": round(self.statement_max_seconds * 1000, 3),
+        }
+
+
+class _LaneAcquire:
+    __slots__ = ("_lane", "_timeout", "_context", "_connection")
+
+    def __init__(self, lane: "LanePool", timeout: float | None) -> None:
+        self._lane = lane
+        self._timeout = timeout
+        self._context = None
+        self._connection = None
+
+    async def __aenter__(self) -> asyncpg.Connection:
+        started = time.perf_counter()
+        self._context = self._lane.pool.acquire(timeout=self._timeout)
+        try:
+            self._connection = await self._context.__aenter__()
+        except TimeoutError:
+            self._lane.metrics.acquire_timeouts += 1
+            raise
+        self._lane.metrics.record_acquire(time.perf_counter() - started)
+        return self._connection
+
+    async def __aexit__(self, *exc_info) -> bool | None:
+        self._lane.metrics.in_use -= 1
+        return await self._context.__aexit__(*exc_info)
+
+
+class LanePool:
+    """Pool asyncpg de uma lane; delega o restante da API ao pool real."""
+
+    def __init__(self, name: str, pool: asyncpg.Pool, metrics: LaneMetrics) -> None:
+        self.name = name
+        self.pool = pool
+        self.metrics = metrics
+
+    def acquire(self, *, timeout: float | None = None) -> _LaneAcquire:
+        return _LaneAcquire(self, timeout)
 
+    async def execute(self, query: str, *args: Any, timeout: float | None = None) -> str:
+        async with self.acquire() as conn:
+            return await conn.execute(query, *args, timeout=timeout)
 
-async def get_pool() -> asyncpg.Pool:
-    if _pool is None:
+    async def executemany(self, command: str, args: Any, *, timeout: float | None = None) -> None:
+        async with self.acquire() as conn:
+            return await conn.executemany(command, args, timeout=timeout)
+
+    async def fetch(self, query: str, *args: Any, timeout: float | None = None) -> list:
+        async with self.acquire() as conn:
+            return await conn.fetch(query, *args, timeout=timeout)
+
+    async def fetchrow(self, query: str, *args: Any, timeout: float | None = None):
+        async with self.acquire() as conn:
+            return await conn.fetchrow(query, *args, timeout=timeout)
+
+    async def fetchval(
+        self, query: str, *args: Any, column: int = 0, timeout: float | None = None
+    ):
+        async with self.acquire() as conn:
+            return await conn.fetchval(query, *args, column=column, timeout=timeout)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "size": self.pool.get_size(),
+            "idle": self.pool.get_idle_size(),
+            "min_size": self.pool.get_min_size(),
+            "max_size": self.pool.get_max_size(),
+            **self.metrics.snapshot(),
+        }
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.pool, name)
+
+
+def use_background_lane() -> None:
+    """Marca o contexto atual (e as tasks criadas a partir dele) como background."""
+    _current_lane.set(BACKGROUND_LANE)
+
+
+async def get_pool() -> LanePool:
+    pool = _pools.get(_current_lane.get()) or _pools.get(REQUEST_LANE)
+    if pool is None:
         raise RuntimeError("Database pool not initialized")
-    return _pool
+    return pool
+
+
+async def get_background_pool() -> LanePool:
+    pool = _pools.get(BACKGROUND_LANE)
+    if pool is None:
+        raise RuntimeError("Database pool not initialized")
+    return pool
+
+
+async def _create_lane(name: str, dsn: str, *, min_size: int, max_size: int) -> LanePool:
+    metrics = LaneMetrics()
+
+    async def init(conn: asyncpg.Connection) -> None:
+        conn.add_query_logger(metrics.record_query)
+
+    pool = await asyncpg.create_pool(dsn, min_size=min_size, max_size=max_size, init=init)
+    return LanePool(name, pool, metrics)
+
+
+async def initialize_pool(
+    dsn: str,
+    *,
+    min_size: int = 1,
+    max_size: int = 10,
+    background_min_size: int = 1,
+    background_max_size: int = 5,
+) -> LanePool:
+    if REQUEST_LANE in _pools:
+        return _pools[REQUEST_LANE]
+    requests = await _create_lane(REQUEST_LANE, dsn, min_size=min_size, max_size=max_size)
+    try:
+        background = await _create_lane(
+            BACKGROUND_LANE,
+            dsn,
+            min_size=background_min_size,
+            max_size=background_max_size,
+        )
+    except BaseException:
+        await requests.pool.close()
+        raise
+    _pools[REQUEST_LANE] = requests
+    _pools[BACKGROUND_LANE] = background
+    return requests
 
 
-async def initialize_pool(dsn: str) -> asyncpg.Pool:
-    global _pool
-    if _pool is not None:
-        return _pool
-    _pool = await asyncpg.create_pool(dsn, min_size=1, max_size=10)
-    return _pool
+def pool_metrics() -> dict[str, dict[str, Any]]:
+    return {name: lane.snapshot() for name, lane in _pools.items()}
 
 
 async def close_pool() -> None:
-    global _pool
-    if _pool is None:
-        return
-    await _pool.close()
-    _pool = None
+    lanes = list(_pools.values())
+    _pools.clear()
+    for lane in lanes:
+        await lane.pool.close()
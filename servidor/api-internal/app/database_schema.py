@@ -1,350 +1,640 @@
 """Bootstrap e migracoes incrementais do schema do control plane."""
 
+import hashlib
+import time
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import dataclass
+
 import asyncpg
 
-async def ensure_identity_schema(pool: asyncpg.Pool) -> None:
-    async with pool.acquire() as conn:
-        await conn.execute(
-            """
-            CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
-
-            CREATE TABLE IF NOT EXISTS users (
-                id UUID PRIMARY KEY,
-                authelia_username TEXT UNIQUE NOT NULL,
-                display_name TEXT,
-                is_active BOOLEAN NOT NULL DEFAULT true,
-                source TEXT NOT NULL DEFAULT 'authelia',
-                last_login_at TIMESTAMPTZ,
-                last_sync_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
-            );
 
-            ALTER TABLE users
-                ADD COLUMN IF NOT EXISTS email TEXT,
-                ADD COLUMN IF NOT EXISTS picture_url TEXT,
-                ADD COLUMN IF NOT EXISTS profile_data JSONB NOT NULL DEFAULT '{}'::jsonb,
-                ADD COLUMN IF NOT EXISTS profile_version BIGINT NOT NULL DEFAULT 1,
-                ADD COLUMN IF NOT EXISTS profile_updated_at TIMESTAMPTZ,
-                ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMPTZ,
-                ADD COLUMN IF NOT EXISTS last_login_session_hash TEXT;
-
-            CREATE TABLE IF NOT EXISTS user_groups (
-                user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                group_name TEXT NOT NULL,
-                source TEXT NOT NULL DEFAULT 'authelia',
-                synced_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-                PRIMARY KEY (user_id, group_name)
-            );
+SCHEMA_MIGRATIONS_LOCK = "control-plane:schema-migrations"
 
-            CREATE TABLE IF NOT EXISTS user_group_audit (
-                id BIGSERIAL PRIMARY KEY,
-                user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                group_name TEXT NOT NULL,
-                action TEXT NOT NULL,
-                old_value JSONB,
-                new_value JSONB,
-                actor_type TEXT NOT NULL DEFAULT 'system',
-                actor_user_id UUID,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
-            );
+MigrationStep = Callable[[asyncpg.Connection], Awaitable[None]]
 
-            CREATE TABLE IF NOT EXISTS project_members_audit (
-                id BIGSERIAL PRIMARY KEY,
-                project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
-                target_user_id UUID REFERENCES users(id) ON DELETE SET NULL,
-                old_role TEXT,
-                new_role TEXT,
-                action TEXT NOT NULL,
-                actor_user_id UUID REFERENCES users(id) ON DELETE SET NULL,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
-            );
 
-            CREATE INDEX IF NOT EXISTS idx_users_last_sync_at ON users(last_sync_at);
-            CREATE INDEX IF NOT EXISTS idx_users_last_seen_at ON users(last_seen_at);
-            CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_unique
-                ON users(lower(email))
-                WHERE email IS NOT NULL AND email <> '';
-            CREATE INDEX IF NOT EXISTS idx_user_groups_user_id ON user_groups(user_id);
-            CREATE INDEX IF NOT EXISTS idx_projects_owner_id ON projects(owner_id);
-            CREATE INDEX IF NOT EXISTS idx_project_members_user_id ON project_members(user_id);
-            CREATE INDEX IF NOT EXISTS idx_project_members_audit_project_id ON project_members_audit(project_id);
-            """
-        )
-        await conn.execute(
-            """
-            UPDATE project_members
-            SET role = 'member'
-            WHERE role IS NULL OR role NOT IN ('admin', 'member');
-
-            ALTER TABLE project_members
-                ALTER COLUMN role SET DEFAULT 'member';
-            ALTER TABLE project_members
-                ALTER COLUMN role SET NOT NULL;
-
-            DO $$
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1
-                    FROM pg_constraint
-                    WHERE conrelid = 'project_members'::regclass
-                      AND conname = 'project_members_role_check'
-                ) THEN
-                    ALTER TABLE project_members
-                        ADD CONSTRAINT project_members_role_check
-                        CHECK (role IN ('admin', 'member'));
-                END IF;
-            END
-            $$;
-            """
-        )
-        await conn.execute(
-            "ALTER TABLE projects ADD COLUMN IF NOT EXISTS display_name TEXT"
-        )
-        await conn.execute(
-            """
-            ALTER TABLE projects
-                ADD COLUMN IF NOT EXISTS project_key_version BIGINT NOT NULL DEFAULT 1,
-                ADD COLUMN IF NOT EXISTS tenant_uuid UUID,
-                ADD COLUMN IF NOT EXISTS automatic_key_rotation_enabled BOOLEAN NOT NULL DEFAULT true,
-                ADD COLUMN IF NOT EXISTS key_expires_at TIMESTAMPTZ,
-                ADD COLUMN IF NOT EXISTS last_key_rotation_at TIMESTAMPTZ,
-                ADD COLUMN IF NOT EXISTS automatic_key_rotation_blocked_at TIMESTAMPTZ,
-                ADD COLUMN IF NOT EXISTS automatic_key_rotation_last_error TEXT;
-            UPDATE projects SET project_key_version = 1
-            WHERE project_key_version IS NULL OR project_key_version < 1;
-            UPDATE projects SET automatic_key_rotation_enabled = true
-            WHERE automatic_key_rotation_enabled IS NULL;
-            ALTER TABLE projects
-                ALTER COLUMN automatic_key_rotation_enabled SET DEFAULT true,
-                ALTER COLUMN automatic_key_rotation_enabled SET NOT NULL;
-
-            CREATE UNIQUE INDEX IF NOT EXISTS idx_projects_tenant_uuid_unique
-                ON projects(tenant_uuid)
-                WHERE tenant_uuid IS NOT NULL;
-            CREATE INDEX IF NOT EXISTS idx_projects_automatic_key_rotation_due
-                ON projects(key_expires_at)
-                WHERE automatic_key_rotation_enabled
-                  AND automatic_key_rotation_blocked_at IS NULL
-                  AND anon_key IS NOT NULL;
-
-            COMMENT ON COLUMN projects.tenant_uuid IS
-                'Tenant externo persistido (Realtime/JWT/backups). Em projetos novos equivale a projects.id.';
-
-            CREATE OR REPLACE FUNCTION set_project_tenant_uuid_from_id()
-            RETURNS trigger
-            LANGUAGE plpgsql
-            AS $$
-            BEGIN
-                IF NEW.tenant_uuid IS NULL THEN
-                    NEW.tenant_uuid := NEW.id;
-                END IF;
-                RETURN NEW;
-            END;
-            $$;
+@dataclass(frozen=True)
+class Migration:
+    """Passo versionado do schema; nunca editar depois de publicado."""
 
-            DO $$
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1
-                    FROM pg_trigger
-                    WHERE tgrelid = 'projects'::regclass
-                      AND tgname = 'projects_default_tenant_uuid'
-                      AND NOT tgisinternal
-                ) THEN
-                    CREATE TRIGGER projects_default_tenant_uuid
-                    BEFORE INSERT ON projects
-                    FOR EACH ROW
-                    EXECUTE FUNCTION set_project_tenant_uuid_from_id();
-                END IF;
-            END
-            $$;
-            """
-        )
+    version: int
+    name: str
+    apply: MigrationStep
 
 
-async def ensure_restore_points_schema(pool: asyncpg.Pool) -> None:
-    async with pool.acquire() as conn:
-        await conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS project_restore_points (
-                id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-                project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
-                title TEXT NOT NULL,
-                description TEXT,
-                status TEXT NOT NULL DEFAULT 'creating'
-                    CHECK (status IN ('creating', 'ready', 'restoring', 'deleting', 'failed')),
-                is_automatic BOOLEAN NOT NULL DEFAULT false,
-                job_id UUID,
-                created_by UUID REFERENCES users(id) ON DELETE SET NULL,
-                project_ref_at_creation TEXT,
-                size_bytes BIGINT,
-                last_restored_at TIMESTAMPTZ,
-                restore_count INTEGER NOT NULL DEFAULT 0,
-                error TEXT,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-                updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-                completed_at TIMESTAMPTZ
-            );
+class SchemaMigrationError(RuntimeError):
+    pass
 
-            CREATE INDEX IF NOT EXISTS idx_project_restore_points_project_created
-                ON project_restore_points(project_id, created_at DESC);
-            CREATE INDEX IF NOT EXISTS idx_project_restore_points_job
-                ON project_restore_points(job_id);
-            """
-        )
+
+class _StatementRecorder:
+    """Captura o SQL de um passo sem executa-lo, para o checksum."""
+
+    def __init__(self) -> None:
+        self.statements: list[str] = []
+
+    async def execute(self, query: str, *args) -> str:
+        self.statements.append(query)
+        return ""
+
+
+async def migration_checksum(migration: Migration) -> str:
+    recorder = _StatementRecorder()
+    await migration.apply(recorder)
+    digest = hashlib.sha256(f"{migration.version}:{migration.name}".encode())
+    for statement in recorder.statements:
+        # Indentacao do codigo Python nao altera a migracao.
+        normalized = "\n".join(line.strip() for line in statement.strip().splitlines())
+        digest.update(b"\0" + normalized.encode())
+    return digest.hexdigest()
+
+
+def _pending_migrations(
+    migrations: Sequence[Migration],
+    checksums: dict[int, str],
+    applied: dict[int, str],
+) -> list[Migration]:
+    pending = []
+    for migration in migrations:
+        recorded = applied.get(migration.version)
+        if recorded is None:
+            pending.append(migration)
+        elif recorded != checksums[migration.version]:
+            raise SchemaMigrationError(
+                f"migracao {migration.version} ({migration.name}) mudou depois de "
+                "aplicada; crie uma nova versao em vez de editar a existente"
+            )
+    return pending
 
 
-async def ensure_collaboration_schema(pool: asyncpg.Pool) -> None:
+async def _applied_migrations(conn: asyncpg.Connection) -> dict[int, str] | None:
+    try:
+        rows = await conn.fetch("SELECT version, checksum FROM schema_migrations")
+    except asyncpg.UndefinedTableError:
+        return None
+    return {row["version"]: row["checksum"] for row in rows}
+
+
+async def apply_schema_migrations(
+    pool: asyncpg.Pool, migrations: Sequence[Migration]
+) -> list[Migration]:
+    """Aplica as migracoes pendentes uma unica vez, em ordem.
+
+    Com o ledger em dia o boot custa uma leitura de ``schema_migrations``;
+    DDL e backfills so rodam sob o advisory lock, com recheck, para que
+    replicas subindo juntas nao apliquem o mesmo passo duas vezes.
+    """
+    versions = [migration.version for migration in migrations]
+    if versions != sorted(set(versions)):
+        raise SchemaMigrationError("versoes de migracao devem ser unicas e crescentes")
+    checksums = {
+        migration.version: await migration_checksum(migration) for migration in migrations
+    }
     async with pool.acquire() as conn:
-        await conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS studio_project_tags (
-                id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-                name TEXT NOT NULL UNIQUE,
-                color TEXT NOT NULL DEFAULT '#3ECF8E',
-                category TEXT NOT NULL DEFAULT 'custom',
-                is_system BOOLEAN NOT NULL DEFAULT false,
-                created_by UUID REFERENCES users(id) ON DELETE SET NULL,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
-            );
+        applied = await _applied_migrations(conn)
+        if applied is not None and not _pending_migrations(migrations, checksums, applied):
+            return []
+        async with conn.transaction():
+            await conn.execute(
+                "SELECT pg_advisory_xact_lock(hashtextextended($1, 0))",
+                SCHEMA_MIGRATIONS_LOCK,
+            )
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    checksum TEXT NOT NULL,
+                    duration_ms INTEGER NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+                """
+            )
+            applied = await _applied_migrations(conn) or {}
+            pending = _pending_migrations(migrations, checksums, applied)
+            for migration in pending:
+                started = time.monotonic()
+                await migration.apply(conn)
+                await conn.execute(
+                    """
+                    INSERT INTO schema_migrations(version, name, checksum, duration_ms)
+                    VALUES($1, $2, $3, $4)
+                    """,
+                    migration.version,
+                    migration.name,
+                    checksums[migration.version],
+                    int((time.monotonic() - started) * 1000),
+                )
+    return pending
 
-            CREATE TABLE IF NOT EXISTS studio_project_tag_assignments (
-                project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
-                tag_id UUID NOT NULL REFERENCES studio_project_tags(id) ON DELETE CASCADE,
-                assigned_by UUID REFERENCES users(id) ON DELETE SET NULL,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-                PRIMARY KEY (project_id, tag_id)
-            );
+async def ensure_identity_schema(conn: asyncpg.Connection) -> None:
+    await conn.execute(
+        """
+        CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 
-            CREATE TABLE IF NOT EXISTS studio_project_notes (
-                id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-                project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
-                author_user_id UUID REFERENCES users(id) ON DELETE SET NULL,
-                visibility TEXT NOT NULL CHECK (visibility IN ('public', 'private')),
-                body TEXT NOT NULL,
-                is_encrypted BOOLEAN NOT NULL DEFAULT false,
-                encryption_key_id UUID,
-                encryption_version TEXT,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
-            );
+        CREATE TABLE IF NOT EXISTS users (
+            id UUID PRIMARY KEY,
+            authelia_username TEXT UNIQUE NOT NULL,
+            display_name TEXT,
+            is_active BOOLEAN NOT NULL DEFAULT true,
+            source TEXT NOT NULL DEFAULT 'authelia',
+            last_login_at TIMESTAMPTZ,
+            last_sync_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
 
-            CREATE TABLE IF NOT EXISTS studio_project_hints (
-                id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-                project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
-                author_user_id UUID REFERENCES users(id) ON DELETE SET NULL,
-                target_user_id UUID REFERENCES users(id) ON DELETE CASCADE,
-                body TEXT NOT NULL,
-                status TEXT NOT NULL DEFAULT 'open' CHECK (status IN ('open', 'resolved')),
-                is_encrypted BOOLEAN NOT NULL DEFAULT false,
-                encryption_key_id UUID,
-                encryption_version TEXT,
-                resolved_by UUID REFERENCES users(id) ON DELETE SET NULL,
-                resolved_at TIMESTAMPTZ,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
-            );
+        ALTER TABLE users
+            ADD COLUMN IF NOT EXISTS email TEXT,
+            ADD COLUMN IF NOT EXISTS picture_url TEXT,
+            ADD COLUMN IF NOT EXISTS profile_data JSONB NOT NULL DEFAULT '{}'::jsonb,
+            ADD COLUMN IF NOT EXISTS profile_version BIGINT NOT NULL DEFAULT 1,
+            ADD COLUMN IF NOT EXISTS profile_updated_at TIMESTAMPTZ,
+            ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMPTZ,
+            ADD COLUMN IF NOT EXISTS last_login_session_hash TEXT;
 
-            CREATE TABLE IF NOT EXISTS studio_project_thread_messages (
-                id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-                project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
-                author_user_id UUID REFERENCES users(id) ON DELETE SET NULL,
-                body TEXT NOT NULL,
-                is_encrypted BOOLEAN NOT NULL DEFAULT false,
-                encryption_key_id UUID,
-                encryption_version TEXT,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
-            );
+        CREATE TABLE IF NOT EXISTS user_groups (
+            user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            group_name TEXT NOT NULL,
+            source TEXT NOT NULL DEFAULT 'authelia',
+            synced_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (user_id, group_name)
+        );
 
-            CREATE TABLE IF NOT EXISTS studio_audit_log (
-                id BIGSERIAL PRIMARY KEY,
-                project_id UUID REFERENCES projects(id) ON DELETE SET NULL,
-                actor_user_id UUID REFERENCES users(id) ON DELETE SET NULL,
-                action TEXT NOT NULL,
-                target_type TEXT NOT NULL,
-                target_id TEXT,
-                old_value JSONB,
-                new_value JSONB,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
-            );
+        CREATE TABLE IF NOT EXISTS user_group_audit (
+            id BIGSERIAL PRIMARY KEY,
+            user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            group_name TEXT NOT NULL,
+            action TEXT NOT NULL,
+            old_value JSONB,
+            new_value JSONB,
+            actor_type TEXT NOT NULL DEFAULT 'system',
+            actor_user_id UUID,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
 
-            CREATE TABLE IF NOT EXISTS project_name_history (
-                id BIGSERIAL PRIMARY KEY,
-                project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
-                job_id UUID NOT NULL UNIQUE,
-                actor_user_id UUID REFERENCES users(id) ON DELETE SET NULL,
-                old_name TEXT NOT NULL,
-                new_name TEXT NOT NULL,
-                old_path TEXT NOT NULL,
-                new_path TEXT NOT NULL,
-                status TEXT NOT NULL DEFAULT 'queued'
-                    CHECK (status IN ('queued', 'running', 'succeeded', 'failed', 'rolled_back')),
-                error TEXT,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-                updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-                completed_at TIMESTAMPTZ
-            );
+        CREATE TABLE IF NOT EXISTS project_members_audit (
+            id BIGSERIAL PRIMARY KEY,
+            project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+            target_user_id UUID REFERENCES users(id) ON DELETE SET NULL,
+            old_role TEXT,
+            new_role TEXT,
+            action TEXT NOT NULL,
+            actor_user_id UUID REFERENCES users(id) ON DELETE SET NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
 
-            CREATE TABLE IF NOT EXISTS studio_project_notifications (
-                id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-                project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
-                target_user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                actor_user_id UUID REFERENCES users(id) ON DELETE SET NULL,
-                kind TEXT NOT NULL,
-                target_type TEXT NOT NULL,
-                target_id TEXT,
-                payload JSONB NOT NULL DEFAULT '{}'::jsonb,
-                read_at TIMESTAMPTZ,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
-            );
+        CREATE INDEX IF NOT EXISTS idx_users_last_sync_at ON users(last_sync_at);
+        CREATE INDEX IF NOT EXISTS idx_users_last_seen_at ON users(last_seen_at);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_unique
+            ON users(lower(email))
+            WHERE email IS NOT NULL AND email <> '';
+        CREATE INDEX IF NOT EXISTS idx_user_groups_user_id ON user_groups(user_id);
+        CREATE INDEX IF NOT EXISTS idx_projects_owner_id ON projects(owner_id);
+        CREATE INDEX IF NOT EXISTS idx_project_members_user_id ON project_members(user_id);
+        CREATE INDEX IF NOT EXISTS idx_project_members_audit_project_id ON project_members_audit(project_id);
+        """
+    )
+    await conn.execute(
+        """
+        UPDATE project_members
+        SET role = 'member'
+        WHERE role IS NULL OR role NOT IN ('admin', 'member');
+
+        ALTER TABLE project_members
+            ALTER COLUMN role SET DEFAULT 'member';
+        ALTER TABLE project_members
+            ALTER COLUMN role SET NOT NULL;
+
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1
+                FROM pg_constraint
+                WHERE conrelid = 'project_members'::regclass
+                  AND conname = 'project_members_role_check'
+            ) THEN
+                ALTER TABLE project_members
+                    ADD CONSTRAINT project_members_role_check
+                    CHECK (role IN ('admin', 'member'));
+            END IF;
+        END
+        $$;
+        """
+    )
+    await conn.execute(
+        "ALTER TABLE projects ADD COLUMN IF NOT EXISTS display_name TEXT"
+    )
+    await conn.execute(
+        """
+        ALTER TABLE projects
+            ADD COLUMN IF NOT EXISTS project_key_version BIGINT NOT NULL DEFAULT 1,
+            ADD COLUMN IF NOT EXISTS tenant_uuid UUID,
+            ADD COLUMN IF NOT EXISTS automatic_key_rotation_enabled BOOLEAN NOT NULL DEFAULT true,
+            ADD COLUMN IF NOT EXISTS key_expires_at TIMESTAMPTZ,
+            ADD COLUMN IF NOT EXISTS last_key_rotation_at TIMESTAMPTZ,
+            ADD COLUMN IF NOT EXISTS automatic_key_rotation_blocked_at TIMESTAMPTZ,
+            ADD COLUMN IF NOT EXISTS automatic_key_rotation_last_error TEXT;
+        UPDATE projects SET project_key_version = 1
+        WHERE project_key_version IS NULL OR project_key_version < 1;
+        UPDATE projects SET automatic_key_rotation_enabled = true
+        WHERE automatic_key_rotation_enabled IS NULL;
+        ALTER TABLE projects
+            ALTER COLUMN automatic_key_rotation_enabled SET DEFAULT true,
+            ALTER COLUMN automatic_key_rotation_enabled SET NOT NULL;
+
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_projects_tenant_uuid_unique
+            ON projects(tenant_uuid)
+            WHERE tenant_uuid IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_projects_automatic_key_rotation_due
+            ON projects(key_expires_at)
+            WHERE automatic_key_rotation_enabled
+              AND automatic_key_rotation_blocked_at IS NULL
+              AND anon_key IS NOT NULL;
+
+        COMMENT ON COLUMN projects.tenant_uuid IS
+            'Tenant externo persistido (Realtime/JWT/backups). Em projetos novos equivale a projects.id.';
+
+        CREATE OR REPLACE FUNCTION set_project_tenant_uuid_from_id()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            IF NEW.tenant_uuid IS NULL THEN
+                NEW.tenant_uuid := NEW.id;
+            END IF;
+            RETURN NEW;
+        END;
+        $$;
+
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1
+                FROM pg_trigger
+                WHERE tgrelid = 'projects'::regclass
+                  AND tgname = 'projects_default_tenant_uuid'
+                  AND NOT tgisinternal
+            ) THEN
+                CREATE TRIGGER projects_default_tenant_uuid
+                BEFORE INSERT ON projects
+                FOR EACH ROW
+                EXECUTE FUNCTION set_project_tenant_uuid_from_id();
+            END IF;
+        END
+        $$;
+        """
+    )
+
+
+async def ensure_restore_points_schema(conn: asyncpg.Connection) -> None:
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS project_restore_points (
+            id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+            project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+            title TEXT NOT NULL,
+            description TEXT,
+            status TEXT NOT NULL DEFAULT 'creating'
+                CHECK (status IN ('creating', 'ready', 'restoring', 'deleting', 'failed')),
+            is_automatic BOOLEAN NOT NULL DEFAULT false,
+            job_id UUID,
+            created_by UUID REFERENCES users(id) ON DELETE SET NULL,
+            project_ref_at_creation TEXT,
+            size_bytes BIGINT,
+            last_restored_at TIMESTAMPTZ,
+            restore_count INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            completed_at TIMESTAMPTZ
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_project_restore_points_project_created
+            ON project_restore_points(project_id, created_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_project_restore_points_job
+            ON project_restore_points(job_id);
+        """
+    )
+
+
+async def ensure_collaboration_schema(conn: asyncpg.Connection) -> None:
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS studio_project_tags (
+            id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+            name TEXT NOT NULL UNIQUE,
+            color TEXT NOT NULL DEFAULT '#3ECF8E',
+            category TEXT NOT NULL DEFAULT 'custom',
+            is_system BOOLEAN NOT NULL DEFAULT false,
+            created_by UUID REFERENCES users(id) ON DELETE SET NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+
+        CREATE TABLE IF NOT EXISTS studio_project_tag_assignments (
+            project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+            tag_id UUID NOT NULL REFERENCES studio_project_tags(id) ON DELETE CASCADE,
+            assigned_by UUID REFERENCES users(id) ON DELETE SET NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (project_id, tag_id)
+        );
+
+        CREATE TABLE IF NOT EXISTS studio_project_notes (
+            id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+            project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+            author_user_id UUID REFERENCES users(id) ON DELETE SET NULL,
+            visibility TEXT NOT NULL CHECK (visibility IN ('public', 'private')),
+            body TEXT NOT NULL,
+            is_encrypted BOOLEAN NOT NULL DEFAULT false,
+            encryption_key_id UUID,
+            encryption_version TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+
+        CREATE TABLE IF NOT EXISTS studio_project_hints (
+            id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+            project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+            author_user_id UUID REFERENCES users(id) ON DELETE SET NULL,
+            target_user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+            body TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'open' CHECK (status IN ('open', 'resolved')),
+            is_encrypted BOOLEAN NOT NULL DEFAULT false,
+            encryption_key_id UUID,
+            encryption_version TEXT,
+            resolved_by UUID REFERENCES users(id) ON DELETE SET NULL,
+            resolved_at TIMESTAMPTZ,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+
+        CREATE TABLE IF NOT EXISTS studio_project_thread_messages (
+            id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+            project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+            author_user_id UUID REFERENCES users(id) ON DELETE SET NULL,
+            body TEXT NOT NULL,
+            is_encrypted BOOLEAN NOT NULL DEFAULT false,
+            encryption_key_id UUID,
+            encryption_version TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+
+        CREATE TABLE IF NOT EXISTS studio_audit_log (
+            id BIGSERIAL PRIMARY KEY,
+            project_id UUID REFERENCES projects(id) ON DELETE SET NULL,
+            actor_user_id UUID REFERENCES users(id) ON DELETE SET NULL,
+            action TEXT NOT NULL,
+            target_type TEXT NOT NULL,
+            target_id TEXT,
+            old_value JSONB,
+            new_value JSONB,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+
+        CREATE TABLE IF NOT EXISTS project_name_history (
+            id BIGSERIAL PRIMARY KEY,
+            project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+            job_id UUID NOT NULL UNIQUE,
+            actor_user_id UUID REFERENCES users(id) ON DELETE SET NULL,
+            old_name TEXT NOT NULL,
+            new_name TEXT NOT NULL,
+            old_path TEXT NOT NULL,
+            new_path TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued'
+                CHECK (status IN ('queued', 'running', 'succeeded', 'failed', 'rolled_back')),
+            error TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            completed_at TIMESTAMPTZ
+        );
+
+        CREATE TABLE IF NOT EXISTS studio_project_notifications (
+            id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+            project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+            target_user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            actor_user_id UUID REFERENCES users(id) ON DELETE SET NULL,
+            kind TEXT NOT NULL,
+            target_type TEXT NOT NULL,
+            target_id TEXT,
+            payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+            read_at TIMESTAMPTZ,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_studio_project_notes_project_id
+            ON studio_project_notes(project_id);
+        CREATE INDEX IF NOT EXISTS idx_studio_project_notes_author_visibility
+            ON studio_project_notes(author_user_id, visibility);
+        CREATE INDEX IF NOT EXISTS idx_studio_project_hints_project_status
+            ON studio_project_hints(project_id, status);
+        CREATE INDEX IF NOT EXISTS idx_studio_project_hints_target_status
+            ON studio_project_hints(target_user_id, status);
+        CREATE INDEX IF NOT EXISTS idx_studio_project_thread_project_created
+            ON studio_project_thread_messages(project_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_studio_project_tag_assignments_project_id
+            ON studio_project_tag_assignments(project_id);
+        CREATE INDEX IF NOT EXISTS idx_studio_audit_log_project_id
+            ON studio_audit_log(project_id);
+        CREATE INDEX IF NOT EXISTS idx_project_name_history_project_created
+            ON project_name_history(project_id, created_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_studio_notifications_target_unread
+            ON studio_project_notifications(target_user_id, read_at, created_at DESC);
 
-            CREATE INDEX IF NOT EXISTS idx_studio_project_notes_project_id
-                ON studio_project_notes(project_id);
-            CREATE INDEX IF NOT EXISTS idx_studio_project_notes_author_visibility
-                ON studio_project_notes(author_user_id, visibility);
-            CREATE INDEX IF NOT EXISTS idx_studio_project_hints_project_status
-                ON studio_project_hints(project_id, status);
-            CREATE INDEX IF NOT EXISTS idx_studio_project_hints_target_status
-                ON studio_project_hints(target_user_id, status);
-            CREATE INDEX IF NOT EXISTS idx_studio_project_thread_project_created
-                ON studio_project_thread_messages(project_id, created_at);
-            CREATE INDEX IF NOT EXISTS idx_studio_project_tag_assignments_project_id
-                ON studio_project_tag_assignments(project_id);
-            CREATE INDEX IF NOT EXISTS idx_studio_audit_log_project_id
-                ON studio_audit_log(project_id);
-            CREATE INDEX IF NOT EXISTS idx_project_name_history_project_created
-                ON project_name_history(project_id, created_at DESC);
-            CREATE INDEX IF NOT EXISTS idx_studio_notifications_target_unread
-                ON studio_project_notifications(target_user_id, read_at, created_at DESC);
-
-            DELETE FROM studio_project_tags
-            WHERE name = 'Cliente crítico'
-              AND is_system = true;
-
-            INSERT INTO studio_project_tags(name, color, category, is_system)
-            VALUES
-                ('Produção', '#3ECF8E', 'ambiente', true),
-                ('Desenvolvimento', '#A78BFA', 'ambiente', true),
-                ('Teste 1', '#3B82F6', 'ambiente', true),
-                ('Teste 2', '#06B6D4', 'ambiente', true),
-                ('Homologação', '#22C55E', 'ambiente', true),
-                ('Staging', '#8B5CF6', 'ambiente', true),
-                ('Demo', '#EC4899', 'ambiente', true),
-                ('Sandbox', '#64748B', 'ambiente', true),
-                ('Manutenção', '#F97316', 'status', true),
-                ('Pausado', '#94A3B8', 'status', true),
-                ('Pendente', '#EF4444', 'status', true),
-                ('Revisar', '#F59E0B', 'status', true),
-                ('Monitorar', '#0EA5E9', 'operacao', true),
-                ('Migração', '#EAB308', 'operacao', true),
-                ('Backup', '#14B8A6', 'operacao', true),
-                ('Auth', '#10B981', 'area', true),
-                ('Storage', '#6366F1', 'area', true),
-                ('Database', '#84CC16', 'area', true),
-                ('Realtime', '#F43F5E', 'area', true),
-                ('Gateway', '#F97316', 'area', true)
-            ON CONFLICT (name) DO NOTHING;
-            """
+        DELETE FROM studio_project_tags
+        WHERE name = 'Cliente crítico'
+          AND is_system = true;
+
+        INSERT INTO studio_project_tags(name, color, category, is_system)
+        VALUES
+            ('Produção', '#3ECF8E', 'ambiente', true),
+            ('Desenvolvimento', '#A78BFA', 'ambiente', true),
+            ('Teste 1', '#3B82F6', 'ambiente', true),
+            ('Teste 2', '#06B6D4', 'ambiente', true),
+            ('Homologação', '#22C55E', 'ambiente', true),
+            ('Staging', '#8B5CF6', 'ambiente', true),
+            ('Demo', '#EC4899', 'ambiente', true),
+            ('Sandbox', '#64748B', 'ambiente', true),
+            ('Manutenção', '#F97316', 'status', true),
+            ('Pausado', '#94A3B8', 'status', true),
+            ('Pendente', '#EF4444', 'status', true),
+            ('Revisar', '#F59E0B', 'status', true),
+            ('Monitorar', '#0EA5E9', 'operacao', true),
+            ('Migração', '#EAB308', 'operacao', true),
+            ('Backup', '#14B8A6', 'operacao', true),
+            ('Auth', '#10B981', 'area', true),
+            ('Storage', '#6366F1', 'area', true),
+            ('Database', '#84CC16', 'area', true),
+            ('Realtime', '#F43F5E', 'area', true),
+            ('Gateway', '#F97316', 'area', true)
+        ON CONFLICT (name) DO NOTHING;
+        """
+    )
+    # Contadores de mudanca do painel de colaboracao (ETag e modo delta).
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS studio_project_collaboration_versions (
+            project_id UUID PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+            version BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+
+        CREATE TABLE IF NOT EXISTS studio_project_collaboration_changes (
+            project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+            version BIGINT NOT NULL,
+            section TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            deleted BOOLEAN NOT NULL DEFAULT false,
+            changed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (project_id, version)
+        );
+
+        CREATE SEQUENCE IF NOT EXISTS studio_project_tags_version_seq;
+
+        CREATE OR REPLACE FUNCTION bump_studio_collaboration_version(
+            target UUID,
+            change_section TEXT,
+            change_item TEXT,
+            change_deleted BOOLEAN
         )
+        RETURNS void
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            next_version BIGINT;
+        BEGIN
+            -- Cascata do DELETE do projeto: nao ha mais painel para versionar.
+            IF NOT EXISTS (SELECT 1 FROM projects WHERE id = target) THEN
+                RETURN;
+            END IF;
+
+            INSERT INTO studio_project_collaboration_versions AS v (project_id, version)
+            VALUES (target, 1)
+            ON CONFLICT (project_id) DO UPDATE
+                SET version = v.version + 1,
+                    updated_at = now()
+            RETURNING v.version INTO next_version;
+
+            INSERT INTO studio_project_collaboration_changes(
+                project_id, version, section, item_id, deleted
+            )
+            VALUES (target, next_version, change_section, change_item, change_deleted);
+
+            IF next_version % 100 = 0 THEN
+                DELETE FROM studio_project_collaboration_changes
+                WHERE project_id = target
+                  AND version <= next_version - 1000;
+            END IF;
+        END;
+        $$;
+
+        CREATE OR REPLACE FUNCTION record_studio_collaboration_change()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            row_data JSONB;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                row_data := to_jsonb(OLD);
+            ELSE
+                row_data := to_jsonb(NEW);
+            END IF;
+            PERFORM bump_studio_collaboration_version(
+                (row_data ->> 'project_id')::uuid,
+                TG_ARGV[0],
+                row_data ->> TG_ARGV[1],
+                TG_OP = 'DELETE'
+            );
+            RETURN NULL;
+        END;
+        $$;
+
+        CREATE OR REPLACE FUNCTION record_studio_collaboration_user_change()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            -- Nome exibido aparece em varias secoes; forca recarga completa.
+            PERFORM bump_studio_collaboration_version(pm.project_id, 'panel', NEW.id::text, false)
+            FROM project_members pm
+            WHERE pm.user_id = NEW.id;
+            RETURN NULL;
+        END;
+        $$;
+
+        CREATE OR REPLACE FUNCTION bump_studio_project_tags_version()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            PERFORM nextval('studio_project_tags_version_seq');
+            RETURN NULL;
+        END;
+        $$;
+
+        DO $$
+        DECLARE
+            spec TEXT[];
+        BEGIN
+            FOREACH spec SLICE 1 IN ARRAY ARRAY[
+                ['studio_project_notes', 'notes', 'id'],
+                ['studio_project_hints', 'hints', 'id'],
+                ['studio_project_thread_messages', 'thread_messages', 'id'],
+                ['studio_project_notifications', 'notifications', 'id'],
+                ['studio_project_tag_assignments', 'tags', 'tag_id'],
+                ['project_members', 'members', 'user_id']
+            ] LOOP
+                IF NOT EXISTS (
+                    SELECT 1
+                    FROM pg_trigger
+                    WHERE tgrelid = spec[1]::regclass
+                      AND tgname = spec[1] || '_collaboration_version'
+                      AND NOT tgisinternal
+                ) THEN
+                    EXECUTE format(
+                        'CREATE TRIGGER %I
+                         AFTER INSERT OR UPDATE OR DELETE ON %I
+                         FOR EACH ROW
+                         EXECUTE FUNCTION record_studio_collaboration_change(%L, %L)',
+                        spec[1] || '_collaboration_version',
+                        spec[1],
+                        spec[2],
+                        spec[3]
+                    );
+                END IF;
+            END LOOP;
+
+            IF NOT EXISTS (
+                SELECT 1
+                FROM pg_trigger
+                WHERE tgrelid = 'users'::regclass
+                  AND tgname = 'users_collaboration_version'
+                  AND NOT tgisinternal
+            ) THEN
+                CREATE TRIGGER users_collaboration_version
+                AFTER UPDATE OF display_name, authelia_username, is_active ON users
+                FOR EACH ROW
+                WHEN (
+                    OLD.display_name IS DISTINCT FROM NEW.display_name
+                    OR OLD.authelia_username IS DISTINCT FROM NEW.authelia_username
+                    OR OLD.is_active IS DISTINCT FROM NEW.is_active
+                )
+                EXECUTE FUNCTION record_studio_collaboration_user_change();
+            END IF;
+
+            IF NOT EXISTS (
+                SELECT 1
+                FROM pg_trigger
+                WHERE tgrelid = 'studio_project_tags'::regclass
+                  AND tgname = 'studio_project_tags_version'
+                  AND NOT tgisinternal
+            ) THEN
+                CREATE TRIGGER studio_project_tags_version
+                AFTER INSERT OR UPDATE OR DELETE ON studio_project_tags
+                FOR EACH ROW
+                EXECUTE FUNCTION bump_studio_project_tags_version();
+            END IF;
+        END
+        $$;
+        """
+    )
@@ -3,17 +3,26 @@
 from __future__ import annotations
 
 import re
+import threading
+import time
 import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
 from typing import Any
 
 import asyncpg
 from fastapi import HTTPException, Request
 
-from app.runtime_config import NGINX_HMAC_SECRET, USER_TOKEN_MAX_CLOCK_SKEW_SECONDS
+from app.runtime_config import (
+    NGINX_HMAC_SECRET,
+    PROJECT_ACCESS_CACHE_TTL_SECONDS,
+    USER_TOKEN_MAX_CLOCK_SKEW_SECONDS,
+)
 from app.security_tokens import (
     resolve_user_claims_from_hmac_token as resolve_signed_user_claims,
     resolve_user_id_from_hmac_token as resolve_signed_user_id,
 )
+from app.user_activity import cache_user, get_cached_user, record_user_activity
 from app.validation import normalize_groups, parse_uuid_value
 
 
@@ -44,6 +53,11 @@ async def resolve_authenticated_user(
     if not re.fullmatch(r"[A-Za-z0-9_-]{43}", login_session):
         login_session = ""
 
+    cached = get_cached_user(signed_user_id, login_session)
+    if cached is not None:
+        record_user_activity(signed_user_id, login_session)
+        return cached
+
     async with pool.acquire() as conn:
         user_row = await conn.fetchrow(
             """
@@ -64,46 +78,23 @@ async def resolve_authenticated_user(
             signed_user_id,
         )
 
-        if user_row:
-            if login_session:
-                await conn.execute(
-                    """
-                    UPDATE users
-                    SET last_login_at = now(),
-                        last_login_session_hash = $2,
-                        updated_at = now()
-                    WHERE id = $1
-                      AND last_login_session_hash IS DISTINCT FROM $2
-                    """,
-                    user_row["id"],
-                    login_session,
-                )
-            await conn.execute(
-                """
-                UPDATE users
-                SET last_seen_at = now(), updated_at = now()
-                WHERE id = $1
-                  AND (
-                      last_seen_at IS NULL
-                      OR last_seen_at < now() - interval '5 minutes'
-                  )
-                """,
-                user_row["id"],
-            )
-
     if not user_row:
         raise HTTPException(403, "Usuário não sincronizado com o banco")
     if not user_row["is_active"]:
         raise HTTPException(403, "Usuário desativado")
 
+    # last_seen_at/last_login_at sao gravados em lote por app.user_activity.
+    record_user_activity(user_row["id"], login_session)
     groups = normalize_groups(user_row["groups"])
-    return {
+    user = {
         "db_user_id": user_row["id"],
         "username": user_row["authelia_username"],
         "display_name": user_row["display_name"],
         "groups": groups,
         "is_global_admin": "admin" in groups,
     }
+    cache_user(signed_user_id, login_session, user)
+    return user
 
 
 async def get_user_record_by_identifier(
@@ -160,6 +151,144 @@ async def get_project_row(conn: asyncpg.Connection, project_name: str) -> asyncp
     return row
 
 
+PROJECT_ACCESS_CACHE_MAX_ENTRIES = 4096
+
+_access_cache_lock = threading.Lock()
+_access_cache: OrderedDict[
+    tuple[uuid.UUID, str], tuple[float, dict[str, Any], str | None]
+] = OrderedDict()
+
+
+@dataclass(frozen=True)
+class ProjectAccess:
+    """Projeto e papel do usuario resolvidos numa unica consulta."""
+
+    project: dict[str, Any]
+    role: str | None
+    is_owner: bool
+    is_global_admin: bool
+
+    def require_member(
+        self,
+        message: str = "Acesso negado: você não é membro deste projeto",
+    ) -> None:
+        if self.role is None and not self.is_global_admin:
+            raise HTTPException(403, message)
+
+    def require_admin(
+        self,
+        message: str = "Acesso negado: apenas admin do projeto ou administrador do sistema",
+    ) -> None:
+        if self.role != "admin" and not self.is_global_admin:
+            raise HTTPException(403, message)
+
+    def require_owner(
+        self,
+        message: str = "Acesso negado: apenas o dono do projeto ou administrador do sistema",
+    ) -> None:
+        if not self.is_owner and not self.is_global_admin:
+            raise HTTPException(403, message)
+
+
+def _cached_project_access(
+    user_id: uuid.UUID, project_name: str
+) -> tuple[dict[str, Any], str | None] | None:
+    if PROJECT_ACCESS_CACHE_TTL_SECONDS <= 0:
+        return None
+    key = (user_id, project_name)
+    with _access_cache_lock:
+        cached = _access_cache.get(key)
+        if cached is None:
+            return None
+        expires_at, project, role = cached
+        if expires_at <= time.monotonic():
+            del _access_cache[key]
+            return None
+        _access_cache.move_to_end(key)
+        return project, role
+
+
+def _cache_project_access(
+    user_id: uuid.UUID, project_name: str, project: dict[str, Any], role: str | None
+) -> None:
+    if PROJECT_ACCESS_CACHE_TTL_SECONDS <= 0:
+        return
+    key = (user_id, project_name)
+    with _access_cache_lock:
+        _access_cache[key] = (
+            time.monotonic() + PROJECT_ACCESS_CACHE_TTL_SECONDS,
+            project,
+            role,
+        )
+        _access_cache.move_to_end(key)
+        while len(_access_cache) > PROJECT_ACCESS_CACHE_MAX_ENTRIES:
+            _access_cache.popitem(last=False)
+
+
+def invalidate_project_access(
+    *,
+    project_id: Any = None,
+    project_name: str | None = None,
+    user_id: uuid.UUID | str | None = None,
+) -> None:
+    """Descarta entradas do projeto e/ou do usuario (membros, transfer, rename, delete)."""
+    target_project = str(project_id) if project_id is not None else None
+    target_user = uuid.UUID(str(user_id)) if user_id is not None else None
+    with _access_cache_lock:
+        for key, (_, project, _) in list(_access_cache.items()):
+            if target_user is not None and key[0] != target_user:
+                continue
+            if target_project is not None and str(project["id"]) != target_project:
+                continue
+            if project_name is not None and key[1] != project_name:
+                continue
+            del _access_cache[key]
+
+
+async def resolve_project_access(
+    conn: asyncpg.Connection,
+    project_name: str,
+    auth_user: dict[str, Any],
+    *,
+    use_cache: bool = True,
+) -> ProjectAccess:
+    """Projeto, papel e ownership em um round trip, com cache curto por processo.
+
+    O projeto traz apenas colunas de identidade; estado mutavel (chaves,
+    rotacao) continua sendo lido da tabela. Rotas que alteram o projeto usam
+    ``get_project_row`` dentro da propria transacao.
+    """
+    user_id = auth_user["db_user_id"]
+    cached = _cached_project_access(user_id, project_name) if use_cache else None
+    if cached is not None:
+        project, role = cached
+    else:
+        row = await conn.fetchrow(
+            """
+            SELECT p.id, p.tenant_uuid, p.name, p.display_name, p.owner_id,
+                   pm.role AS member_role
+            FROM projects p
+            LEFT JOIN project_members pm
+              ON pm.project_id = p.id
+             AND pm.user_id = $2
+            WHERE p.name = $1
+            """,
+            project_name,
+            user_id,
+        )
+        if not row:
+            raise HTTPException(404, "Project not found")
+        project = dict(row)
+        role = project.pop("member_role")
+        _cache_project_access(user_id, project_name, project, role)
+    return ProjectAccess(
+        project=dict(project),
+        role=role,
+        is_owner=project["owner_id"] == user_id,
+        is_global_admin=auth_user["is_global_admin"],
+    )
+
+
 async def get_project_role(
     conn: asyncpg.Connection,
     *,
@@ -12,12 +12,13 @@ import asyncio
 import json
 import time
 import uuid
-from typing import Any, Awaitable, Callable
+from typing import Any, AsyncIterator, Awaitable, Callable
 
 import asyncpg
 
 from app.host_agent_protocol import (
     COMMAND_TIMEOUTS,
+    EVENTS_NOTIFY_CHANNEL,
     NOTIFY_CHANNEL,
     command_signature,
     validate_command_args,
@@ -28,6 +29,11 @@ OFFLINE_QUEUE_GRACE_SECONDS = 60
 WAIT_EXTRA_MARGIN_SECONDS = 120
 LEASE_EXPIRED_GRACE_SECONDS = 60
 STATE_FRESHNESS_LIMIT_SECONDS = 60
+# Com o listener ativo o poll e so rede de seguranca (NOTIFY perdido,
+# deadline, agent offline); sem ele, vale o ``poll_interval`` do chamador.
+EVENT_FALLBACK_POLL_SECONDS = 5.0
+# Comentario SSE enviado quando o stream de logs fica ocioso.
+LOG_STREAM_KEEPALIVE_SECONDS = 15.0
 
 ProgressCallback = Callable[[asyncpg.Record], Awaitable[None]]
 
@@ -47,74 +53,185 @@ class HostAgentOffline(HostAgentError):
         )
 
 
-async def ensure_host_agent_schema(pool: asyncpg.Pool) -> None:
-    async with pool.acquire() as conn:
-        await conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS host_agent_workers (
-                worker_id TEXT PRIMARY KEY,
-                hostname TEXT,
-                pid INTEGER,
-                version TEXT,
-                started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-                last_heartbeat_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-                stopped_at TIMESTAMPTZ
-            );
-
-            CREATE TABLE IF NOT EXISTS host_agent_commands (
-                id UUID PRIMARY KEY,
-                job_id UUID REFERENCES jobs(job_id) ON DELETE SET NULL,
-                project TEXT NOT NULL,
-                project_uuid UUID,
-                command TEXT NOT NULL,
-                args JSONB NOT NULL DEFAULT '{}'::jsonb,
-                requested_by UUID,
-                issued_at BIGINT NOT NULL,
-                signature TEXT NOT NULL,
-                timeout_seconds INTEGER NOT NULL CHECK (timeout_seconds > 0),
-                status TEXT NOT NULL DEFAULT 'queued'
-                    CHECK (status IN ('queued','running','done','failed','cancelled')),
-                progress SMALLINT NOT NULL DEFAULT 0
-                    CHECK (progress BETWEEN 0 AND 100),
-                current_step TEXT,
-                message TEXT,
-                worker_id TEXT,
-                lease_seconds INTEGER NOT NULL DEFAULT 60,
-                lease_expires_at TIMESTAMPTZ,
-                heartbeat_at TIMESTAMPTZ,
-                exit_code INTEGER,
-                error_code TEXT,
-                stdout_tail TEXT,
-                stderr_tail TEXT,
-                result JSONB,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-                started_at TIMESTAMPTZ,
-                finished_at TIMESTAMPTZ,
-                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
-            );
-
-            CREATE INDEX IF NOT EXISTS idx_host_agent_commands_status_created
-                ON host_agent_commands(status, created_at);
-            CREATE INDEX IF NOT EXISTS idx_host_agent_commands_job
-                ON host_agent_commands(job_id, command, created_at DESC);
-            CREATE INDEX IF NOT EXISTS idx_host_agent_commands_project_active
-                ON host_agent_commands(project)
-                WHERE status IN ('queued', 'running');
-
-            CREATE TABLE IF NOT EXISTS project_container_state (
-                container_name TEXT PRIMARY KEY,
-                project TEXT NOT NULL,
-                state TEXT,
-                status TEXT,
-                image TEXT,
-                ports TEXT,
-                created_at_text TEXT,
-                refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now()
-            );
-            CREATE INDEX IF NOT EXISTS idx_project_container_state_project
-                ON project_container_state(project);
-            """
-        )
+class CommandEventListener:
+    """Uma conexao LISTEN compartilhada que acorda os ``wait_command`` ativos.
+
+    O agent emite ``EVENTS_NOTIFY_CHANNEL`` com o id do comando a cada lease,
+    heartbeat e desfecho; cada espera registra um ``asyncio.Event`` por id.
+    Se a conexao cair, todos os waiters acordam e voltam ao polling ate a
+    proxima tentativa de reconexao.
+    """
+
+    def __init__(self) -> None:
+        self._conn: asyncpg.Connection | None = None
+        self._waiters: dict[uuid.UUID, set[asyncio.Event]] = {}
+        self._connect_lock = asyncio.Lock()
+        self._retry_after = 0.0
+
+    @property
+    def active(self) -> bool:
+        return self._conn is not None and not self._conn.is_closed()
+
+    async def ensure_started(self) -> bool:
+        if self.active:
+            return True
+        if time.monotonic() < self._retry_after:
+            return False
+        async with self._connect_lock:
+            if self.active:
+                return True
+            from app.runtime_config import DB_DSN
+
+            try:
+                conn = await asyncpg.connect(DB_DSN, timeout=5)
+                await conn.add_listener(EVENTS_NOTIFY_CHANNEL, self._on_notify)
+                conn.add_termination_listener(self._on_terminated)
+            except Exception as exc:  # noqa: BLE001
+                self._retry_after = time.monotonic() + EVENT_FALLBACK_POLL_SECONDS
+                print(f"[host_agent] LISTEN indisponivel ({exc}); usando polling")
+                return False
+            self._conn = conn
+            return True
+
+    def subscribe(self, command_id: uuid.UUID) -> asyncio.Event:
+        event = asyncio.Event()
+        self._waiters.setdefault(command_id, set()).add(event)
+        return event
+
+    def unsubscribe(self, command_id: uuid.UUID, event: asyncio.Event) -> None:
+        waiters = self._waiters.get(command_id)
+        if waiters is None:
+            return
+        waiters.discard(event)
+        if not waiters:
+            del self._waiters[command_id]
+
+    def _on_notify(self, _conn: Any, _pid: int, _channel: str, payload: str) -> None:
+        try:
+            command_id = uuid.UUID(payload)
+        except ValueError:
+            return
+        for event in self._waiters.get(command_id, ()):
+            event.set()
+
+    def _on_terminated(self, _conn: Any) -> None:
+        self._conn = None
+        for waiters in self._waiters.values():
+            for event in waiters:
+                event.set()
+
+    async def close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None and not conn.is_closed():
+            await conn.close()
+
+
+command_events = CommandEventListener()
+
+
+async def close_command_events() -> None:
+    await command_events.close()
+
+
+async def ensure_host_agent_schema(conn: asyncpg.Connection) -> None:
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS host_agent_workers (
+            worker_id TEXT PRIMARY KEY,
+            hostname TEXT,
+            pid INTEGER,
+            version TEXT,
+            started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            last_heartbeat_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            stopped_at TIMESTAMPTZ
+        );
+
+        CREATE TABLE IF NOT EXISTS host_agent_commands (
+            id UUID PRIMARY KEY,
+            job_id UUID REFERENCES jobs(job_id) ON DELETE SET NULL,
+            project TEXT NOT NULL,
+            project_uuid UUID,
+            command TEXT NOT NULL,
+            args JSONB NOT NULL DEFAULT '{}'::jsonb,
+            requested_by UUID,
+            issued_at BIGINT NOT NULL,
+            signature TEXT NOT NULL,
+            timeout_seconds INTEGER NOT NULL CHECK (timeout_seconds > 0),
+            status TEXT NOT NULL DEFAULT 'queued'
+                CHECK (status IN ('queued','running','done','failed','cancelled')),
+            progress SMALLINT NOT NULL DEFAULT 0
+                CHECK (progress BETWEEN 0 AND 100),
+            current_step TEXT,
+            message TEXT,
+            worker_id TEXT,
+            lease_seconds INTEGER NOT NULL DEFAULT 60,
+            lease_expires_at TIMESTAMPTZ,
+            heartbeat_at TIMESTAMPTZ,
+            exit_code INTEGER,
+            error_code TEXT,
+            stdout_tail TEXT,
+            stderr_tail TEXT,
+            result JSONB,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            started_at TIMESTAMPTZ,
+            finished_at TIMESTAMPTZ,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_host_agent_commands_status_created
+            ON host_agent_commands(status, created_at);
+        CREATE INDEX IF NOT EXISTS idx_host_agent_commands_job
+            ON host_agent_commands(job_id, command, created_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_host_agent_commands_project_active
+            ON host_agent_commands(project)
+            WHERE status IN ('queued', 'running');
+
+        -- Canal de logs em streaming: efemero (unlogged) e consumido pela
+        -- API; o cursor do cliente e o timestamp da ultima linha.
+        CREATE UNLOGGED TABLE IF NOT EXISTS host_agent_log_chunks (
+            command_id UUID NOT NULL
+                REFERENCES host_agent_commands(id) ON DELETE CASCADE,
+            seq INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            log_cursor TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (command_id, seq)
+        );
+
+        CREATE TABLE IF NOT EXISTS project_container_state (
+            container_name TEXT PRIMARY KEY,
+            project TEXT NOT NULL,
+            state TEXT,
+            status TEXT,
+            image TEXT,
+            ports TEXT,
+            created_at_text TEXT,
+            refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS idx_project_container_state_project
+            ON project_container_state(project);
+        """
+    )
+
+
+async def ensure_host_agent_queue_indexes(conn: asyncpg.Connection) -> None:
+    """Indices parciais do lease: so linhas na fila ou em execucao."""
+    await conn.execute(
+        """
+        -- Cabeca da fila por projeto (loose index scan do lease).
+        CREATE INDEX IF NOT EXISTS idx_host_agent_commands_queue_head
+            ON host_agent_commands(project, created_at)
+            WHERE status = 'queued';
+        -- Streams de logs saem antes, em ordem de chegada.
+        CREATE INDEX IF NOT EXISTS idx_host_agent_commands_queued_command
+            ON host_agent_commands(command, created_at)
+            WHERE status = 'queued';
+        -- Projeto ocupado: lease vivo de um comando serializado.
+        CREATE INDEX IF NOT EXISTS idx_host_agent_commands_running
+            ON host_agent_commands(project, lease_expires_at)
+            WHERE status = 'running';
+        """
+    )
 
 
 async def worker_alive(pool: asyncpg.Pool) -> bool:
@@ -218,114 +335,130 @@ async def wait_command(
 ) -> asyncpg.Record:
     """Espera o comando terminar, espelhando progresso e vigiando o lease.
 
-    Falha fail-closed quando o agent fica offline com o comando ainda na
-    fila ou quando o lease expira sem heartbeat (agent morto no meio da
-    execucao).
+    Acorda pelos NOTIFY do agent (lease, heartbeat, desfecho); o polling
+    fica como fallback lento. Falha fail-closed quando o agent fica offline
+    com o comando ainda na fila ou quando o lease expira sem heartbeat
+    (agent morto no meio da execucao).
     """
     queued_offline_since: float | None = None
     deadline: float | None = None
     last_status: str | None = None
     last_progress_key: tuple[Any, ...] | None = None
-
-    while True:
-        row = await pool.fetchrow(
-            "SELECT * FROM host_agent_commands WHERE id = $1", command_id
-        )
-        if row is None:
-            raise HostAgentError("command_missing", "Intencao sumiu do banco.")
-
-        if row["status"] in {"done", "failed", "cancelled"}:
-            return row
-
-        if on_progress is not None:
-            progress_key = (row["status"], row["progress"], row["current_step"], row["message"])
-            if progress_key != last_progress_key:
-                last_progress_key = progress_key
-                await on_progress(row)
-
-        now = time.monotonic()
-        if deadline is None or row["status"] != last_status:
-            # Cobre tambem o tempo em fila (ex.: outro comando do mesmo
-            # projeto em execucao) para a espera nunca ficar sem teto. O
-            # deadline reinicia na transicao queued -> running porque o
-            # timeout real e contado pelo agent a partir do inicio.
-            deadline = now + row["timeout_seconds"] + WAIT_EXTRA_MARGIN_SECONDS
-        last_status = row["status"]
-        if row["status"] == "queued":
-            if now > deadline:
-                await pool.execute(
-                    """
-                    UPDATE host_agent_commands
-                    SET status = 'cancelled',
-                        error_code = 'queue_wait_timeout',
-                        message = 'Comando expirou aguardando o host-agent.',
-                        finished_at = now(),
-                        updated_at = now()
-                    WHERE id = $1 AND status = 'queued'
-                    """,
-                    command_id,
-                )
-                continue
-            if await worker_alive(pool):
-                queued_offline_since = None
-            elif queued_offline_since is None:
-                queued_offline_since = now
-            elif now - queued_offline_since > OFFLINE_QUEUE_GRACE_SECONDS:
-                cancelled = await pool.execute(
-                    """
-                    UPDATE host_agent_commands
-                    SET status = 'cancelled',
-                        error_code = 'host_agent_offline',
-                        message = 'Nenhum host-agent ativo para executar o comando.',
-                        finished_at = now(),
-                        updated_at = now()
-                    WHERE id = $1 AND status = 'queued'
-                    """,
-                    command_id,
-                )
-                if cancelled.endswith("1"):
-                    raise HostAgentOffline()
-        elif row["status"] == "running":
-            expired = await pool.fetchval(
+    await command_events.ensure_started()
+    wakeup = command_events.subscribe(command_id)
+    try:
+        while True:
+            # Limpa antes de ler: um NOTIFY entre a leitura e a espera
+            # mantem o evento setado e nao se perde.
+            wakeup.clear()
+            row = await pool.fetchrow(
                 """
-                SELECT 1 FROM host_agent_commands
-                WHERE id = $1
-                  AND status = 'running'
-                  AND lease_expires_at < now() - make_interval(secs => $2)
+                SELECT c.*,
+                       c.lease_expires_at < now() - make_interval(secs => $2)
+                           AS lease_expired
+                FROM host_agent_commands c
+                WHERE c.id = $1
                 """,
                 command_id,
                 LEASE_EXPIRED_GRACE_SECONDS,
             )
-            if expired:
-                await pool.execute(
-                    """
-                    UPDATE host_agent_commands
-                    SET status = 'failed',
-                        error_code = 'lease_expired',
-                        message = 'Lease expirado sem heartbeat do worker.',
-                        finished_at = now(),
-                        updated_at = now()
-                    WHERE id = $1 AND status = 'running'
-                    """,
-                    command_id,
-                )
-                continue
-            if now > deadline:
-                await pool.execute(
-                    """
-                    UPDATE host_agent_commands
-                    SET status = 'failed',
-                        error_code = 'api_wait_timeout',
-                        message = 'Comando ultrapassou o timeout e a margem de espera.',
-                        finished_at = now(),
-                        updated_at = now()
-                    WHERE id = $1 AND status = 'running'
-                    """,
-                    command_id,
-                )
-                continue
-
-        await asyncio.sleep(poll_interval)
+            if row is None:
+                raise HostAgentError("command_missing", "Intencao sumiu do banco.")
+
+            if row["status"] in {"done", "failed", "cancelled"}:
+                return row
+
+            if on_progress is not None:
+                progress_key = (row["status"], row["progress"], row["current_step"], row["message"])
+                if progress_key != last_progress_key:
+                    last_progress_key = progress_key
+                    await on_progress(row)
+
+            now = time.monotonic()
+            if deadline is None or row["status"] != last_status:
+                # Cobre tambem o tempo em fila (ex.: outro comando do mesmo
+                # projeto em execucao) para a espera nunca ficar sem teto. O
+                # deadline reinicia na transicao queued -> running porque o
+                # timeout real e contado pelo agent a partir do inicio.
+                deadline = now + row["timeout_seconds"] + WAIT_EXTRA_MARGIN_SECONDS
+            last_status = row["status"]
+            if row["status"] == "queued":
+                if now > deadline:
+                    await pool.execute(
+                        """
+                        UPDATE host_agent_commands
+                        SET status = 'cancelled',
+                            error_code = 'queue_wait_timeout',
+                            message = 'Comando expirou aguardando o host-agent.',
+                            finished_at = now(),
+                            updated_at = now()
+                        WHERE id = $1 AND status = 'queued'
+                        """,
+                        command_id,
+                    )
+                    continue
+                if await worker_alive(pool):
+                    queued_offline_since = None
+                elif queued_offline_since is None:
+                    queued_offline_since = now
+                elif now - queued_offline_since > OFFLINE_QUEUE_GRACE_SECONDS:
+                    cancelled = await pool.execute(
+                        """
+                        UPDATE host_agent_commands
+                        SET status = 'cancelled',
+                            error_code = 'host_agent_offline',
+                            message = 'Nenhum host-agent ativo para executar o comando.',
+                            finished_at = now(),
+                            updated_at = now()
+                        WHERE id = $1 AND status = 'queued'
+                        """,
+                        command_id,
+                    )
+                    if cancelled.endswith("1"):
+                        raise HostAgentOffline()
+            elif row["status"] == "running":
+                if row["lease_expired"]:
+                    await pool.execute(
+                        """
+                        UPDATE host_agent_commands
+                        SET status = 'failed',
+                            error_code = 'lease_expired',
+                            message = 'Lease expirado sem heartbeat do worker.',
+                            finished_at = now(),
+                            updated_at = now()
+                        WHERE id = $1 AND status = 'running'
+                        """,
+                        command_id,
+                    )
+                    continue
+                if now > deadline:
+                    await pool.execute(
+                        """
+                        UPDATE host_agent_commands
+                        SET status = 'failed',
+                            error_code = 'api_wait_timeout',
+                            message = 'Comando ultrapassou o timeout e a margem de espera.',
+                            finished_at = now(),
+                            updated_at = now()
+                        WHERE id = $1 AND status = 'running'
+                        """,
+                        command_id,
+                    )
+                    continue
+
+            timeout = (
+                max(poll_interval, EVENT_FALLBACK_POLL_SECONDS)
+                if command_events.active
+                else poll_interval
+            )
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            if not command_events.active:
+                await command_events.ensure_started()
+    finally:
+        command_events.unsubscribe(command_id, wakeup)
 
 
 async def run_command(
@@ -393,6 +526,144 @@ async def run_command_for_job(
     )
 
 
+_log_stream_cleanups: set[asyncio.Task[None]] = set()
+
+
+async def _close_log_stream(
+    pool: asyncpg.Pool, command_id: uuid.UUID, *, cancel: bool
+) -> None:
+    if cancel:
+        # O proximo append do agent falha e ele encerra o ``docker logs``.
+        await pool.execute(
+            """
+            UPDATE host_agent_commands
+            SET status = 'cancelled',
+                error_code = 'stream_closed',
+                message = 'Leitor do stream de logs desconectou.',
+                finished_at = now(),
+                updated_at = now()
+            WHERE id = $1 AND status IN ('queued', 'running')
+            """,
+            command_id,
+        )
+    await pool.execute(
+        "DELETE FROM host_agent_log_chunks WHERE command_id = $1", command_id
+    )
+
+
+async def _drain_log_chunks(
+    pool: asyncpg.Pool, command_id: uuid.UUID
+) -> list[asyncpg.Record]:
+    rows = await pool.fetch(
+        """
+        DELETE FROM host_agent_log_chunks
+        WHERE command_id = $1
+        RETURNING seq, data, log_cursor
+        """,
+        command_id,
+    )
+    return sorted(rows, key=lambda row: row["seq"])
+
+
+async def stream_command_logs(
+    pool: asyncpg.Pool,
+    command_id: uuid.UUID,
+    *,
+    poll_interval: float = 1.0,
+) -> AsyncIterator[tuple[str, Any]]:
+    """Consome os chunks de um ``container_logs_stream`` conforme chegam.
+
+    Gera ``("logs", (texto, cursor))`` a cada chunk, ``("keepalive", None)``
+    quando nada chega por ``LOG_STREAM_KEEPALIVE_SECONDS`` e, por ultimo,
+    ``("end", registro)`` com o comando finalizado. Chunks lidos saem da
+    tabela; se o consumidor desistir antes do fim, o comando e cancelado.
+    """
+    finished = False
+    deadline: float | None = None
+    queued_offline_since: float | None = None
+    last_output = time.monotonic()
+    await command_events.ensure_started()
+    wakeup = command_events.subscribe(command_id)
+    try:
+        while True:
+            wakeup.clear()
+            for chunk in await _drain_log_chunks(pool, command_id):
+                last_output = time.monotonic()
+                yield "logs", (chunk["data"], chunk["log_cursor"])
+
+            row = await pool.fetchrow(
+                """
+                SELECT c.*,
+                       c.lease_expires_at < now() - make_interval(secs => $2)
+                           AS lease_expired
+                FROM host_agent_commands c
+                WHERE c.id = $1
+                """,
+                command_id,
+                LEASE_EXPIRED_GRACE_SECONDS,
+            )
+            if row is None:
+                raise HostAgentError("command_missing", "Intencao sumiu do banco.")
+            if row["status"] in {"done", "failed", "cancelled"}:
+                # O agent grava os ultimos chunks antes do desfecho.
+                for chunk in await _drain_log_chunks(pool, command_id):
+                    yield "logs", (chunk["data"], chunk["log_cursor"])
+                finished = True
+                yield "end", row
+                return
+
+            now = time.monotonic()
+            if deadline is None:
+                deadline = now + row["timeout_seconds"] + WAIT_EXTRA_MARGIN_SECONDS
+            if row["status"] == "queued":
+                if await worker_alive(pool):
+                    queued_offline_since = None
+                elif queued_offline_since is None:
+                    queued_offline_since = now
+                elif now - queued_offline_since > OFFLINE_QUEUE_GRACE_SECONDS:
+                    raise HostAgentOffline()
+            elif row["lease_expired"] or now > deadline:
+                await pool.execute(
+                    """
+                    UPDATE host_agent_commands
+                    SET status = 'failed',
+                        error_code = 'lease_expired',
+                        message = 'Stream de logs sem heartbeat do worker.',
+                        finished_at = now(),
+                        updated_at = now()
+                    WHERE id = $1 AND status = 'running'
+                    """,
+                    command_id,
+                )
+                continue
+
+            timeout = (
+                max(poll_interval, EVENT_FALLBACK_POLL_SECONDS)
+                if command_events.active
+                else poll_interval
+            )
+            timeout = min(
+                timeout,
+                max(0.0, last_output + LOG_STREAM_KEEPALIVE_SECONDS - now),
+            )
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                if time.monotonic() - last_output >= LOG_STREAM_KEEPALIVE_SECONDS:
+                    last_output = time.monotonic()
+                    yield "keepalive", None
+            if not command_events.active:
+                await command_events.ensure_started()
+    finally:
+        command_events.unsubscribe(command_id, wakeup)
+        # Roda fora do escopo cancelado quando o cliente HTTP desconecta.
+        task = asyncio.create_task(
+            _close_log_stream(pool, command_id, cancel=not finished)
+        )
+        _log_stream_cleanups.add(task)
+        task.add_done_callback(_log_stream_cleanups.discard)
+
+
 def command_result(row: asyncpg.Record) -> dict[str, Any]:
     raw = row["result"]
     if raw is None:
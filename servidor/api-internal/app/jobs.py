@@ -1,12 +1,17 @@
 """Persistencia e serializacao dos jobs de projeto.
 
 Este modulo concentra o ciclo de vida duravel dos jobs. Os runners de cada
-acao continuam nos modulos de dominio e sao injetados na fila.
+acao continuam nos modulos de dominio e sao injetados na fila, que vive na
+propria tabela ``jobs`` e pode ser consumida por varias replicas da API.
 """
 
 from __future__ import annotations
 
 import asyncio
+import base64
+import binascii
+import contextvars
+import datetime as dt
 import json
 import time
 import uuid
@@ -25,6 +30,16 @@ JobRunner = Callable[[], Awaitable[None]]
 
 _pool_provider: PoolProvider | None = None
 
+# (job_id, lease_owner) do runner da fila em execucao neste contexto: as
+# escritas desse job so valem enquanto o lease for nosso.
+_job_lease: contextvars.ContextVar[tuple[str, str] | None] = contextvars.ContextVar(
+    "job_lease", default=None
+)
+
+
+class JobLeaseLost(RuntimeError):
+    """O runner perdeu o lease do job; outra replica pode ja te-lo assumido."""
+
 
 def configure_jobs(pool_provider: PoolProvider) -> None:
     global _pool_provider
@@ -41,121 +56,138 @@ def is_action_idempotent(action: str | None) -> bool:
     return bool(action and action in IDEMPOTENT_ACTIONS)
 
 
-async def ensure_jobs_schema(pool: asyncpg.Pool) -> None:
-    async with pool.acquire() as conn:
-        await conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS jobs (
-                job_id UUID PRIMARY KEY,
-                project TEXT NOT NULL,
-                project_uuid UUID,
-                owner_id UUID REFERENCES users(id) ON DELETE SET NULL,
-                created_by UUID REFERENCES users(id) ON DELETE SET NULL,
-                status TEXT NOT NULL,
-                message TEXT,
-                action TEXT NOT NULL,
-                payload JSONB NOT NULL DEFAULT '{}'::jsonb,
-                progress SMALLINT NOT NULL DEFAULT 0
-                    CHECK (progress BETWEEN 0 AND 100),
-                current_step TEXT,
-                total_steps INTEGER NOT NULL DEFAULT 1 CHECK (total_steps > 0),
-                started_at TIMESTAMPTZ,
-                finished_at TIMESTAMPTZ,
-                stdout_tail TEXT,
-                stderr_tail TEXT,
-                error_code TEXT,
-                is_idempotent BOOLEAN NOT NULL DEFAULT false,
-                retryable BOOLEAN NOT NULL DEFAULT false,
-                retry_of UUID REFERENCES jobs(job_id) ON DELETE SET NULL,
-                attempt INTEGER NOT NULL DEFAULT 1 CHECK (attempt > 0),
-                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
-            );
-
-            ALTER TABLE jobs ADD COLUMN IF NOT EXISTS project_uuid UUID;
-            ALTER TABLE jobs ADD COLUMN IF NOT EXISTS created_by UUID;
-            ALTER TABLE jobs ADD COLUMN IF NOT EXISTS message TEXT;
-            ALTER TABLE jobs ADD COLUMN IF NOT EXISTS action TEXT;
-            ALTER TABLE jobs ADD COLUMN IF NOT EXISTS payload JSONB NOT NULL DEFAULT '{}'::jsonb;
-            ALTER TABLE jobs ADD COLUMN IF NOT EXISTS progress SMALLINT NOT NULL DEFAULT 0;
-            ALTER TABLE jobs ADD COLUMN IF NOT EXISTS current_step TEXT;
-            ALTER TABLE jobs ADD COLUMN IF NOT EXISTS total_steps INTEGER NOT NULL DEFAULT 1;
-            ALTER TABLE jobs ADD COLUMN IF NOT EXISTS started_at TIMESTAMPTZ;
-            ALTER TABLE jobs ADD COLUMN IF NOT EXISTS finished_at TIMESTAMPTZ;
-            ALTER TABLE jobs ADD COLUMN IF NOT EXISTS stdout_tail TEXT;
-            ALTER TABLE jobs ADD COLUMN IF NOT EXISTS stderr_tail TEXT;
-            ALTER TABLE jobs ADD COLUMN IF NOT EXISTS error_code TEXT;
-            ALTER TABLE jobs ADD COLUMN IF NOT EXISTS is_idempotent BOOLEAN NOT NULL DEFAULT false;
-            ALTER TABLE jobs ADD COLUMN IF NOT EXISTS retryable BOOLEAN NOT NULL DEFAULT false;
-            ALTER TABLE jobs ADD COLUMN IF NOT EXISTS retry_of UUID;
-            ALTER TABLE jobs ADD COLUMN IF NOT EXISTS attempt INTEGER NOT NULL DEFAULT 1;
-            ALTER TABLE jobs ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT now();
-            ALTER TABLE jobs ALTER COLUMN owner_id DROP NOT NULL;
-
-            UPDATE jobs j
-            SET project_uuid = p.id
-            FROM projects p
-            WHERE j.project_uuid IS NULL AND p.name = j.project;
+async def ensure_jobs_schema(conn: asyncpg.Connection) -> None:
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id UUID PRIMARY KEY,
+            project TEXT NOT NULL,
+            project_uuid UUID,
+            owner_id UUID REFERENCES users(id) ON DELETE SET NULL,
+            created_by UUID REFERENCES users(id) ON DELETE SET NULL,
+            status TEXT NOT NULL,
+            message TEXT,
+            action TEXT NOT NULL,
+            payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+            progress SMALLINT NOT NULL DEFAULT 0
+                CHECK (progress BETWEEN 0 AND 100),
+            current_step TEXT,
+            total_steps INTEGER NOT NULL DEFAULT 1 CHECK (total_steps > 0),
+            started_at TIMESTAMPTZ,
+            finished_at TIMESTAMPTZ,
+            stdout_tail TEXT,
+            stderr_tail TEXT,
+            error_code TEXT,
+            is_idempotent BOOLEAN NOT NULL DEFAULT false,
+            retryable BOOLEAN NOT NULL DEFAULT false,
+            retry_of UUID REFERENCES jobs(job_id) ON DELETE SET NULL,
+            attempt INTEGER NOT NULL DEFAULT 1 CHECK (attempt > 0),
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            enqueued_at TIMESTAMPTZ,
+            lease_owner TEXT,
+            lease_expires_at TIMESTAMPTZ
+        );
 
-            UPDATE jobs SET created_by = owner_id WHERE created_by IS NULL;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS project_uuid UUID;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS created_by UUID;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS message TEXT;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS action TEXT;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS payload JSONB NOT NULL DEFAULT '{}'::jsonb;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS progress SMALLINT NOT NULL DEFAULT 0;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS current_step TEXT;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS total_steps INTEGER NOT NULL DEFAULT 1;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS started_at TIMESTAMPTZ;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS finished_at TIMESTAMPTZ;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS stdout_tail TEXT;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS stderr_tail TEXT;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS error_code TEXT;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS is_idempotent BOOLEAN NOT NULL DEFAULT false;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS retryable BOOLEAN NOT NULL DEFAULT false;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS retry_of UUID;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS attempt INTEGER NOT NULL DEFAULT 1;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT now();
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS enqueued_at TIMESTAMPTZ;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS lease_owner TEXT;
+        ALTER TABLE jobs ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ;
+        ALTER TABLE jobs ALTER COLUMN owner_id DROP NOT NULL;
 
-            UPDATE jobs
-            SET is_idempotent = action IN ('start', 'stop', 'restart', 'recreate_services'),
-                retryable = action IN ('start', 'stop', 'restart', 'recreate_services');
-
-            CREATE INDEX IF NOT EXISTS idx_jobs_status_updated
-                ON jobs(status, updated_at);
-            CREATE INDEX IF NOT EXISTS idx_jobs_project_status
-                ON jobs(project, status, updated_at);
-            CREATE INDEX IF NOT EXISTS idx_jobs_project_uuid_created
-                ON jobs(project_uuid, created_at DESC);
-            CREATE INDEX IF NOT EXISTS idx_jobs_created_by_created
-                ON jobs(created_by, created_at DESC);
-            CREATE INDEX IF NOT EXISTS idx_jobs_retry_of
-                ON jobs(retry_of);
-            CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_one_active_retry
-                ON jobs(retry_of)
-                WHERE retry_of IS NOT NULL AND status IN ('queued', 'running');
-            """
-        )
-        # Constraints are added separately so this migration remains safe for
-        # installations whose jobs table predates these columns.
-        await conn.execute(
-            """
-            DO $$
-            BEGIN
-                IF EXISTS (
-                    SELECT 1 FROM pg_constraint WHERE conname = 'jobs_project_uuid_fkey'
-                ) THEN
-                    ALTER TABLE jobs DROP CONSTRAINT jobs_project_uuid_fkey;
-                END IF;
-                IF EXISTS (
-                    SELECT 1 FROM pg_constraint
-                    WHERE conname = 'jobs_owner_id_fkey' AND confdeltype <> 'n'
-                ) THEN
-                    ALTER TABLE jobs DROP CONSTRAINT jobs_owner_id_fkey;
-                END IF;
-                IF NOT EXISTS (
-                    SELECT 1 FROM pg_constraint WHERE conname = 'jobs_owner_id_fkey'
-                ) THEN
-                    ALTER TABLE jobs ADD CONSTRAINT jobs_owner_id_fkey
-                        FOREIGN KEY (owner_id) REFERENCES users(id) ON DELETE SET NULL;
-                END IF;
-                IF NOT EXISTS (
-                    SELECT 1 FROM pg_constraint WHERE conname = 'jobs_created_by_fkey'
-                ) THEN
-                    ALTER TABLE jobs ADD CONSTRAINT jobs_created_by_fkey
-                        FOREIGN KEY (created_by) REFERENCES users(id) ON DELETE SET NULL;
-                END IF;
-                IF NOT EXISTS (
-                    SELECT 1 FROM pg_constraint WHERE conname = 'jobs_retry_of_fkey'
-                ) THEN
-                    ALTER TABLE jobs ADD CONSTRAINT jobs_retry_of_fkey
-                        FOREIGN KEY (retry_of) REFERENCES jobs(job_id) ON DELETE SET NULL;
-                END IF;
-            END $$;
-            """
-        )
+        UPDATE jobs j
+        SET project_uuid = p.id
+        FROM projects p
+        WHERE j.project_uuid IS NULL AND p.name = j.project;
+
+        UPDATE jobs SET created_by = owner_id WHERE created_by IS NULL;
+
+        UPDATE jobs
+        SET is_idempotent = action IN ('start', 'stop', 'restart', 'recreate_services'),
+            retryable = action IN ('start', 'stop', 'restart', 'recreate_services')
+        WHERE is_idempotent IS DISTINCT FROM (action IN ('start', 'stop', 'restart', 'recreate_services'))
+           OR retryable IS DISTINCT FROM (action IN ('start', 'stop', 'restart', 'recreate_services'));
+
+        CREATE INDEX IF NOT EXISTS idx_jobs_status_updated
+            ON jobs(status, updated_at);
+        CREATE INDEX IF NOT EXISTS idx_jobs_project_status
+            ON jobs(project, status, updated_at);
+        CREATE INDEX IF NOT EXISTS idx_jobs_project_uuid_created
+            ON jobs(project_uuid, created_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_jobs_created_by_created
+            ON jobs(created_by, created_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_jobs_retry_of
+            ON jobs(retry_of);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_one_active_retry
+            ON jobs(retry_of)
+            WHERE retry_of IS NOT NULL AND status IN ('queued', 'running');
+        CREATE INDEX IF NOT EXISTS idx_jobs_queue_head
+            ON jobs(project_uuid, enqueued_at, job_id)
+            WHERE status = 'queued' AND enqueued_at IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_jobs_lease_expires
+            ON jobs(lease_expires_at)
+            WHERE lease_owner IS NOT NULL;
+        -- Serializacao por projeto: um unico job com lease ativo.
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_one_leased_per_project
+            ON jobs(project_uuid)
+            WHERE lease_owner IS NOT NULL AND status IN ('queued', 'running');
+        """
+    )
+    # Constraints are added separately so this migration remains safe for
+    # installations whose jobs table predates these columns.
+    await conn.execute(
+        """
+        DO $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM pg_constraint WHERE conname = 'jobs_project_uuid_fkey'
+            ) THEN
+                ALTER TABLE jobs DROP CONSTRAINT jobs_project_uuid_fkey;
+            END IF;
+            IF EXISTS (
+                SELECT 1 FROM pg_constraint
+                WHERE conname = 'jobs_owner_id_fkey' AND confdeltype <> 'n'
+            ) THEN
+                ALTER TABLE jobs DROP CONSTRAINT jobs_owner_id_fkey;
+            END IF;
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_constraint WHERE conname = 'jobs_owner_id_fkey'
+            ) THEN
+                ALTER TABLE jobs ADD CONSTRAINT jobs_owner_id_fkey
+                    FOREIGN KEY (owner_id) REFERENCES users(id) ON DELETE SET NULL;
+            END IF;
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_constraint WHERE conname = 'jobs_created_by_fkey'
+            ) THEN
+                ALTER TABLE jobs ADD CONSTRAINT jobs_created_by_fkey
+                    FOREIGN KEY (created_by) REFERENCES users(id) ON DELETE SET NULL;
+            END IF;
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_constraint WHERE conname = 'jobs_retry_of_fkey'
+            ) THEN
+                ALTER TABLE jobs ADD CONSTRAINT jobs_retry_of_fkey
+                    FOREIGN KEY (retry_of) REFERENCES jobs(job_id) ON DELETE SET NULL;
+            END IF;
+        END $$;
+        """
+    )
 
 
 async def set_job_status(
@@ -204,11 +236,19 @@ async def set_job_status(
             assignments.append("progress=100")
 
     values.append(uuid.UUID(str(job_id)))
+    where = f"job_id=${len(values)}"
+    lease = _job_lease.get()
+    fenced = lease is not None and lease[0] == str(job_id)
+    if fenced:
+        values.append(lease[1])
+        where += f" AND lease_owner=${len(values)}"
     pool = await _get_pool()
-    await pool.execute(
-        "UPDATE jobs SET " + ", ".join(assignments) + f" WHERE job_id=${len(values)}",
+    status = await pool.execute(
+        "UPDATE jobs SET " + ", ".join(assignments) + " WHERE " + where,
         *values,
     )
+    if fenced and status.rsplit(" ", 1)[-1] == "0":
+        raise JobLeaseLost(f"job {job_id} perdeu o lease de {lease[1]}")
 
 
 async def create_project_job(
@@ -328,10 +368,14 @@ def serialize_job(row: asyncpg.Record, *, include_output: bool = False) -> dict[
         value = row[column]
         return value.isoformat() if value else None
 
-    payload = row["payload"] or {}
-    if isinstance(payload, str):
-        payload = json.loads(payload)
-    tenant_uuid = payload.get("tenant_uuid") if isinstance(payload, dict) else None
+    if "payload" in row.keys():
+        payload = row["payload"] or {}
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+        tenant_uuid = payload.get("tenant_uuid") if isinstance(payload, dict) else None
+    else:
+        # Linha estreita do historico: so o tenant_uuid sai do payload.
+        tenant_uuid = row["tenant_uuid"]
 
     result = {
         "job_id": str(row["job_id"]),
@@ -361,78 +405,326 @@ def serialize_job(row: asyncpg.Record, *, include_output: bool = False) -> dict[
     return result
 
 
-class _QueuedAction:
-    __slots__ = ("job_id", "project_id", "project_name", "submitted_at", "runner")
+JOB_HISTORY_COLUMNS = """
+    j.job_id, j.project, j.project_uuid, j.payload->>'tenant_uuid' AS tenant_uuid,
+    j.created_by, j.action, j.status, j.message, j.progress, j.current_step,
+    j.total_steps, j.started_at, j.finished_at, j.error_code, j.is_idempotent,
+    j.retryable, j.retry_of, j.attempt, j.created_at, j.updated_at
+"""
+JOB_HISTORY_OUTPUT_COLUMNS = ", j.stdout_tail, j.stderr_tail"
+JOB_HISTORY_ORDER = "ORDER BY j.created_at DESC, j.job_id DESC"
 
-    def __init__(self, job_id: str, project_id: uuid.UUID, project_name: str, runner: JobRunner) -> None:
-        self.job_id = job_id
-        self.project_id = project_id
-        self.project_name = project_name
-        self.submitted_at = time.time()
-        self.runner = runner
 
+class JobHistoryValidationError(ValueError):
+    pass
 
-class ProjectActionQueue:
-    """Fila FIFO por projeto, protegida tambem por advisory lock no Postgres."""
 
-    def __init__(self) -> None:
-        self._queues: dict[str, asyncio.Queue[_QueuedAction]] = {}
-        self._workers: dict[str, asyncio.Task[None]] = {}
-        self._current: dict[str, _QueuedAction] = {}
-        self._registry_lock = asyncio.Lock()
-        self._shutting_down = False
+async def ensure_job_history_indexes(conn: asyncpg.Connection) -> None:
+    await conn.execute(
+        """
+        -- Keyset (created_at, job_id) para admin, autor e jobs de sistema
+        -- visiveis por projeto; o indice por autor substitui o antigo.
+        CREATE INDEX IF NOT EXISTS idx_jobs_history
+            ON jobs(created_at DESC, job_id DESC);
+        CREATE INDEX IF NOT EXISTS idx_jobs_created_by_history
+            ON jobs(created_by, created_at DESC, job_id DESC);
+        CREATE INDEX IF NOT EXISTS idx_jobs_project_shared_history
+            ON jobs(project_uuid, created_at DESC, job_id DESC)
+            WHERE created_by IS NULL;
+        DROP INDEX IF EXISTS idx_jobs_created_by_created;
+        """
+    )
+
 
-    async def _ensure_worker(self, project_name: str) -> asyncio.Queue[_QueuedAction]:
-        async with self._registry_lock:
-            if self._shutting_down:
-                raise RuntimeError("action_queue esta em shutdown")
-            queue = self._queues.get(project_name)
-            if queue is None:
-                queue = asyncio.Queue()
-                self._queues[project_name] = queue
-                self._workers[project_name] = asyncio.create_task(
-                    self._worker_loop(project_name, queue), name=f"project-queue:{project_name}"
+def encode_job_cursor(created_at: dt.datetime, job_id: Any) -> str:
+    raw = f"{created_at.astimezone(dt.timezone.utc).isoformat()}|{job_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_job_cursor(cursor: str | None) -> tuple[dt.datetime, uuid.UUID] | None:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        created_at, job_id = raw.split("|", 1)
+        parsed = dt.datetime.fromisoformat(created_at)
+        if parsed.tzinfo is None:
+            raise ValueError("cursor sem timezone")
+        return parsed, uuid.UUID(job_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise JobHistoryValidationError("cursor invalido") from exc
+
+
+async def _estimate_rows(conn: asyncpg.Connection, query: str, *args: Any) -> int:
+    """Total aproximado pelo planner; nao varre a tabela."""
+    plan = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {query}", *args)
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def fetch_job_history(
+    conn: asyncpg.Connection,
+    *,
+    viewer_id: uuid.UUID | None,
+    project_uuid: uuid.UUID | None = None,
+    action: str | None = None,
+    status: str | None = None,
+    cursor: str | None = None,
+    limit: int = 50,
+    include_output: bool = False,
+) -> dict[str, Any]:
+    """Pagina o historico por keyset ``(created_at, job_id)``.
+
+    ``viewer_id`` nulo significa admin global. Para os demais, os jobs do
+    proprio usuario e os jobs de sistema dos projetos visiveis sao lidos por
+    indices separados e intercalados, sem EXISTS aninhado por linha. O total
+    estimado so acompanha a primeira pagina.
+    """
+    after = decode_job_cursor(cursor)
+    values: list[Any] = []
+    filters: list[str] = []
+
+    def bind(value: Any) -> str:
+        values.append(value)
+        return f"${len(values)}"
+
+    # Visibilidade e filtros primeiro: o total estimado reusa esse prefixo
+    # dos parametros, sem cursor nem LIMIT.
+    viewer = bind(viewer_id) if viewer_id is not None else None
+    if project_uuid is not None:
+        filters.append(f"j.project_uuid = {bind(project_uuid)}")
+    if action:
+        filters.append(f"j.action = {bind(action)}")
+    if status:
+        filters.append(f"j.status = {bind(status)}")
+    count_filters = list(filters)
+    count_arity = len(values)
+    if after is not None:
+        filters.append(f"(j.created_at, j.job_id) < ({bind(after[0])}, {bind(after[1])})")
+    page_size = bind(limit + 1)
+
+    columns = JOB_HISTORY_COLUMNS + (JOB_HISTORY_OUTPUT_COLUMNS if include_output else "")
+    if viewer is None:
+        where_sql = " WHERE " + " AND ".join(filters) if filters else ""
+        query = f"""
+            SELECT {columns}
+            FROM jobs j
+            {where_sql}
+            {JOB_HISTORY_ORDER}
+            LIMIT {page_size}
+        """
+        count_where = " WHERE " + " AND ".join(count_filters) if count_filters else ""
+        count_query = f"SELECT 1 FROM jobs j{count_where}"
+    else:
+        extra = "".join(f" AND {expression}" for expression in filters)
+        query = f"""
+            WITH visible_projects AS (
+                SELECT id FROM projects WHERE owner_id = {viewer}
+                UNION
+                SELECT project_id FROM project_members WHERE user_id = {viewer}
+            )
+            SELECT page.*
+            FROM (
+                (
+                    SELECT {columns}
+                    FROM jobs j
+                    WHERE j.created_by = {viewer}{extra}
+                    {JOB_HISTORY_ORDER}
+                    LIMIT {page_size}
+                )
+                UNION ALL
+                (
+                    SELECT shared.*
+                    FROM visible_projects v
+                    CROSS JOIN LATERAL (
+                        SELECT {columns}
+                        FROM jobs j
+                        WHERE j.project_uuid = v.id
+                          AND j.created_by IS NULL{extra}
+                        {JOB_HISTORY_ORDER}
+                        LIMIT {page_size}
+                    ) shared
+                )
+            ) page
+            ORDER BY page.created_at DESC, page.job_id DESC
+            LIMIT {page_size}
+        """
+        count_extra = "".join(f" AND {expression}" for expression in count_filters)
+        count_query = f"""
+            SELECT 1 FROM jobs j
+            WHERE (
+                j.created_by = {viewer}
+                OR (
+                    j.created_by IS NULL
+                    AND j.project_uuid IN (
+                        SELECT id FROM projects WHERE owner_id = {viewer}
+                        UNION
+                        SELECT project_id FROM project_members WHERE user_id = {viewer}
+                    )
                 )
-            return queue
+            ){count_extra}
+        """
 
-    async def _worker_loop(self, project_name: str, queue: asyncio.Queue[_QueuedAction]) -> None:
-        try:
-            while True:
-                action = await queue.get()
-                self._current[project_name] = action
-                try:
-                    await self._run_with_project_lock(action)
-                except asyncio.CancelledError:
-                    raise
-                except Exception as exc:  # noqa: BLE001
-                    print(f"[action_queue] job {action.job_id} falhou: {exc}")
-                    try:
-                        await set_job_status(
-                            action.job_id,
-                            "failed",
-                            message="Falha interna ao executar a acao enfileirada.",
-                            current_step="queue_runner_failed",
-                            error_code="queue_runner_failed",
-                        )
-                    except Exception as status_exc:  # noqa: BLE001
-                        print(f"[action_queue] falha ao persistir status: {status_exc}")
-                finally:
-                    self._current.pop(project_name, None)
-                    queue.task_done()
-        except asyncio.CancelledError:
-            raise
-        except Exception as exc:  # noqa: BLE001
-            print(f"[action_queue] worker de {project_name} morreu: {exc!r}")
+    rows = await conn.fetch(query, *values)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_job_cursor(rows[-1]["created_at"], rows[-1]["job_id"])
 
-    async def _run_with_project_lock(self, action: _QueuedAction) -> None:
-        pool = await _get_pool()
-        async with pool.acquire() as conn:
-            lock_key = str(action.project_id)
-            await conn.execute("SELECT pg_advisory_lock(hashtextextended($1, 0))", lock_key)
-            try:
-                await action.runner()
-            finally:
-                await conn.execute("SELECT pg_advisory_unlock(hashtextextended($1, 0))", lock_key)
+    estimated_total = None
+    if after is None:
+        estimated_total = await _estimate_rows(conn, count_query, *values[:count_arity])
+    return {
+        "items": [serialize_job(row, include_output=include_output) for row in rows],
+        "limit": limit,
+        "count": len(rows),
+        "next_cursor": next_cursor,
+        "estimated_total": estimated_total,
+    }
+
+
+
+
+_LEASE_NEXT_JOB = """
+UPDATE jobs j
+SET lease_owner = $1,
+    lease_expires_at = now() + make_interval(secs => $2)
+WHERE j.job_id = (
+    SELECT q.job_id
+    FROM jobs q
+    WHERE q.status = 'queued'
+      AND q.enqueued_at IS NOT NULL
+      AND q.lease_owner IS NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM jobs r
+          WHERE r.project_uuid = q.project_uuid
+            AND r.lease_owner IS NOT NULL
+            AND r.status IN ('queued', 'running')
+      )
+      AND NOT EXISTS (
+          SELECT 1 FROM jobs o
+          WHERE o.project_uuid = q.project_uuid
+            AND o.status = 'queued'
+            AND o.enqueued_at IS NOT NULL
+            AND o.lease_owner IS NULL
+            AND (o.enqueued_at, o.job_id) < (q.enqueued_at, q.job_id)
+      )
+    ORDER BY q.enqueued_at, q.job_id
+    FOR UPDATE SKIP LOCKED
+    LIMIT 1
+)
+RETURNING j.*
+"""
+
+# Lease vencido (replica morta), job running sem lease (worker encerrado no
+# meio) ou job criado e nunca enfileirado alem da carencia (request
+# interrompido, nao so lento).
+_ORPHANED_JOBS = """
+SELECT *
+FROM jobs
+WHERE status IN ('queued', 'running')
+  AND (
+      (lease_owner IS NOT NULL AND lease_expires_at < now())
+      OR (lease_owner IS NULL AND status = 'running')
+      OR (
+          lease_owner IS NULL
+          AND enqueued_at IS NULL
+          AND updated_at < now() - make_interval(secs => $1)
+      )
+  )
+ORDER BY updated_at ASC
+LIMIT 100
+FOR UPDATE SKIP LOCKED
+"""
+
+# O reaper assume o lease vencido antes de decidir: a renovacao do runner
+# antigo deixa de casar e ele e cancelado, e nenhuma outra replica pega o
+# job enquanto o handler roda.
+_FENCE_ORPHANS = """
+UPDATE jobs
+SET lease_owner = $1,
+    lease_expires_at = now() + make_interval(secs => $3)
+WHERE job_id = ANY($2::uuid[])
+  AND lease_owner IS NOT NULL
+  AND lease_expires_at < now()
+RETURNING job_id
+"""
+
+# As decisoes sao aplicadas so se ninguem mexeu no lease desde a leitura.
+_REQUEUE_ORPHAN = """
+UPDATE jobs
+SET status = 'queued',
+    lease_owner = NULL,
+    lease_expires_at = NULL,
+    enqueued_at = clock_timestamp(),
+    updated_at = now()
+WHERE job_id = $1 AND lease_owner IS NOT DISTINCT FROM $2
+"""
+
+_RELEASE_ORPHAN = """
+UPDATE jobs
+SET lease_owner = NULL, lease_expires_at = NULL
+WHERE job_id = $1 AND lease_owner IS NOT DISTINCT FROM $2
+"""
+
+ACTION_QUEUE_REAPER_LOCK_NAME = "supabase-multitenant:action-queue-reaper"
+
+RunnerFactory = Callable[[asyncpg.Record], Awaitable[JobRunner | None]]
+OrphanHandler = Callable[[asyncpg.Record], Awaitable[bool]]
+
+
+class ProjectActionQueue:
+    """Fila duravel na tabela ``jobs``, serializada por projeto no Postgres.
+
+    Cada replica faz lease do proximo job elegivel com ``FOR UPDATE SKIP
+    LOCKED``: no maximo um job com lease por projeto (garantido tambem pelo
+    indice unico parcial) e sempre o mais antigo da fila daquele projeto.
+    Nenhuma conexao fica presa durante a execucao; o lease e renovado em
+    lote e, se vencer, o job volta para o reaper. O runner que perde o lease
+    e cancelado e suas escritas em ``jobs`` sao cercadas por ``lease_owner``.
+    O runner sai do closure local de quem enfileirou ou e reconstruido a
+    partir da linha.
+    """
+
+    def __init__(self) -> None:
+        self.worker_id = f"api-{uuid.uuid4()}"
+        self._local_runners: dict[str, tuple[float, JobRunner]] = {}
+        self._running: dict[str, asyncio.Task[None]] = {}
+        self._lease_deadlines: dict[str, float] = {}
+        self._wakeup = asyncio.Event()
+        self._dispatcher: asyncio.Task[None] | None = None
+        self._runner_factory: RunnerFactory | None = None
+        self._on_orphaned: OrphanHandler | None = None
+        self.max_concurrent = 1
+        self.lease_seconds = 60
+        self.enqueue_grace_seconds = 900
+        self.poll_interval = 2.0
+        self._shutting_down = False
+
+    def start(
+        self,
+        *,
+        runner_factory: RunnerFactory,
+        on_orphaned: OrphanHandler,
+        max_concurrent: int,
+        lease_seconds: int,
+        poll_interval: float,
+        enqueue_grace_seconds: int = 900,
+    ) -> None:
+        if self._dispatcher is not None:
+            return
+        self._runner_factory = runner_factory
+        self._on_orphaned = on_orphaned
+        self.max_concurrent = max_concurrent
+        self.lease_seconds = lease_seconds
+        self.enqueue_grace_seconds = enqueue_grace_seconds
+        self.poll_interval = poll_interval
+        self._shutting_down = False
+        self._dispatcher = asyncio.create_task(
+            self._dispatch_loop(), name="project-action-queue"
+        )
 
     async def submit(
         self,
@@ -441,38 +733,319 @@ class ProjectActionQueue:
         job_id: str,
         runner: JobRunner,
     ) -> int:
-        queue = await self._ensure_worker(project_name)
-        position = queue.qsize()
-        await queue.put(_QueuedAction(job_id, project_id, project_name, runner))
-        return position
-
-    def status(self, project_name: str) -> dict[str, Any]:
-        queue = self._queues.get(project_name)
-        current = self._current.get(project_name)
+        """Libera o job para lease; devolve quantos esperam antes dele."""
+        if self._shutting_down:
+            raise RuntimeError("action_queue esta em shutdown")
+        self._local_runners[job_id] = (time.monotonic(), runner)
+        pool = await _get_pool()
+        row = await pool.fetchrow(
+            """
+            WITH enqueued AS (
+                UPDATE jobs
+                SET enqueued_at = COALESCE(enqueued_at, clock_timestamp()),
+                    project_uuid = COALESCE(project_uuid, $2)
+                WHERE job_id = $1 AND status = 'queued'
+                RETURNING job_id, project_uuid, enqueued_at
+            )
+            SELECT
+                e.job_id,
+                (
+                    SELECT count(*) FROM jobs j
+                    WHERE j.project_uuid = e.project_uuid
+                      AND j.status = 'queued'
+                      AND j.lease_owner IS NULL
+                      AND j.enqueued_at IS NOT NULL
+                      AND j.job_id <> e.job_id
+                      AND j.enqueued_at <= e.enqueued_at
+                ) AS position
+            FROM enqueued e
+            """,
+            uuid.UUID(job_id),
+            project_id,
+        )
+        if row is None:
+            self._local_runners.pop(job_id, None)
+            raise LookupError(f"job {job_id} de {project_name} nao esta em queued")
+        self._wakeup.set()
+        return int(row["position"])
+
+    async def status(self, project_name: str) -> dict[str, Any]:
+        pool = await _get_pool()
+        row = await pool.fetchrow(
+            """
+            SELECT
+                (
+                    SELECT j.job_id FROM jobs j
+                    WHERE j.project_uuid = p.id
+                      AND j.lease_owner IS NOT NULL
+                      AND j.status IN ('queued', 'running')
+                    LIMIT 1
+                ) AS current_job_id,
+                (
+                    SELECT count(*) FROM jobs j
+                    WHERE j.project_uuid = p.id
+                      AND j.status = 'queued'
+                      AND j.lease_owner IS NULL
+                      AND j.enqueued_at IS NOT NULL
+                ) AS queued
+            FROM projects p
+            WHERE p.name = $1
+            """,
+            project_name,
+        )
+        current = row["current_job_id"] if row else None
         return {
             "project": project_name,
-            "current_job_id": current.job_id if current else None,
-            "current_project": current.project_name if current else None,
-            "queued": queue.qsize() if queue else 0,
+            "current_job_id": str(current) if current else None,
+            "current_project": project_name if current else None,
+            "queued": int(row["queued"]) if row else 0,
             "is_busy": current is not None,
         }
 
-    def known_projects(self) -> list[str]:
-        return list(self._queues)
+    async def lease_next(self) -> asyncpg.Record | None:
+        pool = await _get_pool()
+        try:
+            return await pool.fetchrow(
+                _LEASE_NEXT_JOB, self.worker_id, float(self.lease_seconds)
+            )
+        except asyncpg.UniqueViolationError:
+            # Outra replica pegou um job do mesmo projeto no mesmo instante.
+            return None
+
+    async def renew_leases(self) -> list[str]:
+        """Renova os leases locais e cancela os runners que os perderam.
+
+        Sem renovacao confirmada dentro de ``lease_seconds`` (failover,
+        dispatcher parado) o reaper de outra replica pode reenfileirar o job;
+        o runner local para em vez de executar em paralelo com o novo.
+        """
+        if not self._running:
+            return []
+        loop = asyncio.get_running_loop()
+        job_ids = list(self._running)
+        started = loop.time()
+        try:
+            pool = await _get_pool()
+            rows = await pool.fetch(
+                """
+                UPDATE jobs
+                SET lease_expires_at = now() + make_interval(secs => $3)
+                WHERE lease_owner = $1
+                  AND job_id = ANY($2::uuid[])
+                  AND lease_expires_at > now()
+                RETURNING job_id
+                """,
+                self.worker_id,
+                [uuid.UUID(job_id) for job_id in job_ids],
+                float(self.lease_seconds),
+            )
+        except Exception:
+            self._cancel_lost(
+                [
+                    job_id
+                    for job_id in job_ids
+                    if self._lease_deadlines.get(job_id, started) <= loop.time()
+                ]
+            )
+            raise
+        renewed = {str(row["job_id"]) for row in rows}
+        for job_id in renewed:
+            self._lease_deadlines[job_id] = started + self.lease_seconds
+        lost = [job_id for job_id in job_ids if job_id not in renewed]
+        self._cancel_lost(lost)
+        return lost
+
+    def _cancel_lost(self, job_ids: list[str]) -> None:
+        for job_id in job_ids:
+            # Runner ja no finally saiu de _running: so libera o proprio lease.
+            task = self._running.get(job_id)
+            if task is not None and not task.done():
+                print(f"[action_queue] lease de {job_id} perdido; cancelando runner local")
+                task.cancel()
+
+    async def release(self, job_id: str) -> None:
+        pool = await _get_pool()
+        await pool.execute(
+            """
+            UPDATE jobs
+            SET lease_owner = NULL,
+                lease_expires_at = NULL,
+                enqueued_at = CASE
+                    WHEN status IN ('queued', 'running') THEN NULL
+                    ELSE enqueued_at
+                END
+            WHERE job_id = $1 AND lease_owner = $2
+            """,
+            uuid.UUID(job_id),
+            self.worker_id,
+        )
+
+    async def reap_orphans(self) -> int:
+        """Entrega jobs orfaos ao handler; uma replica por vez.
+
+        A transacao do advisory lock so le os orfaos e assume os leases
+        vencidos. O handler roda fora dela, e cada decisao e aplicada numa
+        escrita curta cercada pelo ``lease_owner`` lido.
+        """
+        if self._on_orphaned is None:
+            return 0
+        pool = await _get_pool()
+        reaper_owner = f"{self.worker_id}:reaper"
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                leader = await conn.fetchval(
+                    "SELECT pg_try_advisory_xact_lock(hashtextextended($1, 0))",
+                    ACTION_QUEUE_REAPER_LOCK_NAME,
+                )
+                if not leader:
+                    return 0
+                rows = await conn.fetch(
+                    _ORPHANED_JOBS, float(self.enqueue_grace_seconds)
+                )
+                expired = [row["job_id"] for row in rows if row["lease_owner"]]
+                fenced: set[uuid.UUID] = set()
+                if expired:
+                    fenced = {
+                        record["job_id"]
+                        for record in await conn.fetch(
+                            _FENCE_ORPHANS,
+                            reaper_owner,
+                            expired,
+                            float(self.lease_seconds),
+                        )
+                    }
+        if rows:
+            print(f"[action_queue] {len(rows)} job(s) orfaos para recovery")
+
+        decisions: list[tuple[asyncpg.Record, str | None, bool]] = []
+        for row in rows:
+            if row["lease_owner"] and row["job_id"] not in fenced:
+                continue
+            owner = reaper_owner if row["job_id"] in fenced else None
+            try:
+                requeue = await self._on_orphaned(row)
+            except Exception as exc:  # noqa: BLE001
+                # Continua orfao (ou o lease do reaper vence): volta na
+                # proxima rodada.
+                print(f"[action_queue] recovery de {row['job_id']} falhou: {exc!r}")
+                continue
+            decisions.append((row, owner, requeue))
+
+        handled = 0
+        for row, owner, requeue in decisions:
+            status = await pool.execute(
+                _REQUEUE_ORPHAN if requeue else _RELEASE_ORPHAN,
+                row["job_id"],
+                owner,
+            )
+            if status.rsplit(" ", 1)[-1] != "0":
+                handled += 1
+        if handled:
+            self._wakeup.set()
+        return handled
+
+    async def _dispatch_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        maintenance_interval = self.lease_seconds / 3
+        next_maintenance = loop.time()
+        while True:
+            self._wakeup.clear()
+            try:
+                if loop.time() >= next_maintenance:
+                    next_maintenance = loop.time() + maintenance_interval
+                    await self.renew_leases()
+                    await self.reap_orphans()
+                    self._prune_local_runners()
+                while len(self._running) < self.max_concurrent:
+                    row = await self.lease_next()
+                    if row is None:
+                        break
+                    job_id = str(row["job_id"])
+                    self._lease_deadlines[job_id] = loop.time() + self.lease_seconds
+                    self._running[job_id] = asyncio.create_task(
+                        self._run_leased(row), name=f"project-job:{job_id}"
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # noqa: BLE001
+                print(f"[action_queue] falha no dispatcher: {exc!r}")
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(),
+                    timeout=max(
+                        0.0, min(self.poll_interval, next_maintenance - loop.time())
+                    ),
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    def _prune_local_runners(self) -> None:
+        # Jobs leased por outra replica nunca passam por aqui; o closure
+        # antigo vira lixo e a reconstrucao pela linha cobre o resto.
+        deadline = time.monotonic() - self.lease_seconds
+        for job_id, (submitted_at, _runner) in list(self._local_runners.items()):
+            if submitted_at < deadline and job_id not in self._running:
+                del self._local_runners[job_id]
+
+    async def _run_leased(self, row: asyncpg.Record) -> None:
+        job_id = str(row["job_id"])
+        _job_lease.set((job_id, self.worker_id))
+        try:
+            local = self._local_runners.pop(job_id, None)
+            runner = local[1] if local else None
+            if runner is None and self._runner_factory is not None:
+                runner = await self._runner_factory(row)
+            if runner is None:
+                await set_job_status(
+                    job_id,
+                    "failed",
+                    message="Nao foi possivel reconstruir a acao enfileirada.",
+                    current_step="queue_runner_unavailable",
+                    error_code="queue_runner_unavailable",
+                )
+            else:
+                await runner()
+        except asyncio.CancelledError:
+            raise
+        except JobLeaseLost as exc:
+            # Quem tem o lease agora decide o status; nada a gravar aqui.
+            print(f"[action_queue] {exc}; runner local interrompido")
+        except Exception as exc:  # noqa: BLE001
+            print(f"[action_queue] job {job_id} falhou: {exc}")
+            try:
+                await set_job_status(
+                    job_id,
+                    "failed",
+                    message="Falha interna ao executar a acao enfileirada.",
+                    current_step="queue_runner_failed",
+                    error_code="queue_runner_failed",
+                )
+            except Exception as status_exc:  # noqa: BLE001
+                print(f"[action_queue] falha ao persistir status: {status_exc}")
+        finally:
+            self._running.pop(job_id, None)
+            self._lease_deadlines.pop(job_id, None)
+            try:
+                await self.release(job_id)
+            except Exception as exc:  # noqa: BLE001
+                # O lease vence sozinho e o reaper assume o job.
+                print(f"[action_queue] falha ao liberar lease de {job_id}: {exc}")
+            self._wakeup.set()
 
     async def shutdown(self) -> None:
         self._shutting_down = True
-        workers = list(self._workers.values())
-        for task in workers:
+        tasks = [task for task in (self._dispatcher, *self._running.values()) if task]
+        for task in tasks:
             task.cancel()
-        for task in workers:
+        for task in tasks:
             try:
                 await task
             except (asyncio.CancelledError, Exception):
                 pass
-        self._queues.clear()
-        self._workers.clear()
-        self._current.clear()
+        self._dispatcher = None
+        self._running.clear()
+        self._lease_deadlines.clear()
+        self._local_runners.clear()
 
 
 action_queue = ProjectActionQueue()
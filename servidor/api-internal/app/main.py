@@ -13,26 +13,40 @@ from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request
 from fastapi.responses import JSONResponse, Response
 from app.schemas import NewProject, DuplicateProject, UserSyncPayload, AddMember, TransferBody, UpdateSettings, RecreateServices, ProjectNoteCreate, ProjectTagAssign, ProjectHintCreate, ProjectHintStatusUpdate, ProjectThreadMessageCreate, ProjectRenameRequest, ProjectDisplayNameUpdate, ProjectNotificationRead, RestorePointCreate, AutomaticKeyRotationUpdate
 from typing import Any, List, Dict
-from dotenv import dotenv_values
 from app.pg_meta_crypto import encrypt_postgres_meta_uri
+from app.project_env import invalidate_project_env, read_project_env
 from app.project_secret_service import (
     decrypt_project_secret,
+    decrypt_project_secrets_many,
     ensure_project_secrets_schema,
+    invalidate_project_dek_cache,
     store_project_secrets,
 )
 from app.jobs import (
     IDEMPOTENT_ACTIONS,
+    JobHistoryValidationError,
     action_queue,
     configure_jobs,
     create_project_job as _create_project_job,
     create_retry_job,
+    ensure_job_history_indexes,
     ensure_jobs_schema,
+    fetch_job_history,
     serialize_job,
     set_job_status as _set_job_status,
 )
 from app.runtime_config import (
     ANALYTICS_INTERNAL_URL, BASE_DIR, DB_DSN,
+    DB_BACKGROUND_POOL_MAX_SIZE, DB_BACKGROUND_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE, DB_POOL_MIN_SIZE,
     AUTOMATIC_KEY_ROTATION_LEAD_DAYS,
+    JOB_QUEUE_LEASE_SECONDS, JOB_QUEUE_MAX_CONCURRENT,
+    JOB_QUEUE_POLL_INTERVAL_SECONDS, JOB_QUEUE_ENQUEUE_GRACE_SECONDS,
+    JOB_RETENTION_DAYS, JOB_RETENTION_DAYS_BY_ACTION,
+    HOST_AGENT_COMMAND_RETENTION_DAYS, HOST_AGENT_COMMAND_RETENTION_DAYS_BY_COMMAND,
+    RETENTION_BATCH_SIZE, RETENTION_INTERVAL_SECONDS,
+    TELEMETRY_ROLLUP_INTERVAL_SECONDS,
+    TENANT_POOL_IDLE_SECONDS, TENANT_POOL_MAX_SIZE, TENANT_POOL_MAX_TENANTS,
     KEY_EXPIRY_WARNING_DAYS, NGINX_HMAC_SECRET, NGINX_SHARED_TOKEN, PG_META_CRYPTO_KEY,
     LOGFLARE_PRIVATE_ACCESS_TOKEN, PG_META_INTERNAL_URL,
     USER_TOKEN_MAX_CLOCK_SKEW_SECONDS,
@@ -41,7 +55,9 @@ from app.runtime_config import (
 from app.host_agent import (
     HostAgentError,
     HostAgentOffline,
+    close_command_events,
     command_result,
+    ensure_host_agent_queue_indexes,
     ensure_host_agent_schema,
     fetch_project_containers,
     run_command as run_host_agent_command,
@@ -53,6 +69,8 @@ from app.validation import (
     validate_service_name,
 )
 from app.database_schema import (
+    Migration,
+    apply_schema_migrations,
     ensure_collaboration_schema,
     ensure_identity_schema,
     ensure_restore_points_schema,
@@ -71,6 +89,7 @@ from app.project_settings import (
     get_project_file_size_limit,
 )
 from app.service_key_cache import invalidate_service_key_cache
+from app.tenant_pools import TenantPoolManager
 from app.snippets_migration import rename_project_snippets
 from app.key_rotation import KeyRotationMetadataError, project_key_schedule
 from app.automatic_key_rotation import (
@@ -79,10 +98,37 @@ from app.automatic_key_rotation import (
     start_automatic_key_rotation,
     stop_automatic_key_rotation,
 )
+from app.retention import (
+    RetentionPolicy,
+    ensure_retention_schema,
+    start_retention,
+    stop_retention,
+)
+from app.user_activity import (
+    start_user_activity_flusher,
+    stop_user_activity_flusher,
+)
+from app.upstream_http import (
+    PG_META_UPSTREAM,
+    close_upstream_clients,
+    get_upstream_client,
+    open_upstream_stream,
+    stream_upstream_response,
+)
 from app.project_telemetry import (
+    DEFAULT_PAGE_SIZE as TELEMETRY_DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE as TELEMETRY_MAX_PAGE_SIZE,
     TelemetryValidationError,
+    decode_telemetry_cursor,
+    ensure_telemetry_schema,
+    fetch_live_activity_series,
     fetch_project_user_telemetry,
+    fetch_rolled_up_user_telemetry,
+    read_auth_activity_watermark,
     resolve_telemetry_period,
+    start_auth_activity_rollups,
+    stop_auth_activity_rollups,
+    wake_auth_activity_rollups,
 )
 from app.project_deletion import (
     ProjectDeletionError,
@@ -98,22 +144,29 @@ from app.project_deletion import (
 from app.routers.lifecycle import get_project_status
 from app.project_identity import (
     ProjectIdentityError,
+    ensure_project_identity_schema,
     get_job_project_identity as _get_job_project_identity,
     parse_tenant_uuid,
     reconcile_project_tenant_uuids,
 )
-from app.database import close_pool, get_pool, initialize_pool
+from app.database import (
+    close_pool,
+    get_pool,
+    initialize_pool,
+    use_background_lane,
+)
 from app.dependencies import (
     audit_project_member_change,
     ensure_project_admin_access,
     ensure_project_member_access,
     ensure_project_owner_access,
     get_project_member_row,
-    get_project_role,
     get_project_row,
     get_user_record_by_identifier,
+    invalidate_project_access,
     require_synced_user_record,
     resolve_authenticated_user,
+    resolve_project_access,
     resolve_user_claims_from_hmac_token,
     resolve_user_id_from_hmac_token,
     upsert_project_member,
@@ -182,16 +235,18 @@ async def rollback_project_from_db(
 ) -> bool:
     try:
         async with pool.acquire() as conn:
-            result = await conn.execute(
+            removed_id = await conn.fetchval(
                 """
                 DELETE FROM projects
                 WHERE name = $1 AND ($2::uuid IS NULL OR id = $2)
+                RETURNING id
                 """,
                 project_name,
                 project_uuid,
             )
-        removed = result.endswith("1")
+        removed = removed_id is not None
         if removed:
+            invalidate_project_dek_cache(removed_id)
             print(f"Rollback: Projeto '{project_name}' removido do banco")
         else:
             print(
@@ -443,33 +498,19 @@ async def _build_recovery_runner(row: asyncpg.Record):
     return None
 
 
-async def _recover_pending_jobs() -> None:
-    """Retoma jobs seguros e preserva o ponto de parada dos demais."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch(
-            """
-            SELECT
-                job_id, project, owner_id, status, message, action, payload,
-                progress, current_step, total_steps, project_uuid, created_by,
-                is_idempotent, retryable, retry_of, attempt
-            FROM jobs
-            WHERE status IN ('queued', 'running')
-            ORDER BY updated_at ASC
-            """
-        )
-
-    if not rows:
-        return
+async def _recover_orphaned_job(r: asyncpg.Record) -> bool:
+    """Decide o destino de um job orfao entregue pelo reaper da fila.
 
-    print(
-        f"[recovery] {len(rows)} job(s) pendentes do startup anterior"
-    )
-    for r in rows:
-        job_id = str(r["job_id"])
-        project = r["project"]
-        old_status = r["status"]
-        action = r["action"]
+    Devolve True quando o job pode voltar para a fila (o runner e
+    reconstruido pela linha no lease); caso contrario preserva o ponto de
+    parada e marca falha para revisao manual.
+    """
+    pool = await get_pool()
+    job_id = str(r["job_id"])
+    project = r["project"]
+    old_status = r["status"]
+    action = r["action"]
+    try:
         # Rename, backup, restore e delete de ponto sao retomaveis: o
         # runner religa no comando que o host-agent continua executando
         # (ou reusa o resultado terminal), em vez de reexecutar o script.
@@ -478,127 +519,126 @@ async def _recover_pending_jobs() -> None:
             or action in RECOVERABLE_RUNNING_ACTIONS
             or action in {"rename", "backup", "restore", "delete_restore_point"}
         )
-        try:
-            runner = await _build_recovery_runner(r) if can_resume and action else None
-            if runner is not None:
-                message = (
-                    f"Job retomado após reinício da API em "
-                    f"{r['current_step'] or 'queued'} ({r['progress'] or 0}%)."
-                )
-                await _set_job_status(
-                    job_id,
-                    "queued",
-                    message=message,
-                    current_step=r["current_step"] or "queued",
-                )
-                await _enqueue_project_action(project, job_id, runner)
-                async with pool.acquire() as conn:
-                    project_id = await conn.fetchval(
-                        "SELECT id FROM projects WHERE name = $1",
-                        project,
-                    )
-                    if project_id:
-                        await audit_studio_action(
-                            conn,
-                            project_id=project_id,
-                            actor_user_id=None,
-                            action="project_recovery_resumed",
-                            target_type="job",
-                            target_id=job_id,
-                            old_value={
-                                "status": old_status,
-                                "current_step": r["current_step"],
-                                "progress": r["progress"],
-                            },
-                            new_value={"status": "queued", "action": action},
-                        )
-                print(
-                    f"[recovery] job {job_id} ({project}, {action}) retomado"
-                )
-                continue
-
+        runner = await _build_recovery_runner(r) if can_resume and action else None
+        if runner is not None:
             message = (
-                "API reiniciada durante operação não idempotente. "
-                f"Ação={action or 'desconhecida'}, etapa="
-                f"{r['current_step'] or 'desconhecida'}, progresso="
-                f"{r['progress'] or 0}%. Revisão manual obrigatória."
+                f"Job retomado após reinício da API em "
+                f"{r['current_step'] or 'queued'} ({r['progress'] or 0}%)."
             )
             await _set_job_status(
                 job_id,
-                "failed",
+                "queued",
                 message=message,
-                error_code="recovery_manual_review_required",
+                current_step=r["current_step"] or "queued",
             )
             async with pool.acquire() as conn:
-                await conn.execute(
-                    """
-                    UPDATE project_name_history
-                    SET status = 'failed',
-                        error = $1,
-                        updated_at = now(),
-                        completed_at = now()
-                    WHERE job_id = $2
-                      AND status IN ('queued', 'running')
-                    """,
-                    message,
-                    r["job_id"],
-                )
-                await conn.execute(
-                    """
-                    UPDATE project_restore_points
-                    SET status = 'failed', error = $1, updated_at = now()
-                    WHERE job_id = $2 AND status IN ('creating', 'deleting')
-                    """,
-                    message,
-                    r["job_id"],
-                )
-                await conn.execute(
-                    """
-                    UPDATE project_restore_points
-                    SET status = 'ready', error = $1, updated_at = now()
-                    WHERE job_id = $2 AND status = 'restoring'
-                    """,
-                    message,
-                    r["job_id"],
-                )
-                project_row = await conn.fetchrow(
+                project_id = await conn.fetchval(
                     "SELECT id FROM projects WHERE name = $1",
                     project,
                 )
-                if project_row:
+                if project_id:
                     await audit_studio_action(
                         conn,
-                        project_id=project_row["id"],
+                        project_id=project_id,
                         actor_user_id=None,
-                        action="project_recovery_failed",
+                        action="project_recovery_resumed",
                         target_type="job",
                         target_id=job_id,
-                        old_value={"status": old_status},
-                        new_value={
-                            "status": "failed",
-                            "reason": "api_restart",
-                            "action": action,
+                        old_value={
+                            "status": old_status,
                             "current_step": r["current_step"],
                             "progress": r["progress"],
                         },
+                        new_value={"status": "queued", "action": action},
                     )
             print(
-                f"[recovery] job {job_id} ({project}, {old_status}) "
-                "marcado como failed"
+                f"[recovery] job {job_id} ({project}, {action}) retomado"
             )
-        except Exception as exc:  # noqa: BLE001
-            try:
-                await _set_job_status(
-                    job_id,
-                    "failed",
-                    message="Falha interna ao reconstruir job após reinício.",
-                    error_code="recovery_dispatch_failed",
+            return True
+
+        message = (
+            "API reiniciada durante operação não idempotente. "
+            f"Ação={action or 'desconhecida'}, etapa="
+            f"{r['current_step'] or 'desconhecida'}, progresso="
+            f"{r['progress'] or 0}%. Revisão manual obrigatória."
+        )
+        await _set_job_status(
+            job_id,
+            "failed",
+            message=message,
+            error_code="recovery_manual_review_required",
+        )
+        async with pool.acquire() as conn:
+            await conn.execute(
+                """
+                UPDATE project_name_history
+                SET status = 'failed',
+                    error = $1,
+                    updated_at = now(),
+                    completed_at = now()
+                WHERE job_id = $2
+                  AND status IN ('queued', 'running')
+                """,
+                message,
+                r["job_id"],
+            )
+            await conn.execute(
+                """
+                UPDATE project_restore_points
+                SET status = 'failed', error = $1, updated_at = now()
+                WHERE job_id = $2 AND status IN ('creating', 'deleting')
+                """,
+                message,
+                r["job_id"],
+            )
+            await conn.execute(
+                """
+                UPDATE project_restore_points
+                SET status = 'ready', error = $1, updated_at = now()
+                WHERE job_id = $2 AND status = 'restoring'
+                """,
+                message,
+                r["job_id"],
+            )
+            project_row = await conn.fetchrow(
+                "SELECT id FROM projects WHERE name = $1",
+                project,
+            )
+            if project_row:
+                await audit_studio_action(
+                    conn,
+                    project_id=project_row["id"],
+                    actor_user_id=None,
+                    action="project_recovery_failed",
+                    target_type="job",
+                    target_id=job_id,
+                    old_value={"status": old_status},
+                    new_value={
+                        "status": "failed",
+                        "reason": "api_restart",
+                        "action": action,
+                        "current_step": r["current_step"],
+                        "progress": r["progress"],
+                    },
                 )
-            except Exception:
-                pass
-            print(
-                f"[recovery] falha ao reconstruir job {job_id}: {exc}"
+        print(
+            f"[recovery] job {job_id} ({project}, {old_status}) "
+            "marcado como failed"
+        )
+    except Exception as exc:  # noqa: BLE001
+        try:
+            await _set_job_status(
+                job_id,
+                "failed",
+                message="Falha interna ao reconstruir job após reinício.",
+                error_code="recovery_dispatch_failed",
             )
+        except Exception:
+            pass
+        print(
+            f"[recovery] falha ao reconstruir job {job_id}: {exc}"
+        )
+    return False
 
 
 async def _scan_automatic_key_rotations() -> int:
@@ -608,38 +648,94 @@ async def _scan_automatic_key_rotations() -> int:
     )
 
 
+# Ledger do schema: so acrescentar versoes novas no fim; o checksum
+# impede editar uma migracao que ja rodou em alguma instalacao.
+SCHEMA_MIGRATIONS = (
+    Migration(1, "identity", ensure_identity_schema),
+    Migration(2, "project_secrets", ensure_project_secrets_schema),
+    Migration(3, "jobs", ensure_jobs_schema),
+    Migration(4, "host_agent", ensure_host_agent_schema),
+    Migration(5, "collaboration", ensure_collaboration_schema),
+    Migration(6, "restore_points", ensure_restore_points_schema),
+    Migration(7, "telemetry", ensure_telemetry_schema),
+    Migration(8, "project_identity", ensure_project_identity_schema),
+    Migration(9, "job_history", ensure_job_history_indexes),
+    Migration(10, "retention", ensure_retention_schema),
+    Migration(11, "host_agent_queue", ensure_host_agent_queue_indexes),
+)
+
+
 @app.on_event("startup")
 async def startup():
-    pool = await initialize_pool(DB_DSN)
-    await ensure_identity_schema(pool)
-    await ensure_project_secrets_schema(pool)
-    await ensure_jobs_schema(pool)
-    await ensure_host_agent_schema(pool)
-    identity_result = await reconcile_project_tenant_uuids(pool, PROJECTS_ROOT)
-    print(
-        "[identity] tenant UUIDs: "
-        f"migrados={identity_result.migrated}, "
-        f"persistidos={identity_result.already_persisted}, "
-        f"pendentes={len(identity_result.unresolved)}"
+    pool = await initialize_pool(
+        DB_DSN,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        background_min_size=DB_BACKGROUND_POOL_MIN_SIZE,
+        background_max_size=DB_BACKGROUND_POOL_MAX_SIZE,
     )
+    applied = await apply_schema_migrations(pool, SCHEMA_MIGRATIONS)
+    if applied:
+        print(
+            "[schema] migracoes aplicadas: "
+            + ", ".join(f"{migration.version}:{migration.name}" for migration in applied)
+        )
+    identity_result = await reconcile_project_tenant_uuids(pool, PROJECTS_ROOT)
+    if identity_result.skipped:
+        print("[identity] tenant UUIDs ja reconciliados")
+    else:
+        print(
+            "[identity] tenant UUIDs: "
+            f"migrados={identity_result.migrated}, "
+            f"persistidos={identity_result.already_persisted}, "
+            f"pendentes={len(identity_result.unresolved)}"
+        )
     if identity_result.unresolved:
         print(
             "[identity] projetos sem tenant UUID verificavel: "
             + ", ".join(identity_result.unresolved)
         )
-    await ensure_collaboration_schema(pool)
-    await ensure_restore_points_schema(pool)
     print("✅ Database pool initialized")
-    await _recover_pending_jobs()
+    # Fila, rotacao automatica e flusher herdam a lane background: tudo que
+    # rodar nessas tasks usa o pool proprio e nao disputa com as rotas.
+    use_background_lane()
+    action_queue.start(
+        runner_factory=_build_recovery_runner,
+        on_orphaned=_recover_orphaned_job,
+        max_concurrent=JOB_QUEUE_MAX_CONCURRENT,
+        lease_seconds=JOB_QUEUE_LEASE_SECONDS,
+        poll_interval=JOB_QUEUE_POLL_INTERVAL_SECONDS,
+        enqueue_grace_seconds=JOB_QUEUE_ENQUEUE_GRACE_SECONDS,
+    )
     await start_automatic_key_rotation(
         enqueue_action=_enqueue_project_action,
         rotation_runner=_rotate_project_key_background,
     )
+    start_user_activity_flusher()
+    start_retention(
+        jobs_policy=RetentionPolicy(JOB_RETENTION_DAYS, JOB_RETENTION_DAYS_BY_ACTION),
+        commands_policy=RetentionPolicy(
+            HOST_AGENT_COMMAND_RETENTION_DAYS,
+            HOST_AGENT_COMMAND_RETENTION_DAYS_BY_COMMAND,
+        ),
+        batch_size=RETENTION_BATCH_SIZE,
+        interval_seconds=RETENTION_INTERVAL_SECONDS,
+    )
+    start_auth_activity_rollups(
+        tenants=tenant_pools,
+        interval_seconds=TELEMETRY_ROLLUP_INTERVAL_SECONDS,
+    )
 
 @app.on_event("shutdown")
 async def shutdown():
+    await stop_retention()
+    await stop_auth_activity_rollups()
     await stop_automatic_key_rotation()
     await action_queue.shutdown()
+    await tenant_pools.close()
+    await stop_user_activity_flusher()
+    await close_command_events()
+    await close_upstream_clients()
     await close_pool()
     print("✅ Database pool closed")
 
@@ -705,24 +801,13 @@ async def list_projects(
                   )
                 ORDER BY p.name
             """, auth_user["db_user_id"])
+            decrypted = await decrypt_project_secrets_many(
+                conn, rows, ("anon_key", "service_role")
+            )
             result = []
             for r in rows:
-                anon_token = await decrypt_project_secret(
-                    conn,
-                    project_id=r["id"],
-                    column="anon_key",
-                    ciphertext=r["anon_key"],
-                )
-                service_role_token = (
-                    await decrypt_project_secret(
-                        conn,
-                        project_id=r["id"],
-                        column="service_role",
-                        ciphertext=r["service_role"],
-                    )
-                    if r["service_role"]
-                    else ""
-                )
+                anon_token = decrypted[r["id"]]["anon_key"]
+                service_role_token = decrypted[r["id"]]["service_role"] or ""
                 key_metadata_error = None
                 try:
                     key_schedule = project_key_schedule(
@@ -876,6 +961,13 @@ async def _rename_project_background(
             reuse_terminal=True,
             on_progress=_job_progress_mirror(job_id),
         )
+        # O diretorio mudou de nome (ou voltou no rollback): cache por caminho.
+        invalidate_project_env(PROJECTS_ROOT / old_name)
+        invalidate_project_env(PROJECTS_ROOT / new_name)
+        await tenant_pools.invalidate(old_name)
+        await tenant_pools.invalidate(new_name)
+        invalidate_project_access(project_name=old_name)
+        invalidate_project_access(project_name=new_name)
 
         if record["status"] != "done":
             output = (record["stdout_tail"] or record["message"] or "").strip()
@@ -1261,6 +1353,7 @@ async def update_project_display_name(
                 new_value={"display_name": new_display},
             )
 
+    invalidate_project_access(project_id=project_id)
     return {
         "project": project_name,
         "display_name": new_display,
@@ -1280,13 +1373,9 @@ async def get_project_config_token(
 
     async with pool.acquire() as conn:
         async with conn.transaction():
-            project = await get_project_row(conn, project_name)
-            await ensure_project_member_access(
-                conn,
-                project_id=project["id"],
-                auth_user=auth_user,
-                message="Apenas membros podem acessar o config token",
-            )
+            access = await resolve_project_access(conn, project_name, auth_user)
+            access.require_member("Apenas membros podem acessar o config token")
+            project = access.project
             encrypted_token = await conn.fetchval(
                 "SELECT config_token FROM projects WHERE id = $1",
                 project["id"],
@@ -1329,13 +1418,8 @@ async def get_project_queue_status(
     auth_user = await resolve_authenticated_user(request, pool)
 
     async with pool.acquire() as conn:
-        project_row = await get_project_row(conn, project_name)
-        project_id = project_row["id"]
-        await ensure_project_member_access(
-            conn,
-            project_id=project_id,
-            auth_user=auth_user,
-        )
+        access = await resolve_project_access(conn, project_name, auth_user)
+        access.require_member()
 
         in_flight_rows = await conn.fetch(
             """
@@ -1356,7 +1440,7 @@ async def get_project_queue_status(
             project_name,
         )
 
-    queue_state = action_queue.status(project_name)
+    queue_state = await action_queue.status(project_name)
     in_flight = [
         {
             "job_id": str(r["job_id"]),
@@ -1586,19 +1670,12 @@ async def list_project_restore_points(
     auth_user = await resolve_authenticated_user(request, pool)
 
     async with pool.acquire() as conn:
-        project_row = await get_project_row(conn, project_name)
-        await ensure_project_member_access(
-            conn,
-            project_id=project_row["id"],
-            auth_user=auth_user,
-        )
-        role = await get_project_role(
-            conn,
-            project_id=project_row["id"],
-            auth_user=auth_user,
-        )
-        is_owner = project_row["owner_id"] == auth_user["db_user_id"]
-        is_global_admin = auth_user["is_global_admin"]
+        access = await resolve_project_access(conn, project_name, auth_user)
+        access.require_member()
+        project_row = access.project
+        role = access.role
+        is_owner = access.is_owner
+        is_global_admin = access.is_global_admin
         rows = await conn.fetch(
             """
             SELECT
@@ -2065,6 +2142,8 @@ async def _restore_project_background(
             reuse_terminal=True,
             on_progress=_job_progress_mirror(job_id),
         )
+        # O banco foi trocado (ou voltou no rollback): conexoes antigas morreram.
+        await tenant_pools.invalidate(project_name)
         result = command_result(record)
         safety_completed = bool(result.get("safety_backup_completed"))
         async with pool.acquire() as conn:
@@ -2753,6 +2832,8 @@ async def _delete_project_impl(
         )
 
         await report(65, "drop_database", "Removendo slots e database...")
+        await tenant_pools.invalidate(project_name)
+        invalidate_project_access(project_name=project_name)
         await drain_database_connections(conn, db_name)
 
         slot_errors = await drop_supabase_replication_slots(conn, project_name)
@@ -2796,6 +2877,8 @@ async def _delete_project_impl(
                 project_id,
             )
             await conn.execute("DELETE FROM projects WHERE id = $1", project_id)
+        invalidate_project_dek_cache(project_id)
+        invalidate_project_env(PROJECTS_ROOT / project_name)
 
     await report(96, "verify_cleanup", "Verificando limpeza final...")
     async with pool.acquire() as conn:
@@ -3377,6 +3460,7 @@ async def add_member(
                 action="added" if existing_role is None else "updated",
                 actor_user_id=auth_user["db_user_id"],
             )
+    invalidate_project_access(project_id=project_row["id"], user_id=target_user["id"])
     return {"ok": True}
 
 
@@ -3390,9 +3474,9 @@ async def list_members_by_ref(
 
     async with pool.acquire() as conn:
         auth_user = await resolve_authenticated_user(request, pool)
-        row = await get_project_row(conn, name)
-        pid = row["id"]
-        await ensure_project_member_access(conn, project_id=pid, auth_user=auth_user)
+        access = await resolve_project_access(conn, name, auth_user)
+        access.require_member()
+        pid = access.project["id"]
 
         rows = await conn.fetch(
             "SELECT user_id, role FROM project_members "
@@ -3465,6 +3549,8 @@ async def remove_member_by_ref(
                 actor_user_id=auth_user["db_user_id"],
             )
 
+    if target_uuid is not None:
+        invalidate_project_access(project_id=project_id, user_id=target_uuid)
     return {"ok": True}
 
 
@@ -3475,68 +3561,25 @@ async def list_job_history(
     action: str | None = Query(default=None, max_length=80),
     status: str | None = Query(default=None, max_length=32),
     limit: int = Query(default=50, ge=1, le=200),
-    offset: int = Query(default=0, ge=0),
+    cursor: str | None = Query(default=None, max_length=200),
+    include_output: bool = Query(default=False),
     pool=Depends(get_pool),
 ):
     """Lista o historico duravel de jobs visivel para o usuario autenticado."""
     auth_user = await resolve_authenticated_user(request, pool)
-    filters: list[str] = []
-    values: list[Any] = []
-
-    def add_filter(expression: str, value: Any) -> None:
-        values.append(value)
-        filters.append(expression.format(index=len(values)))
-
-    if not auth_user["is_global_admin"]:
-        add_filter(
-            """
-            (
-                j.created_by = ${index}
-                OR (
-                    j.created_by IS NULL
-                    AND EXISTS (
-                        SELECT 1
-                        FROM projects p
-                        WHERE p.id = j.project_uuid
-                          AND (
-                              p.owner_id = ${index}
-                              OR EXISTS (
-                                  SELECT 1 FROM project_members pm
-                                  WHERE pm.project_id = p.id
-                                    AND pm.user_id = ${index}
-                              )
-                          )
-                    )
-                )
-            )
-            """,
-            auth_user["db_user_id"],
+    try:
+        return await fetch_job_history(
+            pool,
+            viewer_id=None if auth_user["is_global_admin"] else auth_user["db_user_id"],
+            project_uuid=project_uuid,
+            action=action.strip() if action else None,
+            status=status.strip() if status else None,
+            cursor=cursor,
+            limit=limit,
+            include_output=include_output,
         )
-    if project_uuid is not None:
-        add_filter("j.project_uuid = ${index}", project_uuid)
-    if action:
-        add_filter("j.action = ${index}", action.strip())
-    if status:
-        add_filter("j.status = ${index}", status.strip())
-
-    where_sql = " WHERE " + " AND ".join(filters) if filters else ""
-    values.extend((limit, offset))
-    rows = await pool.fetch(
-        f"""
-        SELECT *
-        FROM jobs j
-        {where_sql}
-        ORDER BY j.created_at DESC, j.job_id DESC
-        LIMIT ${len(values) - 1} OFFSET ${len(values)}
-        """,
-        *values,
-    )
-    return {
-        "items": [serialize_job(row) for row in rows],
-        "limit": limit,
-        "offset": offset,
-        "count": len(rows),
-    }
+    except JobHistoryValidationError as exc:
+        raise HTTPException(422, str(exc)) from exc
 
 
 @app.post("/api/jobs/{job_id}/retry", status_code=202)
@@ -3900,7 +3943,7 @@ def _extract_project_admin_apikey(request: Request) -> str:
 
 
 def _read_env_file(env_path: pathlib.Path) -> dict[str, str]:
-    return {k: (v or "") for k, v in dotenv_values(env_path).items()}
+    return {k: (v or "") for k, v in read_project_env(env_path).items()}
 
 
 async def _container_lifecycle_background(
@@ -4408,24 +4451,13 @@ async def transfer_project(
                     actor_user_id=auth_user["db_user_id"],
                 )
 
+    invalidate_project_access(project_id=project_id)
     return {
         "project": project_name,
         "new_owner_id": str(new_owner_user["id"]),
         "status": "transferred"
     }
 
-async def get_project_conn(project_ref: str):
-    dsn = urllib.parse.urlparse(DB_DSN)
-    db_name = f"_supabase_{project_ref}"
-    return await asyncpg.connect(
-        host=dsn.hostname,
-        port=dsn.port,
-        user=dsn.username,
-        password=dsn.password,
-        database=db_name
-    )
-
-
 def get_project_meta_connection_string(project_ref: str) -> str:
     dsn = urllib.parse.urlparse(DB_DSN)
     if dsn.scheme not in {"postgres", "postgresql"} or not dsn.hostname or not dsn.username:
@@ -4442,6 +4474,14 @@ def get_project_meta_connection_string(project_ref: str) -> str:
     )
 
 
+tenant_pools = TenantPoolManager(
+    get_project_meta_connection_string,
+    max_tenants=TENANT_POOL_MAX_TENANTS,
+    max_size=TENANT_POOL_MAX_SIZE,
+    idle_seconds=TENANT_POOL_IDLE_SECONDS,
+)
+
+
 @app.get("/api/projects/{project_name}/telemetry/users")
 async def get_project_user_telemetry(
     project_name: str,
@@ -4450,6 +4490,8 @@ async def get_project_user_telemetry(
     period: str = Query("24h"),
     start: dt.datetime | None = Query(None),
     end: dt.datetime | None = Query(None),
+    limit: int = Query(TELEMETRY_DEFAULT_PAGE_SIZE, ge=1, le=TELEMETRY_MAX_PAGE_SIZE),
+    cursor: str | None = Query(None),
     pool=Depends(get_pool),
 ):
     project_name = validate_project_id(project_name)
@@ -4461,17 +4503,15 @@ async def get_project_user_telemetry(
             start=start,
             end=end,
         )
+        page_cursor = decode_telemetry_cursor(cursor)
     except TelemetryValidationError as exc:
         raise HTTPException(422, str(exc)) from exc
 
     async with pool.acquire() as conn:
-        project_row = await get_project_row(conn, project_name)
-        project_role = await get_project_role(
-            conn,
-            project_id=project_row["id"],
-            auth_user=auth_user,
-        )
-        is_owner = project_row["owner_id"] == auth_user["db_user_id"]
+        access = await resolve_project_access(conn, project_name, auth_user)
+        project_row = access.project
+        project_role = access.role
+        is_owner = access.is_owner
         if (
             project_role != "admin"
             and not is_owner
@@ -4497,11 +4537,37 @@ async def get_project_user_telemetry(
 
     project_conn: asyncpg.Connection | None = None
     try:
-        project_conn = await get_project_conn(project_name)
-        result = await fetch_project_user_telemetry(
-            project_conn,
-            telemetry_period,
-        )
+        project_conn = await tenant_pools.acquire(project_name)
+        if telemetry_period.uses_rollups:
+            # So le o que ja foi consolidado; o rollup roda em segundo plano.
+            async with pool.acquire() as conn:
+                rolled_up_to = await read_auth_activity_watermark(
+                    conn,
+                    project_id=project_row["id"],
+                )
+                result = await fetch_rolled_up_user_telemetry(
+                    conn,
+                    project_conn,
+                    telemetry_period,
+                    project_id=project_row["id"],
+                    rolled_up_to=rolled_up_to,
+                    limit=limit,
+                    cursor=page_cursor,
+                )
+            if not result["complete"]:
+                wake_auth_activity_rollups()
+        else:
+            # 24h le o tenant direto; nada de rollup (nem lock) no caminho.
+            result = await fetch_project_user_telemetry(
+                project_conn,
+                telemetry_period,
+                limit=limit,
+                cursor=page_cursor,
+            )
+            result["series"] = await fetch_live_activity_series(
+                project_conn,
+                telemetry_period,
+            )
     except asyncpg.InvalidCatalogNameError as exc:
         raise HTTPException(409, "Database do projeto nao esta disponivel") from exc
     except (asyncpg.UndefinedTableError, asyncpg.UndefinedColumnError) as exc:
@@ -4516,9 +4582,12 @@ async def get_project_user_telemetry(
         ) from exc
     finally:
         if project_conn is not None:
-            await project_conn.close()
+            await tenant_pools.release(project_conn)
 
-    response.headers["Cache-Control"] = "no-store"
+    if result["closed"]:
+        response.headers["Cache-Control"] = "private, max-age=86400"
+    else:
+        response.headers["Cache-Control"] = "no-store"
     return {"project": project_name, **result}
 
 
@@ -4538,16 +4607,14 @@ async def proxy_project_meta(
 ):
     ref = validate_project_id(ref)
     auth_user = await resolve_authenticated_user(request, pool)
+    # Escrita autoriza pelo papel atual, nao pelo cache de acesso.
+    read_only = request.method == "GET"
 
     async with pool.acquire() as conn:
         async with conn.transaction():
-            project_row = await get_project_row(conn, ref)
-            await ensure_project_admin_access(
-                conn,
-                project_id=project_row["id"],
-                auth_user=auth_user,
-                message="Apenas admins podem acessar roles e metadados do banco",
-            )
+            access = await resolve_project_access(conn, ref, auth_user, use_cache=read_only)
+            access.require_admin("Apenas admins podem acessar roles e metadados do banco")
+            project_row = access.project
             encrypted_service_role = await conn.fetchval(
                 "SELECT service_role FROM projects WHERE id = $1",
                 project_row["id"],
@@ -4590,14 +4657,12 @@ async def proxy_project_meta(
         upstream_headers["x-pg-application-name"] = x_pg_application_name
 
     try:
-        async with httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=5.0)) as client:
-            upstream_response = await client.request(
-                request.method,
-                target_url,
-                params=list(request.query_params.multi_items()),
-                headers=upstream_headers,
-                content=await request.body(),
-            )
+        upstream_response = await open_upstream_stream(
+            get_upstream_client(PG_META_UPSTREAM),
+            request,
+            target_url,
+            headers=upstream_headers,
+        )
     except httpx.HTTPError as exc:
         print(f"[postgres_meta_proxy] {ref}: {exc}")
         raise HTTPException(
@@ -4605,16 +4670,7 @@ async def proxy_project_meta(
             detail="Falha ao acessar postgres-meta global.",
         ) from exc
 
-    response_headers: dict[str, str] = {}
-    response_content_type = upstream_response.headers.get("content-type")
-    if response_content_type:
-        response_headers["content-type"] = response_content_type
-
-    return Response(
-        content=upstream_response.content,
-        status_code=upstream_response.status_code,
-        headers=response_headers,
-    )
+    return stream_upstream_response(upstream_response)
 
 @app.get("/api/projects/{ref}/functions")
 async def get_project_ai_functions(
@@ -4625,12 +4681,12 @@ async def get_project_ai_functions(
     ref = validate_project_id(ref)
     async with pool.acquire() as conn:
         auth_user = await resolve_authenticated_user(request, pool)
-        project_row = await get_project_row(conn, ref)
-        await ensure_project_member_access(conn, project_id=project_row["id"], auth_user=auth_user)
+        access = await resolve_project_access(conn, ref, auth_user)
+        access.require_member()
 
     proj_conn = None
     try:
-        proj_conn = await get_project_conn(ref)
+        proj_conn = await tenant_pools.acquire(ref)
         rows = await proj_conn.fetch("""
             SELECT
                 p.proname AS name,
@@ -4649,7 +4705,7 @@ async def get_project_ai_functions(
         raise HTTPException(503, "Cannot connect to project database") from exc
     finally:
         if proj_conn:
-            await proj_conn.close()
+            await tenant_pools.release(proj_conn)
 
     functions = []
     for r in rows:
@@ -4692,18 +4748,13 @@ async def execute_project_function(
 
     async with pool.acquire() as conn:
         auth_user = await resolve_authenticated_user(request, pool)
-        project_row = await get_project_row(conn, ref)
-        await ensure_project_admin_access(
-            conn,
-            project_id=project_row["id"],
-            auth_user=auth_user,
-            message="Apenas admins podem executar AI tools",
-        )
-        project_id = project_row["id"]
+        access = await resolve_project_access(conn, ref, auth_user, use_cache=False)
+        access.require_admin("Apenas admins podem executar AI tools")
+        project_id = access.project["id"]
 
     proj_conn = None
     try:
-        proj_conn = await get_project_conn(ref)
+        proj_conn = await tenant_pools.acquire(ref)
 
         candidates = await proj_conn.fetch("""
             SELECT
@@ -4796,7 +4847,7 @@ async def execute_project_function(
         raise HTTPException(400, "Function execution failed") from exc
     finally:
         if proj_conn:
-            await proj_conn.close()
+            await tenant_pools.release(proj_conn)
 
 @app.get("/api/projects/{project_name}/settings")
 async def get_project_settings(
@@ -4808,8 +4859,8 @@ async def get_project_settings(
 
     async with pool.acquire() as conn:
         auth_user = await resolve_authenticated_user(request, pool)
-        project_row = await get_project_row(conn, project_name)
-        await ensure_project_member_access(conn, project_id=project_row["id"], auth_user=auth_user)
+        access = await resolve_project_access(conn, project_name, auth_user)
+        access.require_member()
 
     env_path = _get_project_env_path(project_name)
     if not env_path.exists():
@@ -20,8 +20,8 @@ from collections.abc import Mapping
 
 import asyncpg
 import httpx
-from dotenv import dotenv_values
 
+from app.project_env import read_project_env
 from app.runtime_config import REALTIME_INTERNAL_URL, SUPAVISOR_INTERNAL_URL
 
 
@@ -71,7 +71,7 @@ def load_project_environment(
     if not env_path.is_file():
         raise ProjectDeletionError(f"ambiente do projeto {project_name} não existe")
 
-    raw_values = dotenv_values(env_path, interpolate=False)
+    raw_values = read_project_env(env_path, interpolate=False)
     values = {
         str(key): str(value)
         for key, value in raw_values.items()
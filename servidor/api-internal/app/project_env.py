@@ -0,0 +1,73 @@
+"""Cache do ``.env`` dos projetos validado por ``stat``.
+
+Listagem, contexto do Studio, settings e rotas de storage liam o mesmo
+``/docker/projects/<nome>/.env`` com ``dotenv_values`` a cada chamada. Aqui o
+resultado parseado fica em memoria, por caminho, e so e reaproveitado
+enquanto ``(st_mtime_ns, st_size, st_ino)`` nao mudar; qualquer escrita,
+inclusive a substituicao atomica feita pelo host-agent, invalida sozinha.
+"""
+
+from __future__ import annotations
+
+import os
+import pathlib
+import threading
+from collections import OrderedDict
+
+from dotenv import dotenv_values
+
+
+PROJECT_ENV_CACHE_MAX_ENTRIES = 1024
+
+_lock = threading.Lock()
+_entries: OrderedDict[
+    tuple[str, bool],
+    tuple[tuple[int, int, int], dict[str, str | None]],
+] = OrderedDict()
+
+
+def read_project_env(
+    env_path: pathlib.Path | str,
+    *,
+    interpolate: bool = True,
+) -> dict[str, str | None]:
+    """Equivale a ``dotenv_values(env_path)``, com cache; devolve uma copia."""
+    path = os.fspath(env_path)
+    key = (path, interpolate)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        with _lock:
+            _entries.pop(key, None)
+        return dict(dotenv_values(path, interpolate=interpolate))
+    signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    with _lock:
+        cached = _entries.get(key)
+        if cached is not None and cached[0] == signature:
+            _entries.move_to_end(key)
+            return dict(cached[1])
+
+    values = dict(dotenv_values(path, interpolate=interpolate))
+    with _lock:
+        _entries[key] = (signature, values)
+        _entries.move_to_end(key)
+        while len(_entries) > PROJECT_ENV_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+    return dict(values)
+
+
+def invalidate_project_env(path: pathlib.Path | str) -> None:
+    """Descarta o ``.env`` informado, ou todos sob o diretorio do projeto."""
+    target = os.fspath(path)
+    prefix = target.rstrip(os.sep) + os.sep
+    with _lock:
+        for key in [
+            key for key in _entries if key[0] == target or key[0].startswith(prefix)
+        ]:
+            del _entries[key]
+
+
+def clear_project_env_cache() -> None:
+    with _lock:
+        _entries.clear()
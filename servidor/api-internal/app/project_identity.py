@@ -8,6 +8,7 @@ de instalacoes legadas sem reescrever tenants existentes.
 
 from __future__ import annotations
 
+import asyncio
 import json
 import uuid
 from dataclasses import dataclass
@@ -15,7 +16,33 @@ from pathlib import Path
 from typing import Any
 
 import asyncpg
-from dotenv import dotenv_values
+
+from app.project_env import read_project_env
+
+
+RECONCILED_MARKER = "project_tenant_uuids_reconciled"
+ENV_READ_CONCURRENCY = 16
+
+_RECONCILIATION_SQL = """
+    SELECT
+        p.id,
+        p.name,
+        p.tenant_uuid,
+        p.anon_key IS NOT NULL AS is_provisioned,
+        hc.tenant_uuid AS command_tenant_uuid
+    FROM projects p
+    LEFT JOIN (
+        SELECT DISTINCT ON (project_uuid)
+            project_uuid,
+            args->>'tenant_uuid' AS tenant_uuid
+        FROM host_agent_commands
+        WHERE command IN ('create_project', 'duplicate_project')
+          AND args ? 'tenant_uuid'
+          AND project_uuid IS NOT NULL
+        ORDER BY project_uuid, (status = 'done') DESC, created_at DESC
+    ) hc ON hc.project_uuid = p.id
+    ORDER BY p.name
+"""
 
 
 class ProjectIdentityError(RuntimeError):
@@ -31,6 +58,7 @@ class ProjectIdentityReconciliation:
     migrated: int
     already_persisted: int
     unresolved: tuple[str, ...]
+    skipped: bool = False
 
 
 async def get_job_project_identity(
@@ -114,10 +142,45 @@ def read_project_tenant_uuid(projects_root: Path, project_name: str) -> uuid.UUI
     env_path = project_dir / ".env"
     if not env_path.is_file():
         return None
-    values = dotenv_values(env_path)
+    values = read_project_env(env_path)
     return parse_tenant_uuid(values.get("PROJECT_UUID"))
 
 
+async def ensure_project_identity_schema(conn: asyncpg.Connection) -> None:
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS control_plane_markers (
+            name TEXT PRIMARY KEY,
+            details JSONB NOT NULL DEFAULT '{}'::jsonb,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+
+        -- Caminho do DISTINCT ON da reconciliacao: so comandos que criam tenant.
+        CREATE INDEX IF NOT EXISTS idx_host_agent_commands_project_identity
+            ON host_agent_commands(project_uuid, (status = 'done') DESC, created_at DESC)
+            WHERE command IN ('create_project', 'duplicate_project')
+              AND args ? 'tenant_uuid';
+        """
+    )
+
+
+async def _read_env_tenant_uuids(
+    projects_root: Path,
+    project_names: list[str],
+) -> dict[str, uuid.UUID | None]:
+    """Le os ``.env`` em threads, no maximo ENV_READ_CONCURRENCY por vez."""
+    slots = asyncio.Semaphore(ENV_READ_CONCURRENCY)
+
+    async def read(project_name: str) -> uuid.UUID | None:
+        async with slots:
+            return await asyncio.to_thread(
+                read_project_tenant_uuid, projects_root, project_name
+            )
+
+    values = await asyncio.gather(*(read(name) for name in project_names))
+    return dict(zip(project_names, values))
+
+
 def _project_artifacts_exist(projects_root: Path, project_name: str) -> bool:
     """Trata caminho inseguro ou diretorio existente como estado ja iniciado."""
     root = projects_root.resolve()
@@ -136,26 +199,24 @@ async def reconcile_project_tenant_uuids(
     Projetos provisionados sem qualquer evidencia ficam nulos para revisao;
     assumir ``projects.id`` nesses casos poderia apontar para o tenant errado.
     Qualquer divergencia observavel falha o startup antes de operacoes fisicas.
+    Depois de uma passada sem pendencias o marcador persistido pula o passo
+    inteiro, enquanto nenhum projeto voltar a ter ``tenant_uuid`` nulo.
     """
-    rows = await pool.fetch(
-        """
-        SELECT
-            p.id,
-            p.name,
-            p.tenant_uuid,
-            p.anon_key IS NOT NULL AS is_provisioned,
-            (
-                SELECT hc.args->>'tenant_uuid'
-                FROM host_agent_commands hc
-                WHERE hc.project_uuid = p.id
-                  AND hc.command IN ('create_project', 'duplicate_project')
-                  AND hc.args ? 'tenant_uuid'
-                ORDER BY (hc.status = 'done') DESC, hc.created_at DESC
-                LIMIT 1
-            ) AS command_tenant_uuid
-        FROM projects p
-        ORDER BY p.name
+    reconciled = await pool.fetchval(
         """
+        SELECT EXISTS (SELECT 1 FROM control_plane_markers WHERE name = $1)
+           AND NOT EXISTS (SELECT 1 FROM projects WHERE tenant_uuid IS NULL)
+        """,
+        RECONCILED_MARKER,
+    )
+    if reconciled:
+        return ProjectIdentityReconciliation(
+            migrated=0, already_persisted=0, unresolved=(), skipped=True
+        )
+
+    rows = await pool.fetch(_RECONCILIATION_SQL)
+    env_tenant_uuids = await _read_env_tenant_uuids(
+        projects_root, [str(row["name"]) for row in rows]
     )
 
     updates: list[tuple[uuid.UUID, uuid.UUID]] = []
@@ -168,7 +229,7 @@ async def reconcile_project_tenant_uuids(
         project_id = uuid.UUID(str(row["id"]))
         project_name = str(row["name"])
         persisted = parse_tenant_uuid(row["tenant_uuid"])
-        from_env = read_project_tenant_uuid(projects_root, project_name)
+        from_env = env_tenant_uuids[project_name]
         from_command = parse_tenant_uuid(row["command_tenant_uuid"])
 
         evidence = {
@@ -231,6 +292,18 @@ async def reconcile_project_tenant_uuids(
             """,
             updates,
         )
+    if not unresolved:
+        await pool.execute(
+            """
+            INSERT INTO control_plane_markers(name, details)
+            VALUES($1, jsonb_build_object('migrated', $2::int, 'already_persisted', $3::int))
+            ON CONFLICT (name) DO UPDATE
+            SET details = EXCLUDED.details, updated_at = now()
+            """,
+            RECONCILED_MARKER,
+            len(updates),
+            already_persisted,
+        )
 
     return ProjectIdentityReconciliation(
         migrated=len(updates),
@@ -1,33 +1,52 @@
 """Persistencia criptografada dos segredos de cada projeto."""
 
 import uuid
+from typing import Any, Iterable, Mapping
 
 import asyncpg
 
-from app.project_secrets import ProjectKeyEnvelope, ProjectSecretError
-from app.runtime_config import project_secret_manager
+from app.project_secrets import (
+    ProjectDekCache,
+    ProjectKeyEnvelope,
+    ProjectSecretError,
+    ciphertext_key_id,
+)
+from app.runtime_config import (
+    PROJECT_DEK_CACHE_MAX_ENTRIES,
+    PROJECT_DEK_CACHE_TTL_SECONDS,
+    project_secret_manager,
+)
 
 
 PROJECT_SECRET_COLUMNS = frozenset({"anon_key", "service_role", "config_token"})
 
+_dek_cache = ProjectDekCache(
+    ttl_seconds=PROJECT_DEK_CACHE_TTL_SECONDS,
+    max_entries=PROJECT_DEK_CACHE_MAX_ENTRIES,
+)
+
+
+def invalidate_project_dek_cache(project_id: uuid.UUID | str) -> None:
+    """Descarta a DEK em cache; usar ao remover ou trocar o envelope."""
+    _dek_cache.invalidate(project_id)
 
-async def ensure_project_secrets_schema(pool: asyncpg.Pool) -> None:
-    async with pool.acquire() as conn:
-        await conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS project_key_envelopes (
-                project_id UUID PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
-                key_id UUID NOT NULL UNIQUE,
-                wrapped_dek TEXT NOT NULL,
-                wrapping_key_id TEXT NOT NULL,
-                algorithm TEXT NOT NULL DEFAULT 'aes-256-gcm',
-                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
-            );
-            CREATE INDEX IF NOT EXISTS idx_project_key_envelopes_wrapping_key
-                ON project_key_envelopes(wrapping_key_id);
-            """
-        )
+
+async def ensure_project_secrets_schema(conn: asyncpg.Connection) -> None:
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS project_key_envelopes (
+            project_id UUID PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+            key_id UUID NOT NULL UNIQUE,
+            wrapped_dek TEXT NOT NULL,
+            wrapping_key_id TEXT NOT NULL,
+            algorithm TEXT NOT NULL DEFAULT 'aes-256-gcm',
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS idx_project_key_envelopes_wrapping_key
+            ON project_key_envelopes(wrapping_key_id);
+        """
+    )
 
 
 def _project_secret_column(column: str) -> str:
@@ -45,9 +64,10 @@ def _record_to_envelope(row: asyncpg.Record) -> ProjectKeyEnvelope:
     )
 
 
-async def _get_project_key_envelope(
+async def _lock_project_key_envelope(
     conn: asyncpg.Connection, project_id: uuid.UUID
 ) -> tuple[ProjectKeyEnvelope, bytes]:
+    """Cria ou reembrulha o envelope sob ``FOR UPDATE``."""
     row = await conn.fetchrow(
         """
         SELECT key_id, wrapped_dek, wrapping_key_id, algorithm
@@ -106,6 +126,42 @@ async def _get_project_key_envelope(
     return envelope, dek
 
 
+async def _get_project_key_envelope(
+    conn: asyncpg.Connection,
+    project_id: uuid.UUID,
+    *,
+    key_id: str | None = None,
+    use_cache: bool = True,
+) -> tuple[ProjectKeyEnvelope, bytes]:
+    """Resolve a DEK do projeto.
+
+    A leitura comum nao trava a linha do envelope; ``FOR UPDATE`` fica
+    restrito a criacao e ao rewrap com a master key atual.
+    """
+    wrapping_key_id = project_secret_manager.wrapping_key_id
+    if use_cache:
+        cached = _dek_cache.get(
+            project_id, wrapping_key_id=wrapping_key_id, key_id=key_id
+        )
+        if cached is not None:
+            return cached
+
+    row = await conn.fetchrow(
+        """
+        SELECT key_id, wrapped_dek, wrapping_key_id, algorithm
+        FROM project_key_envelopes WHERE project_id = $1
+        """,
+        project_id,
+    )
+    if row is not None and row["wrapping_key_id"] == wrapping_key_id:
+        envelope = _record_to_envelope(row)
+        dek = project_secret_manager.unwrap_dek(envelope)
+    else:
+        envelope, dek = await _lock_project_key_envelope(conn, project_id)
+    _dek_cache.put(project_id, envelope, dek)
+    return envelope, dek
+
+
 async def encrypt_project_secret(
     conn: asyncpg.Connection,
     *,
@@ -114,7 +170,11 @@ async def encrypt_project_secret(
     plaintext: str,
 ) -> str:
     column = _project_secret_column(column)
-    envelope, dek = await _get_project_key_envelope(conn, project_id)
+    # Escrita e rara: relê o envelope para nunca cifrar com um key_id
+    # trocado fora do processo (migrate_project_secrets --rotate-deks).
+    envelope, dek = await _get_project_key_envelope(
+        conn, project_id, use_cache=False
+    )
     return project_secret_manager.encrypt(
         project_id=project_id,
         purpose=column,
@@ -137,7 +197,9 @@ async def decrypt_project_secret(
             "legacy project secret format is not supported by projects-api; "
             "run app.migrate_project_secrets before deploying this version"
         )
-    envelope, dek = await _get_project_key_envelope(conn, project_id)
+    envelope, dek = await _get_project_key_envelope(
+        conn, project_id, key_id=ciphertext_key_id(ciphertext)
+    )
     return project_secret_manager.decrypt(
         project_id=project_id,
         purpose=column,
@@ -147,6 +209,83 @@ async def decrypt_project_secret(
     )
 
 
+async def decrypt_project_secrets_many(
+    conn: asyncpg.Connection,
+    rows: Iterable[Mapping[str, Any]],
+    columns: Iterable[str],
+    *,
+    id_column: str = "id",
+) -> dict[uuid.UUID, dict[str, str | None]]:
+    """Decifra as colunas de varios projetos com uma unica consulta de envelopes.
+
+    Valores vazios voltam como ``None``. DEKs ausentes do cache sao buscadas
+    com ``project_id = ANY($1)``; so criacao e rewrap caem no caminho com lock.
+    """
+    columns = [_project_secret_column(column) for column in columns]
+    pending: dict[uuid.UUID, dict[str, str]] = {}
+    results: dict[uuid.UUID, dict[str, str | None]] = {}
+    for row in rows:
+        project_id = row[id_column]
+        values = results.setdefault(project_id, {})
+        for column in columns:
+            ciphertext = row[column]
+            values[column] = None
+            if not ciphertext:
+                continue
+            if not project_secret_manager.is_v2(ciphertext):
+                raise ProjectSecretError(
+                    "legacy project secret format is not supported by projects-api; "
+                    "run app.migrate_project_secrets before deploying this version"
+                )
+            pending.setdefault(project_id, {})[column] = ciphertext
+
+    wrapping_key_id = project_secret_manager.wrapping_key_id
+    deks: dict[uuid.UUID, tuple[ProjectKeyEnvelope, bytes]] = {}
+    missing: list[uuid.UUID] = []
+    for project_id, ciphertexts in pending.items():
+        cached = _dek_cache.get(
+            project_id,
+            wrapping_key_id=wrapping_key_id,
+            key_id=ciphertext_key_id(next(iter(ciphertexts.values()))),
+        )
+        if cached is not None:
+            deks[project_id] = cached
+        else:
+            missing.append(project_id)
+
+    if missing:
+        envelope_rows = await conn.fetch(
+            """
+            SELECT project_id, key_id, wrapped_dek, wrapping_key_id, algorithm
+            FROM project_key_envelopes WHERE project_id = ANY($1::uuid[])
+            """,
+            missing,
+        )
+        for envelope_row in envelope_rows:
+            if envelope_row["wrapping_key_id"] != wrapping_key_id:
+                continue
+            envelope = _record_to_envelope(envelope_row)
+            dek = project_secret_manager.unwrap_dek(envelope)
+            _dek_cache.put(envelope_row["project_id"], envelope, dek)
+            deks[envelope_row["project_id"]] = (envelope, dek)
+        for project_id in missing:
+            if project_id not in deks:
+                deks[project_id] = await _lock_project_key_envelope(conn, project_id)
+                _dek_cache.put(project_id, *deks[project_id])
+
+    for project_id, ciphertexts in pending.items():
+        envelope, dek = deks[project_id]
+        for column, ciphertext in ciphertexts.items():
+            results[project_id][column] = project_secret_manager.decrypt(
+                project_id=project_id,
+                purpose=column,
+                key_id=envelope.key_id,
+                dek=dek,
+                ciphertext=ciphertext,
+            )
+    return results
+
+
 async def store_project_secrets(
     conn: asyncpg.Connection,
     *,
@@ -2,8 +2,12 @@ from __future__ import annotations
 
 import base64
 import os
+import threading
+import time
 import uuid
+from collections import OrderedDict
 from dataclasses import dataclass
+from typing import Callable
 
 from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
@@ -139,3 +143,90 @@ class ProjectSecretManager:
     @staticmethod
     def is_v2(ciphertext: str | None) -> bool:
         return bool(ciphertext and ciphertext.startswith(f"{FORMAT_VERSION}."))
+
+
+class ProjectDekCache:
+    """Cache LRU com TTL de DEKs ja desembrulhadas, por projeto e ``key_id``.
+
+    Evita repetir o unwrap Fernet (e o lock da linha do envelope) a cada
+    decrypt. Entradas embrulhadas com outra master key nao sao servidas,
+    para que o caminho com lock ainda faca o rewrap.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl_seconds: float,
+        max_entries: int,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._ttl = max(0.0, float(ttl_seconds))
+        self._max_entries = max(0, int(max_entries))
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[float, ProjectKeyEnvelope, bytes]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._ttl > 0 and self._max_entries > 0
+
+    def get(
+        self,
+        project_id: uuid.UUID | str,
+        *,
+        wrapping_key_id: str,
+        key_id: str | None = None,
+    ) -> tuple[ProjectKeyEnvelope, bytes] | None:
+        if not self.enabled:
+            return None
+        cache_key = str(project_id)
+        with self._lock:
+            cached = self._entries.get(cache_key)
+            if cached is None:
+                return None
+            expires_at, envelope, dek = cached
+            if expires_at <= self._clock():
+                del self._entries[cache_key]
+                return None
+            if envelope.wrapping_key_id != wrapping_key_id:
+                return None
+            if key_id is not None and envelope.key_id != key_id:
+                return None
+            self._entries.move_to_end(cache_key)
+            return envelope, dek
+
+    def put(
+        self,
+        project_id: uuid.UUID | str,
+        envelope: ProjectKeyEnvelope,
+        dek: bytes,
+    ) -> None:
+        if not self.enabled:
+            return
+        cache_key = str(project_id)
+        with self._lock:
+            self._entries[cache_key] = (self._clock() + self._ttl, envelope, dek)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, project_id: uuid.UUID | str) -> None:
+        with self._lock:
+            self._entries.pop(str(project_id), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def ciphertext_key_id(ciphertext: str) -> str | None:
+    """Extrai o ``key_id`` de um segredo v2 sem decifra-lo."""
+    parts = ciphertext.split(".", 2)
+    if len(parts) != 3 or parts[0] != FORMAT_VERSION:
+        return None
+    return parts[1]
@@ -6,9 +6,10 @@ import re
 import shutil
 import tempfile
 
-from dotenv import dotenv_values
 from fastapi import HTTPException
 
+from app.project_env import invalidate_project_env, read_project_env
+
 
 DEFAULT_FILE_SIZE_LIMIT = "524288000"
 DEFAULT_PROJECTS_ROOT = pathlib.Path("/docker/projects")
@@ -80,7 +81,7 @@ SETTING_TO_SERVICES: dict[str, list[str]] = {
 def _read_env_whitelisted(env_path: pathlib.Path) -> dict[str, str]:
     all_values = {
         key: str(value)
-        for key, value in dotenv_values(env_path).items()
+        for key, value in read_project_env(env_path).items()
         if value is not None
     }
     return {k: value for k, value in all_values.items() if k in SETTINGS_WHITELIST}
@@ -93,7 +94,7 @@ def get_project_file_size_limit(
 ) -> str:
     """Return the tenant upload limit without exposing the tenant env file."""
     try:
-        values = dotenv_values(projects_root / project_name / ".env")
+        values = read_project_env(projects_root / project_name / ".env")
     except (OSError, ValueError):
         return DEFAULT_FILE_SIZE_LIMIT
 
@@ -201,6 +202,7 @@ def _write_env_whitelisted(env_path: pathlib.Path, updates: dict[str, str]) -> N
             os.fsync(temp_file.fileno())
         shutil.copymode(env_path, temp_path)
         os.replace(temp_path, env_path)
+        invalidate_project_env(env_path)
     finally:
         if temp_path is not None and temp_path.exists():
             temp_path.unlink()
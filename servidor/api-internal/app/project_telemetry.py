@@ -1,16 +1,44 @@
-"""Consulta de telemetria do Auth isolada por database de projeto."""
+"""Consulta de telemetria do Auth isolada por database de projeto.
+
+O periodo de 24h le ``auth.sessions`` direto, inclusive a serie horaria. Os
+demais sao servidos por rollups diarios no control plane (atividade por
+usuario e buckets por dia), mantidos em segundo plano a partir de um
+watermark por projeto: a leitura nunca consolida, so usa os dias inteiros ja
+consolidados e le do tenant os dias parciais das bordas, entao totais e serie
+respeitam ``start``/``end``. Dias ainda nao consolidados ficam de fora e a
+resposta sai com ``complete`` falso. A lista de usuarios e paginada por
+cursor keyset ``(last_login_at, user_id)``.
+"""
 
 from __future__ import annotations
 
+import asyncio
+import base64
+import binascii
 import datetime as dt
+import uuid
+from collections import defaultdict
 from dataclasses import dataclass
 from typing import Any
 
 import asyncpg
 
+from app.database import get_pool
+
 
 UTC = dt.timezone.utc
 MAX_CUSTOM_RANGE = dt.timedelta(days=366)
+LIVE_PERIODS = frozenset({"24h"})
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+# Sessoes gravadas perto da virada da hora ainda podem estar em transacao.
+ROLLUP_SETTLE_DELAY = dt.timedelta(minutes=5)
+ROLLUP_CHUNK = dt.timedelta(days=31)
+ROLLUP_RETENTION = MAX_CUSTOM_RANGE + dt.timedelta(days=2)
+ROLLUP_PROJECTS_PER_RUN = 50
+
+_rollup_task: asyncio.Task[None] | None = None
+_rollup_wakeup = asyncio.Event()
 
 
 class TelemetryValidationError(ValueError):
@@ -23,6 +51,16 @@ class TelemetryPeriod:
     start: dt.datetime
     end: dt.datetime
 
+    @property
+    def uses_rollups(self) -> bool:
+        return self.key not in LIVE_PERIODS
+
+
+@dataclass(frozen=True)
+class TelemetryCursor:
+    last_login_at: dt.datetime
+    user_id: uuid.UUID
+
 
 def _as_utc(value: dt.datetime) -> dt.datetime:
     if value.tzinfo is None:
@@ -79,10 +117,359 @@ def resolve_telemetry_period(
     return TelemetryPeriod(key="custom", start=range_start, end=range_end)
 
 
+def encode_telemetry_cursor(last_login_at: dt.datetime, user_id: Any) -> str:
+    raw = f"{_as_utc(last_login_at).isoformat()}|{user_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_telemetry_cursor(cursor: str | None) -> TelemetryCursor | None:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        last_login_at, user_id = raw.split("|", 1)
+        return TelemetryCursor(
+            last_login_at=_as_utc(dt.datetime.fromisoformat(last_login_at)),
+            user_id=uuid.UUID(user_id),
+        )
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise TelemetryValidationError("cursor invalido") from exc
+
+
+def _cursor_arguments(cursor: TelemetryCursor | None) -> tuple[Any, Any]:
+    if cursor is None:
+        return None, None
+    return cursor.last_login_at, cursor.user_id
+
+
+def _floor_hour(value: dt.datetime) -> dt.datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _floor_day(value: dt.datetime) -> dt.datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _ceil_day(value: dt.datetime) -> dt.datetime:
+    floor = _floor_day(value)
+    return floor if floor == value else floor + dt.timedelta(days=1)
+
+
+async def ensure_telemetry_schema(conn: asyncpg.Connection) -> None:
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS project_auth_activity_daily (
+            project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+            day DATE NOT NULL,
+            user_id UUID NOT NULL,
+            session_count BIGINT NOT NULL DEFAULT 0,
+            last_login_at TIMESTAMPTZ NOT NULL,
+            PRIMARY KEY (project_id, day, user_id)
+        );
+
+        CREATE TABLE IF NOT EXISTS project_auth_activity_buckets (
+            project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+            granularity TEXT NOT NULL CHECK (granularity IN ('hour', 'day')),
+            bucket_start TIMESTAMPTZ NOT NULL,
+            active_users INTEGER NOT NULL,
+            session_count BIGINT NOT NULL,
+            PRIMARY KEY (project_id, granularity, bucket_start)
+        );
+
+        CREATE TABLE IF NOT EXISTS project_auth_telemetry_watermarks (
+            project_id UUID PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+            rolled_up_to TIMESTAMPTZ NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """
+    )
+
+
+_TENANT_ACTIVITY = """
+    WITH activity AS (
+        SELECT user_id, created_at AS seen_at, 1 AS is_session
+        FROM auth.sessions
+        WHERE created_at >= $1
+          AND created_at < $2
+        UNION ALL
+        SELECT id, last_sign_in_at, 0
+        FROM auth.users
+        WHERE last_sign_in_at >= $1
+          AND last_sign_in_at < $2
+    )
+"""
+
+_TENANT_DAILY_ACTIVITY = _TENANT_ACTIVITY + """
+    SELECT
+        user_id,
+        (seen_at AT TIME ZONE 'UTC')::date AS day,
+        sum(is_session)::bigint AS session_count,
+        max(seen_at) AS last_login_at
+    FROM activity
+    GROUP BY 1, 2
+"""
+
+_TENANT_HOURLY_ACTIVITY = _TENANT_ACTIVITY + """
+    SELECT
+        date_trunc('hour', seen_at, 'UTC') AS bucket_start,
+        count(DISTINCT user_id)::integer AS active_users,
+        sum(is_session)::bigint AS session_count
+    FROM activity
+    GROUP BY 1
+"""
+
+
+async def _roll_up_window(
+    conn: asyncpg.Connection,
+    project_conn: asyncpg.Connection,
+    project_id: Any,
+    window_start: dt.datetime,
+    window_end: dt.datetime,
+) -> None:
+    daily = await project_conn.fetch(_TENANT_DAILY_ACTIVITY, window_start, window_end)
+    if daily:
+        # Janelas nao se sobrepoem, entao somar sessoes e exato.
+        await conn.execute(
+            """
+            INSERT INTO project_auth_activity_daily AS daily (
+                project_id, day, user_id, session_count, last_login_at
+            )
+            SELECT $1, rows.day, rows.user_id, rows.session_count, rows.last_login_at
+            FROM unnest($2::date[], $3::uuid[], $4::bigint[], $5::timestamptz[])
+                AS rows(day, user_id, session_count, last_login_at)
+            ON CONFLICT (project_id, day, user_id) DO UPDATE SET
+                session_count = daily.session_count + EXCLUDED.session_count,
+                last_login_at = GREATEST(daily.last_login_at, EXCLUDED.last_login_at)
+            """,
+            project_id,
+            [row["day"] for row in daily],
+            [row["user_id"] for row in daily],
+            [row["session_count"] for row in daily],
+            [row["last_login_at"] for row in daily],
+        )
+        await conn.execute(
+            """
+            INSERT INTO project_auth_activity_buckets AS buckets (
+                project_id, granularity, bucket_start, active_users, session_count
+            )
+            SELECT
+                project_id,
+                'day',
+                day::timestamp AT TIME ZONE 'UTC',
+                count(*)::integer,
+                sum(session_count)::bigint
+            FROM project_auth_activity_daily
+            WHERE project_id = $1
+              AND day >= $2
+              AND day < $3
+            GROUP BY project_id, day
+            ON CONFLICT (project_id, granularity, bucket_start) DO UPDATE SET
+                active_users = EXCLUDED.active_users,
+                session_count = EXCLUDED.session_count
+            """,
+            project_id,
+            window_start.date(),
+            _ceil_day(window_end).date(),
+        )
+
+
+def _rollup_upper(now: dt.datetime | None) -> dt.datetime:
+    return _floor_hour(_as_utc(now or dt.datetime.now(UTC)) - ROLLUP_SETTLE_DELAY)
+
+
+async def read_auth_activity_watermark(
+    conn: asyncpg.Connection,
+    *,
+    project_id: Any,
+    now: dt.datetime | None = None,
+) -> dt.datetime:
+    """Watermark atual do projeto, registrando-o para o rollup em segundo plano.
+
+    So le (ou cria) a linha, sem lock: a consolidacao nunca roda no request.
+    """
+    await conn.execute(
+        """
+        INSERT INTO project_auth_telemetry_watermarks (project_id, rolled_up_to)
+        VALUES ($1, $2)
+        ON CONFLICT (project_id) DO NOTHING
+        """,
+        project_id,
+        _floor_day(_rollup_upper(now) - MAX_CUSTOM_RANGE),
+    )
+    return _as_utc(
+        await conn.fetchval(
+            """
+            SELECT rolled_up_to
+            FROM project_auth_telemetry_watermarks
+            WHERE project_id = $1
+            """,
+            project_id,
+        )
+    )
+
+
+async def refresh_auth_activity_rollups(
+    conn: asyncpg.Connection,
+    project_conn: asyncpg.Connection,
+    *,
+    project_id: Any,
+    now: dt.datetime | None = None,
+) -> dt.datetime | None:
+    """Consolida as horas fechadas desde o watermark e devolve o novo watermark.
+
+    Cada janela de ``ROLLUP_CHUNK`` e uma transacao curta com o lock da linha
+    do watermark; ``None`` quando outra replica esta consolidando o projeto.
+    """
+    upper = _rollup_upper(now)
+    while True:
+        async with conn.transaction():
+            # O lock da linha serializa replicas: cada janela entra uma unica vez.
+            watermark = await conn.fetchval(
+                """
+                SELECT rolled_up_to
+                FROM project_auth_telemetry_watermarks
+                WHERE project_id = $1
+                FOR UPDATE SKIP LOCKED
+                """,
+                project_id,
+            )
+            if watermark is None:
+                return None
+            watermark = _as_utc(watermark)
+            if watermark >= upper:
+                break
+            window_end = min(upper, watermark + ROLLUP_CHUNK)
+            await _roll_up_window(conn, project_conn, project_id, watermark, window_end)
+            await conn.execute(
+                """
+                UPDATE project_auth_telemetry_watermarks
+                SET rolled_up_to = $2,
+                    updated_at = now()
+                WHERE project_id = $1
+                """,
+                project_id,
+                window_end,
+            )
+
+    cutoff = _floor_day(upper - ROLLUP_RETENTION)
+    await conn.execute(
+        "DELETE FROM project_auth_activity_daily WHERE project_id = $1 AND day < $2",
+        project_id,
+        cutoff.date(),
+    )
+    await conn.execute(
+        """
+        DELETE FROM project_auth_activity_buckets
+        WHERE project_id = $1
+          AND bucket_start < $2
+        """,
+        project_id,
+        cutoff,
+    )
+    return watermark
+
+
+async def roll_up_pending_projects(
+    pool: asyncpg.Pool,
+    tenants: Any,
+    *,
+    now: dt.datetime | None = None,
+) -> int:
+    """Consolida os projetos registrados com watermark atrasado, os mais atrasados antes."""
+    rows = await pool.fetch(
+        """
+        SELECT w.project_id, p.name
+        FROM project_auth_telemetry_watermarks w
+        JOIN projects p ON p.id = w.project_id
+        WHERE w.rolled_up_to < $1
+        ORDER BY w.rolled_up_to
+        LIMIT $2
+        """,
+        _rollup_upper(now),
+        ROLLUP_PROJECTS_PER_RUN,
+    )
+    refreshed = 0
+    for row in rows:
+        project_conn = None
+        try:
+            project_conn = await tenants.acquire(row["name"])
+            async with pool.acquire() as conn:
+                if await refresh_auth_activity_rollups(
+                    conn, project_conn, project_id=row["project_id"], now=now
+                ) is not None:
+                    refreshed += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            print(f"[telemetry] rollup de {row['name']} falhou: {exc}")
+        finally:
+            if project_conn is not None:
+                await tenants.release(project_conn)
+    return refreshed
+
+
+def wake_auth_activity_rollups() -> None:
+    """Antecipa a proxima rodada (projeto recem-registrado ou atrasado)."""
+    _rollup_wakeup.set()
+
+
+async def _rollup_loop(tenants: Any, interval_seconds: int) -> None:
+    while True:
+        _rollup_wakeup.clear()
+        try:
+            await roll_up_pending_projects(await get_pool(), tenants)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            print(f"[telemetry] rollup falhou: {exc}")
+        try:
+            await asyncio.wait_for(_rollup_wakeup.wait(), timeout=interval_seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_auth_activity_rollups(*, tenants: Any, interval_seconds: int) -> None:
+    global _rollup_task
+    if _rollup_task is not None:
+        raise RuntimeError("telemetry rollup loop already started")
+    _rollup_task = asyncio.create_task(
+        _rollup_loop(tenants, interval_seconds), name="telemetry-rollup"
+    )
+
+
+async def stop_auth_activity_rollups() -> None:
+    global _rollup_task
+    if _rollup_task is None:
+        return
+    _rollup_task.cancel()
+    try:
+        await _rollup_task
+    except asyncio.CancelledError:
+        pass
+    _rollup_task = None
+
+
+def _page(
+    rows: list[Any],
+    limit: int,
+) -> tuple[list[Any], str | None]:
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_telemetry_cursor(last["last_login_at"], last["user_id"])
+
+
 async def fetch_project_user_telemetry(
     conn: asyncpg.Connection,
     telemetry_period: TelemetryPeriod,
+    *,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: TelemetryCursor | None = None,
 ) -> dict[str, Any]:
+    """Leitura direta do tenant; usada no periodo de 24h."""
+    cursor_at, cursor_user = _cursor_arguments(cursor)
     rows = await conn.fetch(
         """
         WITH period_sessions AS (
@@ -94,46 +481,296 @@ async def fetch_project_user_telemetry(
             WHERE created_at >= $1
               AND created_at < $2
             GROUP BY user_id
+        ),
+        period_users AS (
+            SELECT
+                users.id AS user_id,
+                users.email,
+                users.phone,
+                GREATEST(
+                    users.last_sign_in_at,
+                    period_sessions.last_session_at
+                ) AS last_login_at,
+                COALESCE(period_sessions.session_count, 0)::bigint AS session_count
+            FROM auth.users AS users
+            LEFT JOIN period_sessions ON period_sessions.user_id = users.id
+            WHERE period_sessions.user_id IS NOT NULL
+               OR (
+                    users.last_sign_in_at >= $1
+                    AND users.last_sign_in_at < $2
+               )
+        ),
+        totals AS (
+            SELECT
+                period_users.*,
+                count(*) OVER () AS active_users,
+                sum(session_count) OVER () AS total_sessions
+            FROM period_users
         )
-        SELECT
-            users.id::text AS user_id,
-            users.email,
-            users.phone,
-            GREATEST(
-                users.last_sign_in_at,
-                period_sessions.last_session_at
-            ) AS last_login_at,
-            COALESCE(period_sessions.session_count, 0)::bigint AS session_count
-        FROM auth.users AS users
-        LEFT JOIN period_sessions ON period_sessions.user_id = users.id
-        WHERE period_sessions.user_id IS NOT NULL
-           OR (
-                users.last_sign_in_at >= $1
-                AND users.last_sign_in_at < $2
-           )
-        ORDER BY last_login_at DESC NULLS LAST, users.id
+        SELECT *
+        FROM totals
+        WHERE $3::timestamptz IS NULL
+           OR last_login_at < $3
+           OR (last_login_at = $3 AND user_id > $4::uuid)
+        ORDER BY last_login_at DESC, user_id
+        LIMIT $5
         """,
         telemetry_period.start,
         telemetry_period.end,
+        cursor_at,
+        cursor_user,
+        limit + 1,
     )
+    page, next_cursor = _page(rows, limit)
 
     users = [
         {
-            "user_id": row["user_id"],
+            "user_id": str(row["user_id"]),
             "email": row["email"],
             "phone": row["phone"],
             "last_login_at": row["last_login_at"],
             "session_count": int(row["session_count"] or 0),
         }
-        for row in rows
+        for row in page
     ]
     return {
         "period": telemetry_period.key,
         "start": telemetry_period.start,
         "end": telemetry_period.end,
-        "active_users": len(users),
-        "total_sessions": sum(user["session_count"] for user in users),
+        "active_users": int(rows[0]["active_users"]) if rows else 0,
+        "total_sessions": int(rows[0]["total_sessions"] or 0) if rows else 0,
         "users": users,
+        "next_cursor": next_cursor,
+        "closed": False,
         "source": "auth.users+auth.sessions",
         "sessions_are_current_records": True,
     }
+
+
+@dataclass(frozen=True)
+class _RollupCoverage:
+    """Como o periodo e coberto: dias dos rollups, bordas ao vivo e lacuna."""
+
+    first_day: dt.datetime
+    rollup_end: dt.datetime
+    live_windows: list[tuple[dt.datetime, dt.datetime]]
+    complete: bool
+
+
+def _rolled_up_days(
+    telemetry_period: TelemetryPeriod,
+    rolled_up_to: dt.datetime,
+) -> _RollupCoverage:
+    """Dias inteiros servidos pelos rollups e bordas que o tenant cobre.
+
+    O tenant so le as pontas parciais (no maximo um dia cada); dias inteiros
+    alem do watermark ficam de fora ate o rollup em segundo plano alcanca-los.
+    """
+    first_day = _ceil_day(telemetry_period.start)
+    last_day = _floor_day(telemetry_period.end)
+    if last_day <= first_day:
+        return _RollupCoverage(
+            first_day,
+            first_day,
+            [(telemetry_period.start, telemetry_period.end)],
+            True,
+        )
+    rollup_end = max(first_day, min(last_day, _floor_day(_as_utc(rolled_up_to))))
+    windows = [
+        (telemetry_period.start, first_day),
+        (last_day, telemetry_period.end),
+    ]
+    return _RollupCoverage(
+        first_day,
+        rollup_end,
+        [(lower, upper) for lower, upper in windows if lower < upper],
+        rollup_end == last_day,
+    )
+
+
+def _live_day_buckets(live_rows: list[Any]) -> list[dict[str, Any]]:
+    users: dict[dt.date, set[Any]] = defaultdict(set)
+    sessions: dict[dt.date, int] = defaultdict(int)
+    for row in live_rows:
+        users[row["day"]].add(row["user_id"])
+        sessions[row["day"]] += int(row["session_count"])
+    return [
+        {
+            "bucket_start": dt.datetime.combine(day, dt.time(), tzinfo=UTC),
+            "active_users": len(users[day]),
+            "session_count": sessions[day],
+        }
+        for day in users
+    ]
+
+
+async def fetch_rolled_up_user_telemetry(
+    conn: asyncpg.Connection,
+    project_conn: asyncpg.Connection,
+    telemetry_period: TelemetryPeriod,
+    *,
+    project_id: Any,
+    rolled_up_to: dt.datetime,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: TelemetryCursor | None = None,
+) -> dict[str, Any]:
+    """Resumo, serie diaria e pagina de usuarios: rollups mais as bordas do tenant.
+
+    Os dias UTC inteiros e ja consolidados vem de ``project_auth_activity_daily``
+    e dos buckets diarios; as pontas parciais sao lidas do tenant e entram nos
+    totais e na serie recortadas em ``start``/``end``.
+    """
+    coverage = _rolled_up_days(telemetry_period, rolled_up_to)
+    live_windows = coverage.live_windows
+    live_rows: list[Any] = []
+    for window_start, window_end in live_windows:
+        live_rows.extend(
+            await project_conn.fetch(_TENANT_DAILY_ACTIVITY, window_start, window_end)
+        )
+    cursor_at, cursor_user = _cursor_arguments(cursor)
+    rows = await conn.fetch(
+        """
+        WITH activity AS (
+            SELECT user_id, session_count, last_login_at
+            FROM project_auth_activity_daily
+            WHERE project_id = $1
+              AND day >= $2
+              AND day < $3
+            UNION ALL
+            SELECT *
+            FROM unnest($7::uuid[], $8::bigint[], $9::timestamptz[])
+                AS live(user_id, session_count, last_login_at)
+        ),
+        period_users AS (
+            SELECT
+                user_id,
+                sum(session_count)::bigint AS session_count,
+                max(last_login_at) AS last_login_at
+            FROM activity
+            GROUP BY user_id
+        ),
+        totals AS (
+            SELECT
+                period_users.*,
+                count(*) OVER () AS active_users,
+                sum(session_count) OVER () AS total_sessions
+            FROM period_users
+        )
+        SELECT *
+        FROM totals
+        WHERE $4::timestamptz IS NULL
+           OR last_login_at < $4
+           OR (last_login_at = $4 AND user_id > $5::uuid)
+        ORDER BY last_login_at DESC, user_id
+        LIMIT $6
+        """,
+        project_id,
+        coverage.first_day.date(),
+        coverage.rollup_end.date(),
+        cursor_at,
+        cursor_user,
+        limit + 1,
+        [row["user_id"] for row in live_rows],
+        [row["session_count"] for row in live_rows],
+        [row["last_login_at"] for row in live_rows],
+    )
+    page, next_cursor = _page(rows, limit)
+
+    bucket_rows = await conn.fetch(
+        """
+        SELECT bucket_start, active_users, session_count
+        FROM project_auth_activity_buckets
+        WHERE project_id = $1
+          AND granularity = 'day'
+          AND bucket_start >= $2
+          AND bucket_start < $3
+        ORDER BY bucket_start
+        """,
+        project_id,
+        coverage.first_day,
+        coverage.rollup_end,
+    )
+    buckets = [
+        {
+            "bucket_start": row["bucket_start"],
+            "active_users": int(row["active_users"]),
+            "session_count": int(row["session_count"]),
+        }
+        for row in bucket_rows
+    ]
+    buckets.extend(_live_day_buckets(live_rows))
+    buckets.sort(key=lambda bucket: bucket["bucket_start"])
+
+    # Email e telefone vem do tenant, apenas para a pagina atual.
+    contacts: dict[str, Any] = {}
+    if page:
+        contact_rows = await project_conn.fetch(
+            """
+            SELECT id::text AS user_id, email, phone
+            FROM auth.users
+            WHERE id = ANY($1::uuid[])
+            """,
+            [row["user_id"] for row in page],
+        )
+        contacts = {row["user_id"]: row for row in contact_rows}
+
+    users = []
+    for row in page:
+        user_id = str(row["user_id"])
+        contact = contacts.get(user_id)
+        users.append(
+            {
+                "user_id": user_id,
+                "email": contact["email"] if contact else None,
+                "phone": contact["phone"] if contact else None,
+                "last_login_at": row["last_login_at"],
+                "session_count": int(row["session_count"] or 0),
+            }
+        )
+    return {
+        "period": telemetry_period.key,
+        "start": telemetry_period.start,
+        "end": telemetry_period.end,
+        "active_users": int(rows[0]["active_users"]) if rows else 0,
+        "total_sessions": int(rows[0]["total_sessions"] or 0) if rows else 0,
+        "users": users,
+        "next_cursor": next_cursor,
+        "series": {"granularity": "day", "buckets": buckets},
+        "rolled_up_to": rolled_up_to,
+        "complete": coverage.complete,
+        # Dias totalmente consolidados nao mudam mais; bordas lidas ao vivo sim.
+        "closed": (
+            coverage.complete
+            and not live_windows
+            and telemetry_period.end <= rolled_up_to
+        ),
+        "source": (
+            "project_auth_activity_daily+auth.sessions"
+            if live_windows
+            else "project_auth_activity_daily"
+        ),
+        "sessions_are_current_records": False,
+    }
+
+
+async def fetch_live_activity_series(
+    project_conn: asyncpg.Connection,
+    telemetry_period: TelemetryPeriod,
+) -> dict[str, Any]:
+    """Serie horaria do periodo de 24h, lida do tenant sem tocar nos rollups."""
+    rows = await project_conn.fetch(
+        _TENANT_HOURLY_ACTIVITY + "    ORDER BY bucket_start\n",
+        _floor_hour(telemetry_period.start),
+        telemetry_period.end,
+    )
+    return {
+        "granularity": "hour",
+        "buckets": [
+            {
+                "bucket_start": row["bucket_start"],
+                "active_users": int(row["active_users"]),
+                "session_count": int(row["session_count"]),
+            }
+            for row in rows
+        ],
+    }
@@ -1,10 +1,12 @@
 import asyncio
+import math
 import os
 import json
-import urllib.request
-import urllib.error
+import socket
+import uuid
 from urllib.parse import urlparse
 import asyncpg
+import httpx
 import ssl
 
 try:
@@ -71,189 +73,723 @@ def get_tenant_dsn(base_dsn: str, db_name: str) -> str:
     new_dsn = parsed._replace(path=f"/{db_name}")
     return new_dsn.geturl()
 
-async def send_to_api(token_fcm: str, body: str, project_name: str) -> bool:
+def _read_positive_int(name: str, default: int) -> int:
+    value = int(os.getenv(name, str(default)))
+    if value < 1:
+        raise RuntimeError(f"{name} must be at least 1")
+    return value
+
+
+# Requisicoes HTTP em voo: teto global (tambem o tamanho do pool keep-alive)
+# e teto por tenant, para um projeto barulhento nao monopolizar o gateway.
+PUSH_MAX_IN_FLIGHT = _read_positive_int("PUSH_MAX_IN_FLIGHT", 64)
+PUSH_TENANT_MAX_IN_FLIGHT = _read_positive_int("PUSH_TENANT_MAX_IN_FLIGHT", 16)
+# Itens por requisicao assinada e janela maxima de espera para completar o
+# lote. O gateway aceita ate 500 itens por lote.
+PUSH_BATCH_MAX_ITEMS = _read_positive_int("PUSH_BATCH_MAX_ITEMS", 100)
+PUSH_BATCH_WINDOW_MS = _read_positive_int("PUSH_BATCH_WINDOW_MS", 20)
+if PUSH_BATCH_MAX_ITEMS > 500:
+    raise RuntimeError("PUSH_BATCH_MAX_ITEMS must be at most 500")
+# Espelham send_push.lua: envios simultaneos ao FCM por lote e pior caso de
+# uma chamada ao Google ja iniciada (conexao, handshake TLS, envio, leitura).
+GATEWAY_FCM_CONCURRENCY = 16
+GATEWAY_CALL_SECONDS = 16.0
+# Folga de prazo por rodada de envios simultaneos no gateway.
+PUSH_BATCH_ROUND_SECONDS = 1.0
+# Notificacoes reservadas por transacao de dreno.
+PUSH_DRAIN_BATCH_SIZE = _read_positive_int("PUSH_DRAIN_BATCH_SIZE", 100)
+# Reserva sem status final depois deste prazo e considerada abandonada
+# (worker morto) e volta para 'pendente'. Deve cobrir com folga uma rodada
+# de entrega; abaixo disso a mesma notificacao seria enviada duas vezes.
+PUSH_CLAIM_STALL_SECONDS = _read_positive_int("PUSH_CLAIM_STALL_SECONDS", 600)
+# Identifica as reservas deste processo entre replicas do worker.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_http_client: httpx.AsyncClient | None = None
+_in_flight: asyncio.Semaphore | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            verify=SSL_CONTEXT,
+            timeout=PUSH_REQUEST_TIMEOUT,
+            follow_redirects=False,
+            limits=httpx.Limits(
+                max_connections=PUSH_MAX_IN_FLIGHT,
+                max_keepalive_connections=PUSH_MAX_IN_FLIGHT,
+            ),
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    client, _http_client = _http_client, None
+    if client is not None:
+        await client.aclose()
+
+
+def batch_budget(item_count: int) -> float:
+    """Prazo do gateway para iniciar os envios do lote; cresce com o tamanho."""
+    rounds = math.ceil(item_count / GATEWAY_FCM_CONCURRENCY)
+    return PUSH_REQUEST_TIMEOUT + rounds * PUSH_BATCH_ROUND_SECONDS
+
+
+def batch_timeout(item_count: int) -> float:
+    """Espera do worker: o prazo do lote mais uma chamada ja em andamento.
+
+    O gateway nao inicia envios depois do prazo, entao sempre responde antes
+    e nenhuma entrega ja concluida pelo FCM vira erro por timeout do worker.
+    """
+    return batch_budget(item_count) + GATEWAY_CALL_SECONDS + 1.0
+
+
+def _global_in_flight() -> asyncio.Semaphore:
+    global _in_flight
+    if _in_flight is None:
+        _in_flight = asyncio.Semaphore(PUSH_MAX_IN_FLIGHT)
+    return _in_flight
+
+
+async def send_batch_to_api(
+    items: list[tuple[str, str]],
+    project_name: str,
+) -> list[bool]:
+    """Envia varios pares (token, body) em uma requisicao assinada.
+
+    Retorna o sucesso de cada item na mesma ordem; qualquer falha da
+    requisicao inteira conta como falha de todos os itens.
+    """
     payload = {
         "project": project_name,
-        "token": token_fcm,
-        "body": body
+        "budget_ms": int(batch_budget(len(items)) * 1000),
+        "items": [
+            {"id": str(index), "token": token, "body": body}
+            for index, (token, body) in enumerate(items)
+        ],
     }
     request_body = json.dumps(payload).encode("utf-8")
     headers = {
         "Content-Type": "application/json",
         **build_internal_hmac_headers("POST", API_URL, request_body),
     }
-    
-    req = urllib.request.Request(
-        API_URL, 
-        data=request_body, 
-        headers=headers, 
-        method='POST'
-    )
-    
+
     try:
-        response = await asyncio.to_thread(
-            urllib.request.urlopen,
-            req,
-            timeout=PUSH_REQUEST_TIMEOUT,
-            context=SSL_CONTEXT,
-        )
-        return response.status in (200, 201)
-    except urllib.error.HTTPError as e:
-        detail = e.read().decode("utf-8", errors="replace")
-        print(f"[{project_name}] ❌ Push rejeitado: HTTP {e.code} - {detail}")
-        return False
-    except Exception as e:
+        async with _global_in_flight():
+            response = await get_http_client().post(
+                API_URL,
+                content=request_body,
+                headers=headers,
+                timeout=batch_timeout(len(items)),
+            )
+    except httpx.HTTPError as e:
         print(f"[{project_name}] ❌ Erro ao avisar a api: {e}")
-        return False
+        return [False] * len(items)
+    if response.status_code != 200:
+        print(f"[{project_name}] ❌ Push rejeitado: HTTP {response.status_code} - {response.text}")
+        return [False] * len(items)
+    try:
+        results = response.json()["results"]
+        delivered = {str(result["id"]) for result in results if result.get("ok") is True}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        print(f"[{project_name}] ❌ Resposta de lote inválida da api")
+        return [False] * len(items)
+    return [str(index) in delivered for index in range(len(items))]
+
+
+class PushBatcher:
+    """Agrupa entregas de um tenant por tamanho (PUSH_BATCH_MAX_ITEMS) e janela."""
+
+    def __init__(self, tenant: "TenantState") -> None:
+        self.tenant = tenant
+        self.pending: list[tuple[tuple[str, str], asyncio.Future]] = []
+        self.timer: asyncio.TimerHandle | None = None
+        self.tasks: set[asyncio.Task] = set()
+
+    async def send(self, token: str, body: str) -> bool:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append(((token, body), future))
+        if len(self.pending) >= PUSH_BATCH_MAX_ITEMS:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(PUSH_BATCH_WINDOW_MS / 1000, self.flush)
+        return await future
+
+    def flush(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        while self.pending:
+            batch = self.pending[:PUSH_BATCH_MAX_ITEMS]
+            del self.pending[:PUSH_BATCH_MAX_ITEMS]
+            task = asyncio.create_task(self._post(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def cancel(self) -> None:
+        """Interrompe lotes agendados e em voo, para nada sair depois do dreno."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        pending, self.pending = self.pending, []
+        for _item, future in pending:
+            future.cancel()
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _post(self, batch) -> None:
+        try:
+            async with self.tenant.in_flight:
+                results = await send_batch_to_api(
+                    [item for item, _future in batch],
+                    self.tenant.project_name,
+                )
+        except Exception as exc:
+            print(f"[{self.tenant.project_name}] ❌ Erro ao enviar lote: {exc}")
+            results = [False] * len(batch)
+        for (_item, future), ok in zip(batch, results):
+            if not future.done():
+                future.set_result(ok)
+
+
+# Reserva de notificacoes: o lote passa a 'processando' em um UPDATE curto,
+# com claimed_at/claimed_by, e a entrega acontece fora de qualquer transacao.
+# Outras replicas podem estar entregando as proprias reservas, entao so volta
+# para 'pendente' o que passou de PUSH_CLAIM_STALL_SECONDS.
+CLAIMED_STATUS = "processando"
+
+
+async def ensure_claim_columns(conn: asyncpg.Connection) -> None:
+    """Adiciona claimed_at/claimed_by em tabelas criadas antes da reserva."""
+    rows = await conn.fetch(
+        """
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = 'notifications'
+          AND column_name IN ('claimed_at', 'claimed_by')
+        """
+    )
+    if len(rows) == 2:
+        return
+    await conn.execute(
+        """
+        ALTER TABLE notifications
+            ADD COLUMN IF NOT EXISTS claimed_at timestamp with time zone,
+            ADD COLUMN IF NOT EXISTS claimed_by text
+        """
+    )
 
 
-async def get_pending_notifications(conn: asyncpg.Connection):
+async def reclaim_stalled_notifications(conn: asyncpg.Connection) -> None:
+    # Reservas sem claimed_at vem de workers anteriores as colunas.
+    await conn.execute(
+        """
+        UPDATE notifications
+        SET status = 'pendente', claimed_at = NULL, claimed_by = NULL
+        WHERE status = $1
+          AND COALESCE(claimed_at, created_at) < now() - make_interval(secs => $2)
+        """,
+        CLAIMED_STATUS,
+        PUSH_CLAIM_STALL_SECONDS,
+    )
+
+
+async def claim_pending_notifications(conn: asyncpg.Connection):
     query = """
-        SELECT id, user_id, body
-        FROM notifications
-        WHERE status = 'pendente'
-        ORDER BY created_at
-        LIMIT 10
-        FOR UPDATE SKIP LOCKED
+        WITH next AS (
+            SELECT id
+            FROM notifications
+            WHERE status = 'pendente'
+            ORDER BY created_at
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE notifications n
+        SET status = $2, claimed_at = now(), claimed_by = $3
+        FROM next
+        WHERE n.id = next.id
+        RETURNING n.id, n.user_id, n.body
     """
-    return await conn.fetch(query)
+    return await conn.fetch(query, PUSH_DRAIN_BATCH_SIZE, CLAIMED_STATUS, WORKER_ID)
 
 
-async def get_user_push_tokens(conn: asyncpg.Connection, user_id):
+async def get_push_tokens_by_user(conn: asyncpg.Connection, user_ids) -> dict:
+    """Tokens de todos os destinatarios do lote em uma unica consulta."""
     query = """
-        SELECT DISTINCT token, platform
+        SELECT DISTINCT user_id, token
         FROM push_tokens
-        WHERE user_id = $1
+        WHERE user_id = ANY($1::uuid[])
           AND platform = ANY($2::text[])
     """
-    return await conn.fetch(query, user_id, list(SUPPORTED_PLATFORMS))
+    tokens: dict = {}
+    for record in await conn.fetch(query, list(user_ids), list(SUPPORTED_PLATFORMS)):
+        tokens.setdefault(record["user_id"], []).append(record["token"])
+    return tokens
+
+# Conexoes com o Postgres ficam limitadas independentemente do numero de
+# tenants: LISTEN so para tenants com atividade recente (ate
+# PUSH_MAX_LISTENERS), uma conexao de controle, confirmacoes curtas e drenos
+# concorrentes limitados por PUSH_MAX_CONCURRENT_DRAINS (x
+# PUSH_TENANT_POOL_SIZE nos drenos). Tenants frios sao filtrados pelo
+# contador de INSERTs de pg_stat_database, lido a cada PUSH_PROBE_INTERVAL
+# pela conexao de controle; so acorda quem tiver INSERT em notifications,
+# confirmado em pg_stat_user_tables no proprio banco (no maximo uma vez por
+# PUSH_CONFIRM_INTERVAL). A varredura completa fica como rede de seguranca.
+PUSH_MAX_LISTENERS = _read_positive_int("PUSH_MAX_LISTENERS", 32)
+PUSH_LISTENER_IDLE_SECONDS = _read_positive_int("PUSH_LISTENER_IDLE_SECONDS", 600)
+PUSH_PROBE_INTERVAL = _read_positive_int("PUSH_PROBE_INTERVAL", 2)
+PUSH_CONFIRM_INTERVAL = _read_positive_int("PUSH_CONFIRM_INTERVAL", 10)
+PUSH_SWEEP_INTERVAL = _read_positive_int("PUSH_SWEEP_INTERVAL", 900)
+PUSH_MAX_CONCURRENT_DRAINS = _read_positive_int("PUSH_MAX_CONCURRENT_DRAINS", 8)
+PUSH_TENANT_POOL_SIZE = _read_positive_int("PUSH_TENANT_POOL_SIZE", 2)
+PUSH_POOL_IDLE_SECONDS = _read_positive_int("PUSH_POOL_IDLE_SECONDS", 120)
+DATABASE_DISCOVERY_INTERVAL = 60
+MISSING_TABLE_RETRY_SECONDS = 3600
+DRAIN_RETRY_SECONDS = 30
+
+
+class TenantState:
+    def __init__(self, db_name: str) -> None:
+        self.db_name = db_name
+        self.project_name = db_name.removeprefix("_supabase_")
+        self.dsn = get_tenant_dsn(BASE_DSN, db_name)
+        self.pool: asyncpg.Pool | None = None
+        self.listener: asyncpg.Connection | None = None
+        self.last_activity = 0.0
+        self.pool_used_at = 0.0
+        self.disabled_until = 0.0
+        self.drain_task: asyncio.Task | None = None
+        self.drain_requested = False
+        # INSERTs no banco todo (filtro barato) e em notifications (sinal).
+        self.inserted: int | None = None
+        self.notifications_inserted: int | None = None
+        self.confirm_pending = False
+        self.confirmed_at = float("-inf")
+        self.claim_columns_ready = False
+        # Status de entregas ja feitas cuja gravacao falhou; gravados antes
+        # de reservar de novo, para nao reenviar o que ja saiu.
+        self.unsaved_statuses: dict = {}
+        self.in_flight = asyncio.Semaphore(PUSH_TENANT_MAX_IN_FLIGHT)
+        self.batcher = PushBatcher(self)
+
+    @property
+    def draining(self) -> bool:
+        return self.drain_task is not None and not self.drain_task.done()
+
+    async def get_pool(self) -> asyncpg.Pool:
+        if self.pool is None:
+            self.pool = await asyncpg.create_pool(
+                self.dsn,
+                min_size=0,
+                max_size=PUSH_TENANT_POOL_SIZE,
+                max_inactive_connection_lifetime=PUSH_POOL_IDLE_SECONDS,
+            )
+        self.pool_used_at = asyncio.get_running_loop().time()
+        return self.pool
+
+    async def close_pool(self) -> None:
+        pool, self.pool = self.pool, None
+        if pool is not None:
+            try:
+                await pool.close()
+            except Exception:
+                pool.terminate()
+
+
+async def update_notification_statuses(
+    conn: asyncpg.Connection,
+    statuses: dict,
+) -> None:
+    if not statuses:
+        return
+    await conn.execute(
+        """
+        UPDATE notifications n
+        SET status = v.status, claimed_at = NULL, claimed_by = NULL
+        FROM unnest($1::uuid[], $2::text[]) AS v(id, status)
+        WHERE n.id = v.id
+          AND n.status = $3
+          AND n.claimed_by = $4
+        """,
+        list(statuses),
+        list(statuses.values()),
+        CLAIMED_STATUS,
+        WORKER_ID,
+    )
 
-async def poll_tenant(db_name: str):
-    project_name = db_name.removeprefix("_supabase_")
-    tenant_dsn = get_tenant_dsn(BASE_DSN, db_name)
-    
-    print(f"✅ Iniciando monitoramento HÍBRIDO para o projeto: {project_name}")
-    
-    wakeup_event = asyncio.Event()
 
-    def acordar_python(connection, pid, channel, payload):
-        wakeup_event.set()
+async def deliver_notification(tenant: TenantState, row, tokens: list[str]) -> str:
+    """Entrega para todos os dispositivos via lote; retorna o status final."""
+    project_name = tenant.project_name
+    results = await asyncio.gather(
+        *(tenant.batcher.send(token, row["body"]) for token in tokens)
+    )
+    success_count = sum(results)
+    if not success_count:
+        return "erro"
+    if success_count == len(tokens):
+        print(f"[{project_name}] Push enviado com sucesso para {success_count} dispositivo(s)!")
+    else:
+        print(
+            f"[{project_name}] Push enviado parcialmente "
+            f"({success_count}/{len(tokens)} dispositivo(s))."
+        )
+    return "enviado"
 
-    while True:
-        conn = None
-        try:
-            conn = await asyncpg.connect(tenant_dsn)
-            await conn.add_listener('new_push', acordar_python)
 
+async def drain_tenant(tenant: TenantState) -> int:
+    """Processa pendencias do tenant ate a fila esvaziar; retorna o total.
+
+    Nenhuma conexao fica presa durante o lote e a chamada HTTP: reservar e
+    gravar os status sao duas escritas curtas em autocommit.
+    """
+    try:
+        return await _drain_claims(tenant)
+    except asyncio.CancelledError:
+        await tenant.batcher.cancel()
+        raise
+
+
+async def _save_statuses(pool: asyncpg.Pool, tenant: TenantState) -> None:
+    if not tenant.unsaved_statuses:
+        return
+    async with pool.acquire() as conn:
+        await update_notification_statuses(conn, tenant.unsaved_statuses)
+    tenant.unsaved_statuses = {}
+
+
+async def _drain_claims(tenant: TenantState) -> int:
+    project_name = tenant.project_name
+    pool = await tenant.get_pool()
+    async with pool.acquire() as conn:
+        if not tenant.claim_columns_ready:
+            await ensure_claim_columns(conn)
+            tenant.claim_columns_ready = True
+        await reclaim_stalled_notifications(conn)
+    await _save_statuses(pool, tenant)
+    processed = 0
+    while True:
+        async with pool.acquire() as conn:
+            rows = await claim_pending_notifications(conn)
+            if not rows:
+                return processed
+            tokens_by_user = await get_push_tokens_by_user(
+                conn, {row["user_id"] for row in rows}
+            )
+
+        statuses = {}
+        deliveries = []
+        for row in rows:
+            tokens = tokens_by_user.get(row["user_id"])
+            if not tokens:
+                print(f"[{project_name}] ⚠️ Usuário {row['user_id']} sem token. Marcando como erro.")
+                statuses[row["id"]] = "sem_token"
+                continue
+            deliveries.append((row, tokens))
+
+        outcomes = await asyncio.gather(
+            *(deliver_notification(tenant, row, tokens) for row, tokens in deliveries)
+        )
+        for (row, _tokens), status in zip(deliveries, outcomes):
+            statuses[row["id"]] = status
+        tenant.unsaved_statuses.update(statuses)
+        await _save_statuses(pool, tenant)
+        processed += len(rows)
+
+
+class PushDispatcher:
+    """Distribui LISTEN, varredura e drenos entre os bancos de tenant."""
+
+    def __init__(self) -> None:
+        self.tenants: dict[str, TenantState] = {}
+        self.drain_slots = asyncio.Semaphore(PUSH_MAX_CONCURRENT_DRAINS)
+        self.confirm_slots = asyncio.Semaphore(PUSH_MAX_CONCURRENT_DRAINS)
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    @property
+    def listener_count(self) -> int:
+        return sum(1 for tenant in self.tenants.values() if tenant.listener is not None)
+
+    def sync_databases(self, current_dbs: set[str]) -> list[TenantState]:
+        """Registra bancos novos e devolve os que sumiram (para ``forget``)."""
+        removed = [
+            tenant
+            for db_name, tenant in self.tenants.items()
+            if db_name not in current_dbs
+        ]
+        for db_name in current_dbs - set(self.tenants):
+            project_name = db_name.removeprefix("_supabase_")
+            print(f"✅ Monitorando notificações do projeto: {project_name}")
+            self.tenants[db_name] = TenantState(db_name)
+        return removed
+
+    async def forget(self, tenant: TenantState) -> None:
+        print(f"[{tenant.project_name}] Banco removido da lista. Encerrando monitoramento.")
+        self.tenants.pop(tenant.db_name, None)
+        if tenant.draining and tenant.drain_task is not asyncio.current_task():
+            tenant.drain_task.cancel()
+            await asyncio.gather(tenant.drain_task, return_exceptions=True)
+        await self.detach(tenant)
+        await tenant.close_pool()
+
+    def request_drain(self, tenant: TenantState) -> None:
+        if tenant.db_name not in self.tenants:
+            return
+        if tenant.draining:
+            tenant.drain_requested = True
+            return
+        tenant.drain_task = asyncio.create_task(self._drain(tenant))
+
+    async def _drain(self, tenant: TenantState) -> None:
+        async with self.drain_slots:
             while True:
+                tenant.drain_requested = False
                 try:
-                    async with conn.transaction():
-                        rows = await get_pending_notifications(conn)
-                        
-                        for row in rows:
-                            token_rows = await get_user_push_tokens(conn, row["user_id"])
-
-                            if not token_rows:
-                                print(f"[{project_name}] ⚠️ Usuário {row['user_id']} sem token. Marcando como erro.")
-                                await conn.execute("UPDATE notifications SET status = 'sem_token' WHERE id = $1", row['id'])
-                                continue
-
-                            success_count = 0
-                            for token_row in token_rows:
-                                sucesso = await send_to_api(token_row["token"], row["body"], project_name)
-                                if sucesso:
-                                    success_count += 1
-
-                            if success_count > 0:
-                                await conn.execute("UPDATE notifications SET status = 'enviado' WHERE id = $1", row['id'])
-                                if success_count == len(token_rows):
-                                    print(f"[{project_name}] Push enviado com sucesso para {success_count} dispositivo(s)!")
-                                else:
-                                    print(
-                                        f"[{project_name}] Push enviado parcialmente "
-                                        f"({success_count}/{len(token_rows)} dispositivo(s))."
-                                    )
-                            else:
-                                await conn.execute("UPDATE notifications SET status = 'erro' WHERE id = $1", row['id'])
-                    
-                    if rows:
-                        wakeup_event.clear()
-                        continue
-                    
-                    wakeup_event.clear()
-                    try:
-                        await asyncio.wait_for(wakeup_event.wait(), timeout=300)
-                    except asyncio.TimeoutError:
-                        pass
-                        
+                    processed = await drain_tenant(tenant)
+                except asyncio.CancelledError:
+                    raise
                 except asyncpg.exceptions.UndefinedTableError:
-                    await close_connection(conn)
-                    conn = None
-                    await asyncio.sleep(3600)
+                    tenant.disabled_until = self._now() + MISSING_TABLE_RETRY_SECONDS
+                    await self.detach(tenant)
+                    await tenant.close_pool()
+                    return
+                except Exception as exc:
+                    if is_missing_database_error(exc):
+                        await self.forget(tenant)
+                        return
+                    print(f"[{tenant.project_name}] Erro ao drenar notificações: {exc}")
+                    # Sem contador conhecido, a proxima confirmacao volta a drenar.
+                    tenant.disabled_until = self._now() + DRAIN_RETRY_SECONDS
+                    tenant.notifications_inserted = None
+                    tenant.confirm_pending = True
+                    await tenant.close_pool()
+                    return
+                if processed:
+                    tenant.last_activity = self._now()
+                    await self.attach(tenant)
+                if not tenant.drain_requested:
                     break
-
-        except asyncio.CancelledError:
-            print(f"[{project_name}] Monitoramento encerrado.")
-            raise
-        except Exception as e:
-            if is_missing_database_error(e):
-                print(f"[{project_name}] Banco ausente. Encerrando monitoramento do worker.")
+        if tenant.listener is None:
+            # Tenant frio: nao segura conexao entre varreduras.
+            await tenant.close_pool()
+
+    async def attach(self, tenant: TenantState) -> None:
+        if tenant.listener is not None:
+            return
+        listeners = [t for t in self.tenants.values() if t.listener is not None]
+        if len(listeners) >= PUSH_MAX_LISTENERS:
+            coldest = min(listeners, key=lambda t: t.last_activity)
+            if coldest.last_activity >= tenant.last_activity:
                 return
-            print(f"[{project_name}] Erro de conexão, tentando reconectar... {e}")
-            await asyncio.sleep(5)
-        finally:
-            await close_connection(conn)
+            await self.detach(coldest)
+
+        def on_notify(_conn, _pid, _channel, _payload) -> None:
+            tenant.last_activity = self._now()
+            self.request_drain(tenant)
+
+        def on_terminated(_conn) -> None:
+            tenant.listener = None
 
-async def worker_manager():
-    active_tasks = {}
-    
-    while True:
         try:
-            conn = await asyncpg.connect(BASE_DSN)
-            
-            query = """
-                SELECT datname FROM pg_database 
-                WHERE datname LIKE '_supabase_%' 
-                AND datname NOT IN ('_supabase', '_supabase_template')
+            conn = await asyncpg.connect(tenant.dsn)
+            await conn.add_listener("new_push", on_notify)
+            conn.add_termination_listener(on_terminated)
+        except Exception as exc:
+            print(f"[{tenant.project_name}] LISTEN indisponível: {exc}")
+            return
+        tenant.listener = conn
+
+    async def detach(self, tenant: TenantState) -> None:
+        conn, tenant.listener = tenant.listener, None
+        await close_connection(conn)
+
+    def probe(self, inserted: dict[str, int]) -> list[TenantState]:
+        """Marca para confirmacao tenants sem LISTEN cujo banco recebeu INSERT.
+
+        ``pg_stat_database`` e do cluster inteiro, entao uma consulta cobre
+        todos os tenants, mas conta INSERTs de qualquer tabela: e so um
+        filtro. Quem acorda e decidido por ``confirm``.
+        """
+        now = self._now()
+        for db_name, count in inserted.items():
+            tenant = self.tenants.get(db_name)
+            # Em espera, o contador nao avanca: a mudanca vale quando voltar.
+            if tenant is None or tenant.disabled_until > now:
+                continue
+            previous, tenant.inserted = tenant.inserted, count
+            if previous != count and tenant.listener is None:
+                tenant.confirm_pending = True
+        return [tenant for tenant in self.tenants.values() if tenant.confirm_pending]
+
+    async def confirm(self, tenants: list[TenantState]) -> list[TenantState]:
+        """Acorda so quem teve INSERT em ``notifications`` desde a leitura anterior.
+
+        A primeira leitura de um tenant tambem drena, cobrindo o que foi
+        inserido antes dela.
+        """
+        now = self._now()
+        due = [
+            tenant
+            for tenant in tenants
+            if tenant.db_name in self.tenants
+            and tenant.listener is None
+            and not tenant.draining
+            and tenant.disabled_until <= now
+            and now - tenant.confirmed_at >= PUSH_CONFIRM_INTERVAL
+        ]
+        changed = await asyncio.gather(*(self._confirm(tenant) for tenant in due))
+        woken = [tenant for tenant, wake in zip(due, changed) if wake]
+        for tenant in woken:
+            self.request_drain(tenant)
+        return woken
+
+    async def _confirm(self, tenant: TenantState) -> bool:
+        tenant.confirmed_at = self._now()
+        async with self.confirm_slots:
+            try:
+                count = await read_notification_inserts(tenant.dsn)
+            except Exception as exc:
+                if is_missing_database_error(exc):
+                    await self.forget(tenant)
+                else:
+                    print(f"[{tenant.project_name}] Erro ao ler pg_stat_user_tables: {exc}")
+                return False
+        tenant.confirm_pending = False
+        if count is None:
+            tenant.disabled_until = self._now() + MISSING_TABLE_RETRY_SECONDS
+            return False
+        previous, tenant.notifications_inserted = tenant.notifications_inserted, count
+        return previous != count
+
+    async def sweep(self) -> None:
+        """Rede de seguranca: drena todos os tenants, com ou sem sinal."""
+        now = self._now()
+        for tenant in list(self.tenants.values()):
+            if tenant.disabled_until > now or tenant.draining:
+                continue
+            self.request_drain(tenant)
+
+    async def release_idle(self) -> None:
+        now = self._now()
+        for tenant in list(self.tenants.values()):
+            if tenant.draining:
+                continue
+            if (
+                tenant.listener is not None
+                and now - tenant.last_activity > PUSH_LISTENER_IDLE_SECONDS
+            ):
+                await self.detach(tenant)
+            if tenant.pool is not None and (
+                tenant.listener is None
+                or now - tenant.pool_used_at > PUSH_POOL_IDLE_SECONDS
+            ):
+                await tenant.close_pool()
+
+    async def shutdown(self) -> None:
+        for tenant in list(self.tenants.values()):
+            if tenant.draining:
+                tenant.drain_task.cancel()
+        await asyncio.gather(
+            *(t.drain_task for t in self.tenants.values() if t.drain_task),
+            return_exceptions=True,
+        )
+        for tenant in list(self.tenants.values()):
+            await self.detach(tenant)
+            await tenant.close_pool()
+
+
+async def list_tenant_databases() -> set[str]:
+    conn = await asyncpg.connect(BASE_DSN)
+    try:
+        databases = await conn.fetch(
+            """
+            SELECT datname FROM pg_database
+            WHERE datname LIKE '_supabase_%'
+            AND datname NOT IN ('_supabase', '_supabase_template')
+            """
+        )
+    finally:
+        await close_connection(conn)
+    return {record["datname"] for record in databases}
+
+
+async def read_insert_counters(conn: asyncpg.Connection) -> dict[str, int]:
+    """INSERTs acumulados por banco de tenant, numa unica leitura do cluster."""
+    rows = await conn.fetch(
+        """
+        SELECT datname, tup_inserted
+        FROM pg_stat_database
+        WHERE datname LIKE '_supabase_%'
+        AND datname NOT IN ('_supabase', '_supabase_template')
+        """
+    )
+    return {record["datname"]: int(record["tup_inserted"] or 0) for record in rows}
+
+
+async def read_notification_inserts(dsn: str) -> int | None:
+    """INSERTs acumulados em ``notifications``; ``None`` se a tabela nao existe."""
+    conn = await asyncpg.connect(dsn)
+    try:
+        count = await conn.fetchval(
+            """
+            SELECT n_tup_ins
+            FROM pg_stat_user_tables
+            WHERE schemaname = 'public'
+              AND relname = 'notifications'
             """
-            databases = await conn.fetch(query)
-            await conn.close()
-            
-            current_dbs = {record['datname'] for record in databases}
-
-            finished_dbs = [
-                db_name for db_name, task in active_tasks.items() if task.done()
-            ]
-            for db_name in finished_dbs:
-                task = active_tasks.pop(db_name)
+        )
+    finally:
+        await close_connection(conn)
+    return None if count is None else int(count)
+
+
+async def worker_manager():
+    dispatcher = PushDispatcher()
+    loop = asyncio.get_running_loop()
+    control: asyncpg.Connection | None = None
+    next_discovery = 0.0
+    # A primeira leitura do contador ja drena todos os tenants conhecidos.
+    next_sweep = loop.time() + PUSH_SWEEP_INTERVAL
+
+    try:
+        while True:
+            now = loop.time()
+            if now >= next_discovery:
+                next_discovery = now + DATABASE_DISCOVERY_INTERVAL
                 try:
-                    task.result()
-                except asyncio.CancelledError:
-                    pass
-                except Exception as exc:
-                    print(f"[{db_name}] Worker encerrado com erro: {exc}")
-
-            removed_dbs = set(active_tasks) - current_dbs
-            removed_tasks = []
-            for db_name in removed_dbs:
-                project_name = db_name.removeprefix("_supabase_")
-                print(f"[{project_name}] Banco removido da lista. Encerrando monitoramento.")
-                task = active_tasks.pop(db_name)
-                task.cancel()
-                removed_tasks.append(task)
-
-            if removed_tasks:
-                await asyncio.gather(*removed_tasks, return_exceptions=True)
-            
-            for db_name in current_dbs:
-                if db_name not in active_tasks:
-                    task = asyncio.create_task(poll_tenant(db_name))
-                    active_tasks[db_name] = task
-                    
-        except Exception as e:
-            print(f"Erro ao buscar lista de databases: {e}")
-            
-        await asyncio.sleep(60)
+                    current_dbs = await list_tenant_databases()
+                except Exception as e:
+                    print(f"Erro ao buscar lista de databases: {e}")
+                else:
+                    for tenant in dispatcher.sync_databases(current_dbs):
+                        await dispatcher.forget(tenant)
+            try:
+                if control is None or control.is_closed():
+                    control = await asyncpg.connect(BASE_DSN)
+                candidates = dispatcher.probe(await read_insert_counters(control))
+            except Exception as e:
+                print(f"Erro ao ler pg_stat_database: {e}")
+                await close_connection(control)
+                control = None
+            else:
+                await dispatcher.confirm(candidates)
+            if now >= next_sweep:
+                next_sweep = now + PUSH_SWEEP_INTERVAL
+                await dispatcher.sweep()
+            await dispatcher.release_idle()
+            await asyncio.sleep(PUSH_PROBE_INTERVAL)
+    finally:
+        await close_connection(control)
+        await dispatcher.shutdown()
+        await close_http_client()
 
 if __name__ == "__main__":
     asyncio.run(worker_manager())
@@ -0,0 +1,293 @@
+"""Retencao e arquivamento de ``jobs`` e ``host_agent_commands``.
+
+Linhas terminais mais antigas que a retencao da acao (ou do comando) saem das
+tabelas quentes em lotes e vao inteiras, como JSONB, para ``*_archive``. Fila,
+lease, ``wait_command`` e status passam a varrer so o que esta ativo ou e
+recente; o arquivo continua consultavel para auditoria. Chunks de logs em
+streaming que nenhum leitor consumiu tambem sao varridos aqui.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+
+import asyncpg
+
+from app.database import get_pool
+
+
+RETENTION_LOCK_NAME = "supabase-multitenant:retention:v1"
+MAX_BATCHES_PER_RUN = 50
+# Chunks de comando terminal que o leitor nao drenou (API caiu, cliente
+# sumiu) e chunks antigos de qualquer comando.
+LOG_CHUNK_GRACE_SECONDS = 300
+LOG_CHUNK_STALE_SECONDS = 3600
+
+_retention_task: asyncio.Task[None] | None = None
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """Dias de retencao: padrao e excecoes por acao/comando."""
+
+    default_days: int
+    overrides: Mapping[str, int] = field(default_factory=dict)
+
+    def arrays(self) -> tuple[list[str], list[int]]:
+        names = sorted(self.overrides)
+        return names, [self.overrides[name] for name in names]
+
+
+async def ensure_retention_schema(conn: asyncpg.Connection) -> None:
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs_archive (
+            job_id UUID PRIMARY KEY,
+            project TEXT NOT NULL,
+            project_uuid UUID,
+            action TEXT NOT NULL,
+            status TEXT NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL,
+            finished_at TIMESTAMPTZ,
+            archived_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            data JSONB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_archive_project_created
+            ON jobs_archive(project_uuid, created_at DESC);
+
+        CREATE TABLE IF NOT EXISTS host_agent_commands_archive (
+            id UUID PRIMARY KEY,
+            job_id UUID,
+            project TEXT NOT NULL,
+            project_uuid UUID,
+            command TEXT NOT NULL,
+            status TEXT NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL,
+            finished_at TIMESTAMPTZ,
+            archived_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            data JSONB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_host_agent_commands_archive_job
+            ON host_agent_commands_archive(job_id);
+
+        -- Varredura da retencao: so linhas terminais, da mais antiga.
+        CREATE INDEX IF NOT EXISTS idx_host_agent_commands_terminal_created
+            ON host_agent_commands(created_at)
+            WHERE status IN ('done', 'failed', 'cancelled');
+        """
+    )
+
+
+_ARCHIVE_COMMANDS = """
+WITH policy AS (
+    SELECT * FROM unnest($1::text[], $2::int[]) AS p(command, days)
+),
+expired AS (
+    SELECT c.id
+    FROM host_agent_commands c
+    LEFT JOIN policy p ON p.command = c.command
+    WHERE c.status IN ('done', 'failed', 'cancelled')
+      AND c.created_at < now() - make_interval(days => COALESCE(p.days, $3))
+      AND NOT EXISTS (
+          SELECT 1 FROM jobs j
+          WHERE j.job_id = c.job_id AND j.status IN ('queued', 'running')
+      )
+      -- Evidencia de tenant_uuid ainda necessaria para projetos legados.
+      AND NOT (
+          c.command IN ('create_project', 'duplicate_project')
+          AND EXISTS (
+              SELECT 1 FROM projects pr
+              WHERE pr.id = c.project_uuid AND pr.tenant_uuid IS NULL
+          )
+      )
+    ORDER BY c.created_at
+    LIMIT $4
+    FOR UPDATE OF c SKIP LOCKED
+),
+moved AS (
+    DELETE FROM host_agent_commands c
+    USING expired e
+    WHERE c.id = e.id
+    RETURNING c.*
+)
+INSERT INTO host_agent_commands_archive(
+    id, job_id, project, project_uuid, command, status,
+    created_at, finished_at, data
+)
+SELECT id, job_id, project, project_uuid, command, status,
+       created_at, finished_at, to_jsonb(moved)
+FROM moved
+ON CONFLICT (id) DO NOTHING
+"""
+
+_ARCHIVE_JOBS = """
+WITH policy AS (
+    SELECT * FROM unnest($1::text[], $2::int[]) AS p(action, days)
+),
+expired AS (
+    SELECT j.job_id
+    FROM jobs j
+    LEFT JOIN policy p ON p.action = j.action
+    WHERE j.status IN ('done', 'failed', 'cancelled')
+      AND j.updated_at < now() - make_interval(days => COALESCE(p.days, $3))
+      AND NOT EXISTS (
+          SELECT 1 FROM jobs r
+          WHERE r.retry_of = j.job_id AND r.status IN ('queued', 'running')
+      )
+      -- Comando ainda quente (retencao maior que a do job) guarda o job_id.
+      AND NOT EXISTS (
+          SELECT 1 FROM host_agent_commands c WHERE c.job_id = j.job_id
+      )
+    ORDER BY j.updated_at
+    LIMIT $4
+    FOR UPDATE OF j SKIP LOCKED
+),
+moved AS (
+    DELETE FROM jobs j
+    USING expired e
+    WHERE j.job_id = e.job_id
+    RETURNING j.*
+)
+INSERT INTO jobs_archive(
+    job_id, project, project_uuid, action, status,
+    created_at, finished_at, data
+)
+SELECT job_id, project, project_uuid, action, status,
+       created_at, finished_at, to_jsonb(moved)
+FROM moved
+ON CONFLICT (job_id) DO NOTHING
+"""
+
+
+_SWEEP_LOG_CHUNKS = """
+DELETE FROM host_agent_log_chunks l
+USING host_agent_commands c
+WHERE c.id = l.command_id
+  AND (
+      (
+          c.status IN ('done', 'failed', 'cancelled')
+          AND COALESCE(c.finished_at, c.updated_at)
+              < now() - make_interval(secs => $1)
+      )
+      OR l.created_at < now() - make_interval(secs => $2)
+  )
+"""
+
+
+def _affected(status: str) -> int:
+    try:
+        return int(status.rsplit(" ", 1)[-1])
+    except ValueError:
+        return 0
+
+
+async def archive_expired_rows(
+    pool: asyncpg.Pool,
+    *,
+    jobs_policy: RetentionPolicy,
+    commands_policy: RetentionPolicy,
+    batch_size: int,
+) -> dict[str, int]:
+    """Move lotes expirados para o arquivo; uma replica por vez.
+
+    Comandos vao antes dos jobs para que o arquivo preserve ``job_id``. Cada
+    lote e uma transacao curta, entao a fila nao espera o expurgo inteiro.
+    """
+    moved = {"host_agent_commands": 0, "jobs": 0}
+    steps = (
+        ("host_agent_commands", _ARCHIVE_COMMANDS, commands_policy),
+        ("jobs", _ARCHIVE_JOBS, jobs_policy),
+    )
+    async with pool.acquire() as conn:
+        for table, query, policy in steps:
+            names, days = policy.arrays()
+            for _ in range(MAX_BATCHES_PER_RUN):
+                async with conn.transaction():
+                    owns_run = await conn.fetchval(
+                        "SELECT pg_try_advisory_xact_lock(hashtextextended($1, 0))",
+                        RETENTION_LOCK_NAME,
+                    )
+                    if not owns_run:
+                        return moved
+                    status = await conn.execute(
+                        query, names, days, policy.default_days, batch_size
+                    )
+                count = _affected(status)
+                moved[table] += count
+                if count < batch_size:
+                    break
+    return moved
+
+
+async def sweep_log_chunks(pool: asyncpg.Pool) -> int:
+    """Apaga chunks orfaos; o leitor do stream so apaga o que consome."""
+    status = await pool.execute(
+        _SWEEP_LOG_CHUNKS, LOG_CHUNK_GRACE_SECONDS, LOG_CHUNK_STALE_SECONDS
+    )
+    return _affected(status)
+
+
+async def _retention_loop(
+    *,
+    jobs_policy: RetentionPolicy,
+    commands_policy: RetentionPolicy,
+    batch_size: int,
+    interval_seconds: int,
+) -> None:
+    while True:
+        try:
+            pool = await get_pool()
+            moved = await archive_expired_rows(
+                pool,
+                jobs_policy=jobs_policy,
+                commands_policy=commands_policy,
+                batch_size=batch_size,
+            )
+            if any(moved.values()):
+                print(
+                    "[retention] arquivados: "
+                    f"jobs={moved['jobs']}, comandos={moved['host_agent_commands']}"
+                )
+            swept = await sweep_log_chunks(pool)
+            if swept:
+                print(f"[retention] chunks de log orfaos apagados: {swept}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            print(f"[retention] arquivamento falhou: {exc}")
+        await asyncio.sleep(interval_seconds)
+
+
+def start_retention(
+    *,
+    jobs_policy: RetentionPolicy,
+    commands_policy: RetentionPolicy,
+    batch_size: int,
+    interval_seconds: int,
+) -> None:
+    global _retention_task
+    if _retention_task is not None:
+        raise RuntimeError("retention loop already started")
+    _retention_task = asyncio.create_task(
+        _retention_loop(
+            jobs_policy=jobs_policy,
+            commands_policy=commands_policy,
+            batch_size=batch_size,
+            interval_seconds=interval_seconds,
+        ),
+        name="retention",
+    )
+
+
+async def stop_retention() -> None:
+    global _retention_task
+    if _retention_task is None:
+        return
+    _retention_task.cancel()
+    try:
+        await _retention_task
+    except asyncio.CancelledError:
+        pass
+    _retention_task = None
@@ -1,8 +1,10 @@
 """Notas, hints, threads, tags e notificações de colaboração."""
 
+import hashlib
+import json
 import re
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 
 from app.control_plane_service import audit_studio_action, create_studio_notification
 from app.database import get_pool
@@ -12,6 +14,7 @@ from app.dependencies import (
     get_project_role,
     get_project_row,
     resolve_authenticated_user,
+    resolve_project_access,
 )
 from app.schemas import (
     ProjectHintCreate,
@@ -27,48 +30,122 @@ from app.validation import parse_uuid_value, validate_project_id
 router = APIRouter(tags=["collaboration"])
 
 
-@router.get("/api/projects/{project_name}/collaboration")
-async def get_project_collaboration(
-    project_name: str,
-    request: Request,
-    pool=Depends(get_pool),
-):
-    project_name = validate_project_id(project_name)
-    auth_user = await resolve_authenticated_user(request, pool)
-
-    async with pool.acquire() as conn:
-        project = await get_project_row(conn, project_name)
-        project_id = project["id"]
-        await ensure_project_member_access(
-            conn,
-            project_id=project_id,
-            auth_user=auth_user,
-        )
-        project_role = await get_project_role(
-            conn,
-            project_id=project_id,
-            auth_user=auth_user,
+_PANEL_SECTIONS_WITH_DELETES = ("notes", "hints", "thread_messages", "notifications")
+
+_COLLABORATION_STATE_SQL = """
+SELECT
+    COALESCE(
+        (
+            SELECT version
+            FROM studio_project_collaboration_versions
+            WHERE project_id = $1
+        ),
+        0
+    ) AS version,
+    (SELECT last_value FROM studio_project_tags_version_seq) AS tags_version
+"""
+
+# Painel inteiro em um round trip: cada secao vira um json_agg. Com ``since``
+# valido (cursor ainda coberto pelo historico de mudancas), so os itens
+# alterados depois do cursor voltam; senao o payload e completo. Itens
+# alterados que o usuario deixou de ver (nota que virou privada) voltam em
+# ``deleted``; mudanca na propria linha de ``project_members`` (papel) forca o
+# payload completo, porque ``can_delete``/``can_update`` dependem dela.
+_COLLABORATION_PANEL_SQL = """
+WITH state AS (
+    SELECT
+        COALESCE(v.version, 0) AS version,
+        (SELECT last_value FROM studio_project_tags_version_seq) AS tags_version,
+        (
+            SELECT min(c.version)
+            FROM studio_project_collaboration_changes c
+            WHERE c.project_id = $1
+        ) AS oldest_change,
+        ARRAY(
+            SELECT DISTINCT c.section
+            FROM studio_project_collaboration_changes c
+            WHERE c.project_id = $1
+              AND c.version > $3::bigint
+        ) AS changed_sections,
+        EXISTS (
+            SELECT 1
+            FROM studio_project_collaboration_changes c
+            WHERE c.project_id = $1
+              AND c.version > $3::bigint
+              AND c.section = 'members'
+              AND c.item_id = $2::uuid::text
+        ) AS own_member_changed
+    FROM (SELECT 1) one
+    LEFT JOIN studio_project_collaboration_versions v ON v.project_id = $1
+),
+mode AS (
+    SELECT
+        state.*,
+        COALESCE(
+            $3::bigint <= state.version
+            AND ($3::bigint = state.version OR $3::bigint >= state.oldest_change - 1)
+            AND NOT 'panel' = ANY(state.changed_sections)
+            AND NOT state.own_member_changed,
+            false
+        ) AS is_delta
+    FROM state
+),
+changed AS (
+    SELECT DISTINCT ON (c.section, c.item_id)
+        c.section,
+        c.item_id,
+        c.deleted
+    FROM studio_project_collaboration_changes c
+    JOIN mode ON mode.is_delta
+    WHERE c.project_id = $1
+      AND c.version > $3::bigint
+    ORDER BY c.section, c.item_id, c.version DESC
+)
+SELECT json_build_object(
+    'version', mode.version,
+    'tags_version', mode.tags_version,
+    'delta', mode.is_delta,
+    'available_tags', CASE
+        WHEN NOT mode.is_delta
+          OR $4::bigint IS DISTINCT FROM mode.tags_version
+          OR 'tags' = ANY(mode.changed_sections)
+        THEN (
+            SELECT COALESCE(json_agg(tag ORDER BY tag.is_system DESC, tag.category, tag.name), '[]')
+            FROM (
+                SELECT
+                    t.id,
+                    t.name,
+                    t.color,
+                    t.category,
+                    t.is_system,
+                    a.created_at IS NOT NULL AS assigned
+                FROM studio_project_tags t
+                LEFT JOIN studio_project_tag_assignments a
+                  ON a.tag_id = t.id
+                 AND a.project_id = $1
+            ) tag
         )
-
-        tag_rows = await conn.fetch(
-            """
-            SELECT
-                t.id,
-                t.name,
-                t.color,
-                t.category,
-                t.is_system,
-                a.created_at AS assigned_at
-            FROM studio_project_tags t
-            LEFT JOIN studio_project_tag_assignments a
-              ON a.tag_id = t.id
-             AND a.project_id = $1
-            ORDER BY t.is_system DESC, t.category, t.name
-            """,
-            project_id,
+    END,
+    'members', CASE
+        WHEN NOT mode.is_delta OR 'members' = ANY(mode.changed_sections)
+        THEN (
+            SELECT COALESCE(json_agg(member ORDER BY member.role = 'admin' DESC, member.display_name), '[]')
+            FROM (
+                SELECT
+                    u.id,
+                    COALESCE(u.display_name, u.authelia_username, 'Operador') AS display_name,
+                    u.authelia_username AS username,
+                    pm.role
+                FROM project_members pm
+                JOIN users u ON u.id = pm.user_id
+                WHERE pm.project_id = $1
+                  AND u.is_active = true
+            ) member
         )
-        notes = await conn.fetch(
-            """
+    END,
+    'notes', (
+        SELECT COALESCE(json_agg(note ORDER BY note.created_at DESC), '[]')
+        FROM (
             SELECT
                 n.id,
                 n.visibility,
@@ -85,29 +162,17 @@ async def get_project_collaboration(
                   n.visibility = 'public'
                   OR n.author_user_id = $2
               )
+              AND (
+                  NOT mode.is_delta
+                  OR n.id::text IN (SELECT item_id FROM changed WHERE section = 'notes')
+              )
             ORDER BY n.created_at DESC
             LIMIT 20
-            """,
-            project_id,
-            auth_user["db_user_id"],
-        )
-        member_rows = await conn.fetch(
-            """
-            SELECT
-                u.id,
-                COALESCE(u.display_name, u.authelia_username, 'Operador') AS display_name,
-                u.authelia_username,
-                pm.role
-            FROM project_members pm
-            JOIN users u ON u.id = pm.user_id
-            WHERE pm.project_id = $1
-              AND u.is_active = true
-            ORDER BY pm.role = 'admin' DESC, display_name
-            """,
-            project_id,
-        )
-        hints = await conn.fetch(
-            """
+        ) note
+    ),
+    'hints', (
+        SELECT COALESCE(json_agg(hint ORDER BY hint.status = 'open' DESC, hint.created_at DESC), '[]')
+        FROM (
             SELECT
                 h.id,
                 h.body,
@@ -125,144 +190,196 @@ async def get_project_collaboration(
             LEFT JOIN users target ON target.id = h.target_user_id
             LEFT JOIN users resolver ON resolver.id = h.resolved_by
             WHERE h.project_id = $1
+              AND (
+                  NOT mode.is_delta
+                  OR h.id::text IN (SELECT item_id FROM changed WHERE section = 'hints')
+              )
             ORDER BY h.status = 'open' DESC, h.created_at DESC
             LIMIT 40
-            """,
-            project_id,
-        )
-        thread_messages = await conn.fetch(
-            """
-            SELECT *
-            FROM (
-                SELECT
-                    m.id,
-                    m.body,
-                    m.created_at,
-                    m.updated_at,
-                    m.author_user_id,
-                    COALESCE(u.display_name, u.authelia_username, 'Operador') AS author_name
-                FROM studio_project_thread_messages m
-                LEFT JOIN users u ON u.id = m.author_user_id
-                WHERE m.project_id = $1
-                ORDER BY m.created_at DESC
-                LIMIT 50
-            ) recent
-            ORDER BY created_at ASC
-            """,
-            project_id,
-        )
-        notification_rows = await conn.fetch(
-            """
+        ) hint
+    ),
+    'thread_messages', (
+        SELECT COALESCE(json_agg(message ORDER BY message.created_at ASC), '[]')
+        FROM (
+            SELECT
+                m.id,
+                m.body,
+                m.created_at,
+                m.updated_at,
+                m.author_user_id,
+                COALESCE(u.display_name, u.authelia_username, 'Operador') AS author_name
+            FROM studio_project_thread_messages m
+            LEFT JOIN users u ON u.id = m.author_user_id
+            WHERE m.project_id = $1
+              AND (
+                  NOT mode.is_delta
+                  OR m.id::text IN (SELECT item_id FROM changed WHERE section = 'thread_messages')
+              )
+            ORDER BY m.created_at DESC
+            LIMIT 50
+        ) message
+    ),
+    'notifications', (
+        SELECT COALESCE(json_agg(notification ORDER BY notification.created_at DESC), '[]')
+        FROM (
             SELECT
                 n.id,
                 n.kind,
                 n.target_type,
                 n.target_id,
                 n.payload,
+                COALESCE(u.display_name, u.authelia_username, 'Sistema') AS actor_name,
                 n.read_at,
-                n.created_at,
-                COALESCE(u.display_name, u.authelia_username, 'Sistema') AS actor_name
+                n.created_at
             FROM studio_project_notifications n
             LEFT JOIN users u ON u.id = n.actor_user_id
             WHERE n.project_id = $1
               AND n.target_user_id = $2
+              AND (
+                  NOT mode.is_delta
+                  OR n.id::text IN (SELECT item_id FROM changed WHERE section = 'notifications')
+              )
             ORDER BY n.created_at DESC
             LIMIT 50
-            """,
-            project_id,
-            auth_user["db_user_id"],
+        ) notification
+    ),
+    'deleted', (
+        SELECT COALESCE(json_agg(json_build_object('section', section, 'id', item_id)), '[]')
+        FROM changed
+        WHERE section = ANY($5::text[])
+          AND (
+              deleted
+              OR (
+                  section = 'notes'
+                  AND NOT EXISTS (
+                      SELECT 1
+                      FROM studio_project_notes n
+                      WHERE n.id::text = changed.item_id
+                        AND n.project_id = $1
+                        AND (
+                            n.visibility = 'public'
+                            OR n.author_user_id = $2
+                        )
+                  )
+              )
+          )
+    )
+)::text
+FROM mode
+"""
+
+
+def _parse_collaboration_cursor(since: str | None) -> tuple[int | None, int | None]:
+    if since is None:
+        return None, None
+    version, sep, tags_version = since.partition(":")
+    if not sep or not version.isdigit() or not tags_version.isdigit():
+        raise HTTPException(422, "since deve ser o cursor devolvido pelo painel")
+    return int(version), int(tags_version)
+
+
+def _collaboration_etag(
+    project_id,
+    version: int,
+    tags_version: int,
+    auth_user: dict,
+    project_role: str | None,
+    since: str | None,
+) -> str:
+    # O payload depende do usuario (notas privadas, notificacoes, permissoes).
+    digest = hashlib.sha256(
+        "|".join(
+            (
+                str(project_id),
+                str(version),
+                str(tags_version),
+                str(auth_user["db_user_id"]),
+                str(project_role),
+                str(bool(auth_user["is_global_admin"])),
+                since or "",
+            )
+        ).encode()
+    ).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {item.strip().removeprefix("W/") for item in if_none_match.split(",")}
+    return etag in candidates
+
+
+@router.get("/api/projects/{project_name}/collaboration")
+async def get_project_collaboration(
+    project_name: str,
+    request: Request,
+    response: Response,
+    since: str | None = Query(default=None, max_length=64),
+    pool=Depends(get_pool),
+):
+    project_name = validate_project_id(project_name)
+    since_version, since_tags_version = _parse_collaboration_cursor(since)
+    auth_user = await resolve_authenticated_user(request, pool)
+
+    async with pool.acquire() as conn:
+        access = await resolve_project_access(conn, project_name, auth_user)
+        access.require_member()
+        project_id = access.project["id"]
+        project_role = access.role
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            state = await conn.fetchrow(_COLLABORATION_STATE_SQL, project_id)
+            etag = _collaboration_etag(
+                project_id, state["version"], state["tags_version"], auth_user, project_role, since
+            )
+            if _etag_matches(if_none_match, etag):
+                return Response(
+                    status_code=304,
+                    headers={"ETag": etag, "Cache-Control": "private, no-cache"},
+                )
+
+        panel = json.loads(
+            await conn.fetchval(
+                _COLLABORATION_PANEL_SQL,
+                project_id,
+                auth_user["db_user_id"],
+                since_version,
+                since_tags_version,
+                list(_PANEL_SECTIONS_WITH_DELETES),
+            )
         )
 
-    available_tags = [
-        {
-            "id": str(row["id"]),
-            "name": row["name"],
-            "color": row["color"],
-            "category": row["category"],
-            "is_system": row["is_system"],
-            "assigned": row["assigned_at"] is not None,
-        }
-        for row in tag_rows
-    ]
+    response.headers["ETag"] = _collaboration_etag(
+        project_id, panel["version"], panel["tags_version"], auth_user, project_role, since
+    )
+    response.headers["Cache-Control"] = "private, no-cache"
+
+    user_id = str(auth_user["db_user_id"])
+    is_manager = auth_user["is_global_admin"] or project_role == "admin"
+    for note in panel["notes"]:
+        note["can_delete"] = is_manager or note["author_user_id"] == user_id
+    for hint in panel["hints"]:
+        hint["can_update"] = is_manager or user_id in (
+            hint["author_user_id"],
+            hint["target_user_id"],
+        )
 
-    return {
+    result = {
         "project": project_name,
-        "available_tags": available_tags,
-        "assigned_tags": [tag for tag in available_tags if tag["assigned"]],
-        "members": [
-            {
-                "id": str(row["id"]),
-                "display_name": row["display_name"],
-                "username": row["authelia_username"],
-                "role": row["role"],
-            }
-            for row in member_rows
-        ],
-        "notes": [
-            {
-                "id": str(row["id"]),
-                "visibility": row["visibility"],
-                "body": row["body"],
-                "is_encrypted": row["is_encrypted"],
-                "created_at": row["created_at"].isoformat(),
-                "updated_at": row["updated_at"].isoformat(),
-                "author_user_id": str(row["author_user_id"]) if row["author_user_id"] else None,
-                "author_name": row["author_name"],
-                "can_delete": (
-                    auth_user["is_global_admin"]
-                    or row["author_user_id"] == auth_user["db_user_id"]
-                    or project_role == "admin"
-                ),
-            }
-            for row in notes
-        ],
-        "hints": [
-            {
-                "id": str(row["id"]),
-                "body": row["body"],
-                "status": row["status"],
-                "created_at": row["created_at"].isoformat(),
-                "updated_at": row["updated_at"].isoformat(),
-                "resolved_at": row["resolved_at"].isoformat() if row["resolved_at"] else None,
-                "author_user_id": str(row["author_user_id"]) if row["author_user_id"] else None,
-                "author_name": row["author_name"],
-                "target_user_id": str(row["target_user_id"]) if row["target_user_id"] else None,
-                "target_name": row["target_name"],
-                "resolved_by_name": row["resolved_by_name"],
-                "can_update": (
-                    auth_user["is_global_admin"]
-                    or project_role == "admin"
-                    or row["author_user_id"] == auth_user["db_user_id"]
-                    or row["target_user_id"] == auth_user["db_user_id"]
-                ),
-            }
-            for row in hints
-        ],
-        "thread_messages": [
-            {
-                "id": str(row["id"]),
-                "body": row["body"],
-                "created_at": row["created_at"].isoformat(),
-                "updated_at": row["updated_at"].isoformat(),
-                "author_user_id": str(row["author_user_id"]) if row["author_user_id"] else None,
-                "author_name": row["author_name"],
-            }
-            for row in thread_messages
-        ],
-        "notifications": [
-            {
-                "id": str(row["id"]),
-                "kind": row["kind"],
-                "target_type": row["target_type"],
-                "target_id": row["target_id"],
-                "payload": row["payload"],
-                "actor_name": row["actor_name"],
-                "read_at": row["read_at"].isoformat() if row["read_at"] else None,
-                "created_at": row["created_at"].isoformat(),
-            }
-            for row in notification_rows
-        ],
+        "cursor": f"{panel['version']}:{panel['tags_version']}",
+        "delta": panel["delta"],
     }
+    # Em modo delta, tags e membros so vem quando mudaram (sempre completos).
+    if panel["available_tags"] is not None:
+        result["available_tags"] = panel["available_tags"]
+        result["assigned_tags"] = [tag for tag in panel["available_tags"] if tag["assigned"]]
+    if panel["members"] is not None:
+        result["members"] = panel["members"]
+    for section in ("notes", "hints", "thread_messages", "notifications", "deleted"):
+        result[section] = panel[section]
+    return result
 
 
 @router.post("/api/projects/{project_name}/notes", status_code=201)
@@ -4,14 +4,13 @@ import hmac
 
 import httpx
 from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import JSONResponse
 
 from app.control_plane_service import sync_user_record
-from app.database import get_pool
+from app.database import get_pool, pool_metrics
 from app.dependencies import (
-    ensure_project_member_access,
-    get_project_role,
     resolve_authenticated_user,
+    resolve_project_access,
 )
 from app.project_settings import get_project_file_size_limit
 from app.project_secret_service import decrypt_project_secret
@@ -21,6 +20,13 @@ from app.runtime_config import (
     service_key_transport_fernet,
 )
 from app.schemas import UserSyncPayload
+from app.upstream_http import (
+    ANALYTICS_UPSTREAM,
+    get_upstream_client,
+    open_upstream_stream,
+    stream_upstream_response,
+)
+from app.user_activity import invalidate_user_cache
 from app.validation import validate_project_id
 
 
@@ -59,26 +65,33 @@ async def proxy_global_analytics(
         upstream_headers["content-type"] = content_type
 
     try:
-        async with httpx.AsyncClient(
-            timeout=httpx.Timeout(60.0, connect=5.0)
-        ) as client:
-            upstream = await client.request(
-                request.method,
-                f"{ANALYTICS_INTERNAL_URL}/{analytics_path}",
-                params=list(request.query_params.multi_items()),
-                headers=upstream_headers,
-                content=await request.body(),
-            )
+        upstream = await open_upstream_stream(
+            get_upstream_client(ANALYTICS_UPSTREAM),
+            request,
+            f"{ANALYTICS_INTERNAL_URL}/{analytics_path}",
+            headers=upstream_headers,
+        )
     except httpx.HTTPError as exc:
         raise HTTPException(502, "Analytics service unavailable") from exc
 
-    response_headers = {"Cache-Control": "no-store"}
-    if upstream.headers.get("content-type"):
-        response_headers["Content-Type"] = upstream.headers["content-type"]
-    return Response(
-        content=upstream.content,
-        status_code=upstream.status_code,
-        headers=response_headers,
+    return stream_upstream_response(
+        upstream,
+        extra_headers={"Cache-Control": "no-store"},
+    )
+
+
+@router.get("/api/projects/internal/db-pool-metrics")
+async def db_pool_metrics(
+    request: Request,
+    pool=Depends(get_pool),
+):
+    """Espera de acquire, conexoes em uso e latencia por lane do pool."""
+    auth_user = await resolve_authenticated_user(request, pool)
+    if not auth_user["is_global_admin"]:
+        raise HTTPException(403, "Admin required")
+    return JSONResponse(
+        content={"lanes": pool_metrics()},
+        headers={"Cache-Control": "no-store"},
     )
 
 
@@ -98,6 +111,7 @@ async def sync_user_identity(
                 is_active=body.is_active,
                 source=body.source,
             )
+    invalidate_user_cache(body.id)
     return synced
 
 
@@ -165,31 +179,25 @@ async def get_studio_project_context(
 
     async with pool.acquire() as conn:
         async with conn.transaction():
+            access = await resolve_project_access(conn, ref, auth_user)
+            access.require_member()
+            role = access.role
+            if role is None and auth_user["is_global_admin"]:
+                role = "admin"
+
+            # anon_key e versao mudam na rotacao; nao passam pelo cache.
             project = await conn.fetchrow(
                 """
                 SELECT id, tenant_uuid, name, display_name,
                        anon_key, project_key_version
                 FROM projects
-                WHERE name = $1
+                WHERE id = $1
                 """,
-                ref,
+                access.project["id"],
             )
             if not project:
                 raise HTTPException(404, "Project not found")
 
-            await ensure_project_member_access(
-                conn,
-                project_id=project["id"],
-                auth_user=auth_user,
-            )
-            role = await get_project_role(
-                conn,
-                project_id=project["id"],
-                auth_user=auth_user,
-            )
-            if role is None and auth_user["is_global_admin"]:
-                role = "admin"
-
             if not project["anon_key"]:
                 raise HTTPException(409, "Project API key is not ready")
             anon_key = await decrypt_project_secret(
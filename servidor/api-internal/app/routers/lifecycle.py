@@ -1,23 +1,26 @@
 """Leitura de estado e logs do ciclo de vida dos projetos."""
 
+import json
+
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 
 from app.control_plane_service import audit_studio_action
 from app.database import get_pool
 from app.dependencies import (
-    ensure_project_admin_access,
-    ensure_project_member_access,
-    get_project_role,
-    get_project_row,
     resolve_authenticated_user,
+    resolve_project_access,
 )
 from app.host_agent import (
+    HostAgentError,
     HostAgentOffline,
     command_result,
     fetch_project_containers,
-    run_command as run_host_agent_command,
+    stream_command_logs,
+    submit_command as submit_host_agent_command,
     worker_alive as host_agent_alive,
 )
+from app.host_agent_protocol import CONTAINER_LOGS_LIMIT, LOG_TIMESTAMP_RE
 from app.validation import validate_project_id, validate_service_name
 
 
@@ -83,17 +86,9 @@ async def get_project_docker_status(
     auth_user = await resolve_authenticated_user(request, pool)
 
     async with pool.acquire() as conn:
-        project_row = await get_project_row(conn, project_name)
-        await ensure_project_member_access(
-            conn,
-            project_id=project_row["id"],
-            auth_user=auth_user,
-        )
-        project_role = await get_project_role(
-            conn,
-            project_id=project_row["id"],
-            auth_user=auth_user,
-        )
+        access = await resolve_project_access(conn, project_name, auth_user)
+        access.require_member()
+        project_role = access.role
 
     status_info = await get_project_status(project_name)
     if project_role != "admin" and not auth_user["is_global_admin"]:
@@ -116,29 +111,31 @@ async def get_container_logs(
 
     async with pool.acquire() as conn:
         auth_user = await resolve_authenticated_user(request, pool)
-        project_row = await get_project_row(conn, project_name)
-        await ensure_project_admin_access(
-            conn,
-            project_id=project_row["id"],
-            auth_user=auth_user,
-            message="Apenas admins podem consultar logs do projeto",
-        )
-        project_id = project_row["id"]
+        access = await resolve_project_access(conn, project_name, auth_user)
+        access.require_admin("Apenas admins podem consultar logs do projeto")
+        project_id = access.project["id"]
 
     container_name = f"supabase-{service}-{project_name}"
 
     try:
-        record = await run_host_agent_command(
+        # Mesmo caminho do stream, sem follow: o tail nao passa pelo JSONB.
+        command_id = await submit_host_agent_command(
             pool,
-            command="container_logs",
+            command="container_logs_stream",
             project=project_name,
             project_uuid=project_id,
             requested_by=auth_user["db_user_id"],
             args={"service": service, "lines": lines},
-            poll_interval=0.3,
         )
-        if record["status"] != "done":
-            if record["error_code"] == "container_not_found":
+        chunks: list[str] = []
+        record = None
+        async for kind, payload in stream_command_logs(pool, command_id, poll_interval=0.3):
+            if kind == "logs":
+                chunks.append(payload[0])
+            elif kind == "end":
+                record = payload
+        if record is None or record["status"] != "done":
+            if record is not None and record["error_code"] == "container_not_found":
                 raise HTTPException(404, f"Container {container_name} not found")
             raise HTTPException(500, "Error getting container logs")
 
@@ -157,8 +154,9 @@ async def get_container_logs(
 
         return {
             "container": result.get("container", container_name),
-            "logs": result.get("logs", ""),
+            "logs": "".join(chunks)[-CONTAINER_LOGS_LIMIT:],
             "status": result.get("status", "unknown"),
+            "cursor": result.get("cursor"),
         }
 
     except HTTPException:
@@ -168,3 +166,100 @@ async def get_container_logs(
     except Exception as exc:
         print(f"[project_logs] {project_name}/{service}: {exc}")
         raise HTTPException(500, "Error accessing container logs") from exc
+
+
+def _sse_event(event: str, data: str, event_id: str | None = None) -> str:
+    fields = [f"event: {event}"]
+    if event_id:
+        fields.append(f"id: {event_id}")
+    fields.extend(f"data: {line}" for line in (data.splitlines() or [""]))
+    return "\n".join(fields) + "\n\n"
+
+
+@router.get("/api/projects/{project_name}/logs/{service}/stream")
+async def stream_container_logs(
+    project_name: str,
+    service: str,
+    request: Request,
+    pool=Depends(get_pool),
+    lines: int = Query(100, ge=1, le=MAX_LOG_LINES),
+    since: str | None = Query(None, max_length=40),
+    follow: bool = Query(True),
+):
+    """Logs em Server-Sent Events; o ``id`` de cada evento e o cursor.
+
+    ``since`` (ou ``Last-Event-ID`` na reconexao) retoma depois da ultima
+    linha recebida, sem baixar o tail de novo.
+    """
+    project_name = validate_project_id(project_name)
+    service = validate_service_name(service)
+    since = since or request.headers.get("last-event-id") or None
+    if since is not None and not LOG_TIMESTAMP_RE.fullmatch(since):
+        raise HTTPException(422, "since deve ser um timestamp RFC3339 devolvido pelo stream")
+
+    auth_user = await resolve_authenticated_user(request, pool)
+    async with pool.acquire() as conn:
+        access = await resolve_project_access(conn, project_name, auth_user)
+        access.require_admin("Apenas admins podem consultar logs do projeto")
+        project_id = access.project["id"]
+
+    if not await host_agent_alive(pool):
+        raise HTTPException(503, str(HostAgentOffline()))
+
+    container_name = f"supabase-{service}-{project_name}"
+    args = {"service": service, "lines": lines, "follow": follow}
+    if since is not None:
+        args["since"] = since
+    command_id = await submit_host_agent_command(
+        pool,
+        command="container_logs_stream",
+        project=project_name,
+        project_uuid=project_id,
+        requested_by=auth_user["db_user_id"],
+        args=args,
+    )
+    async with pool.acquire() as conn:
+        await audit_studio_action(
+            conn,
+            project_id=project_id,
+            actor_user_id=auth_user["db_user_id"],
+            action="project_logs_read",
+            target_type="container_logs",
+            target_id=container_name,
+            new_value={"service": service, "lines": lines, "follow": follow, "since": since},
+        )
+
+    async def events():
+        try:
+            async for kind, payload in stream_command_logs(pool, command_id):
+                if kind == "logs":
+                    data, cursor = payload
+                    yield _sse_event("logs", data, cursor)
+                elif kind == "keepalive":
+                    yield ": keep-alive\n\n"
+                else:
+                    result = command_result(payload)
+                    yield _sse_event(
+                        "end",
+                        json.dumps(
+                            {
+                                "status": payload["status"],
+                                "error_code": payload["error_code"],
+                                "container": result.get("container", container_name),
+                                "container_status": result.get("status"),
+                                "cursor": result.get("cursor", since),
+                                "ended": result.get("ended"),
+                            }
+                        ),
+                    )
+        except HostAgentError as exc:
+            yield _sse_event(
+                "end",
+                json.dumps({"status": "failed", "error_code": exc.error_code, "cursor": since}),
+            )
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
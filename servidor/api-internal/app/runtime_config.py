@@ -28,6 +28,24 @@ def _read_bounded_integer(name: str, *, default: int, minimum: int) -> int:
         raise RuntimeError(f"{name} must be at least {minimum}")
     return value
 
+
+def _read_retention_overrides(name: str) -> dict[str, int]:
+    """Le ``nome=dias`` separados por virgula, ex.: ``backup=365,rotate_key=30``."""
+    overrides: dict[str, int] = {}
+    for item in os.getenv(name, "").split(","):
+        if not item.strip():
+            continue
+        key, separator, raw_days = item.partition("=")
+        key = key.strip()
+        try:
+            days = int(raw_days)
+        except ValueError as exc:
+            raise RuntimeError(f"{name} must use name=days pairs") from exc
+        if not separator or not key or days < 1:
+            raise RuntimeError(f"{name} must use name=days pairs with days >= 1")
+        overrides[key] = days
+    return overrides
+
 DB_DSN = os.getenv("DB_DSN")
 HOST_AGENT_HMAC_SECRET = os.getenv("HOST_AGENT_HMAC_SECRET")
 PROJECT_SECRETS_MASTER_KEY = os.getenv("PROJECT_SECRETS_MASTER_KEY")
@@ -60,6 +78,69 @@ AUTOMATIC_KEY_ROTATION_CHECK_INTERVAL_SECONDS = _read_bounded_integer(
 AUTOMATIC_KEY_ROTATION_MAX_CONCURRENT = _read_bounded_integer(
     "AUTOMATIC_KEY_ROTATION_MAX_CONCURRENT", default=3, minimum=1
 )
+AUTH_USER_CACHE_TTL_SECONDS = _read_bounded_integer(
+    "AUTH_USER_CACHE_TTL_SECONDS", default=5, minimum=0
+)
+PROJECT_ACCESS_CACHE_TTL_SECONDS = _read_bounded_integer(
+    "PROJECT_ACCESS_CACHE_TTL_SECONDS", default=5, minimum=0
+)
+USER_ACTIVITY_FLUSH_INTERVAL_SECONDS = _read_bounded_integer(
+    "USER_ACTIVITY_FLUSH_INTERVAL_SECONDS", default=30, minimum=1
+)
+DB_POOL_MIN_SIZE = _read_bounded_integer("DB_POOL_MIN_SIZE", default=1, minimum=0)
+DB_POOL_MAX_SIZE = _read_bounded_integer("DB_POOL_MAX_SIZE", default=10, minimum=1)
+DB_BACKGROUND_POOL_MIN_SIZE = _read_bounded_integer(
+    "DB_BACKGROUND_POOL_MIN_SIZE", default=1, minimum=0
+)
+DB_BACKGROUND_POOL_MAX_SIZE = _read_bounded_integer(
+    "DB_BACKGROUND_POOL_MAX_SIZE", default=5, minimum=1
+)
+if DB_POOL_MIN_SIZE > DB_POOL_MAX_SIZE:
+    raise RuntimeError("DB_POOL_MIN_SIZE must not exceed DB_POOL_MAX_SIZE")
+if DB_BACKGROUND_POOL_MIN_SIZE > DB_BACKGROUND_POOL_MAX_SIZE:
+    raise RuntimeError(
+        "DB_BACKGROUND_POOL_MIN_SIZE must not exceed DB_BACKGROUND_POOL_MAX_SIZE"
+    )
+TENANT_POOL_MAX_TENANTS = _read_bounded_integer(
+    "TENANT_POOL_MAX_TENANTS", default=64, minimum=1
+)
+TENANT_POOL_MAX_SIZE = _read_bounded_integer("TENANT_POOL_MAX_SIZE", default=2, minimum=1)
+TENANT_POOL_IDLE_SECONDS = _read_bounded_integer(
+    "TENANT_POOL_IDLE_SECONDS", default=300, minimum=1
+)
+JOB_QUEUE_MAX_CONCURRENT = _read_bounded_integer(
+    "JOB_QUEUE_MAX_CONCURRENT", default=8, minimum=1
+)
+JOB_QUEUE_LEASE_SECONDS = _read_bounded_integer(
+    "JOB_QUEUE_LEASE_SECONDS", default=60, minimum=15
+)
+JOB_QUEUE_POLL_INTERVAL_SECONDS = _read_bounded_integer(
+    "JOB_QUEUE_POLL_INTERVAL_SECONDS", default=2, minimum=1
+)
+JOB_QUEUE_ENQUEUE_GRACE_SECONDS = _read_bounded_integer(
+    "JOB_QUEUE_ENQUEUE_GRACE_SECONDS", default=900, minimum=60
+)
+JOB_RETENTION_DAYS = _read_bounded_integer("JOB_RETENTION_DAYS", default=90, minimum=1)
+JOB_RETENTION_DAYS_BY_ACTION = _read_retention_overrides("JOB_RETENTION_DAYS_BY_ACTION")
+HOST_AGENT_COMMAND_RETENTION_DAYS = _read_bounded_integer(
+    "HOST_AGENT_COMMAND_RETENTION_DAYS", default=14, minimum=1
+)
+HOST_AGENT_COMMAND_RETENTION_DAYS_BY_COMMAND = _read_retention_overrides(
+    "HOST_AGENT_COMMAND_RETENTION_DAYS_BY_COMMAND"
+)
+RETENTION_INTERVAL_SECONDS = _read_bounded_integer(
+    "RETENTION_INTERVAL_SECONDS", default=3600, minimum=60
+)
+TELEMETRY_ROLLUP_INTERVAL_SECONDS = _read_bounded_integer(
+    "TELEMETRY_ROLLUP_INTERVAL_SECONDS", default=300, minimum=60
+)
+RETENTION_BATCH_SIZE = _read_bounded_integer("RETENTION_BATCH_SIZE", default=500, minimum=1)
+PROJECT_DEK_CACHE_TTL_SECONDS = _read_bounded_integer(
+    "PROJECT_DEK_CACHE_TTL_SECONDS", default=300, minimum=0
+)
+PROJECT_DEK_CACHE_MAX_ENTRIES = _read_bounded_integer(
+    "PROJECT_DEK_CACHE_MAX_ENTRIES", default=1024, minimum=0
+)
 SUPAVISOR_INTERNAL_URL = os.getenv(
     "SUPAVISOR_INTERNAL_URL", "http://supabase-pooler:4000"
 ).rstrip("/")
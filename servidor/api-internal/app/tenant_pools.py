@@ -0,0 +1,126 @@
+"""Pools pequenos e preguicosos para os bancos ``_supabase_<ref>``.
+
+Telemetria e AI tools abriam um ``asyncpg.connect`` por request (handshake,
+autenticacao e um backend novo a cada chamada). Aqui cada tenant ganha um
+pool com ``min_size=0`` criado no primeiro uso; conexoes ociosas fecham
+sozinhas apos ``idle_seconds`` e o numero de pools abertos e limitado por
+LRU. Rename, delete e restore invalidam o pool do tenant.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+
+import asyncpg
+
+
+class _TenantPool:
+    __slots__ = ("pool", "in_use", "last_used")
+
+    def __init__(self, pool: asyncpg.Pool) -> None:
+        self.pool = pool
+        self.in_use = 0
+        self.last_used = time.monotonic()
+
+
+class TenantPoolManager:
+    def __init__(
+        self,
+        dsn_for: Callable[[str], str],
+        *,
+        max_tenants: int,
+        max_size: int,
+        idle_seconds: float,
+    ) -> None:
+        self.dsn_for = dsn_for
+        self.max_tenants = max_tenants
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self._entries: OrderedDict[str, _TenantPool] = OrderedDict()
+        self._lock = asyncio.Lock()
+        self._borrowed: dict[int, _TenantPool] = {}
+        self._closing: set[asyncio.Task[None]] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def acquire(self, project_ref: str) -> asyncpg.Connection:
+        """Conexao do tenant; devolva com ``release``."""
+        entry = await self._entry(project_ref)
+        entry.in_use += 1
+        try:
+            conn = await entry.pool.acquire()
+        except BaseException:
+            self._returned(entry)
+            raise
+        self._borrowed[id(conn)] = entry
+        return conn
+
+    async def release(self, conn: asyncpg.Connection) -> None:
+        # Devolve ao pool de origem, mesmo que ele ja tenha sido invalidado.
+        entry = self._borrowed.pop(id(conn))
+        try:
+            await entry.pool.release(conn)
+        finally:
+            self._returned(entry)
+
+    @staticmethod
+    def _returned(entry: _TenantPool) -> None:
+        entry.in_use -= 1
+        entry.last_used = time.monotonic()
+
+    async def _entry(self, project_ref: str) -> _TenantPool:
+        async with self._lock:
+            self._evict_idle()
+            entry = self._entries.get(project_ref)
+            if entry is not None:
+                self._entries.move_to_end(project_ref)
+                return entry
+            pool = await asyncpg.create_pool(
+                self.dsn_for(project_ref),
+                min_size=0,
+                max_size=self.max_size,
+                max_inactive_connection_lifetime=self.idle_seconds,
+            )
+            entry = _TenantPool(pool)
+            self._entries[project_ref] = entry
+            self._evict_over_capacity()
+            return entry
+
+    def _evict_idle(self) -> None:
+        deadline = time.monotonic() - self.idle_seconds
+        for project_ref, entry in list(self._entries.items()):
+            if entry.in_use == 0 and entry.last_used < deadline:
+                self._discard(project_ref)
+
+    def _evict_over_capacity(self) -> None:
+        # LRU primeiro; pools com conexoes emprestadas fecham ao devolver.
+        for project_ref in list(self._entries):
+            if len(self._entries) <= self.max_tenants:
+                return
+            self._discard(project_ref)
+
+    def _discard(self, project_ref: str) -> None:
+        entry = self._entries.pop(project_ref, None)
+        if entry is None:
+            return
+        task = asyncio.create_task(
+            entry.pool.close(), name=f"tenant-pool-close:{project_ref}"
+        )
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def invalidate(self, project_ref: str) -> None:
+        """Descarta o pool do tenant (rename, delete, restore)."""
+        async with self._lock:
+            self._discard(project_ref)
+
+    async def close(self) -> None:
+        async with self._lock:
+            for project_ref in list(self._entries):
+                self._discard(project_ref)
+        if self._closing:
+            await asyncio.gather(*list(self._closing), return_exceptions=True)
@@ -0,0 +1,110 @@
+"""Clientes HTTP compartilhados e proxy em streaming para upstreams internos.
+
+pg-meta e Analytics eram chamados com um ``httpx.AsyncClient`` novo por
+request, com o corpo da requisicao e da resposta inteiros em memoria. Aqui
+cada upstream tem um cliente com keep-alive pela vida da aplicacao (HTTP/2
+quando ``h2`` estiver instalado) e os corpos passam em chunks: o upstream so
+e lido quando o cliente consome a resposta.
+"""
+
+from __future__ import annotations
+
+import importlib.util
+from collections.abc import AsyncIterator, Iterable, Mapping
+
+import httpx
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+
+PG_META_UPSTREAM = "pg-meta"
+ANALYTICS_UPSTREAM = "analytics"
+
+UPSTREAM_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+UPSTREAM_LIMITS = httpx.Limits(
+    max_connections=64,
+    max_keepalive_connections=16,
+    keepalive_expiry=30.0,
+)
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+_BODYLESS_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+_clients: dict[str, httpx.AsyncClient] = {}
+
+
+def get_upstream_client(name: str) -> httpx.AsyncClient:
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=UPSTREAM_TIMEOUT,
+            limits=UPSTREAM_LIMITS,
+            http2=HTTP2_AVAILABLE,
+            follow_redirects=False,
+        )
+        _clients[name] = client
+    return client
+
+
+async def close_upstream_clients() -> None:
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def _request_body(request: Request, headers: dict[str, str]):
+    if request.method in _BODYLESS_METHODS and "content-length" not in request.headers:
+        return None
+    content_length = request.headers.get("content-length")
+    if content_length:
+        # Preserva o tamanho conhecido em vez de cair em chunked encoding.
+        headers["content-length"] = content_length
+    return request.stream()
+
+
+async def open_upstream_stream(
+    client: httpx.AsyncClient,
+    request: Request,
+    url: str,
+    *,
+    headers: Mapping[str, str],
+) -> httpx.Response:
+    """Envia a requisicao com o corpo em streaming; feche com ``aclose``."""
+    upstream_headers = dict(headers)
+    upstream_request = client.build_request(
+        request.method,
+        url,
+        params=list(request.query_params.multi_items()),
+        headers=upstream_headers,
+        content=_request_body(request, upstream_headers),
+    )
+    return await client.send(upstream_request, stream=True)
+
+
+async def _relay(upstream: httpx.Response) -> AsyncIterator[bytes]:
+    try:
+        async for chunk in upstream.aiter_bytes():
+            yield chunk
+    finally:
+        # Cliente desconectado no meio do corpo tambem devolve a conexao.
+        await upstream.aclose()
+
+
+def stream_upstream_response(
+    upstream: httpx.Response,
+    *,
+    forward_headers: Iterable[str] = ("content-type",),
+    extra_headers: Mapping[str, str] | None = None,
+) -> StreamingResponse:
+    response_headers = dict(extra_headers or {})
+    for name in forward_headers:
+        value = upstream.headers.get(name)
+        if value:
+            response_headers[name] = value
+    return StreamingResponse(
+        _relay(upstream),
+        status_code=upstream.status_code,
+        headers=response_headers,
+        background=BackgroundTask(upstream.aclose),
+    )
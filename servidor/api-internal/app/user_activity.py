@@ -0,0 +1,180 @@
+"""Cache curto do usuario autenticado e flush agrupado de last_seen/last_login.
+
+Cada request autenticada resolvia ``users``/``user_groups`` e gravava ate
+duas escritas em ``users``. Aqui o usuario resolvido fica em cache por poucos
+segundos (por processo) e a atividade observada e acumulada em memoria,
+gravada periodicamente em um unico ``UPDATE ... FROM unnest``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any
+
+import asyncpg
+
+from app.database import get_pool
+from app.runtime_config import (
+    AUTH_USER_CACHE_TTL_SECONDS,
+    USER_ACTIVITY_FLUSH_INTERVAL_SECONDS,
+)
+
+
+AUTH_USER_CACHE_MAX_ENTRIES = 4096
+
+_cache_lock = threading.Lock()
+_user_cache: OrderedDict[tuple[uuid.UUID, str], tuple[float, dict[str, Any]]] = (
+    OrderedDict()
+)
+_pending_seen: dict[uuid.UUID, dt.datetime] = {}
+_pending_logins: dict[uuid.UUID, tuple[str, dt.datetime]] = {}
+_flush_task: asyncio.Task[None] | None = None
+
+
+def get_cached_user(user_id: uuid.UUID, login_session: str) -> dict[str, Any] | None:
+    if AUTH_USER_CACHE_TTL_SECONDS <= 0:
+        return None
+    key = (user_id, login_session)
+    with _cache_lock:
+        cached = _user_cache.get(key)
+        if cached is None:
+            return None
+        expires_at, user = cached
+        if expires_at <= time.monotonic():
+            del _user_cache[key]
+            return None
+        _user_cache.move_to_end(key)
+        return dict(user, groups=list(user["groups"]))
+
+
+def cache_user(user_id: uuid.UUID, login_session: str, user: dict[str, Any]) -> None:
+    if AUTH_USER_CACHE_TTL_SECONDS <= 0:
+        return
+    key = (user_id, login_session)
+    with _cache_lock:
+        _user_cache[key] = (
+            time.monotonic() + AUTH_USER_CACHE_TTL_SECONDS,
+            dict(user, groups=list(user["groups"])),
+        )
+        _user_cache.move_to_end(key)
+        while len(_user_cache) > AUTH_USER_CACHE_MAX_ENTRIES:
+            _user_cache.popitem(last=False)
+
+
+def invalidate_user_cache(user_id: uuid.UUID | str) -> None:
+    """Descarta todas as sessoes em cache do usuario (sync, grupos, desativacao)."""
+    target = uuid.UUID(str(user_id))
+    with _cache_lock:
+        for key in [key for key in _user_cache if key[0] == target]:
+            del _user_cache[key]
+
+
+def record_user_activity(user_id: uuid.UUID, login_session: str) -> None:
+    """Registra o acesso em memoria; o flusher persiste em lote."""
+    now = dt.datetime.now(dt.timezone.utc)
+    _pending_seen[user_id] = now
+    if login_session:
+        pending = _pending_logins.get(user_id)
+        if pending is None or pending[0] != login_session:
+            _pending_logins[user_id] = (login_session, now)
+
+
+async def flush_user_activity(conn: asyncpg.Connection) -> int:
+    """Grava a atividade acumulada em um unico UPDATE; retorna usuarios tocados."""
+    if not _pending_seen and not _pending_logins:
+        return 0
+    seen = dict(_pending_seen)
+    logins = dict(_pending_logins)
+    _pending_seen.clear()
+    _pending_logins.clear()
+
+    user_ids = sorted(set(seen) | set(logins))
+    sessions = [logins[user_id][0] if user_id in logins else None for user_id in user_ids]
+    seen_times = [seen.get(user_id) or logins[user_id][1] for user_id in user_ids]
+    login_times = [logins[user_id][1] if user_id in logins else None for user_id in user_ids]
+    try:
+        await conn.execute(
+            """
+            UPDATE users u
+            SET last_seen_at = CASE
+                    WHEN u.last_seen_at IS NULL
+                      OR u.last_seen_at < v.seen_at - interval '5 minutes'
+                    THEN v.seen_at
+                    ELSE u.last_seen_at
+                END,
+                last_login_at = CASE
+                    WHEN v.session_hash IS NOT NULL
+                     AND u.last_login_session_hash IS DISTINCT FROM v.session_hash
+                    THEN v.login_at
+                    ELSE u.last_login_at
+                END,
+                last_login_session_hash = COALESCE(
+                    v.session_hash, u.last_login_session_hash
+                ),
+                updated_at = now()
+            FROM unnest($1::uuid[], $2::text[], $3::timestamptz[], $4::timestamptz[])
+                AS v(id, session_hash, seen_at, login_at)
+            WHERE u.id = v.id
+              AND (
+                  u.last_seen_at IS NULL
+                  OR u.last_seen_at < v.seen_at - interval '5 minutes'
+                  OR (
+                      v.session_hash IS NOT NULL
+                      AND u.last_login_session_hash IS DISTINCT FROM v.session_hash
+                  )
+              )
+            """,
+            user_ids,
+            sessions,
+            seen_times,
+            login_times,
+        )
+    except Exception:
+        # Devolve o lote sem sobrescrever atividade mais recente.
+        for user_id, seen_at in seen.items():
+            _pending_seen.setdefault(user_id, seen_at)
+        for user_id, login in logins.items():
+            _pending_logins.setdefault(user_id, login)
+        raise
+    return len(user_ids)
+
+
+async def _flush_loop() -> None:
+    while True:
+        await asyncio.sleep(USER_ACTIVITY_FLUSH_INTERVAL_SECONDS)
+        try:
+            pool = await get_pool()
+            async with pool.acquire() as conn:
+                await flush_user_activity(conn)
+        except Exception as exc:
+            print(f"[user_activity] flush falhou: {exc}")
+
+
+def start_user_activity_flusher() -> None:
+    global _flush_task
+    if _flush_task is not None:
+        raise RuntimeError("user activity flusher already started")
+    _flush_task = asyncio.create_task(_flush_loop(), name="user-activity-flush")
+
+
+async def stop_user_activity_flusher() -> None:
+    """Para o loop e faz o flush final antes de fechar o pool."""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        try:
+            await _flush_task
+        except asyncio.CancelledError:
+            pass
+        _flush_task = None
+    try:
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            await flush_user_activity(conn)
+    except Exception as exc:
+        print(f"[user_activity] flush final falhou: {exc}")
@@ -4,13 +4,15 @@ O agent nao expoe porta nenhuma: ele consome intencoes gravadas pela
 Projects API na tabela ``host_agent_commands`` (LISTEN/NOTIFY + poll),
 faz lease com ``FOR UPDATE SKIP LOCKED``, revalida assinatura HMAC,
 argumentos e autorizacao, executa o comando fechado e persiste progresso,
-tails sanitizados e resultado. Um heartbeat estende o lease enquanto o
+tails sanitizados e resultado. Cada mudanca de estado tambem e avisada a
+API por ``EVENTS_NOTIFY_CHANNEL``. Um heartbeat estende o lease enquanto o
 comando roda; o timeout mata o process group.
 """
 
 from __future__ import annotations
 
 import asyncio
+import itertools
 import json
 import logging
 import os
@@ -27,14 +29,14 @@ from .commands import (
     CommandContext,
     CommandOutcome,
     RunningCommandState,
-    container_names,
-    match_project,
-    docker_ps_all,
 )
 from .config import AgentConfig
+from .container_state import ContainerStateTracker
 from .host_agent_protocol import (
     COMMAND_TIMEOUTS,
+    EVENTS_NOTIFY_CHANNEL,
     HOST_AGENT_COMMANDS,
+    LOG_STREAM_COMMANDS,
     NOTIFY_CHANNEL,
     evaluate_authorization,
     intent_is_expired,
@@ -56,9 +58,12 @@ class HostAgent:
         self.pool: asyncpg.Pool | None = None
         self._busy_projects: set[str] = set()
         self._running_tasks: set[asyncio.Task[None]] = set()
+        # Streams de logs: slots proprios e sem serializacao por projeto.
+        self._running_streams: set[asyncio.Task[None]] = set()
         self._wakeup = asyncio.Event()
         self._stopping = asyncio.Event()
         self._listen_conn: asyncpg.Connection | None = None
+        self._container_state: ContainerStateTracker | None = None
 
     async def run(self) -> None:
         assert set(COMMAND_HANDLERS) == HOST_AGENT_COMMANDS, (
@@ -75,9 +80,14 @@ class HostAgent:
         logger.info("host-agent iniciado: worker_id=%s", self.config.worker_id)
 
         await self._start_listener()
+        self._container_state = ContainerStateTracker(
+            self.pool,
+            resync_interval=self.config.state_resync_interval,
+            retry_interval=self.config.state_refresh_interval,
+        )
         tasks = [
             asyncio.create_task(self._worker_heartbeat_loop(), name="worker-heartbeat"),
-            asyncio.create_task(self._state_refresh_loop(), name="state-refresh"),
+            asyncio.create_task(self._container_state.run(), name="container-state"),
             asyncio.create_task(self._lease_reaper_loop(), name="lease-reaper"),
             asyncio.create_task(self._lease_loop(), name="lease-loop"),
         ]
@@ -86,6 +96,11 @@ class HostAgent:
         for task in tasks:
             task.cancel()
         await asyncio.gather(*tasks, return_exceptions=True)
+        # Leitura pura: streams de logs nao seguram o shutdown.
+        for task in self._running_streams:
+            task.cancel()
+        if self._running_streams:
+            await asyncio.gather(*list(self._running_streams), return_exceptions=True)
         if self._running_tasks:
             done, pending = await asyncio.wait(
                 self._running_tasks, timeout=self.config.shutdown_grace
@@ -125,67 +140,42 @@ class HostAgent:
         """Marca como failed comandos cujo lease expirou (agent morto)."""
         while True:
             try:
-                await self.pool.execute(
+                await self.pool.fetch(
                     """
-                    UPDATE host_agent_commands
-                    SET status = 'failed',
-                        error_code = 'lease_expired',
-                        message = 'Lease expirado sem heartbeat do worker.',
-                        finished_at = now(),
-                        updated_at = now()
-                    WHERE status = 'running'
-                      AND lease_expires_at < now() - make_interval(secs => $1)
+                    WITH reaped AS (
+                        UPDATE host_agent_commands
+                        SET status = 'failed',
+                            error_code = 'lease_expired',
+                            message = 'Lease expirado sem heartbeat do worker.',
+                            finished_at = now(),
+                            updated_at = now()
+                        WHERE status = 'running'
+                          AND lease_expires_at < now() - make_interval(secs => $1)
+                        RETURNING id
+                    )
+                    SELECT pg_notify($2, id::text) FROM reaped
                     """,
                     LEASE_REAP_GRACE_SECONDS,
+                    EVENTS_NOTIFY_CHANNEL,
                 )
             except Exception as exc:  # noqa: BLE001
                 logger.warning("reaper de leases falhou: %s", exc)
             await asyncio.sleep(self.config.lease_seconds)
 
-    async def _state_refresh_loop(self) -> None:
-        while True:
-            try:
-                await self._refresh_container_state()
-            except Exception as exc:  # noqa: BLE001
-                logger.warning("refresh do estado de containers falhou: %s", exc)
-            await asyncio.sleep(self.config.state_refresh_interval)
-
-    async def _refresh_container_state(self) -> None:
-        projects = await db.fetch_project_names(self.pool)
-        if not projects:
-            await db.replace_container_state(self.pool, [])
-            return
-        entries: list[dict[str, str]] = []
-        for container in await docker_ps_all():
-            names = container_names(container)
-            if not names:
-                continue
-            for project in projects:
-                if match_project(container, project):
-                    entries.append(
-                        {
-                            "container_name": names[0],
-                            "project": project,
-                            "state": container.get("State", ""),
-                            "status": container.get("Status", ""),
-                            "image": container.get("Image", ""),
-                            "ports": container.get("Ports", ""),
-                            "created_at_text": container.get("CreatedAt", ""),
-                        }
-                    )
-                    break
-        await db.replace_container_state(self.pool, entries)
-
     async def _lease_loop(self) -> None:
         while True:
             leased = None
-            if len(self._running_tasks) < self.config.max_parallel_commands:
+            allow_commands = len(self._running_tasks) < self.config.max_parallel_commands
+            allow_streams = len(self._running_streams) < self.config.max_log_streams
+            if allow_commands or allow_streams:
                 try:
                     leased = await db.lease_next_command(
                         self.pool,
                         self.config.worker_id,
                         self.config.lease_seconds,
                         self._busy_projects,
+                        allow_commands=allow_commands,
+                        allow_streams=allow_streams,
                     )
                 except Exception as exc:  # noqa: BLE001
                     logger.warning("lease falhou: %s", exc)
@@ -202,15 +192,21 @@ class HostAgent:
 
     def _spawn_command(self, record: asyncpg.Record) -> None:
         project = record["project"]
-        self._busy_projects.add(project)
         task = asyncio.create_task(
             self._execute_command(record), name=f"command:{record['id']}"
         )
-        self._running_tasks.add(task)
+        if record["command"] in LOG_STREAM_COMMANDS:
+            self._running_streams.add(task)
+        else:
+            self._busy_projects.add(project)
+            self._running_tasks.add(task)
 
         def _done(finished: asyncio.Task[None]) -> None:
-            self._running_tasks.discard(finished)
-            self._busy_projects.discard(project)
+            if finished in self._running_streams:
+                self._running_streams.discard(finished)
+            else:
+                self._running_tasks.discard(finished)
+                self._busy_projects.discard(project)
             self._wakeup.set()
 
         task.add_done_callback(_done)
@@ -240,6 +236,14 @@ class HostAgent:
             state=state,
             timeout_seconds=timeout_seconds,
             command=command,
+            project_container_ids=(
+                self._container_state.project_container_ids
+                if self._container_state is not None
+                else None
+            ),
+            log_sink=(
+                self._log_sink(command_id) if command in LOG_STREAM_COMMANDS else None
+            ),
         )
         heartbeat = asyncio.create_task(self._command_heartbeat_loop(command_id, state))
         try:
@@ -282,10 +286,9 @@ class HostAgent:
                 command_id,
                 outcome.status,
             )
-        try:
-            await self._refresh_container_state()
-        except Exception:  # noqa: BLE001
-            pass
+        if self._container_state is not None:
+            # Containers chegam pelo docker events; aqui so a lista de projetos.
+            self._container_state.request_project_refresh()
         if outcome.status == "failed":
             logger.warning(
                 "comando %s (%s) falhou: %s — %s",
@@ -296,6 +299,21 @@ class HostAgent:
             )
         logger.info("comando %s finalizado: %s", command_id, outcome.status)
 
+    def _log_sink(self, command_id: uuid.UUID):
+        sequence = itertools.count(1)
+
+        async def publish(data: str, log_cursor: str | None) -> bool:
+            return await db.append_log_chunk(
+                self.pool,
+                command_id,
+                self.config.worker_id,
+                next(sequence),
+                data,
+                log_cursor,
+            )
+
+        return publish
+
     async def _command_heartbeat_loop(self, command_id: uuid.UUID, state: RunningCommandState) -> None:
         while True:
             try:
@@ -11,7 +11,6 @@ from __future__ import annotations
 import asyncio
 import json
 import os
-import re
 import shutil
 import signal
 from dataclasses import dataclass, field
@@ -24,6 +23,8 @@ from .host_agent_protocol import (
     COMMAND_TERM_GRACE,
     CONTAINER_LOGS_LIMIT,
     DEFAULT_TERM_GRACE,
+    LOG_CHUNK_LIMIT,
+    LOG_TIMESTAMP_RE,
     is_valid_uuid,
     sanitize_output,
 )
@@ -35,8 +36,25 @@ from .security import (
 )
 from .templates import sync_project_generated_files
 
-PROJECT_SERVICE_ORDER = ["meta", "auth", "rest", "imgproxy", "storage", "nginx"]
+# Servicos do mesmo tier agem em paralelo; o tier seguinte so comeca com o
+# anterior pronto (running e healthy quando ha healthcheck). Stop e remocao
+# seguem a ordem inversa; servicos fora da lista formam um ultimo tier.
+PROJECT_SERVICE_TIERS: tuple[frozenset[str], ...] = (
+    frozenset({"meta", "auth", "rest", "imgproxy"}),
+    frozenset({"storage"}),
+    frozenset({"nginx"}),
+)
+CONTAINER_ACTION_TIMEOUT = 120.0
+READINESS_TIMEOUT = 60.0
+READINESS_POLL_INTERVAL = 0.5
 _OUTPUT_WINDOW_LIMIT = 64_000
+# Linhas do ``docker logs`` sao agrupadas por ate esse intervalo antes de
+# virar um chunk, para a primeira linha sair rapido sem um INSERT por linha.
+LOG_STREAM_FLUSH_SECONDS = 0.25
+_LOG_READER_LIMIT = 1_048_576
+
+# Recebe (texto, cursor) e devolve False quando a API encerrou o stream.
+LogSink = Callable[[str, str | None], Awaitable[bool]]
 
 ProgressEvent = tuple[int, str, str]
 
@@ -193,6 +211,10 @@ class CommandContext:
     state: RunningCommandState
     timeout_seconds: int
     command: str
+    # Ids de containers do projeto pelo snapshot do agent; None = sem snapshot.
+    project_container_ids: Callable[[str], list[str] | None] | None = None
+    # Destino dos chunks dos comandos de streaming de logs.
+    log_sink: LogSink | None = None
 
 
 @dataclass
@@ -342,6 +364,38 @@ async def docker_ps_all() -> list[dict[str, Any]]:
     return containers
 
 
+async def docker_ps_by_ids(container_ids: list[str]) -> list[dict[str, Any]]:
+    """``docker ps -a`` restrito a ids (filtros ``id=`` sao combinados com OR)."""
+    containers: list[dict[str, Any]] = []
+    for start in range(0, len(container_ids), 100):
+        argv = ["docker", "ps", "-a", "--format", "{{json .}}"]
+        for container_id in container_ids[start:start + 100]:
+            argv.extend(["--filter", f"id={container_id}"])
+        code, stdout, stderr = await _run_short(argv)
+        if code != 0:
+            raise RuntimeError(f"docker ps falhou: {stderr.strip() or code}")
+        for line in stdout.splitlines():
+            line = line.strip()
+            if line:
+                containers.append(json.loads(line))
+    return containers
+
+
+async def docker_container_events() -> asyncio.subprocess.Process:
+    """Stream continuo de ``docker events`` de containers, um JSON por linha."""
+    return await asyncio.create_subprocess_exec(
+        "docker",
+        "events",
+        "--filter",
+        "type=container",
+        "--format",
+        "{{json .}}",
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+        limit=1024 * 1024,
+    )
+
+
 def container_names(entry: Mapping[str, Any]) -> list[str]:
     names = entry.get("Names", "")
     if isinstance(names, str):
@@ -350,27 +404,95 @@ def container_names(entry: Mapping[str, Any]) -> list[str]:
 
 
 def match_project(entry: Mapping[str, Any], project: str) -> bool:
-    pattern = re.compile(rf"-{re.escape(project)}$")
-    return any(pattern.search(name) for name in container_names(entry))
+    suffix = f"-{project}"
+    return any(name.endswith(suffix) for name in container_names(entry))
 
 
-async def list_project_containers(project: str) -> list[dict[str, Any]]:
+async def list_project_containers(
+    project: str,
+    container_ids: list[str] | None = None,
+) -> list[dict[str, Any]]:
+    """Containers do projeto com estado atual.
+
+    Com ``container_ids`` (vindos do snapshot do agent) consulta so esses ids;
+    se o snapshot nao achar nada, cai para o ``docker ps -a`` completo.
+    """
+    if container_ids:
+        containers = [
+            entry
+            for entry in await docker_ps_by_ids(container_ids)
+            if match_project(entry, project)
+        ]
+        if containers:
+            return containers
     return [entry for entry in await docker_ps_all() if match_project(entry, project)]
 
 
-def _service_priority(name: str) -> int:
-    lowered = name.lower()
-    for index, service in enumerate(PROJECT_SERVICE_ORDER):
-        if service in lowered:
+def project_container_service(name: str, project: str) -> str:
+    """``supabase-<servico>-<projeto>`` -> ``<servico>``."""
+    base = name.removesuffix(f"-{project}")
+    return base.rsplit("supabase-", 1)[-1]
+
+
+def _service_tier(name: str, project: str) -> int:
+    service = project_container_service(name, project)
+    for index, tier in enumerate(PROJECT_SERVICE_TIERS):
+        if service in tier:
             return index
-    return 999
+    return len(PROJECT_SERVICE_TIERS)
 
 
-def sort_project_containers(containers: list[dict[str, Any]]) -> list[dict[str, Any]]:
-    return sorted(
-        containers,
-        key=lambda entry: _service_priority(",".join(container_names(entry))),
-    )
+def group_project_containers(
+    containers: list[dict[str, Any]],
+    project: str,
+    *,
+    reverse: bool = False,
+) -> list[list[dict[str, Any]]]:
+    tiers: dict[int, list[dict[str, Any]]] = {}
+    for entry in containers:
+        names = container_names(entry)
+        tier = _service_tier(names[0], project) if names else len(PROJECT_SERVICE_TIERS)
+        tiers.setdefault(tier, []).append(entry)
+    return [tiers[index] for index in sorted(tiers, reverse=reverse)]
+
+
+async def wait_containers_ready(
+    names: list[str],
+    *,
+    timeout: float | None = None,
+) -> tuple[list[str], list[str]]:
+    """Espera running (e healthy, se houver healthcheck) em vez de sleep fixo.
+
+    Retorna (ainda nao prontos no timeout, parados logo apos a acao).
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + (READINESS_TIMEOUT if timeout is None else timeout)
+    pending = set(names)
+    stopped: list[str] = []
+    while pending:
+        _, stdout, _ = await _run_short(
+            [
+                "docker", "inspect", "--format",
+                "{{.Name}} {{.State.Status}} "
+                "{{if .State.Health}}{{.State.Health.Status}}{{else}}none{{end}}",
+                *sorted(pending),
+            ],
+            timeout=15.0,
+        )
+        for line in stdout.splitlines():
+            parts = line.split()
+            if len(parts) != 3 or parts[0].lstrip("/") not in pending:
+                continue
+            name, status, health = parts[0].lstrip("/"), parts[1], parts[2]
+            if status in {"exited", "dead"}:
+                pending.discard(name)
+                stopped.append(name)
+            elif status == "running" and health in {"healthy", "none"}:
+                pending.discard(name)
+        if not pending or loop.time() >= deadline:
+            break
+        await asyncio.sleep(READINESS_POLL_INTERVAL)
+    return sorted(pending), stopped
 
 
 def _load_project_env(ctx: CommandContext, project: str) -> dict[str, str]:
@@ -388,10 +510,14 @@ async def _container_action(
     verb: str,
     argv_builder: Callable[[str], list[str]],
     skip: Callable[[Mapping[str, Any]], bool],
-    settle_seconds: float = 0.0,
+    wait_ready: bool = False,
+    reverse_tiers: bool = False,
     allow_empty: bool = False,
 ) -> CommandOutcome:
-    containers = sort_project_containers(await list_project_containers(project))
+    cached_ids = (
+        ctx.project_container_ids(project) if ctx.project_container_ids else None
+    )
+    containers = await list_project_containers(project, cached_ids)
     if not containers and not allow_empty:
         return CommandOutcome(
             status="failed",
@@ -401,29 +527,58 @@ async def _container_action(
 
     touched: list[str] = []
     errors: list[str] = []
+    not_ready: list[str] = []
     total = max(len(containers), 1)
-    for index, entry in enumerate(containers, start=1):
+    completed = 0
+
+    async def act(entry: Mapping[str, Any]) -> tuple[str | None, str | None, str | None]:
+        """Retorna (rotulo em ``containers``, nome acionado, erro)."""
+        nonlocal completed
         names = container_names(entry)
         if not names:
-            continue
+            return None, None, None
         name = names[0]
+        if skip(entry):
+            outcome: tuple[str | None, str | None, str | None] = (
+                f"{name} (skipped)", None, None
+            )
+        else:
+            code, _, stderr = await _run_short(
+                argv_builder(name), timeout=CONTAINER_ACTION_TIMEOUT
+            )
+            if code == 0:
+                outcome = (name, name, None)
+            else:
+                outcome = (
+                    None,
+                    None,
+                    f"{verb} {name}: {sanitize_output(stderr.strip(), tail_limit=300)}",
+                )
+        completed += 1
         ctx.state.report(
-            progress=min(95, int(index * 95 / total)),
+            progress=min(95, int(completed * 95 / total)),
             step=f"{verb}:{name}",
-            message=f"{verb} ({index}/{total})...",
+            message=f"{verb} ({completed}/{total})...",
         )
-        if skip(entry):
-            touched.append(f"{name} (skipped)")
-            continue
-        code, _, stderr = await _run_short(argv_builder(name), timeout=120.0)
-        if code == 0:
-            touched.append(name)
-            if settle_seconds:
-                await asyncio.sleep(settle_seconds)
-        else:
-            errors.append(f"{verb} {name}: {sanitize_output(stderr.strip(), tail_limit=300)}")
-
-    result = {"containers": touched, "errors": errors}
+        return outcome
+
+    for tier in group_project_containers(containers, project, reverse=reverse_tiers):
+        acted: list[str] = []
+        for label, name, error in await asyncio.gather(*(act(entry) for entry in tier)):
+            if label:
+                touched.append(label)
+            if name:
+                acted.append(name)
+            if error:
+                errors.append(error)
+        if wait_ready and acted:
+            pending, stopped = await wait_containers_ready(acted)
+            not_ready.extend(pending)
+            errors.extend(f"{verb} {name}: container parou apos a acao" for name in stopped)
+
+    result: dict[str, Any] = {"containers": touched, "errors": errors}
+    if not_ready:
+        result["not_ready"] = not_ready
     if errors:
         return CommandOutcome(
             status="failed",
@@ -441,7 +596,7 @@ async def handle_start_project(ctx: CommandContext, project: str, args: dict[str
         verb="start",
         argv_builder=lambda name: ["docker", "start", name],
         skip=lambda entry: entry.get("State", "") == "running",
-        settle_seconds=2.0,
+        wait_ready=True,
     )
 
 
@@ -452,6 +607,7 @@ async def handle_stop_project(ctx: CommandContext, project: str, args: dict[str,
         verb="stop",
         argv_builder=lambda name: ["docker", "stop", name],
         skip=lambda entry: entry.get("State", "") != "running",
+        reverse_tiers=True,
     )
 
 
@@ -462,7 +618,7 @@ async def handle_restart_project(ctx: CommandContext, project: str, args: dict[s
         verb="restart",
         argv_builder=lambda name: ["docker", "restart", "-t", "30", name],
         skip=lambda entry: False,
-        settle_seconds=2.0,
+        wait_ready=True,
     )
 
 
@@ -473,6 +629,7 @@ async def handle_delete_project_containers(ctx: CommandContext, project: str, ar
         verb="remove",
         argv_builder=lambda name: ["docker", "rm", "-f", name],
         skip=lambda entry: False,
+        reverse_tiers=True,
         allow_empty=True,
     )
 
@@ -865,6 +1022,148 @@ async def handle_container_logs(ctx: CommandContext, project: str, args: dict[st
     )
 
 
+def log_timestamp_key(timestamp: str) -> str:
+    """Chave ordenavel de um timestamp RFC3339Nano (fracao com 9 digitos)."""
+    base, _, fraction = timestamp.rstrip("Z").partition(".")
+    return f"{base}.{fraction.ljust(9, '0')}"
+
+
+async def relay_log_lines(
+    reader: asyncio.StreamReader,
+    sink: LogSink,
+    *,
+    since: str | None = None,
+    deadline: float | None = None,
+    flush_interval: float = LOG_STREAM_FLUSH_SECONDS,
+) -> tuple[str | None, str]:
+    """Agrupa as linhas do ``docker logs --timestamps`` em chunks sanitizados.
+
+    Linhas ate ``since`` sao descartadas (o ``--since`` do Docker repete a
+    ultima linha ja entregue). Retorna o cursor da ultima linha publicada e
+    o motivo do fim: ``exited``, ``cancelled`` ou ``timeout``.
+    """
+    loop = asyncio.get_running_loop()
+    since_key = log_timestamp_key(since) if since else None
+    cursor = since
+    pending: list[str] = []
+    pending_size = 0
+    pending_cursor = since
+    flush_at: float | None = None
+
+    async def flush() -> bool:
+        nonlocal cursor, pending_size, flush_at
+        if not pending:
+            return True
+        data = sanitize_output("".join(pending), tail_limit=0)
+        pending.clear()
+        pending_size = 0
+        flush_at = None
+        accepted = await sink(data, pending_cursor)
+        if accepted:
+            cursor = pending_cursor
+        return accepted
+
+    while True:
+        wake_at = min(
+            (moment for moment in (flush_at, deadline) if moment is not None),
+            default=None,
+        )
+        try:
+            line = await asyncio.wait_for(
+                reader.readline(),
+                timeout=None if wake_at is None else max(0.0, wake_at - loop.time()),
+            )
+        except asyncio.TimeoutError:
+            if deadline is not None and loop.time() >= deadline:
+                ended = "timeout" if await flush() else "cancelled"
+                return cursor, ended
+            if not await flush():
+                return cursor, "cancelled"
+            continue
+        except ValueError:
+            line = b"[linha de log excedeu o limite e foi descartada]\n"
+        if not line:
+            break
+        text = line.decode(errors="replace")[:LOG_CHUNK_LIMIT]
+        timestamp = text.split(" ", 1)[0]
+        if LOG_TIMESTAMP_RE.fullmatch(timestamp):
+            if since_key is not None and log_timestamp_key(timestamp) <= since_key:
+                continue
+            pending_cursor = timestamp
+        pending.append(text)
+        pending_size += len(text)
+        if flush_at is None:
+            flush_at = loop.time() + flush_interval
+        if pending_size >= LOG_CHUNK_LIMIT and not await flush():
+            return cursor, "cancelled"
+    ended = "exited" if await flush() else "cancelled"
+    return cursor, ended
+
+
+async def handle_container_logs_stream(ctx: CommandContext, project: str, args: dict[str, Any]) -> CommandOutcome:
+    service = str(args["service"])
+    lines = int(args["lines"])
+    since = args.get("since")
+    container = f"supabase-{service}-{project}"
+
+    code, stdout, _ = await _run_short(
+        ["docker", "inspect", "--format", "{{.State.Status}}", container]
+    )
+    if code != 0:
+        return CommandOutcome(
+            status="failed",
+            error_code="container_not_found",
+            message=f"Container {container} nao encontrado.",
+        )
+    if ctx.log_sink is None:
+        return CommandOutcome(status="failed", error_code="log_sink_unavailable")
+
+    # ``--tail`` vale tambem na retomada: um cursor antigo nao despeja o
+    # historico inteiro desde ``since``.
+    argv = ["docker", "logs", "--timestamps", "--tail", str(lines)]
+    if since:
+        argv += ["--since", since]
+    if args.get("follow"):
+        argv.append("--follow")
+    argv.append(container)
+
+    loop = asyncio.get_running_loop()
+    proc = await asyncio.create_subprocess_exec(
+        *argv,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        start_new_session=True,
+        limit=_LOG_READER_LIMIT,
+    )
+    try:
+        cursor, ended = await relay_log_lines(
+            proc.stdout,
+            ctx.log_sink,
+            since=since,
+            # Folga para publicar o desfecho antes do timeout duro.
+            deadline=loop.time() + max(1, ctx.timeout_seconds - 5),
+        )
+    finally:
+        if proc.returncode is None:
+            _terminate_process_group(proc, signal.SIGTERM)
+        await proc.wait()
+
+    if ended == "exited" and proc.returncode != 0:
+        return CommandOutcome(
+            status="failed", error_code="logs_failed", exit_code=proc.returncode
+        )
+    return CommandOutcome(
+        status="done",
+        exit_code=0,
+        result={
+            "container": container,
+            "status": stdout.strip() or "unknown",
+            "cursor": cursor,
+            "ended": ended,
+        },
+    )
+
+
 CommandHandler = Callable[[CommandContext, str, dict[str, Any]], Awaitable[CommandOutcome]]
 
 COMMAND_HANDLERS: dict[str, CommandHandler] = {
@@ -882,4 +1181,5 @@ COMMAND_HANDLERS: dict[str, CommandHandler] = {
     "restore_project": handle_restore_project,
     "delete_restore_point": handle_delete_restore_point,
     "container_logs": handle_container_logs,
+    "container_logs_stream": handle_container_logs_stream,
 }
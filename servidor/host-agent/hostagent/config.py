@@ -29,7 +29,9 @@ class AgentConfig:
     heartbeat_interval: float
     lease_seconds: int
     state_refresh_interval: float
+    state_resync_interval: float
     max_parallel_commands: int
+    max_log_streams: int
     shutdown_grace: int
     schema_wait_timeout: float
 
@@ -100,7 +102,9 @@ def load_config(root: str | Path) -> AgentConfig:
         heartbeat_interval=_float_env(env, "HOST_AGENT_HEARTBEAT_INTERVAL", 15.0),
         lease_seconds=_int_env(env, "HOST_AGENT_LEASE_SECONDS", 60),
         state_refresh_interval=_float_env(env, "HOST_AGENT_STATE_REFRESH_INTERVAL", 10.0),
+        state_resync_interval=_float_env(env, "HOST_AGENT_STATE_RESYNC_INTERVAL", 300.0),
         max_parallel_commands=_int_env(env, "HOST_AGENT_MAX_PARALLEL_COMMANDS", 3),
+        max_log_streams=_int_env(env, "HOST_AGENT_MAX_LOG_STREAMS", 8),
         shutdown_grace=_int_env(env, "HOST_AGENT_SHUTDOWN_GRACE", 300),
         schema_wait_timeout=_float_env(env, "HOST_AGENT_SCHEMA_WAIT_TIMEOUT", 180.0),
     )
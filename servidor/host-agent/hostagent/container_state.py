@@ -0,0 +1,307 @@
+"""Estado de containers por projeto mantido por ``docker events``.
+
+O snapshot completo (``docker ps -a``) so acontece ao (re)abrir o stream de
+eventos, quando o conjunto de projetos muda e a cada ``state_resync_interval``
+como reconciliacao. No restante, cada evento marca o container como sujo; o
+lote sujo e relido por id e so as linhas alteradas viram upsert/delete em
+``project_container_state``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import Any, Iterable, Mapping
+
+import asyncpg
+
+from . import db
+from .commands import (
+    container_names,
+    docker_container_events,
+    docker_ps_all,
+    docker_ps_by_ids,
+)
+
+logger = logging.getLogger("hostagent")
+
+EVENT_DEBOUNCE_SECONDS = 0.5
+# Healthchecks geram exec_create/exec_start/exec_die sem mudar o container.
+IGNORED_EVENT_PREFIXES = ("exec_",)
+
+
+def project_for_container(
+    names: Iterable[str],
+    projects: frozenset[str] | set[str],
+) -> str | None:
+    """Projeto cujo sufixo ``-<projeto>`` casa com um dos nomes.
+
+    Testa apenas os sufixos apos cada ``-`` do nome (lookup em set), em vez
+    de um regex por projeto; o sufixo mais longo vence.
+    """
+    for name in names:
+        index = name.find("-")
+        while index != -1:
+            candidate = name[index + 1:]
+            if candidate in projects:
+                return candidate
+            index = name.find("-", index + 1)
+    return None
+
+
+def container_state_entry(
+    container: Mapping[str, Any],
+    projects: frozenset[str],
+) -> dict[str, str] | None:
+    names = container_names(container)
+    if not names:
+        return None
+    project = project_for_container(names, projects)
+    if project is None:
+        return None
+    return {
+        "container_name": names[0],
+        "project": project,
+        "state": container.get("State", ""),
+        "status": container.get("Status", ""),
+        "image": container.get("Image", ""),
+        "ports": container.get("Ports", ""),
+        "created_at_text": container.get("CreatedAt", ""),
+    }
+
+
+def _short_id(container_id: str) -> str:
+    return container_id[:12]
+
+
+class ContainerStateIndex:
+    """Ultimo estado gravado por container, para gravar so diferencas."""
+
+    def __init__(self) -> None:
+        self.projects: frozenset[str] = frozenset()
+        self.entries: dict[str, dict[str, str]] = {}
+        self.by_project: dict[str, set[str]] = {}
+
+    def _store(self, container_id: str, entry: dict[str, str]) -> None:
+        self.entries[container_id] = entry
+        self.by_project.setdefault(entry["project"], set()).add(container_id)
+
+    def _drop(self, container_id: str) -> dict[str, str] | None:
+        entry = self.entries.pop(container_id, None)
+        if entry is not None:
+            ids = self.by_project.get(entry["project"])
+            if ids is not None:
+                ids.discard(container_id)
+                if not ids:
+                    del self.by_project[entry["project"]]
+        return entry
+
+    def project_container_ids(self, project: str) -> list[str]:
+        return sorted(self.by_project.get(project, ()))
+
+    def reset(
+        self,
+        projects: Iterable[str],
+        containers: Iterable[Mapping[str, Any]],
+    ) -> list[dict[str, str]]:
+        self.projects = frozenset(projects)
+        self.entries = {}
+        self.by_project = {}
+        for container in containers:
+            entry = container_state_entry(container, self.projects)
+            if entry is not None:
+                self._store(_short_id(container.get("ID", "")), entry)
+        return list(self.entries.values())
+
+    def update(
+        self,
+        container_ids: Iterable[str],
+        containers: Iterable[Mapping[str, Any]],
+    ) -> tuple[list[dict[str, str]], list[str]]:
+        """Reaplica os containers relidos; devolve (upserts, deletes)."""
+        found = {_short_id(container.get("ID", "")): container for container in containers}
+        upserts: list[dict[str, str]] = []
+        removed: list[str] = []
+        for container_id in {_short_id(value) for value in container_ids}:
+            previous = self._drop(container_id)
+            container = found.get(container_id)
+            entry = (
+                container_state_entry(container, self.projects)
+                if container is not None
+                else None
+            )
+            if entry is not None:
+                self._store(container_id, entry)
+                if entry != previous:
+                    upserts.append(entry)
+            if previous is not None and (
+                entry is None or entry["container_name"] != previous["container_name"]
+            ):
+                removed.append(previous["container_name"])
+        # Nome reaproveitado por outro container (recreate) nao pode sumir.
+        current = {entry["container_name"] for entry in self.entries.values()}
+        return upserts, [name for name in removed if name not in current]
+
+
+class ContainerStateTracker:
+    """Le ``docker events`` e mantem ``project_container_state`` em dia."""
+
+    def __init__(
+        self,
+        pool: asyncpg.Pool,
+        *,
+        resync_interval: float,
+        retry_interval: float,
+    ) -> None:
+        self.pool = pool
+        self.resync_interval = resync_interval
+        self.retry_interval = retry_interval
+        self.index = ContainerStateIndex()
+        self._dirty: set[str] = set()
+        # Projetos que cada id sujo pode afetar; None = container desconhecido
+        # sem nome no evento, que pode ser de qualquer projeto.
+        self._dirty_projects: dict[str, set[str | None]] = {}
+        self._wakeup = asyncio.Event()
+        self._needs_resync = True
+        self._projects_changed = False
+        self._streaming = False
+
+    def project_container_ids(self, project: str) -> list[str] | None:
+        """Ids do projeto pelo snapshot, ou None se ele pode estar atrasado.
+
+        Comandos usam isso para consultar so os containers do projeto; sem
+        stream ativo, com resync pendente ou com evento pendente que pode ser
+        do projeto, voltam ao ``docker ps`` completo. Eventos de outros
+        projetos nao atrasam este.
+        """
+        if not self._streaming or self._needs_resync or self._projects_changed:
+            return None
+        for projects in self._dirty_projects.values():
+            if None in projects or project in projects:
+                return None
+        return self.index.project_container_ids(project) or None
+
+    def mark_dirty(self, container_id: str, name: str | None = None) -> None:
+        container_id = _short_id(container_id)
+        projects = self._dirty_projects.setdefault(container_id, set())
+        known = self.index.entries.get(container_id)
+        if known is not None:
+            projects.add(known["project"])
+        if name:
+            # Nome que nao casa com nenhum projeto nao afeta nenhum.
+            owner = project_for_container([name.lstrip("/")], self.index.projects)
+            if owner is not None:
+                projects.add(owner)
+        elif known is None:
+            projects.add(None)
+        self._dirty.add(container_id)
+        self._wakeup.set()
+
+    def _clear_dirty(self, container_ids: Iterable[str]) -> None:
+        for container_id in container_ids:
+            self._dirty.discard(container_id)
+            self._dirty_projects.pop(container_id, None)
+
+    def request_project_refresh(self) -> None:
+        """Chamado apos comandos: projeto criado/renomeado/removido pede resync."""
+        self._projects_changed = True
+        self._wakeup.set()
+
+    async def resync(self) -> None:
+        # O snapshot cobre o que ja estava sujo; eventos posteriores ficam.
+        covered = set(self._dirty)
+        projects = await db.fetch_project_names(self.pool)
+        containers = await docker_ps_all() if projects else []
+        entries = self.index.reset(projects, containers)
+        await db.replace_container_state(self.pool, entries)
+        self._clear_dirty(covered)
+
+    async def refresh_dirty(self) -> None:
+        container_ids = sorted(self._dirty)
+        containers = await docker_ps_by_ids(container_ids)
+        upserts, deletes = self.index.update(container_ids, containers)
+        await db.apply_container_state_changes(self.pool, upserts, deletes)
+        # Eventos que chegaram durante a releitura continuam sujos.
+        self._clear_dirty(container_ids)
+
+    async def run(self) -> None:
+        writer = asyncio.create_task(self._sync_loop(), name="container-state-sync")
+        try:
+            while True:
+                try:
+                    await self._follow_events()
+                    logger.warning("stream docker events encerrado; reabrindo")
+                except Exception as exc:  # noqa: BLE001
+                    logger.warning("docker events indisponivel: %s", exc)
+                # Sem stream, a reconciliacao cobre o intervalo ate reabrir.
+                self._needs_resync = True
+                self._wakeup.set()
+                await asyncio.sleep(self.retry_interval)
+        finally:
+            writer.cancel()
+            await asyncio.gather(writer, return_exceptions=True)
+
+    async def _follow_events(self) -> None:
+        proc = await docker_container_events()
+        try:
+            # Snapshot base so depois do stream aberto: nada entre os dois se perde.
+            self._needs_resync = True
+            self._streaming = True
+            self._wakeup.set()
+            assert proc.stdout is not None
+            while True:
+                line = await proc.stdout.readline()
+                if not line:
+                    return
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                action = str(event.get("Action") or event.get("status") or "")
+                if action.startswith(IGNORED_EVENT_PREFIXES):
+                    continue
+                actor = event.get("Actor") or {}
+                container_id = event.get("id") or actor.get("ID")
+                if container_id:
+                    self.mark_dirty(
+                        container_id, (actor.get("Attributes") or {}).get("name")
+                    )
+        finally:
+            self._streaming = False
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+
+    async def _sync_loop(self) -> None:
+        """Unico escritor da tabela: resync, troca de projetos e lotes sujos."""
+        loop = asyncio.get_running_loop()
+        next_resync = loop.time() + self.resync_interval
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(),
+                    timeout=max(0.0, next_resync - loop.time()),
+                )
+                await asyncio.sleep(EVENT_DEBOUNCE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                if self._projects_changed:
+                    self._projects_changed = False
+                    projects = frozenset(await db.fetch_project_names(self.pool))
+                    if projects != self.index.projects:
+                        self._needs_resync = True
+                if self._needs_resync or loop.time() >= next_resync:
+                    await self.resync()
+                    self._needs_resync = False
+                    next_resync = loop.time() + self.resync_interval
+                elif self._dirty:
+                    await self.refresh_dirty()
+            except Exception as exc:  # noqa: BLE001
+                # O indice pode ter avancado sem a gravacao: reconcilia.
+                self._needs_resync = True
+                logger.warning("refresh do estado de containers falhou: %s", exc)
+                await asyncio.sleep(self.retry_interval)
+                self._wakeup.set()
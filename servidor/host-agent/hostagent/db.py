@@ -1,8 +1,9 @@
 """Acesso do host-agent ao Postgres do control plane.
 
 O agent nao cria schema: as tabelas ``host_agent_commands``,
-``host_agent_workers`` e ``project_container_state`` sao criadas pela
-Projects API no startup (``app/host_agent.py``).
+``host_agent_workers``, ``host_agent_log_chunks`` e
+``project_container_state`` sao criadas pela Projects API no startup
+(``app/host_agent.py``).
 """
 
 from __future__ import annotations
@@ -14,6 +15,8 @@ from typing import Any
 
 import asyncpg
 
+from .host_agent_protocol import EVENTS_NOTIFY_CHANNEL, LOG_STREAM_COMMANDS
+
 
 class HostAgentSchemaTimeout(RuntimeError):
     """O control plane ainda nao publicou o schema exigido pelo agent."""
@@ -30,6 +33,7 @@ async def host_agent_schema_ready(dsn: str) -> bool:
                     to_regclass('host_agent_workers') IS NOT NULL
                     AND to_regclass('host_agent_commands') IS NOT NULL
                     AND to_regclass('project_container_state') IS NOT NULL
+                    AND to_regclass('host_agent_log_chunks') IS NOT NULL
                     AND EXISTS (
                         SELECT 1
                         FROM information_schema.columns
@@ -87,6 +91,13 @@ async def create_pool(dsn: str) -> asyncpg.Pool:
     return await asyncpg.create_pool(dsn, min_size=1, max_size=5)
 
 
+async def _notify_command_event(conn: asyncpg.Connection, command_id: uuid.UUID) -> None:
+    """Acorda quem espera o comando na API; entregue no commit."""
+    await conn.execute(
+        "SELECT pg_notify($1, $2)", EVENTS_NOTIFY_CHANNEL, str(command_id)
+    )
+
+
 async def register_worker(pool: asyncpg.Pool, worker_id: str, hostname: str, pid: int, version: str) -> None:
     await pool.execute(
         """
@@ -116,41 +127,111 @@ async def mark_worker_stopped(pool: asyncpg.Pool, worker_id: str) -> None:
     )
 
 
+LEASE_HEAD_CANDIDATES = 16
+
+_QUEUED_STREAM = """
+SELECT id
+FROM host_agent_commands
+WHERE status = 'queued'
+  AND command = ANY($1::text[])
+ORDER BY created_at
+LIMIT 1
+FOR UPDATE SKIP LOCKED
+"""
+
+# Loose index scan sobre idx_host_agent_commands_queue_head: um salto por
+# projeto com fila e, para cada um, so o comando mais antigo (a cabeca).
+# Comandos enfileirados atras de um projeto ocupado nunca sao lidos.
+_QUEUE_HEADS = """
+WITH RECURSIVE queued_projects(project) AS (
+    (
+        SELECT project
+        FROM host_agent_commands
+        WHERE status = 'queued'
+        ORDER BY project
+        LIMIT 1
+    )
+    UNION ALL
+    SELECT (
+        SELECT c.project
+        FROM host_agent_commands c
+        WHERE c.status = 'queued'
+          AND c.project > q.project
+        ORDER BY c.project
+        LIMIT 1
+    )
+    FROM queued_projects q
+    WHERE q.project IS NOT NULL
+)
+SELECT head.id
+FROM queued_projects q
+CROSS JOIN LATERAL (
+    SELECT c.id, c.created_at
+    FROM host_agent_commands c
+    WHERE c.status = 'queued'
+      AND c.project = q.project
+      AND NOT (c.command = ANY($2::text[]))
+    ORDER BY c.created_at
+    LIMIT 1
+) head
+WHERE q.project IS NOT NULL
+  AND NOT (q.project = ANY($1::text[]))
+  AND NOT EXISTS (
+      SELECT 1 FROM host_agent_commands r
+      WHERE r.status = 'running'
+        AND r.project = q.project
+        AND r.lease_expires_at > now()
+        AND NOT (r.command = ANY($2::text[]))
+  )
+ORDER BY head.created_at
+LIMIT $3
+"""
+
+_LOCK_QUEUED = """
+SELECT id
+FROM host_agent_commands
+WHERE id = $1 AND status = 'queued'
+FOR UPDATE SKIP LOCKED
+"""
+
+
 async def lease_next_command(
     pool: asyncpg.Pool,
     worker_id: str,
     lease_seconds: int,
     busy_projects: set[str],
+    *,
+    allow_commands: bool = True,
+    allow_streams: bool = True,
 ) -> asyncpg.Record | None:
     """Faz o lease atomico do proximo comando elegivel.
 
-    ``FOR UPDATE SKIP LOCKED`` serializa multiplos agents; a subquery
-    tambem pula projetos com comando em execucao (local ou remoto) para
-    manter a serializacao por projeto.
+    Streams de logs ficam fora da serializacao por projeto, tem slots
+    proprios (``allow_streams``) e saem primeiro. Para os demais, so a cabeca
+    da fila de cada projeto livre e candidata, em ordem de chegada; o lock
+    ``SKIP LOCKED`` com recheck de ``status`` resolve a corrida entre agents
+    sem que um deles pegue o segundo comando de um projeto.
     """
+    streams = sorted(LOG_STREAM_COMMANDS)
     async with pool.acquire() as conn:
         async with conn.transaction():
-            row = await conn.fetchrow(
-                """
-                SELECT id
-                FROM host_agent_commands c
-                WHERE c.status = 'queued'
-                  AND NOT (c.project = ANY($1::text[]))
-                  AND NOT EXISTS (
-                      SELECT 1 FROM host_agent_commands r
-                      WHERE r.project = c.project
-                        AND r.status = 'running'
-                        AND r.lease_expires_at > now()
-                  )
-                ORDER BY c.created_at
-                LIMIT 1
-                FOR UPDATE SKIP LOCKED
-                """,
-                sorted(busy_projects),
-            )
-            if row is None:
+            command_id = None
+            if allow_streams:
+                command_id = await conn.fetchval(_QUEUED_STREAM, streams)
+            if command_id is None and allow_commands:
+                heads = await conn.fetch(
+                    _QUEUE_HEADS,
+                    sorted(busy_projects),
+                    streams,
+                    LEASE_HEAD_CANDIDATES,
+                )
+                for head in heads:
+                    command_id = await conn.fetchval(_LOCK_QUEUED, head["id"])
+                    if command_id is not None:
+                        break
+            if command_id is None:
                 return None
-            return await conn.fetchrow(
+            leased = await conn.fetchrow(
                 """
                 UPDATE host_agent_commands
                 SET status = 'running',
@@ -163,10 +244,12 @@ async def lease_next_command(
                 WHERE id = $1
                 RETURNING *
                 """,
-                row["id"],
+                command_id,
                 worker_id,
                 lease_seconds,
             )
+            await _notify_command_event(conn, command_id)
+            return leased
 
 
 async def heartbeat_command(
@@ -181,28 +264,32 @@ async def heartbeat_command(
     current_step: str | None = None,
     message: str | None = None,
 ) -> None:
-    await pool.execute(
-        """
-        UPDATE host_agent_commands
-        SET lease_expires_at = now() + make_interval(secs => $3::integer),
-            heartbeat_at = now(),
-            stdout_tail = COALESCE($4, stdout_tail),
-            stderr_tail = COALESCE($5, stderr_tail),
-            progress = COALESCE($6, progress),
-            current_step = COALESCE($7, current_step),
-            message = COALESCE($8, message),
-            updated_at = now()
-        WHERE id = $1 AND worker_id = $2 AND status = 'running'
-        """,
-        command_id,
-        worker_id,
-        lease_seconds,
-        stdout_tail,
-        stderr_tail,
-        progress,
-        current_step,
-        message,
-    )
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            outcome = await conn.execute(
+                """
+                UPDATE host_agent_commands
+                SET lease_expires_at = now() + make_interval(secs => $3::integer),
+                    heartbeat_at = now(),
+                    stdout_tail = COALESCE($4, stdout_tail),
+                    stderr_tail = COALESCE($5, stderr_tail),
+                    progress = COALESCE($6, progress),
+                    current_step = COALESCE($7, current_step),
+                    message = COALESCE($8, message),
+                    updated_at = now()
+                WHERE id = $1 AND worker_id = $2 AND status = 'running'
+                """,
+                command_id,
+                worker_id,
+                lease_seconds,
+                stdout_tail,
+                stderr_tail,
+                progress,
+                current_step,
+                message,
+            )
+            if outcome.endswith("1"):
+                await _notify_command_event(conn, command_id)
 
 
 async def finish_command(
@@ -219,32 +306,73 @@ async def finish_command(
     message: str | None = None,
 ) -> bool:
     """Finaliza o comando; no-op se a API ja o marcou como expirado."""
-    outcome = await pool.execute(
-        """
-        UPDATE host_agent_commands
-        SET status = $3,
-            exit_code = $4,
-            error_code = $5,
-            stdout_tail = COALESCE($6, stdout_tail),
-            stderr_tail = COALESCE($7, stderr_tail),
-            result = COALESCE($8::jsonb, result),
-            message = COALESCE($9, message),
-            progress = CASE WHEN $3 = 'done' THEN 100 ELSE progress END,
-            finished_at = now(),
-            updated_at = now()
-        WHERE id = $1 AND worker_id = $2 AND status = 'running'
-        """,
-        command_id,
-        worker_id,
-        status,
-        exit_code,
-        error_code,
-        stdout_tail,
-        stderr_tail,
-        json.dumps(result) if result is not None else None,
-        message,
-    )
-    return outcome.endswith("1")
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            outcome = await conn.execute(
+                """
+                UPDATE host_agent_commands
+                SET status = $3,
+                    exit_code = $4,
+                    error_code = $5,
+                    stdout_tail = COALESCE($6, stdout_tail),
+                    stderr_tail = COALESCE($7, stderr_tail),
+                    result = COALESCE($8::jsonb, result),
+                    message = COALESCE($9, message),
+                    progress = CASE WHEN $3 = 'done' THEN 100 ELSE progress END,
+                    finished_at = now(),
+                    updated_at = now()
+                WHERE id = $1 AND worker_id = $2 AND status = 'running'
+                """,
+                command_id,
+                worker_id,
+                status,
+                exit_code,
+                error_code,
+                stdout_tail,
+                stderr_tail,
+                json.dumps(result) if result is not None else None,
+                message,
+            )
+            finished = outcome.endswith("1")
+            if finished:
+                await _notify_command_event(conn, command_id)
+    return finished
+
+
+async def append_log_chunk(
+    pool: asyncpg.Pool,
+    command_id: uuid.UUID,
+    worker_id: str,
+    seq: int,
+    data: str,
+    log_cursor: str | None,
+) -> bool:
+    """Publica um chunk de log; ``False`` se o comando nao esta mais ativo.
+
+    A API cancela o comando quando o leitor desconecta, e o agent usa o
+    retorno para encerrar o ``docker logs``.
+    """
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            outcome = await conn.execute(
+                """
+                INSERT INTO host_agent_log_chunks(command_id, seq, data, log_cursor)
+                SELECT $1, $3, $4, $5
+                WHERE EXISTS (
+                    SELECT 1 FROM host_agent_commands
+                    WHERE id = $1 AND worker_id = $2 AND status = 'running'
+                )
+                """,
+                command_id,
+                worker_id,
+                seq,
+                data,
+                log_cursor,
+            )
+            appended = outcome.endswith("1")
+            if appended:
+                await _notify_command_event(conn, command_id)
+    return appended
 
 
 async def reject_command(
@@ -254,21 +382,25 @@ async def reject_command(
     error_code: str,
     message: str,
 ) -> None:
-    await pool.execute(
-        """
-        UPDATE host_agent_commands
-        SET status = 'failed',
-            error_code = $3,
-            message = $4,
-            finished_at = now(),
-            updated_at = now()
-        WHERE id = $1 AND worker_id = $2 AND status = 'running'
-        """,
-        command_id,
-        worker_id,
-        error_code,
-        message,
-    )
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            outcome = await conn.execute(
+                """
+                UPDATE host_agent_commands
+                SET status = 'failed',
+                    error_code = $3,
+                    message = $4,
+                    finished_at = now(),
+                    updated_at = now()
+                WHERE id = $1 AND worker_id = $2 AND status = 'running'
+                """,
+                command_id,
+                worker_id,
+                error_code,
+                message,
+            )
+            if outcome.endswith("1"):
+                await _notify_command_event(conn, command_id)
 
 
 async def load_authorization_context(
@@ -343,6 +475,54 @@ async def fetch_project_names(pool: asyncpg.Pool) -> list[str]:
     return [row["name"] for row in rows]
 
 
+def _container_state_row(entry: dict[str, str]) -> tuple[Any, ...]:
+    return (
+        entry["container_name"],
+        entry["project"],
+        entry.get("state"),
+        entry.get("status"),
+        entry.get("image"),
+        entry.get("ports"),
+        entry.get("created_at_text"),
+    )
+
+
+async def apply_container_state_changes(
+    pool: asyncpg.Pool,
+    upserts: list[dict[str, str]],
+    deletes: list[str],
+) -> None:
+    """Aplica so as linhas que mudaram desde o ultimo snapshot conhecido."""
+    if not upserts and not deletes:
+        return
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            if deletes:
+                await conn.execute(
+                    "DELETE FROM project_container_state WHERE container_name = ANY($1::text[])",
+                    deletes,
+                )
+            if upserts:
+                await conn.executemany(
+                    """
+                    INSERT INTO project_container_state(
+                        container_name, project, state, status, image,
+                        ports, created_at_text, refreshed_at
+                    )
+                    VALUES($1, $2, $3, $4, $5, $6, $7, now())
+                    ON CONFLICT (container_name) DO UPDATE
+                    SET project = EXCLUDED.project,
+                        state = EXCLUDED.state,
+                        status = EXCLUDED.status,
+                        image = EXCLUDED.image,
+                        ports = EXCLUDED.ports,
+                        created_at_text = EXCLUDED.created_at_text,
+                        refreshed_at = now()
+                    """,
+                    [_container_state_row(entry) for entry in upserts],
+                )
+
+
 async def replace_container_state(
     pool: asyncpg.Pool,
     entries: list[dict[str, str]],
@@ -360,16 +540,5 @@ async def replace_container_state(
                     )
                     VALUES($1, $2, $3, $4, $5, $6, $7, now())
                     """,
-                    [
-                        (
-                            entry["container_name"],
-                            entry["project"],
-                            entry.get("state"),
-                            entry.get("status"),
-                            entry.get("image"),
-                            entry.get("ports"),
-                            entry.get("created_at_text"),
-                        )
-                        for entry in entries
-                    ],
+                    [_container_state_row(entry) for entry in entries],
                 )
@@ -27,8 +27,14 @@ from typing import Any
 
 PROTOCOL_VERSION = "v1"
 NOTIFY_CHANNEL = "host_agent_commands"
+# Sentido inverso: o agent avisa a API a cada lease, heartbeat e desfecho.
+# O payload e o id do comando.
+EVENTS_NOTIFY_CHANNEL = "host_agent_command_events"
 OUTPUT_TAIL_LIMIT = 8_000
 CONTAINER_LOGS_LIMIT = 256_000
+# Logs em streaming saem em chunks de ate ``LOG_CHUNK_LIMIT`` caracteres na
+# tabela unlogged ``host_agent_log_chunks``, nunca no JSONB ``result``.
+LOG_CHUNK_LIMIT = 64_000
 MAX_INTENT_AGE_SECONDS = 24 * 60 * 60
 
 # Timeout duro (em segundos) aplicado pelo agent a cada comando. O conjunto
@@ -48,10 +54,15 @@ COMMAND_TIMEOUTS: dict[str, int] = {
     "restore_project": 3_600,
     "delete_restore_point": 120,
     "container_logs": 60,
+    "container_logs_stream": 900,
 }
 
 HOST_AGENT_COMMANDS = frozenset(COMMAND_TIMEOUTS)
 
+# Leituras longas (follow de logs): nao serializam por projeto e tem um
+# limite de slots proprio no agent, para nao bloquear start/stop/backup.
+LOG_STREAM_COMMANDS = frozenset({"container_logs_stream"})
+
 # Tempo extra concedido apos SIGTERM antes do SIGKILL. Os scripts longos abaixo
 # tratam TERM executando rollback compensatorio (Compose + banco/tenants).
 COMMAND_TERM_GRACE: dict[str, int] = {
@@ -124,6 +135,10 @@ UUID_RE = re.compile(
     r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$"
 )
 MAX_LOG_LINES = 1_000
+# Timestamp RFC3339Nano do ``docker logs --timestamps``; e o cursor de logs.
+LOG_TIMESTAMP_RE = re.compile(
+    r"^[0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2}(\.[0-9]{1,9})?Z$"
+)
 
 
 def is_valid_uuid(raw: Any) -> bool:
@@ -231,8 +246,18 @@ def validate_command_args(command: str, project: str, args: dict[str, Any]) -> l
             errors.append("invalid_backup_id")
         if "tenant_uuid" in args and not is_valid_uuid(args.get("tenant_uuid")):
             errors.append("invalid_tenant_uuid")
-    elif command == "container_logs":
-        reject_unknown({"service", "lines"})
+    elif command in {"container_logs", "container_logs_stream"}:
+        if command == "container_logs":
+            reject_unknown({"service", "lines"})
+        else:
+            reject_unknown({"service", "lines", "since", "follow"})
+            since = args.get("since")
+            if since is not None and (
+                not isinstance(since, str) or not LOG_TIMESTAMP_RE.fullmatch(since)
+            ):
+                errors.append("invalid_since")
+            if not isinstance(args.get("follow", False), bool):
+                errors.append("invalid_follow")
         service = args.get("service")
         if not isinstance(service, str) or not re.fullmatch(
             r"[a-z][a-z0-9\-]{0,39}", service
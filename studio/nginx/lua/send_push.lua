@@ -41,7 +41,18 @@ d:update(to_sign)
 local sig = pk:sign(d)
 local jwt = to_sign .. "." .. b64url(sig)
 
+-- Timeouts (conexao, envio, leitura) de cada chamada ao Google e teto de
+-- envios simultaneos ao FCM por lote; o worker espelha os dois valores.
+local GOOGLE_TIMEOUTS_MS = {2000, 2000, 5000}
+local FCM_CONCURRENCY = 16
+-- Prazo do lote (budget_ms do worker, contado do inicio da requisicao):
+-- depois dele nenhum envio novo comeca, e o gateway responde antes de o
+-- worker desistir.
+local DEFAULT_BATCH_BUDGET_MS = 8000
+local MAX_BATCH_BUDGET_MS = 60000
+
 local httpc = http.new()
+httpc:set_timeouts(unpack(GOOGLE_TIMEOUTS_MS))
 local token_url = "https://oauth2.googleapis.com/token"
 local token_res, token_err = httpc:request_uri(token_url, outbound_tls.apply_public(token_url, {
     method = "POST",
@@ -58,34 +69,145 @@ end
 local token_data = cjson.decode(token_res.body)
 local access_token = token_data.access_token
 
-ngx.req.read_body()
-local req_body = cjson.decode(ngx.req.get_body_data())
-if not req_body or not req_body.token or not req_body.body then
+-- Lote: {project, items = [{id, token, body}, ...]} em uma unica requisicao
+-- assinada, com resultado por item. O formato antigo {token, body} continua
+-- aceito e responde com o corpo do FCM.
+local MAX_BATCH_ITEMS = 500
+
+local function read_request_body()
+    ngx.req.read_body()
+    local body = ngx.req.get_body_data()
+    if body then
+        return body
+    end
+    local body_file = ngx.req.get_body_file()
+    if not body_file then
+        return nil
+    end
+    local file = io.open(body_file, "rb")
+    if not file then
+        return nil
+    end
+    local data = file:read("*a")
+    file:close()
+    return data
+end
+
+local function valid_item(item)
+    return type(item) == "table"
+        and type(item.token) == "string" and item.token ~= ""
+        and type(item.body) == "string"
+end
+
+local fcm_url = "https://fcm.googleapis.com/v1/projects/" .. sa_data.project_id .. "/messages:send"
+
+local function send_fcm(item)
+    -- Cliente por chamada: light threads nao compartilham o objeto, mas a
+    -- conexao volta ao pool keep-alive do worker do Nginx.
+    local client = http.new()
+    client:set_timeouts(unpack(GOOGLE_TIMEOUTS_MS))
+    return client:request_uri(fcm_url, outbound_tls.apply_public(fcm_url, {
+        method = "POST",
+        body = cjson.encode({
+            message = {
+                token = item.token,
+                notification = {
+                    title = "Nova Notificação",
+                    body = item.body
+                }
+            }
+        }),
+        headers = {
+            ["Authorization"] = "Bearer " .. access_token,
+            ["Content-Type"] = "application/json"
+        },
+    }))
+end
+
+local req_body = cjson.decode(read_request_body() or "")
+if type(req_body) ~= "table" then
     ngx.status = 400
     ngx.say(cjson.encode({error="Invalid payload"}))
     return
 end
 
-local fcm_payload = cjson.encode({
-    message = {
-        token = req_body.token,
-        notification = {
-            title = "Nova Notificação",
-            body = req_body.body
-        }
-    }
-})
+ngx.header.content_type = "application/json"
 
-local fcm_url = "https://fcm.googleapis.com/v1/projects/" .. sa_data.project_id .. "/messages:send"
-local fcm_res, fcm_err = httpc:request_uri(fcm_url, outbound_tls.apply_public(fcm_url, {
-    method = "POST",
-    body = fcm_payload,
-    headers = {
-        ["Authorization"] = "Bearer " .. access_token,
-        ["Content-Type"] = "application/json"
-    },
-}))
+if req_body.items ~= nil then
+    local items = req_body.items
+    if type(items) ~= "table" or #items == 0 or #items > MAX_BATCH_ITEMS then
+        ngx.status = 400
+        ngx.say(cjson.encode({error="Invalid batch"}))
+        return
+    end
+
+    local budget_ms = tonumber(req_body.budget_ms) or DEFAULT_BATCH_BUDGET_MS
+    budget_ms = math.max(1000, math.min(budget_ms, MAX_BATCH_BUDGET_MS))
+    local deadline = ngx.req.start_time() + budget_ms / 1000
+
+    -- Ate FCM_CONCURRENCY envios simultaneos, cada light thread puxando o
+    -- proximo item; itens nao iniciados ate o prazo voltam como 503.
+    local results = {}
+    local next_index = 0
+
+    local function send_pending()
+        while true do
+            next_index = next_index + 1
+            local index = next_index
+            if index > #items then
+                return
+            end
+
+            local item = items[index]
+            local item_id = type(item) == "table" and item.id or nil
+            ngx.update_time()
+            if ngx.now() >= deadline then
+                results[index] = {id = item_id, ok = false, status = 503, error = "batch budget exceeded"}
+            elseif not valid_item(item) then
+                results[index] = {id = item_id, ok = false, status = 400}
+            else
+                local fcm_res, fcm_err = send_fcm(item)
+                local status = fcm_res and fcm_res.status or 502
+                results[index] = {
+                    id = item_id,
+                    ok = status == 200 or status == 201,
+                    status = status,
+                    error = fcm_res == nil and fcm_err or nil,
+                }
+            end
+        end
+    end
+
+    local senders = {}
+    for position = 1, math.min(FCM_CONCURRENCY, #items) do
+        senders[position] = ngx.thread.spawn(send_pending)
+    end
+    for _, sender in ipairs(senders) do
+        local sender_ok, sender_err = ngx.thread.wait(sender)
+        if not sender_ok then
+            ngx.log(ngx.ERR, "send_push: envio do lote falhou: ", tostring(sender_err))
+        end
+    end
+
+    for index, item in ipairs(items) do
+        if results[index] == nil then
+            local item_id = type(item) == "table" and item.id or nil
+            results[index] = {id = item_id, ok = false, status = 502}
+        end
+    end
+
+    ngx.status = 200
+    ngx.say(cjson.encode({results = results}))
+    return
+end
+
+if not valid_item(req_body) then
+    ngx.status = 400
+    ngx.say(cjson.encode({error="Invalid payload"}))
+    return
+end
+
+local fcm_res, fcm_err = send_fcm(req_body)
 
 ngx.status = fcm_res and fcm_res.status or 500
-ngx.header.content_type = "application/json"
 ngx.say(fcm_res and fcm_res.body or cjson.encode({error=fcm_err}))
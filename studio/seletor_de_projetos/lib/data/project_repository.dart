@@ -407,11 +407,13 @@ class ProjectRepository {
     required String period,
     DateTime? start,
     DateTime? end,
+    String? cursor,
   }) async {
     final query = <String, String>{
       'period': period,
       if (start != null) 'start': start.toUtc().toIso8601String(),
       if (end != null) 'end': end.toUtc().toIso8601String(),
+      if (cursor != null) 'cursor': cursor,
     };
     final uri = Uri(
       path: '/api/projects/$ref/telemetry/users',
@@ -41,6 +41,7 @@ class ProjectUserTelemetry {
     required this.totalSessions,
     required this.users,
     required this.sessionsAreCurrentRecords,
+    this.nextCursor,
   });
 
   final String project;
@@ -51,6 +52,21 @@ class ProjectUserTelemetry {
   final int totalSessions;
   final List<ProjectTelemetryUser> users;
   final bool sessionsAreCurrentRecords;
+  final String? nextCursor;
+
+  ProjectUserTelemetry appendPage(ProjectUserTelemetry page) {
+    return ProjectUserTelemetry(
+      project: project,
+      period: period,
+      start: start,
+      end: end,
+      activeUsers: activeUsers,
+      totalSessions: totalSessions,
+      users: [...users, ...page.users],
+      sessionsAreCurrentRecords: sessionsAreCurrentRecords,
+      nextCursor: page.nextCursor,
+    );
+  }
 
   factory ProjectUserTelemetry.fromJson(Map<String, dynamic> json) {
     final rawUsers = json['users'] as List<dynamic>? ?? const [];
@@ -69,6 +85,7 @@ class ProjectUserTelemetry {
           )
           .toList(),
       sessionsAreCurrentRecords: json['sessions_are_current_records'] == true,
+      nextCursor: json['next_cursor']?.toString(),
     );
   }
 }
@@ -23,6 +23,9 @@ class _UserTelemetrySectionState extends ConsumerState<UserTelemetrySection> {
   ProjectUserTelemetry? _telemetry;
   String? _error;
   bool _loading = true;
+  bool _loadingMore = false;
+  DateTime? _start;
+  DateTime? _end;
 
   @override
   void initState() {
@@ -64,7 +67,11 @@ class _UserTelemetrySectionState extends ConsumerState<UserTelemetrySection> {
                 end: end,
               );
       if (!mounted) return;
-      setState(() => _telemetry = telemetry);
+      setState(() {
+        _telemetry = telemetry;
+        _start = start;
+        _end = end;
+      });
     } catch (err) {
       if (!mounted) return;
       setState(() {
@@ -76,6 +83,29 @@ class _UserTelemetrySectionState extends ConsumerState<UserTelemetrySection> {
     }
   }
 
+  Future<void> _loadMore() async {
+    final current = _telemetry;
+    if (current == null || current.nextCursor == null || _loadingMore) return;
+    setState(() => _loadingMore = true);
+    try {
+      final page =
+          await ref.read(projectRepositoryProvider).fetchProjectUserTelemetry(
+                widget.projectRef,
+                period: _period,
+                start: _start,
+                end: _end,
+                cursor: current.nextCursor,
+              );
+      if (!mounted) return;
+      setState(() => _telemetry = current.appendPage(page));
+    } catch (err) {
+      if (!mounted) return;
+      setState(() => _error = err.toString().replaceFirst('Exception: ', ''));
+    } finally {
+      if (mounted) setState(() => _loadingMore = false);
+    }
+  }
+
   Future<void> _selectPeriod(String period) async {
     if (period != 'custom') {
       setState(() => _period = period);
@@ -237,11 +267,22 @@ class _UserTelemetrySectionState extends ConsumerState<UserTelemetrySection> {
               itemBuilder: (_, index) => _userRow(telemetry.users[index]),
             ),
           ),
+        if (telemetry.nextCursor != null)
+          Align(
+            alignment: Alignment.centerRight,
+            child: TextButton(
+              onPressed: _loadingMore ? null : _loadMore,
+              child: Text(_loadingMore ? 'Carregando...' : 'Carregar mais'),
+            ),
+          ),
         const SizedBox(height: 10),
-        const Text(
-          'A contagem usa os registros atuais de auth.sessions. Sessoes '
-          'expiradas ou removidas podem nao aparecer no total.',
-          style: TextStyle(
+        Text(
+          telemetry.sessionsAreCurrentRecords
+              ? 'A contagem usa os registros atuais de auth.sessions. Sessoes '
+                  'expiradas ou removidas podem nao aparecer no total.'
+              : 'Periodos longos usam a consolidacao diaria (UTC) ate a '
+                  'ultima hora fechada.',
+          style: const TextStyle(
             color: SupabaseColors.textMuted,
             fontSize: 11,
             height: 1.4,
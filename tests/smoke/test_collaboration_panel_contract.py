@@ -0,0 +1,92 @@
+"""Contrato do painel de colaboracao: um round trip, ETag e modo delta."""
+
+from __future__ import annotations
+
+import pathlib
+import re
+import unittest
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+API_APP = ROOT / "servidor" / "api-internal" / "app"
+
+
+def read(name: str) -> str:
+    return (API_APP / name).read_text(encoding="utf-8")
+
+
+def route(source: str, function_name: str) -> str:
+    start = source.index(f"def {function_name}(")
+    match = re.compile(r"\n(@(app|router)\.|async def |def )").search(source, start + 1)
+    return source[start:match.start() if match else len(source)]
+
+
+class CollaborationPanelContractTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.collaboration = read("routers/collaboration.py")
+        self.body = route(self.collaboration, "get_project_collaboration")
+
+    def test_panel_is_built_by_a_single_statement(self) -> None:
+        self.assertEqual(self.body.count("await conn.fetchval("), 1)
+        self.assertNotIn("await conn.fetch(", self.body)
+        self.assertIn("_COLLABORATION_PANEL_SQL", self.body)
+        for section in (
+            "'available_tags'",
+            "'members'",
+            "'notes'",
+            "'hints'",
+            "'thread_messages'",
+            "'notifications'",
+            "'deleted'",
+        ):
+            self.assertIn(section, self.collaboration)
+        self.assertEqual(self.collaboration.count("json_agg("), 7)
+
+    def test_unchanged_panel_answers_304_from_change_counters(self) -> None:
+        self.assertIn('request.headers.get("if-none-match")', self.body)
+        self.assertIn("_COLLABORATION_STATE_SQL", self.body)
+        self.assertIn("status_code=304", self.body)
+        self.assertIn('response.headers["ETag"]', self.body)
+        self.assertIn('"private, no-cache"', self.body)
+        etag = route(self.collaboration, "_collaboration_etag")
+        for part in ("version", "tags_version", 'auth_user["db_user_id"]', "project_role"):
+            self.assertIn(part, etag)
+
+    def test_since_cursor_selects_only_changed_items(self) -> None:
+        self.assertIn("since: str | None = Query(", self.body)
+        self.assertIn("_parse_collaboration_cursor(since)", self.body)
+        self.assertIn('"cursor": f"{panel[\'version\']}:{panel[\'tags_version\']}"', self.body)
+        self.assertIn("studio_project_collaboration_changes c", self.collaboration)
+        self.assertIn("NOT 'panel' = ANY(state.changed_sections)", self.collaboration)
+        self.assertIn("raise HTTPException(422", route(self.collaboration, "_parse_collaboration_cursor"))
+
+    def test_delta_reports_hidden_items_and_reloads_on_own_role_change(self) -> None:
+        self.assertIn("AND c.item_id = $2::uuid::text", self.collaboration)
+        self.assertIn("AND NOT state.own_member_changed", self.collaboration)
+        deleted = self.collaboration[self.collaboration.index("'deleted', ("):]
+        self.assertIn("section = 'notes'", deleted)
+        self.assertIn("NOT EXISTS", deleted)
+        self.assertIn("n.author_user_id = $2", deleted)
+
+    def test_schema_versions_every_panel_source(self) -> None:
+        schema = read("database_schema.py")
+        self.assertIn("CREATE TABLE IF NOT EXISTS studio_project_collaboration_versions", schema)
+        self.assertIn("CREATE TABLE IF NOT EXISTS studio_project_collaboration_changes", schema)
+        self.assertIn("CREATE SEQUENCE IF NOT EXISTS studio_project_tags_version_seq", schema)
+        for table in (
+            "studio_project_notes",
+            "studio_project_hints",
+            "studio_project_thread_messages",
+            "studio_project_notifications",
+            "studio_project_tag_assignments",
+            "project_members",
+        ):
+            self.assertIn(f"['{table}', ", schema)
+        self.assertIn("CREATE TRIGGER users_collaboration_version", schema)
+        self.assertIn("CREATE TRIGGER studio_project_tags_version", schema)
+        # Cascata do DELETE do projeto nao pode violar a FK dos contadores.
+        self.assertIn("IF NOT EXISTS (SELECT 1 FROM projects WHERE id = target)", schema)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+"""Lanes do pool do control plane: jobs longos nao atrasam as rotas."""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+import types
+import unittest
+from pathlib import Path
+from unittest import mock
+
+
+API_ROOT = Path(__file__).resolve().parents[2] / "servidor" / "api-internal"
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+try:
+    import asyncpg  # noqa: F401
+except ModuleNotFoundError:  # pragma: no cover - depende do ambiente
+    database = None
+else:
+    from app import database
+
+
+class FakeConnection:
+    def __init__(self) -> None:
+        self.loggers = []
+
+    def add_query_logger(self, callback) -> None:
+        self.loggers.append(callback)
+
+    async def fetchval(self, _query, *_args, column=0, timeout=None):
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        record = types.SimpleNamespace(
+            elapsed=time.perf_counter() - started, exception=None
+        )
+        for callback in self.loggers:
+            callback(record)
+        return 1
+
+
+class FakePool:
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.slots = asyncio.Semaphore(max_size)
+        self.connections: list[FakeConnection] = []
+        self.idle: list[FakeConnection] = []
+        self.init = None
+
+    def acquire(self, *, timeout=None):
+        pool = self
+
+        class _Acquire:
+            async def __aenter__(self):
+                await pool.slots.acquire()
+                if pool.idle:
+                    self.connection = pool.idle.pop()
+                else:
+                    self.connection = FakeConnection()
+                    pool.connections.append(self.connection)
+                    await pool.init(self.connection)
+                return self.connection
+
+            async def __aexit__(self, *_exc):
+                pool.idle.append(self.connection)
+                pool.slots.release()
+                return False
+
+        return _Acquire()
+
+    def get_size(self) -> int:
+        return len(self.connections)
+
+    def get_idle_size(self) -> int:
+        return len(self.idle)
+
+    def get_min_size(self) -> int:
+        return 0
+
+    def get_max_size(self) -> int:
+        return self.max_size
+
+    async def close(self) -> None:
+        self.connections.clear()
+
+
+@unittest.skipIf(database is None, "asyncpg indisponivel")
+class PoolLaneLoadTest(unittest.IsolatedAsyncioTestCase):
+    BACKUPS = 8
+    REQUESTS = 300
+
+    async def asyncTearDown(self) -> None:
+        await database.close_pool()
+
+    async def test_concurrent_backups_do_not_starve_studio_polling(self) -> None:
+        async def fake_create_pool(_dsn, *, min_size, max_size, init):
+            pool = FakePool(max_size)
+            pool.init = init
+            return pool
+
+        with mock.patch.object(database.asyncpg, "create_pool", fake_create_pool):
+            await database.initialize_pool(
+                "postgresql://example",
+                max_size=4,
+                background_max_size=2,
+            )
+
+        async def backup() -> None:
+            # Fases longas seguram a conexao, como o antigo advisory lock.
+            pool = await database.get_pool()
+            async with pool.acquire() as conn:
+                await conn.fetchval("SELECT 1")
+                await asyncio.sleep(0.05)
+
+        async def background_jobs() -> None:
+            database.use_background_lane()
+            await asyncio.gather(*(backup() for _ in range(self.BACKUPS)))
+
+        latencies: list[float] = []
+
+        async def studio_poll() -> None:
+            started = time.perf_counter()
+            pool = await database.get_pool()
+            await pool.fetchval("SELECT 1")
+            latencies.append(time.perf_counter() - started)
+
+        jobs = asyncio.create_task(background_jobs())
+        await asyncio.sleep(0)
+        for _ in range(self.REQUESTS // 10):
+            await asyncio.gather(*(studio_poll() for _ in range(10)))
+        await jobs
+
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        self.assertLess(p99, 0.05)
+
+        metrics = database.pool_metrics()
+        requests, background = metrics["requests"], metrics["background"]
+        self.assertEqual(requests["acquires"], self.REQUESTS)
+        self.assertEqual(requests["statements"], self.REQUESTS)
+        self.assertLessEqual(requests["in_use_peak"], 4)
+        self.assertEqual(requests["in_use"], 0)
+        self.assertEqual(background["acquires"], self.BACKUPS)
+        self.assertEqual(background["in_use_peak"], 2)
+        self.assertGreater(background["acquire_wait_max_ms"], 40)
+
+    async def test_request_lane_is_the_default(self) -> None:
+        async def fake_create_pool(_dsn, *, min_size, max_size, init):
+            return FakePool(max_size)
+
+        with mock.patch.object(database.asyncpg, "create_pool", fake_create_pool):
+            requests = await database.initialize_pool("postgresql://example")
+        self.assertIs(await database.get_pool(), requests)
+        self.assertEqual(requests.name, database.REQUEST_LANE)
+        self.assertIsNot(await database.get_background_pool(), requests)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+"""Start/stop/restart do host-agent: tiers em paralelo e espera por readiness."""
+
+from __future__ import annotations
+
+import asyncio
+import pathlib
+import sys
+import time
+import unittest
+from unittest import mock
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+AGENT_ROOT = ROOT / "servidor" / "host-agent"
+if str(AGENT_ROOT) not in sys.path:
+    sys.path.insert(0, str(AGENT_ROOT))
+
+from hostagent import commands
+
+
+PROJECT = "alpha"
+SERVICES = ["nginx", "storage", "imgproxy", "rest", "auth", "meta", "analytics"]
+ACTION_SECONDS = 0.05
+
+
+def project_containers(state: str = "exited") -> list[dict[str, str]]:
+    return [{"Names": f"supabase-{service}-{PROJECT}", "State": state} for service in SERVICES]
+
+
+class FakeDocker:
+    def __init__(self, *, health_delay: float = 0.0) -> None:
+        self.events: list[tuple[str, str, float]] = []
+        self.running = 0
+        self.max_running = 0
+        self.ready_at: dict[str, float] = {}
+        self.health_delay = health_delay
+
+    async def run_short(self, argv: list[str], timeout: float = 30.0) -> tuple[int, str, str]:
+        if argv[1] == "inspect":
+            now = time.monotonic()
+            lines = []
+            for name in argv[4:]:
+                healthy = now >= self.ready_at.get(name, 0.0)
+                lines.append(f"/{name} running {'healthy' if healthy else 'starting'}")
+            return 0, "\n".join(lines), ""
+        name = argv[-1]
+        self.events.append(("begin", name, time.monotonic()))
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(ACTION_SECONDS)
+        self.running -= 1
+        self.ready_at[name] = time.monotonic() + self.health_delay
+        self.events.append(("end", name, time.monotonic()))
+        return 0, "", ""
+
+    def moment(self, kind: str, service: str) -> float:
+        name = f"supabase-{service}-{PROJECT}"
+        return next(at for event, event_name, at in self.events if event == kind and event_name == name)
+
+
+def context() -> commands.CommandContext:
+    return commands.CommandContext(
+        config=None,
+        state=commands.RunningCommandState(),
+        timeout_seconds=600,
+        command="restart_project",
+    )
+
+
+class ContainerActionTest(unittest.IsolatedAsyncioTestCase):
+    async def run_action(self, handler, docker: FakeDocker, containers) -> tuple[commands.CommandOutcome, commands.CommandContext]:
+        ctx = context()
+        with mock.patch.object(commands, "_run_short", docker.run_short), mock.patch.object(
+            commands, "list_project_containers", mock.AsyncMock(return_value=containers)
+        ), mock.patch.object(commands, "READINESS_POLL_INTERVAL", 0.01):
+            outcome = await handler(ctx, PROJECT, {})
+        return outcome, ctx
+
+    async def test_restart_takes_the_dependency_chain_not_the_sum(self) -> None:
+        docker = FakeDocker()
+        started = time.monotonic()
+        outcome, _ = await self.run_action(commands.handle_restart_project, docker, project_containers("running"))
+        elapsed = time.monotonic() - started
+        self.assertEqual(outcome.status, "done")
+        self.assertEqual(len(outcome.result["containers"]), len(SERVICES))
+        # 4 tiers (base, storage, nginx, extras) em vez de 7 acoes em serie.
+        self.assertLess(elapsed, ACTION_SECONDS * 6)
+        self.assertEqual(docker.max_running, 4)
+
+    async def test_later_tiers_wait_for_health_of_the_previous_tier(self) -> None:
+        docker = FakeDocker(health_delay=0.1)
+        outcome, _ = await self.run_action(commands.handle_start_project, docker, project_containers())
+        self.assertEqual(outcome.status, "done")
+        for service in ("meta", "auth", "rest", "imgproxy"):
+            self.assertGreaterEqual(
+                docker.moment("begin", "storage"),
+                docker.moment("end", service) + 0.1 - 0.01,
+            )
+        self.assertGreater(docker.moment("begin", "nginx"), docker.moment("end", "storage"))
+
+    async def test_stop_runs_the_tiers_in_reverse(self) -> None:
+        docker = FakeDocker()
+        outcome, _ = await self.run_action(commands.handle_stop_project, docker, project_containers("running"))
+        self.assertEqual(outcome.status, "done")
+        self.assertLess(docker.moment("end", "nginx"), docker.moment("begin", "storage"))
+        self.assertLess(docker.moment("end", "storage"), docker.moment("begin", "auth"))
+
+    async def test_progress_is_reported_per_container(self) -> None:
+        docker = FakeDocker()
+        with mock.patch.object(commands.RunningCommandState, "report", autospec=True) as report:
+            await self.run_action(commands.handle_restart_project, docker, project_containers("running"))
+        steps = {call.kwargs["step"] for call in report.call_args_list}
+        self.assertEqual(steps, {f"restart:supabase-{service}-{PROJECT}" for service in SERVICES})
+
+    async def test_unhealthy_containers_are_reported_without_blocking_forever(self) -> None:
+        docker = FakeDocker(health_delay=60)
+        with mock.patch.object(commands, "READINESS_TIMEOUT", 0.05):
+            outcome, _ = await self.run_action(commands.handle_start_project, docker, project_containers())
+        self.assertEqual(outcome.status, "done")
+        self.assertEqual(len(outcome.result["not_ready"]), len(SERVICES))
+
+    def test_service_is_parsed_from_the_container_name(self) -> None:
+        # Nome do projeto contendo outro servico nao muda o tier.
+        self.assertEqual(commands.project_container_service("supabase-storage-authapp", "authapp"), "storage")
+        tiers = commands.group_project_containers(
+            [{"Names": "supabase-nginx-authapp"}, {"Names": "supabase-auth-authapp"}],
+            "authapp",
+        )
+        self.assertEqual([[entry["Names"] for entry in tier] for tier in tiers], [["supabase-auth-authapp"], ["supabase-nginx-authapp"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
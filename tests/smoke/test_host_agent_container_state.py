@@ -0,0 +1,280 @@
+"""Estado de containers do host-agent: indice por sufixo, diffs e lookups."""
+
+from __future__ import annotations
+
+import pathlib
+import sys
+import unittest
+from unittest import mock
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+AGENT_ROOT = ROOT / "servidor" / "host-agent"
+if str(AGENT_ROOT) not in sys.path:
+    sys.path.insert(0, str(AGENT_ROOT))
+
+try:
+    import asyncpg  # noqa: F401
+except ModuleNotFoundError:  # pragma: no cover - depende do ambiente
+    container_state = None
+    match_project = None
+else:
+    from hostagent import commands, container_state
+    from hostagent.commands import match_project
+
+
+def container(container_id: str, name: str, state: str = "running") -> dict[str, str]:
+    return {
+        "ID": container_id,
+        "Names": name,
+        "State": state,
+        "Status": "Up" if state == "running" else "Exited (0)",
+        "Image": "img",
+        "Ports": "",
+        "CreatedAt": "2026-01-01",
+    }
+
+
+@unittest.skipIf(container_state is None, "asyncpg indisponivel")
+class ProjectSuffixMatchTest(unittest.TestCase):
+    def test_suffix_lookup_agrees_with_regex_match(self) -> None:
+        projects = {"alpha", "beta", "alpha-beta", "x1"}
+        names = [
+            "supabase-db-alpha",
+            "supabase-db-beta",
+            "supabase-db-alpha-beta",
+            "supabase-auth-x1",
+            "supabase-db-alphax",
+            "alpha",
+            "realtime-dev.supabase-realtime-beta",
+        ]
+        for name in names:
+            expected = {p for p in projects if match_project({"Names": name}, p)}
+            found = container_state.project_for_container([name], projects)
+            if expected:
+                self.assertIn(found, expected, name)
+                self.assertEqual(found, max(expected, key=len), name)
+            else:
+                self.assertIsNone(found, name)
+
+
+@unittest.skipIf(container_state is None, "asyncpg indisponivel")
+class ContainerStateIndexTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.index = container_state.ContainerStateIndex()
+        self.index.reset(
+            {"alpha", "beta"},
+            [
+                container("aaaaaaaaaaaa", "supabase-db-alpha"),
+                container("bbbbbbbbbbbb", "supabase-db-beta"),
+                container("cccccccccccc", "unrelated"),
+            ],
+        )
+
+    def test_snapshot_keeps_only_project_containers(self) -> None:
+        self.assertEqual(
+            sorted(entry["container_name"] for entry in self.index.entries.values()),
+            ["supabase-db-alpha", "supabase-db-beta"],
+        )
+
+    def test_only_changed_rows_are_written(self) -> None:
+        upserts, deletes = self.index.update(
+            ["aaaaaaaaaaaa0000", "bbbbbbbbbbbb"],
+            [
+                container("aaaaaaaaaaaa", "supabase-db-alpha", "exited"),
+                container("bbbbbbbbbbbb", "supabase-db-beta"),
+            ],
+        )
+        self.assertEqual([entry["state"] for entry in upserts], ["exited"])
+        self.assertEqual(deletes, [])
+
+    def test_destroy_and_rename_delete_the_old_row(self) -> None:
+        upserts, deletes = self.index.update(
+            ["aaaaaaaaaaaa", "bbbbbbbbbbbb"],
+            [container("bbbbbbbbbbbb", "supabase-db-alpha-old")],
+        )
+        self.assertEqual(upserts, [])
+        self.assertEqual(sorted(deletes), ["supabase-db-alpha", "supabase-db-beta"])
+
+    def test_recreated_container_keeps_the_reused_name(self) -> None:
+        upserts, deletes = self.index.update(
+            ["dddddddddddd"],
+            [container("dddddddddddd", "supabase-db-alpha")],
+        )
+        self.assertEqual([entry["container_name"] for entry in upserts], ["supabase-db-alpha"])
+        upserts, deletes = self.index.update(["aaaaaaaaaaaa"], [])
+        self.assertEqual((upserts, deletes), ([], []))
+
+
+class _FakeStdout:
+    def __init__(self, lines: list[bytes]) -> None:
+        self.lines = list(lines)
+
+    async def readline(self) -> bytes:
+        return self.lines.pop(0) if self.lines else b""
+
+
+class _FakeProcess:
+    def __init__(self, lines: list[bytes]) -> None:
+        self.stdout = _FakeStdout(lines)
+        self.returncode = 0
+
+
+@unittest.skipIf(container_state is None, "asyncpg indisponivel")
+class ContainerStateTrackerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_events_mark_containers_dirty_and_push_only_diffs(self) -> None:
+        tracker = container_state.ContainerStateTracker(
+            object(), resync_interval=300, retry_interval=10
+        )
+        tracker.index.reset({"alpha"}, [container("aaaaaaaaaaaa", "supabase-db-alpha")])
+        events = [
+            b'{"Type":"container","Action":"exec_start: pg_isready","id":"aaaaaaaaaaaa1111"}\n',
+            b'{"Type":"container","Action":"die","id":"aaaaaaaaaaaa1111"}\n',
+            b"not json\n",
+        ]
+
+        async def fake_events():
+            return _FakeProcess(events)
+
+        with mock.patch.object(container_state, "docker_container_events", fake_events):
+            await tracker._follow_events()
+        self.assertEqual(tracker._dirty, {"aaaaaaaaaaaa"})
+
+        applied: list[tuple] = []
+
+        async def fake_ps(ids):
+            self.assertEqual(ids, ["aaaaaaaaaaaa"])
+            return [container("aaaaaaaaaaaa", "supabase-db-alpha", "exited")]
+
+        async def fake_apply(_pool, upserts, deletes):
+            applied.append((upserts, deletes))
+
+        with (
+            mock.patch.object(container_state, "docker_ps_by_ids", fake_ps),
+            mock.patch.object(container_state.db, "apply_container_state_changes", fake_apply),
+        ):
+            await tracker.refresh_dirty()
+
+        self.assertEqual(len(applied), 1)
+        upserts, deletes = applied[0]
+        self.assertEqual([(e["container_name"], e["state"]) for e in upserts], [("supabase-db-alpha", "exited")])
+        self.assertEqual(deletes, [])
+        self.assertEqual(tracker._dirty, set())
+
+    async def test_resync_clears_only_the_dirty_ids_it_covered(self) -> None:
+        tracker = container_state.ContainerStateTracker(
+            object(), resync_interval=300, retry_interval=10
+        )
+        tracker._streaming = True
+        tracker.mark_dirty("aaaaaaaaaaaa")
+
+        async def fake_projects(_pool):
+            return {"alpha"}
+
+        async def fake_ps_all():
+            # Evento que chega durante o snapshot continua pendente.
+            tracker.mark_dirty("bbbbbbbbbbbb")
+            return [container("aaaaaaaaaaaa", "supabase-db-alpha")]
+
+        async def fake_replace(_pool, _entries):
+            return None
+
+        with (
+            mock.patch.object(container_state.db, "fetch_project_names", fake_projects),
+            mock.patch.object(container_state, "docker_ps_all", fake_ps_all),
+            mock.patch.object(container_state.db, "replace_container_state", fake_replace),
+        ):
+            await tracker.resync()
+        self.assertEqual(tracker._dirty, {"bbbbbbbbbbbb"})
+
+    def test_agent_no_longer_rescans_after_every_command(self) -> None:
+        agent = (AGENT_ROOT / "hostagent" / "agent.py").read_text(encoding="utf-8")
+        self.assertNotIn("docker_ps_all", agent)
+        self.assertNotIn("replace_container_state", agent)
+        self.assertIn("request_project_refresh()", agent)
+
+
+@unittest.skipIf(container_state is None, "asyncpg indisponivel")
+class CachedProjectLookupTest(unittest.IsolatedAsyncioTestCase):
+    def tracker(self):
+        tracker = container_state.ContainerStateTracker(
+            object(), resync_interval=300, retry_interval=10
+        )
+        tracker.index.reset(
+            {"alpha", "beta"},
+            [
+                container("aaaaaaaaaaaa", "supabase-db-alpha"),
+                container("a2a2a2a2a2a2", "supabase-auth-alpha"),
+                container("bbbbbbbbbbbb", "supabase-db-beta"),
+            ],
+        )
+        tracker._needs_resync = False
+        tracker._streaming = True
+        return tracker
+
+    def test_snapshot_is_only_trusted_while_streaming_and_settled(self) -> None:
+        tracker = self.tracker()
+        self.assertEqual(
+            tracker.project_container_ids("alpha"), ["a2a2a2a2a2a2", "aaaaaaaaaaaa"]
+        )
+        self.assertIsNone(tracker.project_container_ids("gamma"))
+        tracker.mark_dirty("cccccccccccc")
+        self.assertIsNone(tracker.project_container_ids("alpha"))
+        tracker._clear_dirty(["cccccccccccc"])
+        tracker._streaming = False
+        self.assertIsNone(tracker.project_container_ids("alpha"))
+
+    def test_dirty_containers_only_bypass_the_snapshot_of_their_project(self) -> None:
+        tracker = self.tracker()
+        tracker.mark_dirty("bbbbbbbbbbbb")
+        self.assertEqual(
+            tracker.project_container_ids("alpha"), ["a2a2a2a2a2a2", "aaaaaaaaaaaa"]
+        )
+        self.assertIsNone(tracker.project_container_ids("beta"))
+        tracker.mark_dirty("dddddddddddd", "supabase-rest-alpha")
+        tracker.mark_dirty("eeeeeeeeeeee", "some-other-service")
+        self.assertIsNone(tracker.project_container_ids("alpha"))
+        tracker._clear_dirty(["bbbbbbbbbbbb"])
+        self.assertEqual(tracker.project_container_ids("beta"), ["bbbbbbbbbbbb"])
+        # Renomeado para outro projeto: afeta o antigo e o novo.
+        tracker.mark_dirty("aaaaaaaaaaaa", "supabase-db-beta")
+        self.assertIsNone(tracker.project_container_ids("beta"))
+
+    async def test_project_lookup_reads_only_cached_ids(self) -> None:
+        tracker = self.tracker()
+        calls: list[list[str]] = []
+
+        async def fake_by_ids(ids):
+            calls.append(ids)
+            return [container("aaaaaaaaaaaa", "supabase-db-alpha")]
+
+        async def forbidden_full_scan():
+            raise AssertionError("docker ps -a completo nao deveria rodar")
+
+        with (
+            mock.patch.object(commands, "docker_ps_by_ids", fake_by_ids),
+            mock.patch.object(commands, "docker_ps_all", forbidden_full_scan),
+        ):
+            found = await commands.list_project_containers(
+                "alpha", tracker.project_container_ids("alpha")
+            )
+        self.assertEqual(calls, [["a2a2a2a2a2a2", "aaaaaaaaaaaa"]])
+        self.assertEqual([entry["Names"] for entry in found], ["supabase-db-alpha"])
+
+    async def test_empty_cached_lookup_falls_back_to_full_scan(self) -> None:
+        async def fake_by_ids(_ids):
+            return []
+
+        async def full_scan():
+            return [container("eeeeeeeeeeee", "supabase-db-alpha")]
+
+        with (
+            mock.patch.object(commands, "docker_ps_by_ids", fake_by_ids),
+            mock.patch.object(commands, "docker_ps_all", full_scan),
+        ):
+            found = await commands.list_project_containers("alpha", ["aaaaaaaaaaaa"])
+        self.assertEqual([entry["ID"] for entry in found], ["eeeeeeeeeeee"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -16,6 +16,7 @@ import sys
 import tempfile
 import types
 import unittest
+import uuid
 from unittest import mock
 
 
@@ -259,6 +260,14 @@ class ClosedCommandSetTest(unittest.TestCase):
             }),
             ("container_logs", "meuprojeto", {"service": "auth", "lines": 100000}),
             ("container_logs", "meuprojeto", {"service": "auth/../db", "lines": 10}),
+            ("container_logs", "meuprojeto", {"service": "auth", "lines": 10, "follow": True}),
+            ("container_logs_stream", "meuprojeto", {
+                "service": "auth", "lines": 10, "since": "ontem; rm -rf /",
+            }),
+            ("container_logs_stream", "meuprojeto", {
+                "service": "auth", "lines": 10, "follow": "yes",
+            }),
+            ("container_logs_stream", "meuprojeto", {"service": "auth", "lines": 0}),
             ("start_project", "meuprojeto", {"extra": True}),
             ("backup_project", "meuprojeto", {"backup_id": "../escape"}),
             ("backup_project", "meuprojeto", {}),
@@ -300,6 +309,13 @@ class ClosedCommandSetTest(unittest.TestCase):
             }),
             ("rename_project", "meuprojeto", {"new_name": "novo_nome"}),
             ("container_logs", "meuprojeto", {"service": "auth", "lines": 100}),
+            ("container_logs_stream", "meuprojeto", {"service": "auth", "lines": 100}),
+            ("container_logs_stream", "meuprojeto", {
+                "service": "rest",
+                "lines": 100,
+                "follow": True,
+                "since": "2026-10-17T12:30:01.123456789Z",
+            }),
             ("backup_project", "meuprojeto", {
                 "backup_id": tenant_uuid,
                 "tenant_uuid": tenant_uuid,
@@ -337,6 +353,86 @@ class LeaseSqlTypingTest(unittest.TestCase):
         )
 
 
+class _FakeTransaction:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_exc):
+        return False
+
+
+class _FakeConnection:
+    def __init__(self, outcome: str) -> None:
+        self.outcome = outcome
+        self.statements: list[tuple[str, tuple]] = []
+
+    def transaction(self):
+        return _FakeTransaction()
+
+    async def execute(self, query, *args):
+        self.statements.append((query, args))
+        return self.outcome if "UPDATE" in query else "SELECT 1"
+
+
+class _FakePool:
+    def __init__(self, conn: _FakeConnection) -> None:
+        self.conn = conn
+
+    def acquire(self):
+        conn = self.conn
+
+        class _Acquire:
+            async def __aenter__(self):
+                return conn
+
+            async def __aexit__(self, *_exc):
+                return False
+
+        return _Acquire()
+
+
+class CommandEventNotifyTest(unittest.IsolatedAsyncioTestCase):
+    async def test_finish_notifies_the_api_only_when_the_row_changed(self) -> None:
+        command_id = uuid.uuid4()
+        finished = _FakeConnection("UPDATE 1")
+        self.assertTrue(
+            await agent_db.finish_command(
+                _FakePool(finished), command_id, "worker", status="done"
+            )
+        )
+        notify = finished.statements[-1]
+        self.assertIn("pg_notify", notify[0])
+        self.assertEqual(
+            notify[1], (protocol.EVENTS_NOTIFY_CHANNEL, str(command_id))
+        )
+
+        stale = _FakeConnection("UPDATE 0")
+        self.assertFalse(
+            await agent_db.finish_command(
+                _FakePool(stale), command_id, "worker", status="done"
+            )
+        )
+        self.assertFalse(any("pg_notify" in query for query, _ in stale.statements))
+
+    async def test_heartbeat_notifies_progress(self) -> None:
+        conn = _FakeConnection("UPDATE 1")
+        await agent_db.heartbeat_command(
+            _FakePool(conn), uuid.uuid4(), "worker", 60, progress=40
+        )
+        self.assertIn("pg_notify", conn.statements[-1][0])
+
+    def test_api_wait_uses_shared_listener_with_slow_fallback(self) -> None:
+        source = (API_ROOT / "app" / "host_agent.py").read_text(encoding="utf-8")
+        start = source.index("async def wait_command(")
+        body = source[start:source.index("async def run_command(", start)]
+        self.assertIn("command_events.subscribe(command_id)", body)
+        self.assertIn("wakeup.wait()", body)
+        self.assertIn("EVENT_FALLBACK_POLL_SECONDS", body)
+        self.assertIn("command_events.unsubscribe(command_id, wakeup)", body)
+        self.assertNotIn("asyncio.sleep(poll_interval)", body)
+        self.assertIn("add_listener(EVENTS_NOTIFY_CHANNEL", source)
+
+
 class HmacSignatureTest(unittest.TestCase):
     FIELDS = dict(
         command_id="9c8ce9f0-3b4e-4bcb-a739-2c1e8ad0e9aa",
@@ -0,0 +1,225 @@
+"""Lease do host-agent: cabeca da fila por projeto sobre indices parciais."""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import pathlib
+import statistics
+import sys
+import time
+import unittest
+import uuid
+
+from tests.smoke.common import env_flag
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+AGENT_ROOT = ROOT / "servidor" / "host-agent"
+API_ROOT = ROOT / "servidor" / "api-internal"
+for path in (AGENT_ROOT, API_ROOT):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+try:
+    import asyncpg
+except ModuleNotFoundError:  # pragma: no cover - depende do ambiente
+    db = None
+    host_agent = None
+else:
+    from app import host_agent
+    from hostagent import db
+
+
+QUEUED_COMMANDS = 5_000
+QUEUED_PROJECTS = 250
+AGENTS = 4
+
+
+class FakeLeaseConnection:
+    """Responde as consultas do lease e registra a ordem das tentativas."""
+
+    def __init__(self, *, stream=None, heads=(), locked=()) -> None:
+        self.stream = stream
+        self.heads = list(heads)
+        self.locked = set(locked)
+        self.calls: list[tuple[str, tuple]] = []
+
+    async def fetchval(self, query, *args):
+        if query is db._QUEUED_STREAM:
+            self.calls.append(("stream", args))
+            return self.stream
+        self.calls.append(("lock", args))
+        return None if args[0] in self.locked else args[0]
+
+    async def fetch(self, query, *args):
+        self.calls.append(("heads", args))
+        return [{"id": command_id} for command_id in self.heads]
+
+    async def fetchrow(self, query, *args):
+        self.calls.append(("update", args))
+        return {"id": args[0], "worker_id": args[1]}
+
+    async def execute(self, query, *args):
+        self.calls.append(("notify", args))
+        return ""
+
+    def transaction(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeLeasePool:
+    def __init__(self, conn: FakeLeaseConnection) -> None:
+        self.conn = conn
+
+    def acquire(self):
+        return self.conn
+
+
+@unittest.skipIf(db is None, "asyncpg indisponivel")
+class LeaseNextCommandTest(unittest.IsolatedAsyncioTestCase):
+    async def lease(self, conn: FakeLeaseConnection, **kwargs):
+        return await db.lease_next_command(
+            FakeLeasePool(conn), "worker-1", 60, {"beta", "alpha"}, **kwargs
+        )
+
+    async def test_log_streams_are_leased_before_queue_heads(self) -> None:
+        stream_id = uuid.uuid4()
+        conn = FakeLeaseConnection(stream=stream_id, heads=[uuid.uuid4()])
+        leased = await self.lease(conn)
+
+        self.assertEqual(leased["id"], stream_id)
+        self.assertEqual([kind for kind, _ in conn.calls], ["stream", "update", "notify"])
+
+    async def test_heads_are_tried_in_order_skipping_locked_ones(self) -> None:
+        first, second, third = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        conn = FakeLeaseConnection(heads=[first, second, third], locked={first})
+        leased = await self.lease(conn)
+
+        self.assertEqual(leased["id"], second)
+        heads_args = next(args for kind, args in conn.calls if kind == "heads")
+        self.assertEqual(heads_args[0], ["alpha", "beta"])
+        self.assertEqual(heads_args[2], db.LEASE_HEAD_CANDIDATES)
+        self.assertEqual(
+            [args[0] for kind, args in conn.calls if kind == "lock"], [first, second]
+        )
+
+    async def test_stream_slots_full_skip_the_stream_lookup(self) -> None:
+        head = uuid.uuid4()
+        conn = FakeLeaseConnection(stream=uuid.uuid4(), heads=[head])
+        leased = await self.lease(conn, allow_streams=False)
+
+        self.assertEqual(leased["id"], head)
+        self.assertNotIn("stream", [kind for kind, _ in conn.calls])
+
+    async def test_nothing_eligible_leases_nothing(self) -> None:
+        head = uuid.uuid4()
+        conn = FakeLeaseConnection(heads=[head], locked={head})
+        self.assertIsNone(await self.lease(conn))
+        self.assertNotIn("update", [kind for kind, _ in conn.calls])
+
+        conn = FakeLeaseConnection(stream=uuid.uuid4())
+        self.assertIsNone(await self.lease(conn, allow_commands=False, allow_streams=False))
+        self.assertEqual(conn.calls, [])
+
+    def test_heads_come_from_a_loose_index_scan(self) -> None:
+        self.assertIn("WITH RECURSIVE queued_projects", db._QUEUE_HEADS)
+        self.assertIn("c.project > q.project", db._QUEUE_HEADS)
+        self.assertIn("CROSS JOIN LATERAL", db._QUEUE_HEADS)
+        self.assertIn("FOR UPDATE SKIP LOCKED", db._LOCK_QUEUED)
+        self.assertIn("status = 'queued'", db._LOCK_QUEUED)
+
+    def test_startup_registers_the_partial_indexes(self) -> None:
+        main_source = (API_ROOT / "app" / "main.py").read_text(encoding="utf-8")
+        self.assertIn(
+            'Migration(11, "host_agent_queue", ensure_host_agent_queue_indexes)',
+            main_source,
+        )
+
+
+@unittest.skipUnless(env_flag("RUN_HOST_AGENT_QUEUE_SMOKE"), "set RUN_HOST_AGENT_QUEUE_SMOKE=1")
+class LiveMultiAgentLeaseBenchmarkTest(unittest.IsolatedAsyncioTestCase):
+    """Drena milhares de comandos com varios agents num schema descartavel."""
+
+    async def asyncSetUp(self) -> None:
+        self.schema = f"host_agent_queue_smoke_{uuid.uuid4().hex[:8]}"
+        admin = await asyncpg.connect(os.environ["SMOKE_DB_DSN"])
+        try:
+            await admin.execute(f"CREATE SCHEMA {self.schema}")
+        finally:
+            await admin.close()
+        self.pool = await asyncpg.create_pool(
+            os.environ["SMOKE_DB_DSN"],
+            min_size=AGENTS + 1,
+            max_size=AGENTS + 1,
+            server_settings={"search_path": self.schema},
+        )
+        async with self.pool.acquire() as conn:
+            await conn.execute("CREATE TABLE jobs (job_id UUID PRIMARY KEY)")
+            await host_agent.ensure_host_agent_schema(conn)
+            await host_agent.ensure_host_agent_queue_indexes(conn)
+            await conn.execute(
+                f"""
+                INSERT INTO host_agent_commands(
+                    id, project, command, issued_at, signature, timeout_seconds, created_at
+                )
+                SELECT md5(i::text)::uuid, 'p' || (i % {QUEUED_PROJECTS}), 'restart_project',
+                       0, 'x', 60, now() - make_interval(secs => {QUEUED_COMMANDS} - i)
+                FROM generate_series(1, {QUEUED_COMMANDS}) AS i;
+                ANALYZE host_agent_commands;
+                """
+            )
+
+    async def asyncTearDown(self) -> None:
+        async with self.pool.acquire() as conn:
+            await conn.execute(f"DROP SCHEMA {self.schema} CASCADE")
+        await self.pool.close()
+
+    async def drain(self, worker_id: str, latencies: list[float], overlaps: list[str]) -> None:
+        while True:
+            started = time.monotonic()
+            leased = await db.lease_next_command(self.pool, worker_id, 60, set())
+            latencies.append(time.monotonic() - started)
+            if leased is None:
+                return
+            running = await self.pool.fetchval(
+                "SELECT count(*) FROM host_agent_commands WHERE project = $1 AND status = 'running'",
+                leased["project"],
+            )
+            if running > 1:
+                overlaps.append(leased["project"])
+            await self.pool.execute(
+                "UPDATE host_agent_commands SET status = 'done', finished_at = now() WHERE id = $1",
+                leased["id"],
+            )
+
+    async def test_agents_drain_the_queue_one_command_per_project(self) -> None:
+        latencies: list[float] = []
+        overlaps: list[str] = []
+        started = time.monotonic()
+        await asyncio.gather(
+            *(self.drain(f"agent-{index}", latencies, overlaps) for index in range(AGENTS))
+        )
+        elapsed = time.monotonic() - started
+
+        remaining = await self.pool.fetchval(
+            "SELECT count(*) FROM host_agent_commands WHERE status <> 'done'"
+        )
+        p95 = statistics.quantiles(latencies, n=20)[-1]
+        print(
+            f"\n[host-agent-queue] {QUEUED_COMMANDS} comandos, {AGENTS} agents: "
+            f"{elapsed:.2f}s, lease p50 {statistics.median(latencies) * 1000:.2f}ms, "
+            f"p95 {p95 * 1000:.2f}ms"
+        )
+        self.assertEqual(remaining, 0)
+        self.assertEqual(overlaps, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+"""Streaming de logs: chunks do agent, cursor de retomada e cancelamento."""
+
+from __future__ import annotations
+
+import asyncio
+import pathlib
+import sys
+import unittest
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+AGENT_ROOT = ROOT / "servidor" / "host-agent"
+API_APP = ROOT / "servidor" / "api-internal" / "app"
+if str(AGENT_ROOT) not in sys.path:
+    sys.path.insert(0, str(AGENT_ROOT))
+
+from hostagent import commands
+from hostagent import host_agent_protocol as protocol
+
+
+def log_reader(lines: list[str], *, eof: bool = True) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader()
+    for line in lines:
+        reader.feed_data(line.encode())
+    if eof:
+        reader.feed_eof()
+    return reader
+
+
+class RecordingSink:
+    def __init__(self, accept: int = 10**6) -> None:
+        self.chunks: list[tuple[str, str | None]] = []
+        self.accept = accept
+
+    async def __call__(self, data: str, log_cursor: str | None) -> bool:
+        if len(self.chunks) >= self.accept:
+            return False
+        self.chunks.append((data, log_cursor))
+        return True
+
+
+class RelayLogLinesTest(unittest.IsolatedAsyncioTestCase):
+    async def test_small_tail_becomes_one_chunk_with_last_cursor(self) -> None:
+        sink = RecordingSink()
+        cursor, ended = await commands.relay_log_lines(
+            log_reader(
+                [
+                    "2026-10-17T12:00:00.1Z boot\n",
+                    "2026-10-17T12:00:00.25Z ready\n",
+                ]
+            ),
+            sink,
+        )
+        self.assertEqual(ended, "exited")
+        self.assertEqual(cursor, "2026-10-17T12:00:00.25Z")
+        self.assertEqual(
+            sink.chunks,
+            [
+                (
+                    "2026-10-17T12:00:00.1Z boot\n2026-10-17T12:00:00.25Z ready\n",
+                    "2026-10-17T12:00:00.25Z",
+                )
+            ],
+        )
+
+    async def test_resume_skips_lines_already_delivered(self) -> None:
+        sink = RecordingSink()
+        # --since do Docker e inclusivo; fracoes tem tamanhos diferentes.
+        cursor, _ = await commands.relay_log_lines(
+            log_reader(
+                [
+                    "2026-10-17T12:00:00.5Z repetida\n",
+                    "2026-10-17T12:00:00.45Z antiga\n",
+                    "2026-10-17T12:00:00.500000001Z nova\n",
+                ]
+            ),
+            sink,
+            since="2026-10-17T12:00:00.5Z",
+        )
+        self.assertEqual(sink.chunks, [("2026-10-17T12:00:00.500000001Z nova\n", cursor)])
+
+    async def test_large_output_is_split_in_bounded_chunks(self) -> None:
+        sink = RecordingSink()
+        line = "2026-10-17T12:00:00Z " + "x" * 999 + "\n"
+        await commands.relay_log_lines(log_reader([line] * 200), sink)
+        self.assertGreater(len(sink.chunks), 1)
+        for data, _ in sink.chunks:
+            self.assertLessEqual(len(data), protocol.LOG_CHUNK_LIMIT + len(line))
+        self.assertEqual(sum(len(data) for data, _ in sink.chunks), 200 * len(line))
+
+    async def test_follow_flushes_before_eof_and_stops_when_cancelled(self) -> None:
+        sink = RecordingSink(accept=1)
+        reader = log_reader(["2026-10-17T12:00:00Z primeira\n"], eof=False)
+        relay = asyncio.create_task(
+            commands.relay_log_lines(reader, sink, flush_interval=0.01)
+        )
+        await asyncio.sleep(0.05)
+        # Primeira linha publicada sem esperar o fim do ``docker logs``.
+        self.assertEqual(len(sink.chunks), 1)
+        reader.feed_data(b"2026-10-17T12:00:01Z segunda\n")
+        cursor, ended = await asyncio.wait_for(relay, timeout=1)
+        self.assertEqual(ended, "cancelled")
+        self.assertEqual(cursor, "2026-10-17T12:00:00Z")
+
+    async def test_deadline_ends_an_idle_follow(self) -> None:
+        loop = asyncio.get_running_loop()
+        _, ended = await commands.relay_log_lines(
+            log_reader([], eof=False),
+            RecordingSink(),
+            deadline=loop.time() + 0.05,
+        )
+        self.assertEqual(ended, "timeout")
+
+    async def test_chunks_are_sanitized(self) -> None:
+        sink = RecordingSink()
+        await commands.relay_log_lines(
+            log_reader(["2026-10-17T12:00:00Z POSTGRES_PASSWORD=segredo\n"]), sink
+        )
+        self.assertNotIn("segredo", sink.chunks[0][0])
+
+
+class LogStreamContractTest(unittest.TestCase):
+    def test_streams_bypass_project_serialization_with_own_slots(self) -> None:
+        self.assertIn("container_logs_stream", protocol.LOG_STREAM_COMMANDS)
+        db_source = (AGENT_ROOT / "hostagent" / "db.py").read_text(encoding="utf-8")
+        self.assertIn("AND NOT (r.command = ANY($2::text[]))", db_source)
+        self.assertIn("INSERT INTO host_agent_log_chunks", db_source)
+        agent_source = (AGENT_ROOT / "hostagent" / "agent.py").read_text(encoding="utf-8")
+        self.assertIn("self.config.max_log_streams", agent_source)
+
+    def test_api_relays_chunks_outside_the_result_column(self) -> None:
+        host_agent = (API_APP / "host_agent.py").read_text(encoding="utf-8")
+        self.assertIn("CREATE UNLOGGED TABLE IF NOT EXISTS host_agent_log_chunks", host_agent)
+        lifecycle = (API_APP / "routers" / "lifecycle.py").read_text(encoding="utf-8")
+        self.assertIn('@router.get("/api/projects/{project_name}/logs/{service}/stream")', lifecycle)
+        self.assertIn('media_type="text/event-stream"', lifecycle)
+        self.assertIn('request.headers.get("last-event-id")', lifecycle)
+        self.assertNotIn('command="container_logs",', lifecycle)
+
+
+if __name__ == "__main__":
+    unittest.main()
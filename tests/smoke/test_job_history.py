@@ -0,0 +1,224 @@
+"""Historico de jobs: keyset, SELECT estreito e total estimado."""
+
+from __future__ import annotations
+
+import datetime as dt
+import json
+import os
+import sys
+import time
+import unittest
+import uuid
+from pathlib import Path
+
+from tests.smoke.common import env_flag
+
+
+API_ROOT = Path(__file__).resolve().parents[2] / "servidor" / "api-internal"
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+try:
+    import asyncpg
+except ModuleNotFoundError:  # pragma: no cover - depende do ambiente
+    jobs = None
+else:
+    from app import jobs
+
+
+JOBS_ROWS = 1_000_000
+PAGE_SIZE = 50
+
+
+def history_row(created_at: dt.datetime) -> dict:
+    return {
+        "job_id": uuid.uuid4(),
+        "project": "alpha",
+        "project_uuid": uuid.uuid4(),
+        "tenant_uuid": None,
+        "created_by": None,
+        "action": "start",
+        "status": "done",
+        "message": None,
+        "progress": 100,
+        "current_step": None,
+        "total_steps": 1,
+        "started_at": None,
+        "finished_at": None,
+        "error_code": None,
+        "is_idempotent": True,
+        "retryable": True,
+        "retry_of": None,
+        "attempt": 1,
+        "created_at": created_at,
+        "updated_at": created_at,
+    }
+
+
+class FakeHistoryConnection:
+    def __init__(self, rows: list[dict], estimate: int = 0) -> None:
+        self.rows = rows
+        self.estimate = estimate
+        self.queries: list[tuple[str, tuple]] = []
+
+    async def fetch(self, query: str, *args):
+        self.queries.append((query, args))
+        return self.rows
+
+    async def fetchval(self, query: str, *args):
+        self.queries.append((query, args))
+        return json.dumps([{"Plan": {"Plan Rows": self.estimate}}])
+
+
+@unittest.skipIf(jobs is None, "asyncpg indisponivel")
+class JobHistoryPageTest(unittest.IsolatedAsyncioTestCase):
+    def rows(self, count: int) -> list[dict]:
+        now = dt.datetime(2026, 10, 17, 12, tzinfo=dt.timezone.utc)
+        return [history_row(now - dt.timedelta(seconds=index)) for index in range(count)]
+
+    async def test_first_page_is_narrow_and_carries_an_estimate(self) -> None:
+        rows = self.rows(3)
+        conn = FakeHistoryConnection(rows, estimate=123_456)
+        page = await jobs.fetch_job_history(conn, viewer_id=None, limit=2)
+
+        query, args = conn.queries[0]
+        self.assertNotIn("SELECT *", query)
+        self.assertNotIn("OFFSET", query)
+        self.assertNotIn("stdout_tail", query)
+        self.assertIn("j.payload->>'tenant_uuid' AS tenant_uuid", query)
+        self.assertEqual(args, (3,))
+        self.assertEqual(page["count"], 2)
+        self.assertEqual(page["estimated_total"], 123_456)
+        self.assertTrue(conn.queries[1][0].startswith("EXPLAIN (FORMAT JSON)"))
+        self.assertEqual(conn.queries[1][1], ())
+        self.assertEqual(
+            jobs.decode_job_cursor(page["next_cursor"]),
+            (rows[1]["created_at"], rows[1]["job_id"]),
+        )
+        self.assertNotIn("stdout_tail", page["items"][0])
+
+    async def test_next_page_seeks_past_the_cursor_without_estimating(self) -> None:
+        rows = self.rows(1)
+        cursor = jobs.encode_job_cursor(rows[0]["created_at"], rows[0]["job_id"])
+        conn = FakeHistoryConnection(rows)
+        page = await jobs.fetch_job_history(
+            conn, viewer_id=None, status="done", cursor=cursor, limit=PAGE_SIZE
+        )
+
+        self.assertEqual(len(conn.queries), 1)
+        query, args = conn.queries[0]
+        self.assertIn("(j.created_at, j.job_id) < ($2, $3)", query)
+        self.assertEqual(args, ("done", rows[0]["created_at"], rows[0]["job_id"], PAGE_SIZE + 1))
+        self.assertIsNone(page["next_cursor"])
+        self.assertIsNone(page["estimated_total"])
+
+    async def test_member_visibility_merges_index_ordered_branches(self) -> None:
+        viewer = uuid.uuid4()
+        conn = FakeHistoryConnection(self.rows(1))
+        await jobs.fetch_job_history(conn, viewer_id=viewer, action="backup")
+
+        query, args = conn.queries[0]
+        self.assertIn("UNION ALL", query)
+        self.assertIn("CROSS JOIN LATERAL", query)
+        self.assertNotIn("EXISTS", query)
+        self.assertEqual(args, (viewer, "backup", PAGE_SIZE + 1))
+        count_query, count_args = conn.queries[1]
+        self.assertEqual(count_args, (viewer, "backup"))
+        self.assertNotIn("LIMIT", count_query)
+
+    async def test_output_columns_only_on_demand(self) -> None:
+        row = self.rows(1)[0] | {"stdout_tail": "out", "stderr_tail": "err"}
+        conn = FakeHistoryConnection([row])
+        page = await jobs.fetch_job_history(conn, viewer_id=None, include_output=True)
+
+        self.assertIn("j.stdout_tail, j.stderr_tail", conn.queries[0][0])
+        self.assertEqual(page["items"][0]["stdout_tail"], "out")
+
+    def test_malformed_cursor_is_rejected(self) -> None:
+        for cursor in ("nao-e-cursor", jobs.encode_job_cursor(dt.datetime.now(dt.timezone.utc), "x")):
+            with self.assertRaises(jobs.JobHistoryValidationError):
+                jobs.decode_job_cursor(cursor)
+
+    def test_route_delegates_to_keyset_history(self) -> None:
+        main_source = (API_ROOT / "app" / "main.py").read_text(encoding="utf-8")
+        route = main_source[main_source.index("async def list_job_history("):]
+        route = route[: route.index("\n@app.")]
+        self.assertIn("await fetch_job_history(", route)
+        self.assertNotIn("offset", route)
+        self.assertIn("raise HTTPException(422, str(exc))", route)
+        self.assertIn('Migration(9, "job_history", ensure_job_history_indexes)', main_source)
+
+
+@unittest.skipUnless(env_flag("RUN_JOB_HISTORY_SMOKE"), "set RUN_JOB_HISTORY_SMOKE=1")
+class LiveJobHistoryBenchmarkTest(unittest.IsolatedAsyncioTestCase):
+    """Pagina 500 com 1M de jobs: keyset contra o OFFSET antigo."""
+
+    async def asyncSetUp(self) -> None:
+        self.schema = f"job_history_smoke_{uuid.uuid4().hex[:8]}"
+        self.conn = await asyncpg.connect(os.environ["SMOKE_DB_DSN"])
+        await self.conn.execute(f"CREATE SCHEMA {self.schema}; SET search_path = {self.schema}")
+        await self.conn.execute(
+            f"""
+            CREATE TABLE projects (id UUID PRIMARY KEY, owner_id UUID);
+            CREATE TABLE project_members (project_id UUID, user_id UUID);
+            CREATE TABLE jobs (
+                job_id UUID PRIMARY KEY,
+                project TEXT NOT NULL,
+                project_uuid UUID,
+                created_by UUID,
+                status TEXT NOT NULL,
+                message TEXT,
+                action TEXT NOT NULL,
+                payload JSONB NOT NULL DEFAULT '{{}}'::jsonb,
+                progress SMALLINT NOT NULL DEFAULT 100,
+                current_step TEXT,
+                total_steps INTEGER NOT NULL DEFAULT 1,
+                started_at TIMESTAMPTZ,
+                finished_at TIMESTAMPTZ,
+                stdout_tail TEXT,
+                stderr_tail TEXT,
+                error_code TEXT,
+                is_idempotent BOOLEAN NOT NULL DEFAULT true,
+                retryable BOOLEAN NOT NULL DEFAULT true,
+                retry_of UUID,
+                attempt INTEGER NOT NULL DEFAULT 1,
+                created_at TIMESTAMPTZ NOT NULL,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            INSERT INTO jobs(job_id, project, status, action, created_at, stdout_tail)
+            SELECT md5(i::text)::uuid, 'p' || (i % 100), 'done', 'start',
+                   now() - make_interval(secs => i), repeat('x', 4000)
+            FROM generate_series(1, {JOBS_ROWS}) AS i;
+            ANALYZE jobs;
+            """
+        )
+        await jobs.ensure_job_history_indexes(self.conn)
+
+    async def asyncTearDown(self) -> None:
+        await self.conn.execute(f"DROP SCHEMA {self.schema} CASCADE")
+        await self.conn.close()
+
+    async def test_page_500_costs_the_same_as_page_1(self) -> None:
+        started = time.monotonic()
+        await self.conn.fetch(
+            "SELECT * FROM jobs j ORDER BY j.created_at DESC, j.job_id DESC LIMIT $1 OFFSET $2",
+            PAGE_SIZE,
+            PAGE_SIZE * 499,
+        )
+        offset_page = time.monotonic() - started
+
+        cursor = None
+        for _ in range(499):
+            page = await jobs.fetch_job_history(self.conn, viewer_id=None, cursor=cursor, limit=PAGE_SIZE)
+            cursor = page["next_cursor"]
+        started = time.monotonic()
+        page = await jobs.fetch_job_history(self.conn, viewer_id=None, cursor=cursor, limit=PAGE_SIZE)
+        keyset_page = time.monotonic() - started
+
+        print(f"\n[job-history] pagina 500: offset {offset_page * 1000:.1f}ms, keyset {keyset_page * 1000:.1f}ms")
+        self.assertEqual(page["count"], PAGE_SIZE)
+        self.assertLess(keyset_page, offset_page)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,319 @@
+"""Fila duravel de jobs: lease no Postgres, runners locais ou reconstruidos."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import io
+import sys
+import time
+import unittest
+import uuid
+from pathlib import Path
+
+
+API_ROOT = Path(__file__).resolve().parents[2] / "servidor" / "api-internal"
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+try:
+    import asyncpg  # noqa: F401
+except ModuleNotFoundError:  # pragma: no cover - depende do ambiente
+    jobs = None
+else:
+    from app import jobs
+
+
+class FakeJobsPool:
+    """Emula a elegibilidade do lease: FIFO e um job ativo por projeto."""
+
+    def __init__(self, rows: list[dict]) -> None:
+        self.rows = rows
+        self.released: list[str] = []
+        self.statuses: list[tuple] = []
+
+    async def fetchrow(self, query, *args):
+        if query is jobs._LEASE_NEXT_JOB:
+            busy = {row["project_uuid"] for row in self.rows if row.get("lease_owner")}
+            for row in self.rows:
+                if row["status"] != "queued" or row.get("lease_owner"):
+                    continue
+                if row["project_uuid"] not in busy:
+                    row["lease_owner"] = args[0]
+                    return row
+                busy.add(row["project_uuid"])
+            return None
+        raise AssertionError(query)
+
+    async def execute(self, query, *args):
+        if "SET lease_owner = NULL" in query:
+            job_id = str(args[0])
+            self.released.append(job_id)
+            for row in self.rows:
+                if str(row["job_id"]) == job_id:
+                    row["lease_owner"] = None
+                    if row["status"] == "queued":
+                        row["status"] = "done"
+        elif query.startswith("UPDATE jobs SET status=$1"):
+            self.statuses.append(args)
+        return "UPDATE 1"
+
+
+def job_row(project: uuid.UUID, action: str = "start") -> dict:
+    return {
+        "job_id": uuid.uuid4(),
+        "project_uuid": project,
+        "project": "alpha",
+        "action": action,
+        "status": "queued",
+        "lease_owner": None,
+    }
+
+
+@unittest.skipIf(jobs is None, "asyncpg indisponivel")
+class DurableActionQueueTest(unittest.IsolatedAsyncioTestCase):
+    async def start_queue(self, pool: FakeJobsPool, runner_factory) -> jobs.ProjectActionQueue:
+        async def provider():
+            return pool
+
+        async def never_orphaned(_row):
+            raise AssertionError("reaper nao deveria rodar")
+
+        jobs.configure_jobs(provider)
+        queue = jobs.ProjectActionQueue()
+        queue.reap_orphans = self.no_reap  # type: ignore[method-assign]
+        queue.start(
+            runner_factory=runner_factory,
+            on_orphaned=never_orphaned,
+            max_concurrent=4,
+            lease_seconds=60,
+            poll_interval=0.01,
+        )
+        return queue
+
+    async def no_reap(self) -> int:
+        return 0
+
+    async def test_jobs_of_one_project_never_overlap(self) -> None:
+        alpha, beta = uuid.uuid4(), uuid.uuid4()
+        rows = [job_row(alpha), job_row(alpha), job_row(beta), job_row(alpha)]
+        pool = FakeJobsPool(rows)
+        active: dict[uuid.UUID, int] = {}
+        overlap: list[uuid.UUID] = []
+        order: list[uuid.UUID] = []
+
+        async def factory(row):
+            async def run() -> None:
+                project = row["project_uuid"]
+                active[project] = active.get(project, 0) + 1
+                if active[project] > 1:
+                    overlap.append(project)
+                order.append(row["job_id"])
+                await asyncio.sleep(0.01)
+                active[project] -= 1
+
+            return run
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            queue = await self.start_queue(pool, factory)
+            for _ in range(200):
+                if len(pool.released) == len(rows):
+                    break
+                await asyncio.sleep(0.01)
+            await queue.shutdown()
+
+        self.assertEqual(overlap, [])
+        self.assertEqual(
+            [job for job in order if job != rows[2]["job_id"]],
+            [rows[0]["job_id"], rows[1]["job_id"], rows[3]["job_id"]],
+        )
+        self.assertEqual(sorted(pool.released), sorted(str(r["job_id"]) for r in rows))
+
+    async def test_local_runner_wins_and_unknown_action_fails(self) -> None:
+        project = uuid.uuid4()
+        local_row, unknown_row = job_row(project), job_row(project, "mystery")
+        pool = FakeJobsPool([local_row, unknown_row])
+        ran: list[str] = []
+
+        async def factory(row):
+            if row["action"] == "mystery":
+                return None
+            raise AssertionError("closure local deveria ser usado")
+
+        async def local_runner() -> None:
+            ran.append("local")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            queue = await self.start_queue(pool, factory)
+            queue._local_runners[str(local_row["job_id"])] = (time.monotonic(), local_runner)
+            queue._wakeup.set()
+            for _ in range(200):
+                if len(pool.released) == 2:
+                    break
+                await asyncio.sleep(0.01)
+            await queue.shutdown()
+
+        self.assertEqual(ran, ["local"])
+        self.assertEqual(len(pool.statuses), 1)
+        self.assertEqual(pool.statuses[0][0], "failed")
+        self.assertIn("queue_runner_unavailable", pool.statuses[0])
+
+
+class FakeRenewPool:
+    def __init__(self, renewed: list[uuid.UUID], *, affected: int = 1) -> None:
+        self.renewed = renewed
+        self.affected = affected
+        self.executed: list[tuple[str, tuple]] = []
+
+    async def fetch(self, query, *args):
+        self.executed.append((query, args))
+        return [{"job_id": job_id} for job_id in self.renewed]
+
+    async def execute(self, query, *args):
+        self.executed.append((query, args))
+        return f"UPDATE {self.affected}"
+
+
+@unittest.skipIf(jobs is None, "asyncpg indisponivel")
+class LeaseFencingTest(unittest.IsolatedAsyncioTestCase):
+    def use_pool(self, pool) -> None:
+        async def provider():
+            return pool
+
+        jobs.configure_jobs(provider)
+
+    async def test_renewal_cancels_runners_whose_lease_was_taken(self) -> None:
+        kept, lost = uuid.uuid4(), uuid.uuid4()
+        pool = FakeRenewPool([kept])
+        self.use_pool(pool)
+        queue = jobs.ProjectActionQueue()
+        tasks = {
+            str(job_id): asyncio.create_task(asyncio.sleep(60)) for job_id in (kept, lost)
+        }
+        queue._running.update(tasks)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(await queue.renew_leases(), [str(lost)])
+        # Lease ja vencido nao e renovado: o reaper pode te-lo assumido.
+        self.assertIn("lease_expires_at > now()", pool.executed[0][0])
+        await asyncio.sleep(0)
+        self.assertTrue(tasks[str(lost)].cancelled())
+        self.assertFalse(tasks[str(kept)].done())
+        tasks[str(kept)].cancel()
+
+    async def test_status_write_without_the_lease_stops_the_runner(self) -> None:
+        job_id = str(uuid.uuid4())
+        pool = FakeRenewPool([], affected=0)
+        self.use_pool(pool)
+
+        async def runner() -> None:
+            jobs._job_lease.set((job_id, "api-1"))
+            await jobs.set_job_status(job_id, "running", progress=40)
+
+        with self.assertRaises(jobs.JobLeaseLost):
+            await asyncio.create_task(runner())
+        query, args = pool.executed[0]
+        self.assertIn("AND lease_owner=$4", query)
+        self.assertEqual(args[-1], "api-1")
+
+        # Fora de um runner da fila (reaper, rotas) a escrita nao e cercada.
+        await jobs.set_job_status(job_id, "failed")
+        self.assertNotIn("lease_owner", pool.executed[-1][0])
+
+
+class FakeReaperPool:
+    """Transacao do reaper com orfaos lidos e leases assumidos controlados."""
+
+    def __init__(self, orphans: list[dict], fenced: set) -> None:
+        self.orphans = orphans
+        self.fenced = fenced
+        self.in_transaction = False
+        self.reads: list[tuple] = []
+        self.decisions: list[tuple[str, tuple]] = []
+
+    def acquire(self):
+        return self
+
+    def transaction(self):
+        return self
+
+    async def __aenter__(self):
+        self.in_transaction = True
+        return self
+
+    async def __aexit__(self, *_exc):
+        self.in_transaction = False
+        return False
+
+    async def fetchval(self, query, *args):
+        return True
+
+    async def fetch(self, query, *args):
+        self.reads.append((query, args))
+        if query is jobs._ORPHANED_JOBS:
+            return self.orphans
+        return [{"job_id": job_id} for job_id in args[1] if job_id in self.fenced]
+
+    async def execute(self, query, *args):
+        assert not self.in_transaction
+        self.decisions.append((query, args))
+        return "UPDATE 1"
+
+
+@unittest.skipIf(jobs is None, "asyncpg indisponivel")
+class OrphanReaperTest(unittest.IsolatedAsyncioTestCase):
+    async def test_decisions_run_outside_the_lock_and_respect_renewals(self) -> None:
+        renewed, expired, unleased = (
+            dict(job_row(uuid.uuid4()), lease_owner="api-old", status="running")
+            for _ in range(3)
+        )
+        unleased["lease_owner"] = None
+        pool = FakeReaperPool(
+            [renewed, expired, unleased], fenced={expired["job_id"]}
+        )
+
+        async def provider():
+            return pool
+
+        handled_in_transaction: list[bool] = []
+
+        async def on_orphaned(row) -> bool:
+            handled_in_transaction.append(pool.in_transaction)
+            return row["job_id"] == expired["job_id"]
+
+        jobs.configure_jobs(provider)
+        queue = jobs.ProjectActionQueue()
+        queue._on_orphaned = on_orphaned
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(await queue.reap_orphans(), 2)
+
+        self.assertEqual(handled_in_transaction, [False, False])
+        orphans_query, orphans_args = pool.reads[0]
+        self.assertIn("FOR UPDATE SKIP LOCKED", orphans_query)
+        self.assertEqual(orphans_args, (float(queue.enqueue_grace_seconds),))
+        self.assertEqual(pool.reads[1][1][1], [renewed["job_id"], expired["job_id"]])
+        self.assertEqual(
+            pool.decisions,
+            [
+                (jobs._REQUEUE_ORPHAN, (expired["job_id"], f"{queue.worker_id}:reaper")),
+                (jobs._RELEASE_ORPHAN, (unleased["job_id"], None)),
+            ],
+        )
+
+
+class DurableActionQueueContractTest(unittest.TestCase):
+    def test_serialization_lives_in_sql_instead_of_a_held_session_lock(self) -> None:
+        source = (API_ROOT / "app" / "jobs.py").read_text(encoding="utf-8")
+        main = (API_ROOT / "app" / "main.py").read_text(encoding="utf-8")
+
+        self.assertIn("FOR UPDATE SKIP LOCKED", source)
+        self.assertIn("idx_jobs_one_leased_per_project", source)
+        self.assertNotIn("pg_advisory_lock(", source)
+        self.assertNotIn("asyncio.Queue", source)
+        self.assertNotIn("_recover_pending_jobs", main)
+        self.assertIn("runner_factory=_build_recovery_runner", main)
+        self.assertIn("await action_queue.status(project_name)", main)
+
+
+if __name__ == "__main__":
+    unittest.main()
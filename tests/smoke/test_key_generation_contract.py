@@ -83,7 +83,7 @@ class KeyGenerationContractTest(unittest.TestCase):
             )
         ]
         meta_proxy = main[main.index("async def proxy_project_meta") :]
-        self.assertIn("ensure_project_member_access", config_endpoint)
+        self.assertIn("access.require_member(", config_endpoint)
         self.assertIn('column="service_role"', meta_proxy)
         self.assertNotIn('column="config_token"', meta_proxy)
 
@@ -0,0 +1,100 @@
+"""Contrato da consulta combinada de autorizacao por projeto e do seu cache."""
+
+from __future__ import annotations
+
+import pathlib
+import re
+import unittest
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+API_APP = ROOT / "servidor" / "api-internal" / "app"
+
+
+def read(name: str) -> str:
+    return (API_APP / name).read_text(encoding="utf-8")
+
+
+def route(source: str, function_name: str) -> str:
+    start = source.index(f"async def {function_name}(")
+    match = re.compile(r"\n(@(app|router)\.|async def |def )").search(source, start + 1)
+    return source[start:match.start() if match else len(source)]
+
+
+class ProjectAccessCacheContractTest(unittest.TestCase):
+    def test_lookup_joins_membership_in_one_round_trip(self) -> None:
+        dependencies = read("dependencies.py")
+        body = route(dependencies, "resolve_project_access")
+        self.assertEqual(body.count("await conn."), 1)
+        self.assertIn("LEFT JOIN project_members pm", body)
+        self.assertIn("_cached_project_access(user_id, project_name)", body)
+        self.assertIn("_cache_project_access(user_id, project_name, project, role)", body)
+        self.assertNotIn("automatic_key_rotation", body)
+        self.assertNotIn("anon_key", body)
+        # Admin global nunca vem do cache de projeto.
+        self.assertIn('is_global_admin=auth_user["is_global_admin"]', body)
+
+    def test_hot_read_routes_use_the_combined_lookup(self) -> None:
+        main = read("main.py")
+        sources = {
+            "get_project_config_token": main,
+            "get_project_queue_status": main,
+            "list_project_restore_points": main,
+            "list_members_by_ref": main,
+            "get_project_user_telemetry": main,
+            "proxy_project_meta": main,
+            "get_project_ai_functions": main,
+            "get_project_settings": main,
+            "get_project_collaboration": read("routers/collaboration.py"),
+            "get_project_docker_status": read("routers/lifecycle.py"),
+            "get_container_logs": read("routers/lifecycle.py"),
+            "get_studio_project_context": read("routers/internal.py"),
+        }
+        for name, source in sources.items():
+            with self.subTest(route=name):
+                body = route(source, name)
+                self.assertIn("resolve_project_access(conn,", body)
+                self.assertNotIn("get_project_row(", body)
+                self.assertNotIn("get_project_role(", body)
+                self.assertNotIn("ensure_project_member_access(", body)
+
+    def test_write_routes_authorize_from_the_current_role(self) -> None:
+        main = read("main.py")
+        self.assertIn(
+            "resolve_project_access(conn, ref, auth_user, use_cache=False)",
+            route(main, "execute_project_function"),
+        )
+        proxy = route(main, "proxy_project_meta")
+        self.assertIn('read_only = request.method == "GET"', proxy)
+        self.assertIn("use_cache=read_only", proxy)
+
+    def test_membership_and_identity_changes_invalidate_the_cache(self) -> None:
+        main = read("main.py")
+        expectations = {
+            "add_member": "invalidate_project_access(project_id=project_row[\"id\"], user_id=target_user[\"id\"])",
+            "remove_member_by_ref": "invalidate_project_access(project_id=project_id, user_id=target_uuid)",
+            "transfer_project": "invalidate_project_access(project_id=project_id)",
+            "update_project_display_name": "invalidate_project_access(project_id=project_id)",
+        }
+        for name, call in expectations.items():
+            with self.subTest(route=name):
+                self.assertIn(call, route(main, name))
+        self.assertIn("invalidate_project_access(project_name=old_name)", main)
+        self.assertIn("invalidate_project_access(project_name=new_name)", main)
+        delete_source = route(main, "_delete_project_impl")
+        self.assertLess(
+            delete_source.index("invalidate_project_access(project_name=project_name)"),
+            delete_source.index("drain_database_connections("),
+        )
+
+    def test_cache_ttl_is_configurable(self) -> None:
+        self.assertIn("PROJECT_ACCESS_CACHE_TTL_SECONDS", read("runtime_config.py"))
+        compose = (ROOT / "servidor" / "docker-compose-api.yml").read_text(encoding="utf-8")
+        self.assertIn(
+            "PROJECT_ACCESS_CACHE_TTL_SECONDS: ${PROJECT_ACCESS_CACHE_TTL_SECONDS:-5}",
+            compose,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
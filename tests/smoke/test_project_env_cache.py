@@ -0,0 +1,92 @@
+"""Cache do .env dos projetos: validacao por stat, LRU e invalidacao."""
+
+from __future__ import annotations
+
+import os
+import pathlib
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+
+API_ROOT = pathlib.Path(__file__).resolve().parents[2] / "servidor" / "api-internal"
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+try:
+    import dotenv  # noqa: F401
+except ModuleNotFoundError:  # pragma: no cover - depende do ambiente
+    project_env = None
+else:
+    from app import project_env
+    from app.project_settings import _write_env_whitelisted
+
+
+@unittest.skipIf(project_env is None, "python-dotenv indisponivel")
+class ProjectEnvCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        project_env.clear_project_env_cache()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp.name)
+        self.project_dir = self.root / "alpha"
+        self.project_dir.mkdir()
+        self.env_path = self.project_dir / ".env"
+        self.env_path.write_text("FILE_SIZE_LIMIT=100\nPROJECT_UUID=abc\n", encoding="utf-8")
+
+    def tearDown(self) -> None:
+        project_env.clear_project_env_cache()
+        self.tmp.cleanup()
+
+    def count_parses(self):
+        return mock.patch.object(
+            project_env, "dotenv_values", wraps=project_env.dotenv_values
+        )
+
+    def test_unchanged_file_is_parsed_once(self) -> None:
+        with self.count_parses() as parse:
+            for _ in range(50):
+                values = project_env.read_project_env(self.env_path)
+        self.assertEqual(values["FILE_SIZE_LIMIT"], "100")
+        self.assertEqual(parse.call_count, 1)
+
+    def test_returned_dict_is_a_copy(self) -> None:
+        project_env.read_project_env(self.env_path)["FILE_SIZE_LIMIT"] = "x"
+        self.assertEqual(project_env.read_project_env(self.env_path)["FILE_SIZE_LIMIT"], "100")
+
+    def test_external_write_is_detected_by_stat(self) -> None:
+        project_env.read_project_env(self.env_path)
+        self.env_path.write_text("FILE_SIZE_LIMIT=200\n", encoding="utf-8")
+        stat = self.env_path.stat()
+        os.utime(self.env_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        self.assertEqual(project_env.read_project_env(self.env_path)["FILE_SIZE_LIMIT"], "200")
+
+    def test_settings_write_invalidates_cached_env(self) -> None:
+        project_env.read_project_env(self.env_path)
+        _write_env_whitelisted(self.env_path, {"FILE_SIZE_LIMIT": "300"})
+        with self.count_parses() as parse:
+            values = project_env.read_project_env(self.env_path)
+        self.assertEqual(values["FILE_SIZE_LIMIT"], "300")
+        self.assertEqual(parse.call_count, 1)
+
+    def test_project_directory_invalidation_and_missing_file(self) -> None:
+        project_env.read_project_env(self.env_path)
+        project_env.invalidate_project_env(self.project_dir)
+        self.assertEqual(project_env._entries, {})
+        self.env_path.unlink()
+        self.assertEqual(project_env.read_project_env(self.env_path), {})
+
+    def test_cache_is_bounded(self) -> None:
+        paths = []
+        for index in range(5):
+            path = self.root / f"p{index}.env"
+            path.write_text(f"N={index}\n", encoding="utf-8")
+            paths.append(path)
+        with mock.patch.object(project_env, "PROJECT_ENV_CACHE_MAX_ENTRIES", 3):
+            for path in paths:
+                project_env.read_project_env(path)
+        self.assertEqual(len(project_env._entries), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
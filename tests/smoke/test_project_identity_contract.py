@@ -1,11 +1,15 @@
 from __future__ import annotations
 
+import asyncio
 import sys
 import tempfile
 import types
+import threading
+import time
 import unittest
 import uuid
 from pathlib import Path
+from unittest import mock
 
 
 ROOT = Path(__file__).resolve().parents[2]
@@ -18,6 +22,7 @@ if "asyncpg" not in sys.modules:
     asyncpg_stub.Pool = object
     sys.modules["asyncpg"] = asyncpg_stub
 
+from app import project_identity  # noqa: E402
 from app.project_identity import (  # noqa: E402
     ProjectIdentityConflict,
     ProjectIdentityError,
@@ -29,11 +34,16 @@ from app.project_identity import (  # noqa: E402
 
 
 class _FakePool:
-    def __init__(self, rows: list[dict]) -> None:
+    def __init__(self, rows: list[dict], *, reconciled: bool = False) -> None:
         self.rows = rows
+        self.reconciled = reconciled
         self.updates: list[tuple[uuid.UUID, uuid.UUID]] = []
+        self.markers: list[tuple] = []
         self.query = ""
 
+    async def fetchval(self, _query: str, _marker: str) -> bool:
+        return self.reconciled
+
     async def fetch(self, query: str) -> list[dict]:
         self.query = query
         return self.rows
@@ -41,6 +51,9 @@ class _FakePool:
     async def executemany(self, _query: str, updates) -> None:
         self.updates.extend(updates)
 
+    async def execute(self, _query: str, *args) -> None:
+        self.markers.append(args)
+
 
 class _FakeJobPool:
     def __init__(self, row: dict | None) -> None:
@@ -123,6 +136,62 @@ class ProjectIdentityMigrationTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(pool.updates, [(project_id, legacy_tenant)])
         self.assertEqual(result.migrated, 1)
         self.assertEqual(result.unresolved, ())
+        self.assertEqual(pool.markers, [(project_identity.RECONCILED_MARKER, 1, 0)])
+
+    async def test_reconciled_marker_skips_the_whole_step(self) -> None:
+        pool = _FakePool([], reconciled=True)
+        with mock.patch.object(project_identity, "read_project_tenant_uuid") as read_env:
+            result = await reconcile_project_tenant_uuids(pool, Path("/nao-existe"))
+
+        self.assertTrue(result.skipped)
+        self.assertEqual(pool.query, "")
+        read_env.assert_not_called()
+        self.assertEqual(pool.markers, [])
+
+    async def test_env_files_are_read_off_loop_with_bounded_concurrency(self) -> None:
+        rows = [
+            {
+                "id": uuid.uuid4(),
+                "name": f"p{index}",
+                "tenant_uuid": uuid.uuid4(),
+                "is_provisioned": True,
+                "command_tenant_uuid": None,
+            }
+            for index in range(12)
+        ]
+        running = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def slow_read(_root, _name):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.02)
+            with lock:
+                running -= 1
+            return None
+
+        loop_ticks = 0
+
+        async def ticker() -> None:
+            nonlocal loop_ticks
+            while True:
+                loop_ticks += 1
+                await asyncio.sleep(0.005)
+
+        tick = asyncio.create_task(ticker())
+        with mock.patch.object(project_identity, "ENV_READ_CONCURRENCY", 3), mock.patch.object(
+            project_identity, "read_project_tenant_uuid", slow_read
+        ):
+            result = await reconcile_project_tenant_uuids(_FakePool(rows), Path("/"))
+        tick.cancel()
+
+        self.assertEqual(result.already_persisted, 12)
+        self.assertEqual(peak, 3)
+        # O loop segue atendendo enquanto os .env sao lidos.
+        self.assertGreater(loop_ticks, 5)
 
     async def test_pending_project_adopts_its_canonical_id(self) -> None:
         project_id = uuid.uuid4()
@@ -193,6 +262,7 @@ class ProjectIdentityMigrationTest(unittest.IsolatedAsyncioTestCase):
 
         self.assertEqual(pool.updates, [])
         self.assertEqual(result.unresolved, ("incompleto",))
+        self.assertEqual(pool.markers, [])
 
     def test_env_reader_is_confined_and_validates_uuid(self) -> None:
         tenant_uuid = uuid.uuid4()
@@ -245,6 +315,12 @@ class ProjectIdentitySourceContractTest(unittest.TestCase):
         self.assertIn("projects_default_tenant_uuid", self.schema)
         self.assertIn("reconcile_project_tenant_uuids", self.main)
 
+    def test_reconciliation_is_one_set_based_pass(self) -> None:
+        sql = project_identity._RECONCILIATION_SQL
+        self.assertIn("DISTINCT ON (project_uuid)", sql)
+        self.assertNotIn("LIMIT 1", sql)
+        self.assertIn('Migration(8, "project_identity", ensure_project_identity_schema)', self.main)
+
 
 if __name__ == "__main__":
     unittest.main()
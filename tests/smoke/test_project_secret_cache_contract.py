@@ -0,0 +1,60 @@
+"""Contrato do cache de DEKs e da decifragem em lote dos segredos de projeto."""
+
+from __future__ import annotations
+
+import pathlib
+import unittest
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+API_APP = ROOT / "servidor" / "api-internal" / "app"
+
+
+def read(name: str) -> str:
+    return (API_APP / name).read_text(encoding="utf-8")
+
+
+def function_body(source: str, name: str) -> str:
+    start = source.index(f"async def {name}(")
+    end = source.find("\nasync def ", start + 1)
+    if end == -1:
+        end = source.find("\n@app.", start + 1)
+    return source[start:end if end != -1 else len(source)]
+
+
+class ProjectSecretCacheContractTest(unittest.TestCase):
+    def test_envelope_row_lock_is_limited_to_create_and_rewrap(self) -> None:
+        service = read("project_secret_service.py")
+        read_path = function_body(service, "_get_project_key_envelope")
+        locked_path = function_body(service, "_lock_project_key_envelope")
+
+        self.assertNotIn("$1 FOR UPDATE", read_path)
+        self.assertIn("_dek_cache.get(", read_path)
+        self.assertIn("_lock_project_key_envelope(conn, project_id)", read_path)
+        self.assertIn("FOR UPDATE", locked_path)
+        self.assertIn("rewrap_dek", locked_path)
+
+    def test_project_removal_invalidates_cached_dek(self) -> None:
+        main = read("main.py")
+        self.assertIn(
+            "invalidate_project_dek_cache(removed_id)",
+            function_body(main, "rollback_project_from_db"),
+        )
+        self.assertIn(
+            "invalidate_project_dek_cache(project_id)",
+            function_body(main, "_delete_project_impl"),
+        )
+
+    def test_project_list_decrypts_secrets_in_one_batch(self) -> None:
+        service = read("project_secret_service.py")
+        batch = function_body(service, "decrypt_project_secrets_many")
+        self.assertIn("project_id = ANY($1::uuid[])", batch)
+        self.assertEqual(batch.count("await conn.fetch("), 1)
+
+        listing = function_body(read("main.py"), "list_projects")
+        self.assertIn("decrypt_project_secrets_many(", listing)
+        self.assertNotIn("decrypt_project_secret(", listing)
+
+
+if __name__ == "__main__":
+    unittest.main()
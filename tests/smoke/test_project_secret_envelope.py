@@ -68,6 +68,81 @@ class ProjectSecretEnvelopeTest(unittest.TestCase):
         )
         self.assertEqual(new_manager.unwrap_dek(envelope), dek)
 
+    def test_ciphertext_key_id_reads_v2_header(self) -> None:
+        ciphertext = self.manager.encrypt(
+            project_id=self.project_id,
+            purpose="anon_key",
+            key_id=self.envelope.key_id,
+            dek=self.dek,
+            plaintext="anon",
+        )
+        self.assertEqual(secrets.ciphertext_key_id(ciphertext), self.envelope.key_id)
+        self.assertIsNone(secrets.ciphertext_key_id("legacy-token"))
+
+
+class ProjectDekCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 1000.0
+        self.cache = secrets.ProjectDekCache(
+            ttl_seconds=60,
+            max_entries=2,
+            clock=lambda: self.now,
+        )
+        self.envelope = secrets.ProjectKeyEnvelope(
+            key_id=str(uuid.uuid4()),
+            wrapped_dek="wrapped",
+            wrapping_key_id="master-v1",
+        )
+        self.dek = b"\x01" * 32
+
+    def test_hit_requires_matching_key_and_wrapping_key(self) -> None:
+        project_id = uuid.uuid4()
+        self.cache.put(project_id, self.envelope, self.dek)
+        self.assertEqual(
+            self.cache.get(
+                project_id,
+                wrapping_key_id="master-v1",
+                key_id=self.envelope.key_id,
+            ),
+            (self.envelope, self.dek),
+        )
+        self.assertIsNone(
+            self.cache.get(project_id, wrapping_key_id="master-v2")
+        )
+        self.assertIsNone(
+            self.cache.get(
+                project_id,
+                wrapping_key_id="master-v1",
+                key_id=str(uuid.uuid4()),
+            )
+        )
+
+    def test_entries_expire_and_can_be_invalidated(self) -> None:
+        first, second = uuid.uuid4(), uuid.uuid4()
+        self.cache.put(first, self.envelope, self.dek)
+        self.cache.put(second, self.envelope, self.dek)
+        self.cache.invalidate(first)
+        self.assertIsNone(self.cache.get(first, wrapping_key_id="master-v1"))
+        self.now += 61
+        self.assertIsNone(self.cache.get(second, wrapping_key_id="master-v1"))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_size_is_bounded_by_least_recently_used(self) -> None:
+        first, second, third = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        self.cache.put(first, self.envelope, self.dek)
+        self.cache.put(second, self.envelope, self.dek)
+        self.assertIsNotNone(self.cache.get(first, wrapping_key_id="master-v1"))
+        self.cache.put(third, self.envelope, self.dek)
+        self.assertIsNone(self.cache.get(second, wrapping_key_id="master-v1"))
+        self.assertIsNotNone(self.cache.get(first, wrapping_key_id="master-v1"))
+        self.assertEqual(len(self.cache), 2)
+
+    def test_zero_ttl_disables_cache(self) -> None:
+        cache = secrets.ProjectDekCache(ttl_seconds=0, max_entries=10)
+        project_id = uuid.uuid4()
+        cache.put(project_id, self.envelope, self.dek)
+        self.assertIsNone(cache.get(project_id, wrapping_key_id="master-v1"))
+
 
 if __name__ == "__main__":
     unittest.main()
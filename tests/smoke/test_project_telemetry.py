@@ -5,6 +5,7 @@ import datetime as dt
 import sys
 import types
 import unittest
+import uuid
 from pathlib import Path
 
 
@@ -18,8 +19,14 @@ if "asyncpg" not in sys.modules:
     sys.modules["asyncpg"] = asyncpg_stub
 
 from app.project_telemetry import (
+    ROLLUP_CHUNK,
     TelemetryValidationError,
+    decode_telemetry_cursor,
+    encode_telemetry_cursor,
     fetch_project_user_telemetry,
+    fetch_rolled_up_user_telemetry,
+    read_auth_activity_watermark,
+    refresh_auth_activity_rollups,
     resolve_telemetry_period,
 )
 
@@ -39,6 +46,63 @@ class FakeConnection:
         return self.rows
 
 
+class FakeTransaction:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_exc):
+        return False
+
+
+class FakeControlConnection:
+    def __init__(self, watermark, rows=()):
+        self.watermark = watermark
+        self.rows = list(rows)
+        self.executed = []
+        self.fetched = []
+        self.arguments = ()
+
+    def transaction(self):
+        return FakeTransaction()
+
+    async def execute(self, query, *arguments):
+        self.executed.append((query, arguments))
+        if "UPDATE project_auth_telemetry_watermarks" in query:
+            self.watermark = arguments[1]
+
+    async def fetchval(self, _query, *_arguments):
+        return self.watermark
+
+    async def fetch(self, query, *arguments):
+        self.fetched.append((query, arguments))
+        if "FROM project_auth_activity_daily" in query:
+            self.arguments = arguments
+        return self.rows
+
+
+class FakeTenantConnection:
+    def __init__(self, rows_by_window=None):
+        self.windows = []
+        self.rows_by_window = rows_by_window or {}
+
+    async def fetch(self, _query, *arguments):
+        self.windows.append(arguments)
+        return self.rows_by_window.get(arguments, [])
+
+
+def telemetry_row(index, last_login_at, **extra):
+    return {
+        "user_id": uuid.UUID(int=index),
+        "email": f"user{index}@example.test",
+        "phone": None,
+        "last_login_at": last_login_at,
+        "session_count": 1,
+        "active_users": 3,
+        "total_sessions": 3,
+        **extra,
+    }
+
+
 class ProjectTelemetryTest(unittest.TestCase):
     def test_predefined_period_is_resolved_in_utc(self) -> None:
         now = dt.datetime(2026, 7, 11, 18, 0, tzinfo=UTC)
@@ -78,6 +142,8 @@ class ProjectTelemetryTest(unittest.TestCase):
                     "phone": None,
                     "last_login_at": period.end - dt.timedelta(hours=1),
                     "session_count": 3,
+                    "active_users": 1,
+                    "total_sessions": 3,
                 }
             ]
         )
@@ -86,10 +152,295 @@ class ProjectTelemetryTest(unittest.TestCase):
 
         self.assertIn("FROM auth.sessions", connection.query)
         self.assertIn("FROM auth.users", connection.query)
-        self.assertEqual(connection.arguments, (period.start, period.end))
+        self.assertEqual(connection.arguments[:2], (period.start, period.end))
         self.assertEqual(result["active_users"], 1)
         self.assertEqual(result["total_sessions"], 3)
         self.assertEqual(result["users"][0]["user_id"], "user-1")
+        self.assertIsNone(result["next_cursor"])
+
+    def test_user_list_is_paginated_with_keyset_cursor(self) -> None:
+        period = resolve_telemetry_period(
+            "24h",
+            now=dt.datetime(2026, 7, 11, 18, 0, tzinfo=UTC),
+        )
+        rows = [
+            telemetry_row(index, period.end - dt.timedelta(minutes=index))
+            for index in range(1, 4)
+        ]
+        connection = FakeConnection(rows)
+
+        result = asyncio.run(
+            fetch_project_user_telemetry(connection, period, limit=2)
+        )
+
+        self.assertEqual(connection.arguments[2:], (None, None, 3))
+        self.assertEqual(len(result["users"]), 2)
+        self.assertEqual(result["active_users"], 3)
+        cursor = decode_telemetry_cursor(result["next_cursor"])
+        self.assertEqual(cursor.last_login_at, rows[1]["last_login_at"])
+        self.assertEqual(cursor.user_id, rows[1]["user_id"])
+
+        asyncio.run(
+            fetch_project_user_telemetry(connection, period, limit=2, cursor=cursor)
+        )
+        self.assertEqual(
+            connection.arguments[2:],
+            (rows[1]["last_login_at"], rows[1]["user_id"], 3),
+        )
+
+    def test_cursor_round_trip_and_rejects_garbage(self) -> None:
+        at = dt.datetime(2026, 7, 11, 18, 0, tzinfo=UTC)
+        user_id = uuid.uuid4()
+        cursor = decode_telemetry_cursor(encode_telemetry_cursor(at, user_id))
+        self.assertEqual((cursor.last_login_at, cursor.user_id), (at, user_id))
+        self.assertIsNone(decode_telemetry_cursor(None))
+        with self.assertRaises(TelemetryValidationError):
+            decode_telemetry_cursor("nao-e-um-cursor")
+
+    def test_rollups_only_read_closed_hours_after_the_watermark(self) -> None:
+        now = dt.datetime(2026, 7, 11, 18, 20, tzinfo=UTC)
+        upper = dt.datetime(2026, 7, 11, 18, 0, tzinfo=UTC)
+        control = FakeControlConnection(upper - dt.timedelta(days=40))
+        tenant = FakeTenantConnection()
+
+        rolled_up_to = asyncio.run(
+            refresh_auth_activity_rollups(
+                control, tenant, project_id="project-1", now=now
+            )
+        )
+
+        self.assertEqual(rolled_up_to, upper)
+        chunk_end = upper - dt.timedelta(days=40) + ROLLUP_CHUNK
+        self.assertEqual(
+            tenant.windows,
+            [(upper - dt.timedelta(days=40), chunk_end), (chunk_end, upper)],
+        )
+        # Uma transacao curta por janela: o watermark avanca a cada uma.
+        self.assertEqual(
+            [
+                arguments
+                for query, arguments in control.executed
+                if "UPDATE project_auth_telemetry_watermarks" in query
+            ],
+            [("project-1", chunk_end), ("project-1", upper)],
+        )
+
+        caught_up = FakeControlConnection(upper)
+        tenant = FakeTenantConnection()
+        asyncio.run(
+            refresh_auth_activity_rollups(
+                caught_up, tenant, project_id="project-1", now=now
+            )
+        )
+        self.assertEqual(tenant.windows, [])
+
+        # Outra replica com o lock da linha: nada a fazer aqui.
+        tenant = FakeTenantConnection()
+        self.assertIsNone(
+            asyncio.run(
+                refresh_auth_activity_rollups(
+                    FakeControlConnection(None), tenant, project_id="project-1", now=now
+                )
+            )
+        )
+        self.assertEqual(tenant.windows, [])
+
+    def test_request_only_reads_the_watermark(self) -> None:
+        now = dt.datetime(2026, 7, 11, 18, 20, tzinfo=UTC)
+        control = FakeControlConnection(dt.datetime(2026, 7, 11, 18, 0))
+        watermark = asyncio.run(
+            read_auth_activity_watermark(control, project_id="project-1", now=now)
+        )
+        self.assertEqual(watermark, dt.datetime(2026, 7, 11, 18, 0, tzinfo=UTC))
+        self.assertEqual(len(control.executed), 1)
+        self.assertIn("ON CONFLICT (project_id) DO NOTHING", control.executed[0][0])
+        self.assertEqual(
+            control.executed[0][1],
+            ("project-1", dt.datetime(2025, 7, 10, tzinfo=UTC)),
+        )
+
+    def test_rolled_up_range_is_cacheable_once_its_days_are_closed(self) -> None:
+        now = dt.datetime(2026, 7, 11, 18, 0, tzinfo=UTC)
+        period = resolve_telemetry_period(
+            "custom",
+            start=dt.datetime(2026, 6, 1, tzinfo=UTC),
+            end=dt.datetime(2026, 7, 1, tzinfo=UTC),
+            now=now,
+        )
+        control = FakeControlConnection(now, [])
+        result = asyncio.run(
+            fetch_rolled_up_user_telemetry(
+                control,
+                FakeTenantConnection(),
+                period,
+                project_id="project-1",
+                rolled_up_to=now,
+            )
+        )
+        self.assertTrue(result["closed"])
+        self.assertEqual(result["active_users"], 0)
+        self.assertEqual(
+            control.arguments[1:3],
+            (dt.date(2026, 6, 1), dt.date(2026, 7, 1)),
+        )
+
+        open_period = resolve_telemetry_period("30d", now=now)
+        result = asyncio.run(
+            fetch_rolled_up_user_telemetry(
+                control,
+                FakeTenantConnection(),
+                open_period,
+                project_id="project-1",
+                rolled_up_to=now,
+            )
+        )
+        self.assertFalse(result["closed"])
+
+    def test_partial_edge_days_are_read_from_the_tenant(self) -> None:
+        now = dt.datetime(2026, 7, 11, 18, 20, tzinfo=UTC)
+        rolled_up_to = dt.datetime(2026, 7, 11, 18, 0, tzinfo=UTC)
+        period = resolve_telemetry_period("7d", now=now)
+        control = FakeControlConnection(rolled_up_to, [])
+        tenant = FakeTenantConnection()
+        result = asyncio.run(
+            fetch_rolled_up_user_telemetry(
+                control,
+                tenant,
+                period,
+                project_id="project-1",
+                rolled_up_to=rolled_up_to,
+            )
+        )
+        self.assertEqual(
+            tenant.windows,
+            [
+                (period.start, dt.datetime(2026, 7, 5, tzinfo=UTC)),
+                (dt.datetime(2026, 7, 11, tzinfo=UTC), now),
+            ],
+        )
+        self.assertEqual(
+            control.arguments[1:3], (dt.date(2026, 7, 5), dt.date(2026, 7, 11))
+        )
+        self.assertFalse(result["closed"])
+
+    def test_lagging_watermark_leaves_unrolled_days_out(self) -> None:
+        now = dt.datetime(2026, 7, 11, 18, 20, tzinfo=UTC)
+        rolled_up_to = dt.datetime(2026, 7, 1, 18, 0, tzinfo=UTC)
+        period = resolve_telemetry_period("30d", now=now)
+        control = FakeControlConnection(rolled_up_to, [])
+        tenant = FakeTenantConnection()
+        result = asyncio.run(
+            fetch_rolled_up_user_telemetry(
+                control,
+                tenant,
+                period,
+                project_id="project-1",
+                rolled_up_to=rolled_up_to,
+            )
+        )
+        # So as pontas parciais vao ao tenant, nunca a lacuna do watermark.
+        self.assertEqual(
+            tenant.windows,
+            [
+                (period.start, dt.datetime(2026, 6, 12, tzinfo=UTC)),
+                (dt.datetime(2026, 7, 11, tzinfo=UTC), now),
+            ],
+        )
+        self.assertEqual(
+            control.arguments[1:3], (dt.date(2026, 6, 12), dt.date(2026, 7, 1))
+        )
+        self.assertFalse(result["complete"])
+        self.assertFalse(result["closed"])
+
+    def test_series_matches_the_clipped_totals(self) -> None:
+        now = dt.datetime(2026, 7, 11, 18, 20, tzinfo=UTC)
+        rolled_up_to = dt.datetime(2026, 7, 11, 18, 0, tzinfo=UTC)
+        period = resolve_telemetry_period("7d", now=now)
+        user = uuid.uuid4()
+        head = (period.start, dt.datetime(2026, 7, 5, tzinfo=UTC))
+        tail = (dt.datetime(2026, 7, 11, tzinfo=UTC), now)
+        tenant = FakeTenantConnection(
+            {
+                head: [
+                    {
+                        "user_id": user,
+                        "day": dt.date(2026, 7, 4),
+                        "session_count": 2,
+                        "last_login_at": period.start + dt.timedelta(hours=1),
+                    }
+                ],
+                tail: [
+                    {
+                        "user_id": user,
+                        "day": dt.date(2026, 7, 11),
+                        "session_count": 1,
+                        "last_login_at": now - dt.timedelta(hours=1),
+                    }
+                ],
+            }
+        )
+        control = FakeControlConnection(rolled_up_to, [])
+        result = asyncio.run(
+            fetch_rolled_up_user_telemetry(
+                control,
+                tenant,
+                period,
+                project_id="project-1",
+                rolled_up_to=rolled_up_to,
+            )
+        )
+        buckets_query, buckets_arguments = next(
+            (query, arguments)
+            for query, arguments in control.fetched
+            if "FROM project_auth_activity_buckets" in query
+        )
+        self.assertIn("granularity = 'day'", buckets_query)
+        self.assertEqual(
+            buckets_arguments[1:],
+            (dt.datetime(2026, 7, 5, tzinfo=UTC), dt.datetime(2026, 7, 11, tzinfo=UTC)),
+        )
+        self.assertEqual(result["series"]["granularity"], "day")
+        self.assertEqual(
+            [
+                (bucket["bucket_start"], bucket["active_users"], bucket["session_count"])
+                for bucket in result["series"]["buckets"]
+            ],
+            [
+                (dt.datetime(2026, 7, 4, tzinfo=UTC), 1, 2),
+                (dt.datetime(2026, 7, 11, tzinfo=UTC), 1, 1),
+            ],
+        )
+        self.assertTrue(result["complete"])
+
+    def test_range_inside_one_day_ignores_the_daily_rollups(self) -> None:
+        now = dt.datetime(2026, 7, 11, 18, 0, tzinfo=UTC)
+        period = resolve_telemetry_period(
+            "custom",
+            start=dt.datetime(2026, 7, 1, 10, tzinfo=UTC),
+            end=dt.datetime(2026, 7, 1, 14, tzinfo=UTC),
+            now=now,
+        )
+        control = FakeControlConnection(now, [])
+        tenant = FakeTenantConnection()
+        asyncio.run(
+            fetch_rolled_up_user_telemetry(
+                control, tenant, period, project_id="project-1", rolled_up_to=now
+            )
+        )
+        self.assertEqual(tenant.windows, [(period.start, period.end)])
+        first_day, end_day = control.arguments[1:3]
+        self.assertGreaterEqual(first_day, end_day)
+
+    def test_live_period_skips_the_rollup_refresh(self) -> None:
+        main_source = (APP_ROOT / "app" / "main.py").read_text(encoding="utf-8")
+        route_start = main_source.index(
+            '@app.get("/api/projects/{project_name}/telemetry/users")'
+        )
+        route_end = main_source.index("\n@app.api_route(", route_start)
+        route_source = main_source[route_start:route_end]
+        live_branch = route_source[route_source.index("        else:\n            # 24h"):]
+        self.assertIn("fetch_live_activity_series(", live_branch)
+        self.assertNotIn("refresh_auth_activity_rollups(", live_branch)
 
     def test_route_contract_requires_project_admin_or_owner(self) -> None:
         main_source = (APP_ROOT / "app" / "main.py").read_text(encoding="utf-8")
@@ -102,6 +453,9 @@ class ProjectTelemetryTest(unittest.TestCase):
         self.assertIn("is_owner", route_source)
         self.assertIn('auth_user["is_global_admin"]', route_source)
         self.assertIn('response.headers["Cache-Control"] = "no-store"', route_source)
+        self.assertIn("read_auth_activity_watermark(", route_source)
+        self.assertNotIn("refresh_auth_activity_rollups(", route_source)
+        self.assertIn("telemetry_period.uses_rollups", route_source)
 
 
     def test_telemetry_route_resolves_period_before_use(self) -> None:
@@ -0,0 +1,521 @@
+"""Dispatcher do push_worker: conexoes limitadas independentemente dos tenants."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import unittest
+import uuid
+from pathlib import Path
+from unittest import mock
+
+
+API_ROOT = Path(__file__).resolve().parents[2] / "servidor" / "api-internal"
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+os.environ.setdefault("PUSH_API_URL", "http://push.invalid/api/internal/push")
+os.environ.setdefault("INTERNAL_HMAC_SECRET", "test-secret")
+os.environ.setdefault("DB_DSN", "postgresql://user:pass@db:5432/postgres")
+
+try:
+    import asyncpg  # noqa: F401
+    import httpx
+except ModuleNotFoundError:  # pragma: no cover - depende do ambiente
+    push_worker = None
+else:
+    from app import push_worker
+
+
+class BackendCounter:
+    def __init__(self) -> None:
+        self.open = 0
+        self.peak = 0
+
+    def opened(self) -> None:
+        self.open += 1
+        self.peak = max(self.peak, self.open)
+
+    def closed(self) -> None:
+        self.open -= 1
+
+
+class FakeListener:
+    def __init__(self, counter: BackendCounter) -> None:
+        self.counter = counter
+        self.closed = False
+        counter.opened()
+
+    async def add_listener(self, _channel, _callback) -> None:
+        return None
+
+    def add_termination_listener(self, _callback) -> None:
+        return None
+
+    def is_closed(self) -> bool:
+        return self.closed
+
+    async def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.counter.closed()
+
+
+class FakeTransaction:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_exc):
+        return False
+
+
+class FakeTenantConnection:
+    def __init__(self, pending: list[dict]) -> None:
+        self.pending = pending
+        self.statuses: list[tuple] = []
+
+    def transaction(self):
+        return FakeTransaction()
+
+    async def fetch(self, query, *_args):
+        await asyncio.sleep(0)
+        if "FROM notifications" in query:
+            rows, self.pending[:] = list(self.pending), []
+            return rows
+        return []
+
+    async def execute(self, query, *args):
+        self.statuses.append((query, args))
+        return "UPDATE 1"
+
+
+class FakeAcquire:
+    def __init__(self, connection) -> None:
+        self.connection = connection
+
+    async def __aenter__(self):
+        return self.connection
+
+    async def __aexit__(self, *_exc):
+        return False
+
+
+class FakePool:
+    def __init__(self, counter: BackendCounter, pending: list[dict], max_size: int) -> None:
+        self.counter = counter
+        self.pending = pending
+        self.max_size = max_size
+        self.idle = 0
+        self.created = 0
+        self.connection = FakeTenantConnection(pending)
+
+    def acquire(self):
+        pool = self
+
+        class _Acquire:
+            async def __aenter__(self):
+                if pool.idle:
+                    pool.idle -= 1
+                else:
+                    assert pool.created < pool.max_size
+                    pool.created += 1
+                    pool.counter.opened()
+                return pool.connection
+
+            async def __aexit__(self, *_exc):
+                pool.idle += 1
+                return False
+
+        return _Acquire()
+
+    async def close(self) -> None:
+        for _ in range(self.created):
+            self.counter.closed()
+        self.created = self.idle = 0
+
+
+@unittest.skipIf(push_worker is None, "asyncpg indisponivel")
+class PushDispatcherBackendUsageTest(unittest.IsolatedAsyncioTestCase):
+    TENANTS = 500
+    HOT_TENANTS = 5
+
+    async def test_backend_usage_is_bounded_for_many_tenants(self) -> None:
+        counter = BackendCounter()
+        pending: dict[str, list[dict]] = {
+            f"_supabase_p{index}": [] for index in range(self.TENANTS)
+        }
+        for index in range(self.HOT_TENANTS):
+            pending[f"_supabase_p{index}"].append(
+                {"id": uuid.uuid4(), "user_id": uuid.uuid4(), "body": "oi"}
+            )
+        pools: dict[str, FakePool] = {}
+
+        async def fake_create_pool(dsn, *, max_size, **_kwargs):
+            db_name = dsn.rsplit("/", 1)[-1]
+            pools[db_name] = FakePool(counter, pending[db_name], max_size)
+            return pools[db_name]
+
+        async def fake_connect(_dsn, **_kwargs):
+            return FakeListener(counter)
+
+        with (
+            mock.patch.object(push_worker.asyncpg, "create_pool", fake_create_pool),
+            mock.patch.object(push_worker.asyncpg, "connect", fake_connect),
+            contextlib.redirect_stdout(io.StringIO()),
+        ):
+            dispatcher = push_worker.PushDispatcher()
+            dispatcher.sync_databases(set(pending))
+            await dispatcher.sweep()
+            await asyncio.gather(
+                *(t.drain_task for t in dispatcher.tenants.values() if t.drain_task)
+            )
+
+            bound = (
+                push_worker.PUSH_MAX_LISTENERS
+                + push_worker.PUSH_MAX_CONCURRENT_DRAINS
+                * push_worker.PUSH_TENANT_POOL_SIZE
+            )
+            self.assertLessEqual(counter.peak, bound)
+            self.assertLess(counter.peak, self.TENANTS / 10)
+            self.assertEqual(dispatcher.listener_count, self.HOT_TENANTS)
+            # Tenants frios liberam o pool ao fim do dreno; so os quentes
+            # mantem LISTEN + conexao de dreno.
+            self.assertLessEqual(counter.open, self.HOT_TENANTS * 2)
+
+            await dispatcher.shutdown()
+            self.assertEqual(counter.open, 0)
+
+
+@unittest.skipIf(push_worker is None, "asyncpg indisponivel")
+class PushDispatcherProbeTest(unittest.IsolatedAsyncioTestCase):
+    TENANTS = 500
+
+    async def test_only_tenants_with_new_notifications_open_a_pool(self) -> None:
+        counter = BackendCounter()
+        created: list[str] = []
+        notification_inserts = {"_supabase_p7": 5, "_supabase_p6": None}
+        confirmed: list[str] = []
+
+        async def fake_create_pool(dsn, *, max_size, **_kwargs):
+            db_name = dsn.rsplit("/", 1)[-1]
+            created.append(db_name)
+            return FakePool(counter, [], max_size)
+
+        async def fake_read_notification_inserts(dsn):
+            db_name = dsn.rsplit("/", 1)[-1]
+            confirmed.append(db_name)
+            return notification_inserts[db_name]
+
+        with (
+            mock.patch.object(push_worker.asyncpg, "create_pool", fake_create_pool),
+            mock.patch.object(
+                push_worker, "read_notification_inserts", fake_read_notification_inserts
+            ),
+            contextlib.redirect_stdout(io.StringIO()),
+        ):
+            dispatcher = push_worker.PushDispatcher()
+            names = {f"_supabase_p{index}" for index in range(self.TENANTS)}
+            dispatcher.sync_databases(names)
+            for tenant in dispatcher.tenants.values():
+                tenant.inserted = 10
+            p7 = dispatcher.tenants["_supabase_p7"]
+            p7.notifications_inserted = 5
+            counts = dict.fromkeys(names, 10)
+            counts["_supabase_p7"] = 11
+            counts["_supabase_p8"] = 12
+            dispatcher.tenants["_supabase_p8"].listener = FakeListener(counter)
+            counts["_supabase_p9"] = 13
+            dispatcher.tenants["_supabase_p9"].disabled_until = dispatcher._now() + 60
+
+            # INSERT em outra tabela do banco: confirma, mas nao abre pool.
+            candidates = dispatcher.probe(counts)
+            self.assertEqual([tenant.db_name for tenant in candidates], ["_supabase_p7"])
+            self.assertEqual(await dispatcher.confirm(candidates), [])
+            self.assertEqual(confirmed, ["_supabase_p7"])
+            self.assertEqual(created, [])
+            self.assertFalse(p7.confirm_pending)
+            # O tenant em espera guarda a mudanca para quando voltar.
+            self.assertEqual(dispatcher.tenants["_supabase_p9"].inserted, 10)
+
+            # Mudanca dentro de PUSH_CONFIRM_INTERVAL fica pendente.
+            counts["_supabase_p7"] = 12
+            notification_inserts["_supabase_p7"] = 6
+            candidates = dispatcher.probe(counts)
+            self.assertEqual(await dispatcher.confirm(candidates), [])
+            self.assertEqual(confirmed, ["_supabase_p7"])
+            self.assertTrue(p7.confirm_pending)
+
+            p7.confirmed_at -= push_worker.PUSH_CONFIRM_INTERVAL
+            woken = await dispatcher.confirm(dispatcher.probe(counts))
+            await asyncio.gather(
+                *(t.drain_task for t in dispatcher.tenants.values() if t.drain_task)
+            )
+            self.assertEqual(woken, [p7])
+            self.assertEqual(created, ["_supabase_p7"])
+
+            # Banco sem a tabela notifications fica em espera.
+            p6 = dispatcher.tenants["_supabase_p6"]
+            counts["_supabase_p6"] = 11
+            self.assertEqual(await dispatcher.confirm(dispatcher.probe(counts)), [])
+            self.assertGreater(p6.disabled_until, dispatcher._now())
+            await dispatcher.shutdown()
+
+    def test_worker_reads_the_cluster_counter_instead_of_sweeping_every_tenant(self) -> None:
+        source = (API_ROOT / "app" / "push_worker.py").read_text(encoding="utf-8")
+        manager = source[source.index("async def worker_manager("):]
+        self.assertIn("FROM pg_stat_database", source)
+        self.assertIn("dispatcher.probe(await read_insert_counters(control))", manager)
+        self.assertIn("await dispatcher.confirm(candidates)", manager)
+        self.assertIn("FROM pg_stat_user_tables", source)
+        self.assertIn("relname = 'notifications'", source)
+        self.assertGreaterEqual(push_worker.PUSH_SWEEP_INTERVAL, 600)
+
+
+class DeliveryConnection(FakeTenantConnection):
+    def __init__(self, pending: list[dict], tokens: dict) -> None:
+        super().__init__(pending)
+        self.tokens = tokens
+
+        self.token_queries = 0
+
+    async def fetch(self, query, *args):
+        if "FROM push_tokens" in query:
+            self.token_queries += 1
+            return [
+                {"user_id": user_id, "token": token}
+                for user_id in args[0]
+                for token in self.tokens[user_id]
+            ]
+        return await super().fetch(query, *args)
+
+
+@unittest.skipIf(push_worker is None, "asyncpg indisponivel")
+class PushBatchDeliveryTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.in_flight = 0
+        self.peak = 0
+        self.held_connections = 0
+        self.batches: list[list[dict]] = []
+
+        async def stub_endpoint(request):
+            self.assertIn("X-Internal-Signature", request.headers)
+            # A chamada HTTP nao pode segurar conexao (nem transacao) do tenant.
+            self.assertEqual(self.held_connections, 0)
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            await asyncio.sleep(0.01)
+            self.in_flight -= 1
+            items = json.loads(request.content)["items"]
+            self.batches.append(items)
+            return httpx.Response(
+                200,
+                json={
+                    "results": [
+                        {"id": item["id"], "ok": not item["token"].startswith("bad")}
+                        for item in items
+                    ]
+                },
+            )
+
+        push_worker._http_client = httpx.AsyncClient(
+            transport=httpx.MockTransport(stub_endpoint)
+        )
+
+    async def asyncTearDown(self) -> None:
+        await push_worker.close_http_client()
+
+    async def drain(self, *, batch_items: int, tenant_cap: int):
+        users = [uuid.uuid4() for _ in range(4)]
+        tokens = {
+            users[0]: ["a1", "a2", "a3", "a4", "a5", "a6"],
+            users[1]: ["b1", "bad-b2"],
+            users[2]: ["bad-c1"],
+            users[3]: [],
+        }
+        rows = [{"id": uuid.uuid4(), "user_id": user, "body": "oi"} for user in users]
+        conn = DeliveryConnection(list(rows), tokens)
+        conn.transaction = None
+        test = self
+
+        class _Acquire(FakeAcquire):
+            async def __aenter__(self):
+                test.held_connections += 1
+                return self.connection
+
+            async def __aexit__(self, *_exc):
+                test.held_connections -= 1
+                return False
+
+        class _Pool:
+            def acquire(self):
+                return _Acquire(conn)
+
+        async def fake_get_pool():
+            return _Pool()
+
+        with (
+            mock.patch.object(push_worker, "PUSH_TENANT_MAX_IN_FLIGHT", tenant_cap),
+            mock.patch.object(push_worker, "PUSH_BATCH_MAX_ITEMS", batch_items),
+            contextlib.redirect_stdout(io.StringIO()),
+        ):
+            tenant = push_worker.TenantState("_supabase_bench")
+            tenant.get_pool = fake_get_pool
+            processed = await push_worker.drain_tenant(tenant)
+
+        self.assertEqual(processed, 4)
+        self.assertEqual(conn.token_queries, 1)
+        self.assertEqual(len(conn.statuses), 3)
+        self.assertIn("ADD COLUMN IF NOT EXISTS claimed_at", conn.statuses[0][0])
+        reclaim_query, reclaim_args = conn.statuses[1]
+        self.assertIn("SET status = 'pendente'", reclaim_query)
+        self.assertIn("COALESCE(claimed_at, created_at) < now()", reclaim_query)
+        self.assertEqual(
+            reclaim_args, ("processando", push_worker.PUSH_CLAIM_STALL_SECONDS)
+        )
+        query, (ids, statuses, claimed, owner) = conn.statuses[2]
+        self.assertIn("unnest($1::uuid[], $2::text[])", query)
+        self.assertIn("n.claimed_by = $4", query)
+        self.assertEqual(claimed, "processando")
+        self.assertEqual(owner, push_worker.WORKER_ID)
+        self.assertEqual(
+            dict(zip(ids, statuses)),
+            {
+                rows[0]["id"]: "enviado",
+                rows[1]["id"]: "enviado",
+                rows[2]["id"]: "erro",
+                rows[3]["id"]: "sem_token",
+            },
+        )
+
+    async def test_tokens_of_a_drain_share_one_signed_request(self) -> None:
+        await self.drain(batch_items=100, tenant_cap=4)
+        self.assertEqual([len(batch) for batch in self.batches], [9])
+
+    async def test_batches_are_split_by_size_and_sent_concurrently(self) -> None:
+        await self.drain(batch_items=2, tenant_cap=2)
+        self.assertEqual(sum(len(batch) for batch in self.batches), 9)
+        self.assertTrue(all(len(batch) <= 2 for batch in self.batches))
+        self.assertEqual(self.peak, 2)
+
+@unittest.skipIf(push_worker is None, "asyncpg indisponivel")
+class PushClaimRecoveryTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncTearDown(self) -> None:
+        await push_worker.close_http_client()
+
+    def tenant_with(self, conn):
+        class _Pool:
+            def acquire(self):
+                return FakeAcquire(conn)
+
+        async def fake_get_pool():
+            return _Pool()
+
+        tenant = push_worker.TenantState("_supabase_claims")
+        tenant.get_pool = fake_get_pool
+        return tenant
+
+    async def test_failed_status_write_is_saved_before_claiming_again(self) -> None:
+        sent: list[str] = []
+
+        async def stub_endpoint(request):
+            items = json.loads(request.content)["items"]
+            sent.extend(item["token"] for item in items)
+            return httpx.Response(
+                200, json={"results": [{"id": item["id"], "ok": True} for item in items]}
+            )
+
+        push_worker._http_client = httpx.AsyncClient(
+            transport=httpx.MockTransport(stub_endpoint)
+        )
+        user = uuid.uuid4()
+        row = {"id": uuid.uuid4(), "user_id": user, "body": "oi"}
+        conn = DeliveryConnection([row], {user: ["t1"]})
+        original_execute = conn.execute
+
+        async def failing_status_write(query, *args):
+            if "unnest(" in query:
+                raise OSError("conexao perdida")
+            return await original_execute(query, *args)
+
+        conn.execute = failing_status_write
+        tenant = self.tenant_with(conn)
+        with contextlib.redirect_stdout(io.StringIO()):
+            with self.assertRaises(OSError):
+                await push_worker.drain_tenant(tenant)
+            self.assertEqual(tenant.unsaved_statuses, {row["id"]: "enviado"})
+
+            conn.execute = original_execute
+            self.assertEqual(await push_worker.drain_tenant(tenant), 0)
+
+        self.assertEqual(sent, ["t1"])
+        self.assertEqual(tenant.unsaved_statuses, {})
+        saved = [args for query, args in conn.statuses if "unnest(" in query]
+        self.assertEqual(saved, [([row["id"]], ["enviado"], "processando", push_worker.WORKER_ID)])
+
+    async def test_cancelled_drain_cancels_batches_in_flight(self) -> None:
+        started = asyncio.Event()
+
+        async def hanging_endpoint(_request):
+            started.set()
+            await asyncio.sleep(3600)
+
+        push_worker._http_client = httpx.AsyncClient(
+            transport=httpx.MockTransport(hanging_endpoint)
+        )
+        user = uuid.uuid4()
+        conn = DeliveryConnection(
+            [{"id": uuid.uuid4(), "user_id": user, "body": "oi"}], {user: ["t1"]}
+        )
+        tenant = self.tenant_with(conn)
+        drain = asyncio.create_task(push_worker.drain_tenant(tenant))
+        await asyncio.wait_for(started.wait(), 1)
+        self.assertEqual(len(tenant.batcher.tasks), 1)
+
+        drain.cancel()
+        await asyncio.gather(drain, return_exceptions=True)
+
+        self.assertEqual(tenant.batcher.tasks, set())
+        self.assertFalse([query for query, _args in conn.statuses if "unnest(" in query])
+
+
+class PushBatchGatewayContractTest(unittest.TestCase):
+    def test_gateway_answers_batches_with_per_item_results(self) -> None:
+        root = Path(__file__).resolve().parents[2]
+        gateway = (root / "studio/nginx/lua/send_push.lua").read_text(encoding="utf-8")
+        worker = (API_ROOT / "app" / "push_worker.py").read_text(encoding="utf-8")
+
+        self.assertIn("local MAX_BATCH_ITEMS = 500", gateway)
+        self.assertIn("req_body.items", gateway)
+        self.assertIn("cjson.encode({results = results})", gateway)
+        self.assertIn("PUSH_BATCH_MAX_ITEMS > 500", worker)
+        self.assertIn('"items": [', worker)
+
+    @unittest.skipIf(push_worker is None, "asyncpg indisponivel")
+    def test_gateway_sends_concurrently_within_the_batch_budget(self) -> None:
+        root = Path(__file__).resolve().parents[2]
+        gateway = (root / "studio/nginx/lua/send_push.lua").read_text(encoding="utf-8")
+
+        self.assertIn(
+            f"local FCM_CONCURRENCY = {push_worker.GATEWAY_FCM_CONCURRENCY}", gateway
+        )
+        self.assertIn("ngx.thread.spawn(send_pending)", gateway)
+        self.assertIn("req_body.budget_ms", gateway)
+        self.assertIn("ngx.now() >= deadline", gateway)
+
+    @unittest.skipIf(push_worker is None, "asyncpg indisponivel")
+    def test_worker_waits_past_the_budget_of_larger_batches(self) -> None:
+        small = push_worker.batch_timeout(1)
+        large = push_worker.batch_timeout(100)
+
+        self.assertEqual(large - small, 6 * push_worker.PUSH_BATCH_ROUND_SECONDS)
+        self.assertGreaterEqual(
+            large - push_worker.batch_budget(100), push_worker.GATEWAY_CALL_SECONDS
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
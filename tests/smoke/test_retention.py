@@ -0,0 +1,120 @@
+"""Retencao: lotes terminais para o arquivo, por acao e com uma replica."""
+
+from __future__ import annotations
+
+import sys
+import unittest
+from pathlib import Path
+
+
+API_ROOT = Path(__file__).resolve().parents[2] / "servidor" / "api-internal"
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+try:
+    import asyncpg  # noqa: F401
+except ModuleNotFoundError:  # pragma: no cover - depende do ambiente
+    retention = None
+else:
+    from app import retention
+
+
+class FakeRetentionConnection:
+    def __init__(self, batches: dict[str, list[int]], *, owns_lock: bool = True) -> None:
+        self.batches = batches
+        self.owns_lock = owns_lock
+        self.calls: list[tuple[str, tuple]] = []
+
+    async def fetchval(self, query, *args):
+        return self.owns_lock
+
+    async def execute(self, query, *args):
+        table = "jobs" if query is retention._ARCHIVE_JOBS else "host_agent_commands"
+        self.calls.append((table, args))
+        pending = self.batches[table]
+        return f"INSERT 0 {pending.pop(0) if pending else 0}"
+
+    def transaction(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeRetentionPool:
+    def __init__(self, conn: FakeRetentionConnection) -> None:
+        self.conn = conn
+
+    def acquire(self):
+        return self.conn
+
+
+@unittest.skipIf(retention is None, "asyncpg indisponivel")
+class ArchiveExpiredRowsTest(unittest.IsolatedAsyncioTestCase):
+    async def archive(self, conn: FakeRetentionConnection) -> dict[str, int]:
+        return await retention.archive_expired_rows(
+            FakeRetentionPool(conn),
+            jobs_policy=retention.RetentionPolicy(90, {"rotate_key": 30, "backup": 365}),
+            commands_policy=retention.RetentionPolicy(14),
+            batch_size=2,
+        )
+
+    async def test_commands_then_jobs_until_a_short_batch(self) -> None:
+        conn = FakeRetentionConnection({"host_agent_commands": [2, 1], "jobs": [2, 2, 0]})
+        moved = await self.archive(conn)
+
+        self.assertEqual(moved, {"host_agent_commands": 3, "jobs": 4})
+        self.assertEqual(
+            [table for table, _ in conn.calls],
+            ["host_agent_commands"] * 2 + ["jobs"] * 3,
+        )
+        self.assertEqual(conn.calls[-1][1], (["backup", "rotate_key"], [365, 30], 90, 2))
+        self.assertEqual(conn.calls[0][1], ([], [], 14, 2))
+
+    async def test_another_replica_holding_the_lock_skips_the_run(self) -> None:
+        conn = FakeRetentionConnection({"host_agent_commands": [2], "jobs": [2]}, owns_lock=False)
+        moved = await self.archive(conn)
+
+        self.assertEqual(moved, {"host_agent_commands": 0, "jobs": 0})
+        self.assertEqual(conn.calls, [])
+
+    def test_only_terminal_rows_leave_the_hot_tables(self) -> None:
+        for query in (retention._ARCHIVE_JOBS, retention._ARCHIVE_COMMANDS):
+            self.assertIn("status IN ('done', 'failed', 'cancelled')", query)
+            self.assertIn("FOR UPDATE OF", query)
+            self.assertIn("SKIP LOCKED", query)
+            self.assertIn("COALESCE(p.days, $3)", query)
+        # Retry ativo mantem a raiz; evidencia de tenant legado nao e arquivada.
+        self.assertIn("r.retry_of = j.job_id", retention._ARCHIVE_JOBS)
+        self.assertIn("host_agent_commands c WHERE c.job_id = j.job_id", retention._ARCHIVE_JOBS)
+        self.assertIn("pr.tenant_uuid IS NULL", retention._ARCHIVE_COMMANDS)
+
+    async def test_orphan_log_chunks_of_finished_or_stale_commands_are_swept(self) -> None:
+        calls: list[tuple[str, tuple]] = []
+
+        class Pool:
+            async def execute(self, query, *args):
+                calls.append((query, args))
+                return "DELETE 7"
+
+        self.assertEqual(await retention.sweep_log_chunks(Pool()), 7)
+        query, args = calls[0]
+        self.assertIs(query, retention._SWEEP_LOG_CHUNKS)
+        self.assertEqual(
+            args, (retention.LOG_CHUNK_GRACE_SECONDS, retention.LOG_CHUNK_STALE_SECONDS)
+        )
+        self.assertIn("c.status IN ('done', 'failed', 'cancelled')", query)
+        self.assertIn("l.created_at < now()", query)
+
+    def test_startup_registers_schema_and_loop(self) -> None:
+        main_source = (API_ROOT / "app" / "main.py").read_text(encoding="utf-8")
+        self.assertIn('Migration(10, "retention", ensure_retention_schema)', main_source)
+        self.assertIn("start_retention(", main_source)
+        self.assertIn("await stop_retention()", main_source)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,216 @@
+"""Ledger de migracoes: boot com schema em dia e uma leitura so."""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+import unittest
+import uuid
+from pathlib import Path
+
+from tests.smoke.common import env_flag
+
+
+API_ROOT = Path(__file__).resolve().parents[2] / "servidor" / "api-internal"
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+try:
+    import asyncpg
+except ModuleNotFoundError:  # pragma: no cover - depende do ambiente
+    database_schema = None
+    jobs = None
+else:
+    from app import database_schema, jobs
+
+
+JOBS_ROWS = 1_000_000
+
+
+class FakeLedgerConnection:
+    """Emula o ledger e conta linhas de ``jobs`` varridas por DDL/backfill."""
+
+    def __init__(self, state: dict) -> None:
+        self.state = state
+
+    async def fetch(self, query, *args):
+        self.state["queries"] += 1
+        if self.state["ledger"] is None:
+            raise asyncpg.UndefinedTableError("schema_migrations")
+        return [
+            {"version": version, "checksum": checksum}
+            for version, (_, checksum) in self.state["ledger"].items()
+        ]
+
+    async def execute(self, query, *args):
+        self.state["queries"] += 1
+        if "CREATE TABLE IF NOT EXISTS schema_migrations" in query:
+            if self.state["ledger"] is None:
+                self.state["ledger"] = {}
+        elif "INSERT INTO schema_migrations" in query:
+            self.state["ledger"][args[0]] = (args[1], args[2])
+        elif "pg_advisory_xact_lock" in query:
+            self.state["locks"] += 1
+        elif "UPDATE jobs" in query or "ALTER TABLE jobs" in query:
+            self.state["jobs_rows_scanned"] += JOBS_ROWS
+        return ""
+
+    def transaction(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeLedgerPool:
+    def __init__(self) -> None:
+        self.state = {"ledger": None, "queries": 0, "locks": 0, "jobs_rows_scanned": 0}
+
+    def acquire(self):
+        return FakeLedgerConnection(self.state)
+
+    def reset_counters(self) -> None:
+        self.state.update(queries=0, locks=0, jobs_rows_scanned=0)
+
+
+async def empty_step(conn) -> None:
+    await conn.execute("CREATE TABLE IF NOT EXISTS example (id INTEGER)")
+
+
+@unittest.skipIf(database_schema is None, "asyncpg indisponivel")
+class SchemaMigrationLedgerTest(unittest.IsolatedAsyncioTestCase):
+    def migrations(self):
+        return (
+            database_schema.Migration(1, "example", empty_step),
+            database_schema.Migration(2, "jobs", jobs.ensure_jobs_schema),
+        )
+
+    async def test_up_to_date_boot_is_a_single_version_check(self) -> None:
+        pool = FakeLedgerPool()
+        applied = await database_schema.apply_schema_migrations(pool, self.migrations())
+        self.assertEqual([migration.version for migration in applied], [1, 2])
+        self.assertEqual(pool.state["locks"], 1)
+        self.assertGreater(pool.state["jobs_rows_scanned"], 0)
+
+        pool.reset_counters()
+        applied = await database_schema.apply_schema_migrations(pool, self.migrations())
+        self.assertEqual(applied, [])
+        self.assertEqual(pool.state["queries"], 1)
+        self.assertEqual(pool.state["locks"], 0)
+        self.assertEqual(pool.state["jobs_rows_scanned"], 0)
+
+    async def test_new_version_applies_only_the_new_step(self) -> None:
+        pool = FakeLedgerPool()
+        await database_schema.apply_schema_migrations(pool, self.migrations()[:1])
+        pool.reset_counters()
+        applied = await database_schema.apply_schema_migrations(pool, self.migrations())
+        self.assertEqual([migration.name for migration in applied], ["jobs"])
+        self.assertEqual(pool.state["locks"], 1)
+
+    async def test_edited_migration_is_rejected(self) -> None:
+        pool = FakeLedgerPool()
+        await database_schema.apply_schema_migrations(pool, self.migrations())
+
+        async def edited_step(conn) -> None:
+            await conn.execute("CREATE TABLE IF NOT EXISTS example (id BIGINT)")
+
+        with self.assertRaises(database_schema.SchemaMigrationError):
+            await database_schema.apply_schema_migrations(
+                pool,
+                (database_schema.Migration(1, "example", edited_step),),
+            )
+
+    async def test_checksum_ignores_python_indentation(self) -> None:
+        async def indented_step(conn) -> None:
+            await conn.execute(
+                """
+                    CREATE TABLE IF NOT EXISTS example (id INTEGER)
+                """
+            )
+
+        self.assertEqual(
+            await database_schema.migration_checksum(
+                database_schema.Migration(1, "example", empty_step)
+            ),
+            await database_schema.migration_checksum(
+                database_schema.Migration(1, "example", indented_step)
+            ),
+        )
+
+    async def test_versions_must_be_unique_and_ordered(self) -> None:
+        with self.assertRaises(database_schema.SchemaMigrationError):
+            await database_schema.apply_schema_migrations(
+                FakeLedgerPool(), tuple(reversed(self.migrations()))
+            )
+
+    def test_startup_runs_the_ledger_instead_of_every_ensure(self) -> None:
+        main_source = (API_ROOT / "app" / "main.py").read_text(encoding="utf-8")
+        startup = main_source[main_source.index("async def startup():"):]
+        startup = startup[: startup.index("\n@app.on_event")]
+        self.assertIn("apply_schema_migrations(pool, SCHEMA_MIGRATIONS)", startup)
+        self.assertNotIn("ensure_", startup)
+
+
+@unittest.skipUnless(env_flag("RUN_MIGRATIONS_SMOKE"), "set RUN_MIGRATIONS_SMOKE=1")
+class LiveSchemaMigrationBootTest(unittest.IsolatedAsyncioTestCase):
+    """Mede o boot contra ``jobs`` com 1M linhas num schema descartavel."""
+
+    async def asyncSetUp(self) -> None:
+        self.schema = f"migrations_smoke_{uuid.uuid4().hex[:8]}"
+        admin = await asyncpg.connect(os.environ["SMOKE_DB_DSN"])
+        try:
+            await admin.execute(f"CREATE SCHEMA {self.schema}")
+        finally:
+            await admin.close()
+        self.pool = await asyncpg.create_pool(
+            os.environ["SMOKE_DB_DSN"],
+            min_size=1,
+            max_size=2,
+            server_settings={"search_path": self.schema},
+        )
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                f"""
+                CREATE TABLE users (id UUID PRIMARY KEY);
+                CREATE TABLE projects (id UUID PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+                CREATE TABLE jobs (
+                    job_id UUID PRIMARY KEY,
+                    project TEXT NOT NULL,
+                    owner_id UUID,
+                    status TEXT NOT NULL,
+                    action TEXT NOT NULL,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                );
+                INSERT INTO jobs(job_id, project, status, action)
+                SELECT md5(i::text)::uuid, 'p' || (i % 100), 'done',
+                       (ARRAY['start', 'stop', 'backup'])[1 + i % 3]
+                FROM generate_series(1, {JOBS_ROWS}) AS i;
+                """
+            )
+
+    async def asyncTearDown(self) -> None:
+        async with self.pool.acquire() as conn:
+            await conn.execute(f"DROP SCHEMA {self.schema} CASCADE")
+        await self.pool.close()
+
+    async def test_second_boot_does_not_touch_the_jobs_history(self) -> None:
+        migrations = (database_schema.Migration(1, "jobs", jobs.ensure_jobs_schema),)
+        started = time.monotonic()
+        await database_schema.apply_schema_migrations(self.pool, migrations)
+        first_boot = time.monotonic() - started
+
+        started = time.monotonic()
+        applied = await database_schema.apply_schema_migrations(self.pool, migrations)
+        second_boot = time.monotonic() - started
+        print(f"\n[migrations] boot inicial {first_boot:.2f}s, boot em dia {second_boot:.3f}s")
+        self.assertEqual(applied, [])
+        self.assertLess(second_boot, 0.5)
+        self.assertLess(second_boot, first_boot / 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -49,11 +49,17 @@ class StudioApiTransportAndActivityTests(unittest.TestCase):
         start = source.index("async def resolve_authenticated_user(")
         end = source.index("async def get_user_record_by_identifier(", start)
         block = source[start:end]
-        self.assertIn("SET last_seen_at = now(), updated_at = now()", block)
-        self.assertIn("last_seen_at < now() - interval '5 minutes'", block)
-        self.assertIn("SET last_login_at = now()", block)
-        self.assertIn("last_login_session_hash IS DISTINCT FROM $2", block)
         self.assertIn('token_claims.get("login_session")', block)
+        self.assertIn("record_user_activity(", block)
+
+        activity = (
+            ROOT / "servidor/api-internal/app/user_activity.py"
+        ).read_text(encoding="utf-8")
+        self.assertIn("u.last_seen_at < v.seen_at - interval '5 minutes'", activity)
+        self.assertIn("THEN v.login_at", activity)
+        self.assertIn(
+            "u.last_login_session_hash IS DISTINCT FROM v.session_hash", activity
+        )
 
     def test_identity_schema_exposes_last_seen_at(self) -> None:
         source = (
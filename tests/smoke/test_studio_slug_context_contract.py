@@ -52,7 +52,7 @@ class StudioSlugContextContractTest(unittest.TestCase):
         endpoint = internal[start:end]
 
         self.assertIn("resolve_authenticated_user(request, pool)", endpoint)
-        self.assertIn("ensure_project_member_access(", endpoint)
+        self.assertIn("access.require_member(", endpoint)
         self.assertIn('column="anon_key"', endpoint)
         self.assertIn('"tenant_uuid"', endpoint)
         self.assertIn('"file_size_limit"', endpoint)
@@ -228,17 +228,17 @@ class ProjectFileSizeLimitTest(unittest.TestCase):
     def test_limit_is_read_server_side_and_has_a_safe_default(self) -> None:
         root = pathlib.Path("/projects")
         with mock.patch(
-            "app.project_settings.dotenv_values",
+            "app.project_settings.read_project_env",
             return_value={"FILE_SIZE_LIMIT": "123456"},
-        ) as dotenv_values:
+        ) as read_project_env:
             self.assertEqual(
                 self.get_limit("alpha", projects_root=root),
                 "123456",
             )
-            dotenv_values.assert_called_once_with(root / "alpha" / ".env")
+            read_project_env.assert_called_once_with(root / "alpha" / ".env")
 
         with mock.patch(
-            "app.project_settings.dotenv_values",
+            "app.project_settings.read_project_env",
             side_effect=OSError("missing"),
         ):
             self.assertEqual(
@@ -0,0 +1,114 @@
+"""Pools por tenant: reuso, limite LRU, ociosidade e invalidacao."""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+
+API_ROOT = Path(__file__).resolve().parents[2] / "servidor" / "api-internal"
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+try:
+    import asyncpg  # noqa: F401
+except ModuleNotFoundError:  # pragma: no cover - depende do ambiente
+    tenant_pools = None
+else:
+    from app import tenant_pools
+
+
+class FakeTenantPool:
+    def __init__(self, dsn: str) -> None:
+        self.dsn = dsn
+        self.connects = 0
+        self.borrowed = 0
+        self.closed = False
+
+    async def acquire(self):
+        self.borrowed += 1
+        self.connects += 1
+        return object()
+
+    async def release(self, _conn) -> None:
+        self.borrowed -= 1
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+@unittest.skipIf(tenant_pools is None, "asyncpg indisponivel")
+class TenantPoolManagerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.created: list[FakeTenantPool] = []
+
+        async def fake_create_pool(dsn, *, min_size, max_size, max_inactive_connection_lifetime):
+            self.assertEqual(min_size, 0)
+            self.assertEqual(max_inactive_connection_lifetime, 300)
+            pool = FakeTenantPool(dsn)
+            self.created.append(pool)
+            return pool
+
+        patcher = mock.patch.object(tenant_pools.asyncpg, "create_pool", fake_create_pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.manager = tenant_pools.TenantPoolManager(
+            lambda ref: f"postgresql://db/_supabase_{ref}",
+            max_tenants=2,
+            max_size=2,
+            idle_seconds=300,
+        )
+
+    async def asyncTearDown(self) -> None:
+        await self.manager.close()
+
+    async def use(self, ref: str) -> None:
+        conn = await self.manager.acquire(ref)
+        await self.manager.release(conn)
+
+    async def test_repeated_requests_reuse_the_tenant_pool(self) -> None:
+        for _ in range(5):
+            await self.use("alpha")
+        self.assertEqual([pool.dsn for pool in self.created], ["postgresql://db/_supabase_alpha"])
+        self.assertEqual(self.created[0].borrowed, 0)
+
+    async def test_open_pools_are_capped_by_lru(self) -> None:
+        await self.use("alpha")
+        await self.use("beta")
+        await self.use("alpha")
+        await self.use("gamma")
+        await asyncio.sleep(0)
+        self.assertEqual(len(self.manager), 2)
+        closed = [pool.dsn.rsplit("_", 1)[-1] for pool in self.created if pool.closed]
+        self.assertEqual(closed, ["beta"])
+
+    async def test_idle_pools_are_dropped(self) -> None:
+        await self.use("alpha")
+        with mock.patch.object(tenant_pools.time, "monotonic", return_value=10**9):
+            await self.use("beta")
+        await asyncio.sleep(0)
+        self.assertTrue(self.created[0].closed)
+        self.assertEqual(len(self.manager), 1)
+
+    async def test_invalidate_returns_borrowed_connection_to_its_pool(self) -> None:
+        conn = await self.manager.acquire("alpha")
+        await self.manager.invalidate("alpha")
+        await self.manager.release(conn)
+        await asyncio.sleep(0)
+        self.assertTrue(self.created[0].closed)
+        self.assertEqual(self.created[0].borrowed, 0)
+        await self.use("alpha")
+        self.assertEqual(len(self.created), 2)
+
+    def test_main_no_longer_opens_bare_tenant_connections(self) -> None:
+        main = (API_ROOT / "app" / "main.py").read_text(encoding="utf-8")
+        self.assertNotIn("get_project_conn", main)
+        self.assertNotIn("asyncpg.connect(", main)
+        self.assertEqual(main.count("await tenant_pools.invalidate("), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
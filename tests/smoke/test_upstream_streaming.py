@@ -0,0 +1,184 @@
+"""Proxy de pg-meta/Analytics: clientes compartilhados e corpos em streaming."""
+
+from __future__ import annotations
+
+import sys
+import tracemalloc
+import unittest
+from pathlib import Path
+
+
+API_ROOT = Path(__file__).resolve().parents[2] / "servidor" / "api-internal"
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+try:
+    import httpx
+    from starlette.requests import Request
+except ModuleNotFoundError:  # pragma: no cover - depende do ambiente
+    upstream_http = None
+else:
+    from app import upstream_http
+
+
+CHUNK = 64 * 1024
+
+
+if upstream_http is not None:
+
+    class StreamingTransport(httpx.AsyncBaseTransport):
+        """Como ``MockTransport``, mas sem ler o corpo antes do handler."""
+
+        def __init__(self, handler) -> None:
+            self.handler = handler
+
+        async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+            return await self.handler(request)
+
+
+def build_request(method: str, body_chunks: int = 0) -> "Request":
+    remaining = body_chunks
+    headers = [(b"content-type", b"application/json")]
+    if body_chunks:
+        headers.append((b"content-length", str(body_chunks * CHUNK).encode()))
+
+    async def receive():
+        nonlocal remaining
+        if remaining == 0:
+            return {"type": "http.request", "body": b"", "more_body": False}
+        remaining -= 1
+        return {"type": "http.request", "body": b"x" * CHUNK, "more_body": remaining > 0}
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": "/",
+        "query_string": b"include_columns=true",
+        "headers": headers,
+    }
+    return Request(scope, receive)
+
+
+@unittest.skipIf(upstream_http is None, "httpx/starlette indisponiveis")
+class UpstreamStreamingTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncTearDown(self) -> None:
+        await upstream_http.close_upstream_clients()
+
+    def install_upstream(self, response_chunks: int) -> list[dict]:
+        seen: list[dict] = []
+
+        async def body():
+            for _ in range(response_chunks):
+                yield b"y" * CHUNK
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            received = 0
+            largest = 0
+            async for chunk in request.stream:
+                received += len(chunk)
+                largest = max(largest, len(chunk))
+            seen.append(
+                {
+                    "received": received,
+                    "largest_chunk": largest,
+                    "headers": request.headers,
+                    "params": dict(request.url.params),
+                }
+            )
+            return httpx.Response(
+                200,
+                headers={"content-type": "application/json", "x-internal": "1"},
+                content=body(),
+            )
+
+        upstream_http._clients[upstream_http.PG_META_UPSTREAM] = httpx.AsyncClient(
+            transport=StreamingTransport(handler)
+        )
+        return seen
+
+    async def proxy_once(self, request: "Request") -> tuple[int, int]:
+        upstream = await upstream_http.open_upstream_stream(
+            upstream_http.get_upstream_client(upstream_http.PG_META_UPSTREAM),
+            request,
+            "http://pg-meta/tables",
+            headers={"x-connection-encrypted": "cipher"},
+        )
+        response = upstream_http.stream_upstream_response(upstream)
+        self.assertNotIn("x-internal", response.headers)
+        total = 0
+        largest = 0
+        async for chunk in response.body_iterator:
+            total += len(chunk)
+            largest = max(largest, len(chunk))
+        self.assertTrue(upstream.is_closed)
+        return total, largest
+
+    async def test_request_body_is_streamed_with_its_length(self) -> None:
+        seen = self.install_upstream(response_chunks=1)
+        await self.proxy_once(build_request("POST", body_chunks=16))
+        self.assertEqual(seen[0]["received"], 16 * CHUNK)
+        self.assertEqual(seen[0]["largest_chunk"], CHUNK)
+        self.assertEqual(seen[0]["headers"]["content-length"], str(16 * CHUNK))
+        self.assertNotIn("transfer-encoding", seen[0]["headers"])
+        self.assertEqual(seen[0]["params"], {"include_columns": "true"})
+
+    async def test_get_without_body_sends_no_body(self) -> None:
+        seen = self.install_upstream(response_chunks=1)
+        await self.proxy_once(build_request("GET"))
+        self.assertEqual(seen[0]["received"], 0)
+        self.assertNotIn("transfer-encoding", seen[0]["headers"])
+
+    async def test_memory_per_request_stays_flat_as_payload_grows(self) -> None:
+        peaks = {}
+        for chunks in (16, 1024):  # 1 MiB e 64 MiB
+            self.install_upstream(response_chunks=chunks)
+            tracemalloc.start()
+            try:
+                total, largest = await self.proxy_once(
+                    build_request("POST", body_chunks=chunks)
+                )
+                peaks[chunks] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            self.assertEqual(total, chunks * CHUNK)
+            self.assertLessEqual(largest, CHUNK)
+
+        # Pico limitado a poucos chunks, independente do tamanho do corpo.
+        self.assertLess(peaks[1024], 16 * CHUNK)
+        self.assertLess(peaks[1024], peaks[16] * 2 + 4 * CHUNK)
+
+    async def test_clients_are_shared_until_closed(self) -> None:
+        first = upstream_http.get_upstream_client(upstream_http.ANALYTICS_UPSTREAM)
+        self.assertIs(
+            upstream_http.get_upstream_client(upstream_http.ANALYTICS_UPSTREAM),
+            first,
+        )
+        await upstream_http.close_upstream_clients()
+        self.assertTrue(first.is_closed)
+        self.assertIsNot(
+            upstream_http.get_upstream_client(upstream_http.ANALYTICS_UPSTREAM),
+            first,
+        )
+
+    def test_proxies_no_longer_buffer_or_build_clients_per_request(self) -> None:
+        main = (API_ROOT / "app" / "main.py").read_text(encoding="utf-8")
+        internal = (API_ROOT / "app" / "routers" / "internal.py").read_text(
+            encoding="utf-8"
+        )
+        meta_start = main.index("async def proxy_project_meta(")
+        meta_source = main[meta_start:main.index("\n@app.", meta_start)]
+        analytics_start = internal.index("async def proxy_global_analytics(")
+        analytics_source = internal[
+            analytics_start:internal.index("\n@router.", analytics_start)
+        ]
+        for source in (meta_source, analytics_source):
+            self.assertNotIn("httpx.AsyncClient(", source)
+            self.assertNotIn("await request.body()", source)
+            self.assertNotIn(".content", source)
+            self.assertIn("open_upstream_stream(", source)
+            self.assertIn("stream_upstream_response(", source)
+        self.assertIn("await close_upstream_clients()", main)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+"""Contrato do cache de usuario autenticado e do flush agrupado de atividade."""
+
+from __future__ import annotations
+
+import pathlib
+import unittest
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+API_APP = ROOT / "servidor" / "api-internal" / "app"
+
+
+def read(name: str) -> str:
+    return (API_APP / name).read_text(encoding="utf-8")
+
+
+class UserActivityContractTest(unittest.TestCase):
+    def test_request_path_reads_cache_and_does_not_write_users(self) -> None:
+        dependencies = read("dependencies.py")
+        start = dependencies.index("async def resolve_authenticated_user(")
+        end = dependencies.index("async def get_user_record_by_identifier(")
+        body = dependencies[start:end]
+
+        self.assertIn("get_cached_user(signed_user_id, login_session)", body)
+        self.assertIn("record_user_activity(", body)
+        self.assertIn("cache_user(signed_user_id, login_session, user)", body)
+        self.assertNotIn("UPDATE users", body)
+        self.assertLess(
+            body.index('raise HTTPException(403, "Usuário desativado")'),
+            body.index("cache_user("),
+        )
+
+    def test_activity_is_flushed_in_one_batched_update(self) -> None:
+        activity = read("user_activity.py")
+        self.assertEqual(activity.count("UPDATE users"), 1)
+        self.assertIn("FROM unnest($1::uuid[]", activity)
+        self.assertIn("last_login_session_hash IS DISTINCT FROM v.session_hash", activity)
+        self.assertIn("interval '5 minutes'", activity)
+
+    def test_identity_sync_invalidates_cached_user(self) -> None:
+        internal = read("routers/internal.py")
+        start = internal.index("async def sync_user_identity(")
+        body = internal[start:internal.index("@router.", start)]
+        self.assertIn("invalidate_user_cache(body.id)", body)
+
+        main = read("main.py")
+        self.assertIn("start_user_activity_flusher()", main)
+        self.assertIn("await stop_user_activity_flusher()", main)
+
+
+if __name__ == "__main__":
+    unittest.main()